@@ -0,0 +1,373 @@
+"""
+Runtime asyncio para los flujos de automatización.
+
+EFootballAutomation.run_all llamaba a BannerSkipper, PlayerSigner,
+PlayerTrainer y MatchPlayer de forma síncrona, con time.sleep por todas
+partes y sin forma de cancelar una ejecución a medias. AsyncRuntime ejecuta
+cada paso desde un bucle asyncio, con timeout y cancelación, y escribe una
+traza: trace() encola eventos (pasos, reconocimientos y entradas, recibidos
+de los listeners del reconocedor y del gamepad) que una tarea escribe en
+JSON Lines por lotes.
+
+Los flujos siguen siendo síncronos: run_workflow los ejecuta en un hilo con
+un CancellationToken. Todas sus esperas son cancelables: workflow_sleep (que
+usan los flujos, ScreenRecognizer.wait_for_state, MenuNavigator,
+DpadNavigator y CursorNavigator) duerme como time.sleep fuera del runtime y,
+dentro, lanza WorkflowCancelled en cuanto se cancela la tarea o vence su
+timeout; wait_future espera las entradas del planificador
+(GamepadController.execute_sequence, run_program de las secuencias)
+comprobando el mismo token cada FUTURE_POLL_S, y las pulsaciones de
+GamepadController sueltan lo pulsado si se cancelan a medias. Al cancelar se
+descartan además las entradas pendientes del planificador (soltando lo pulsado). Un token también se puede
+cancelar con restart=True (lo hace el vigilante de bloqueos): las esperas
+lanzan entonces WorkflowRestart y quien ejecuta el paso puede repetirlo.
+Mientras el vigilante recupera un bloqueo, pause() detiene el flujo en su
+siguiente espera o pulsación hasta resume().
+
+El runtime se limita a ejecutar en hilos los flujos síncronos existentes con
+cancelación, timeout y traza. No ofrece operaciones asíncronas por tarea
+(reconocer, esperar un estado, guardar capturas, pulsar, secuencias) a las
+que se pueda hacer await: los flujos no están escritos como corrutinas y
+esas operaciones ya son cancelables desde su hilo a través del token.
+
+Uso:
+    python main.py --async all --step-timeout 900
+"""
+
+import asyncio
+import contextlib
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import CancelledError, Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger('async_runtime')
+
+CANCEL_GRACE_S = 5.0     # Tiempo que se espera a que un flujo cancelado salga de su hilo
+PAUSE_POLL_S = 0.1       # Periodo con el que un flujo en pausa comprueba si se ha cancelado
+FUTURE_POLL_S = 0.05     # Periodo con el que wait_future comprueba si el flujo se ha cancelado
+TRACE_BATCH = 256        # Eventos de traza escritos por lote como máximo
+
+_local = threading.local()
+
+
+class WorkflowCancelled(BaseException):
+    """
+    El flujo se canceló (cancelación de la tarea o timeout) durante una espera.
+
+    Hereda de BaseException, como asyncio.CancelledError, para que los
+    'except Exception' de los flujos no la conviertan en un fallo normal.
+    """
+
+
+class WorkflowRestart(WorkflowCancelled):
+    """Se pidió repetir el flujo desde el principio (recuperación de un bloqueo)."""
+
+
+class CancellationToken:
+    """
+    Señal de cancelación compartida entre el bucle asyncio y el hilo de un flujo.
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._running = threading.Event()
+        self._running.set()
+        self._lock = threading.Lock()
+        self.reason = None
+        self.restart = False
+
+    def cancel(self, reason: str = "cancelado", restart: bool = False) -> None:
+        """
+        Cancela el flujo; con restart=True sólo pide repetirlo (una cancelación
+        normal posterior tiene prioridad sobre un reinicio pendiente).
+        """
+        with self._lock:
+            if self._event.is_set() and (restart or not self.restart):
+                return
+            self.reason = reason
+            self.restart = restart
+            self._event.set()
+
+    def reset(self) -> None:
+        """Descarta un reinicio ya atendido (no deshace una cancelación normal)."""
+        with self._lock:
+            if self.restart:
+                self._event.clear()
+                self.reason = None
+                self.restart = False
+
+    def pause(self) -> None:
+        """Detiene el flujo en su siguiente check() o sleep() hasta resume()."""
+        self._running.clear()
+
+    def resume(self) -> None:
+        self._running.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    @property
+    def paused(self) -> bool:
+        return not self._running.is_set()
+
+    def _raise(self) -> None:
+        raise (WorkflowRestart if self.restart else WorkflowCancelled)(self.reason)
+
+    def _wait_resumed(self) -> None:
+        # Una cancelación durante la pausa también la interrumpe
+        while not self._running.wait(PAUSE_POLL_S):
+            if self._event.is_set():
+                self._raise()
+
+    def check(self) -> None:
+        """Espera si está en pausa; lanza WorkflowCancelled (o WorkflowRestart) si se ha cancelado."""
+        self._wait_resumed()
+        if self._event.is_set():
+            self._raise()
+
+    def sleep(self, seconds: float, pausable: bool = True) -> None:
+        """
+        Duerme como time.sleep, pero vuelve con WorkflowCancelled al cancelarse.
+
+        Con pausable=False no se detiene al final si el flujo está en pausa
+        (para soltar lo pulsado antes de que la pausa lo retenga).
+        """
+        if self._event.wait(max(0.0, seconds)):
+            self._raise()
+        if pausable:
+            self.check()
+
+
+def current_token() -> Optional[CancellationToken]:
+    """Token del flujo que se ejecuta en este hilo (None fuera de run_workflow)."""
+    return getattr(_local, 'token', None)
+
+
+@contextlib.contextmanager
+def cancellation_scope(token: Optional[CancellationToken] = None):
+    """
+    Asocia un token al hilo actual mientras dura el bloque.
+
+    Sin token, reutiliza el del hilo (p.ej. el de run_workflow) o crea uno nuevo.
+    """
+    previous = current_token()
+    if token is None:
+        token = previous if previous is not None else CancellationToken()
+    _local.token = token
+    try:
+        yield token
+    finally:
+        _local.token = previous
+
+
+def workflow_sleep(seconds: float) -> None:
+    """
+    Espera de los flujos: time.sleep fuera del runtime; dentro, cancelable.
+
+    Raises:
+        WorkflowCancelled: Si el flujo se cancela durante la espera.
+    """
+    token = current_token()
+    if token is None:
+        time.sleep(seconds)
+    else:
+        token.sleep(seconds)
+
+
+def wait_future(future: Future) -> Any:
+    """
+    Espera el resultado de un Future: future.result() fuera del runtime; dentro,
+    comprobando el token del flujo cada FUTURE_POLL_S.
+
+    Raises:
+        WorkflowCancelled: Si el flujo se cancela durante la espera (o el
+            runtime ya canceló el Future).
+    """
+    token = current_token()
+    if token is None:
+        return future.result()
+    while True:
+        token.check()
+        try:
+            return future.result(timeout=FUTURE_POLL_S)
+        except FutureTimeoutError:
+            continue
+        except CancelledError:
+            token.check()  # Cancelado por el runtime: WorkflowCancelled
+            raise
+
+
+class AsyncRuntime:
+    """
+    Bucle de trabajo de una ejecución: pasos cancelables con timeout y traza.
+    """
+
+    def __init__(self, gamepad, recognizer, trace_path: Optional[str] = None):
+        """
+        Args:
+            gamepad: GamepadController (con su InputScheduler).
+            recognizer: ScreenRecognizer o cliente del servicio de reconocimiento.
+            trace_path: Archivo JSON Lines donde escribir la traza (None = sin traza).
+        """
+        self.gamepad = gamepad
+        self.recognizer = recognizer
+        self.trace_path = trace_path
+        self._workflow_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="Workflow")
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._trace_queue: Optional[asyncio.Queue] = None
+        self._trace_task: Optional[asyncio.Task] = None
+        self.stats = {'recognitions': 0, 'inputs': 0, 'trace_events': 0, 'workflows': 0,
+                      'cancelled': 0, 'timeouts': 0}
+
+    async def __aenter__(self) -> 'AsyncRuntime':
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        await self.close()
+
+    async def start(self) -> None:
+        """Arranca la tarea de traza y escucha reconocimientos y entradas (si hay trace_path)."""
+        if self.trace_path and self._trace_task is None:
+            directory = os.path.dirname(self.trace_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._loop = asyncio.get_running_loop()
+            self._trace_queue = asyncio.Queue()
+            self._trace_task = asyncio.create_task(self._trace_writer(), name="trace_writer")
+            if hasattr(self.recognizer, 'add_recognition_listener'):
+                self.recognizer.add_recognition_listener(self._on_recognition)
+            if hasattr(self.gamepad, 'add_input_listener'):
+                self.gamepad.add_input_listener(self._on_input)
+
+    async def close(self) -> None:
+        """Vacía la traza pendiente (el runtime se puede volver a arrancar con start())."""
+        if self._trace_task is not None:
+            if hasattr(self.recognizer, 'remove_recognition_listener'):
+                self.recognizer.remove_recognition_listener(self._on_recognition)
+            if hasattr(self.gamepad, 'remove_input_listener'):
+                self.gamepad.remove_input_listener(self._on_input)
+            await self._trace_queue.put(None)
+            await self._trace_task
+            self._trace_task = None
+            self._trace_queue = None
+            self._loop = None
+
+    def shutdown(self) -> None:
+        """Libera el hilo de flujos."""
+        self._workflow_executor.shutdown(wait=False)
+
+    # --- Traza ---
+
+    def trace(self, event: str, **data) -> None:
+        """Encola un evento de traza (no bloquea; se puede llamar desde cualquier hilo)."""
+        queue, loop = self._trace_queue, self._loop
+        if queue is None or loop is None:
+            return
+        record = {'ts': time.time(), 'event': event, **data}
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            queue.put_nowait(record)
+        else:
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, record)
+            except RuntimeError:
+                pass  # Bucle ya cerrado: se pierde el evento
+
+    def _on_recognition(self, event: Dict[str, Any]) -> None:
+        # Listener del reconocedor (hilo del flujo): sin la pirámide del frame
+        self.stats['recognitions'] += 1
+        self.trace('recognition', state=event.get('state'), method=event.get('method'),
+                   confidence=event.get('confidence'), frame_id=event.get('frame_id'))
+
+    def _on_input(self, event: Dict[str, Any]) -> None:
+        # Listener del gamepad (hilo del flujo o del planificador de entradas)
+        self.stats['inputs'] += 1
+        self.trace('input', **{key: value for key, value in event.items() if key != 'ts'})
+
+    async def _trace_writer(self) -> None:
+        loop = asyncio.get_running_loop()
+        done = False
+        while not done:
+            batch = [await self._trace_queue.get()]
+            while len(batch) < TRACE_BATCH and not self._trace_queue.empty():
+                batch.append(self._trace_queue.get_nowait())
+            if batch[-1] is None or None in batch:
+                done = True
+                batch = [event for event in batch if event is not None]
+            if batch:
+                lines = "".join(json.dumps(event, ensure_ascii=False, default=str) + "\n" for event in batch)
+                try:
+                    await loop.run_in_executor(None, self._append_trace, lines)
+                    self.stats['trace_events'] += len(batch)
+                except OSError as e:
+                    logger.error(f"No se pudo escribir la traza en {self.trace_path}: {e}")
+
+    def _append_trace(self, lines: str) -> None:
+        with open(self.trace_path, "a", encoding="utf-8") as f:
+            f.write(lines)
+
+    # --- Flujos síncronos ---
+
+    async def run_workflow(self, name: str, fn: Callable[..., Any], *args,
+                           timeout: Optional[float] = None, **kwargs) -> Any:
+        """
+        Ejecuta un flujo síncrono en el hilo de flujos, cancelable y con timeout.
+
+        Args:
+            name: Nombre para la traza y los mensajes.
+            fn: Función del flujo (p.ej. BannerSkipper.run).
+            timeout: Tiempo máximo en segundos (None = sin límite).
+
+        Returns:
+            Lo que devuelva fn.
+
+        Raises:
+            asyncio.TimeoutError: Si vence el timeout (el flujo ya se ha detenido o se ha
+                dejado de esperar tras CANCEL_GRACE_S).
+            asyncio.CancelledError: Si se cancela la tarea.
+        """
+        token = CancellationToken()
+
+        def body():
+            with cancellation_scope(token):
+                return fn(*args, **kwargs)
+
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self._workflow_executor, body)
+        self.stats['workflows'] += 1
+        self.trace('workflow_start', name=name, timeout=timeout)
+        start = loop.time()
+        try:
+            result = await asyncio.wait_for(asyncio.shield(future), timeout)
+        except asyncio.TimeoutError:
+            self.stats['timeouts'] += 1
+            await self._stop_workflow(name, token, future, f"timeout de {timeout} s")
+            raise
+        except asyncio.CancelledError:
+            self.stats['cancelled'] += 1
+            await self._stop_workflow(name, token, future, "cancelado")
+            raise
+        self.trace('workflow_end', name=name, result=result, elapsed_s=round(loop.time() - start, 3))
+        return result
+
+    async def _stop_workflow(self, name: str, token: CancellationToken, future: asyncio.Future, reason: str) -> None:
+        token.cancel(reason)
+        self.gamepad.scheduler.cancel_pending()
+        self.trace('workflow_cancelled', name=name, reason=reason)
+        try:
+            await asyncio.wait_for(asyncio.shield(future), CANCEL_GRACE_S)
+        except WorkflowCancelled:
+            pass
+        except asyncio.TimeoutError:
+            logger.warning(f"El flujo '{name}' no respondió a la cancelación en {CANCEL_GRACE_S} s")
+        except Exception as e:
+            logger.warning(f"El flujo '{name}' terminó con error tras cancelarse: {e}")
@@ -9,6 +9,7 @@ Utiliza los módulos de control de gamepad y reconocimiento de pantalla.
 """
 
 import time
+from async_runtime import workflow_sleep
 from gamepad_controller import GamepadController, GamepadButton, EFootballSequences
 from screen_recognizer import ScreenRecognizer, GameScreen, ScreenElement
 
@@ -64,7 +65,7 @@ class BannerSkipper:
                 
                 # Presionar el botón A para continuar
                 self.gamepad.press_button(GamepadButton.A, duration=0.2)
-                time.sleep(wait_time)
+                workflow_sleep(wait_time)
                 
                 # Verificar si hemos avanzado
                 new_screen = self.recognizer.recognize_screen()
@@ -117,7 +118,7 @@ class BannerSkipper:
                     print("Botón X no encontrado, intentando con botón A...")
                     self.gamepad.press_button(GamepadButton.A, duration=0.2)
                 
-                time.sleep(wait_time)
+                workflow_sleep(wait_time)
                 
                 # Verificar si hemos avanzado
                 new_screen = self.recognizer.recognize_screen()
@@ -177,7 +178,7 @@ class BannerSkipper:
                 self.gamepad.press_button(GamepadButton.A, duration=0.2)
             
             # Esperar un momento antes de la siguiente comprobación
-            time.sleep(1.0)
+            workflow_sleep(1.0)
         
         # Verificar si llegamos al menú principal
         final_screen = self.recognizer.recognize_screen()
@@ -0,0 +1,216 @@
+"""
+Clasificación por lotes de capturas de pantalla guardadas.
+
+Etiqueta carpetas de capturas (sesiones, informes de errores...) con
+ScreenRecognizer sin necesidad de monitor. La configuración se compila una
+sola vez en un bundle (recognition_bundle.py) y cada proceso del pool lo
+carga al arrancar, de modo que las plantillas se decodifican una vez por
+proceso y no por imagen.
+
+La salida es CSV o JSONL con estado, confianza, método y tiempos por imagen,
+y al final se muestran estadísticas de rendimiento.
+
+Uso:
+    python batch_classify.py ../temp/sesion_0412
+    python batch_classify.py "capturas/*.png" -o etiquetas.jsonl --workers 6
+    python batch_classify.py capturas --recursive --bundle ../config/recognition_bundle.json
+"""
+
+import argparse
+import csv
+import glob
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional
+
+import cv2
+import numpy as np
+
+from recognition_bundle import PROJECT_DIR, compile_from_config, log_issues
+
+logger = logging.getLogger('batch_classify')
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp')
+TEMP_BUNDLE_FILE = os.path.join(PROJECT_DIR, "temp", "batch_classify_bundle.json")
+OUTPUT_FIELDS = ('file', 'state', 'method', 'confidence', 'complete', 'detection_time_s', 'total_time_s',
+                 'width', 'height', 'worker', 'error')
+
+_WORKER = {}  # Reconocedor del proceso trabajador
+
+
+def collect_images(inputs: List[str], recursive: bool = False) -> List[str]:
+    """
+    Expande directorios y patrones glob a una lista ordenada de imágenes (sin repetidos).
+    """
+    paths = []
+    for entry in inputs:
+        if os.path.isdir(entry):
+            pattern = os.path.join(entry, "**", "*") if recursive else os.path.join(entry, "*")
+            candidates = glob.glob(pattern, recursive=recursive)
+        else:
+            candidates = glob.glob(entry, recursive=recursive) or ([entry] if os.path.isfile(entry) else [])
+            if not candidates:
+                logger.warning(f"Sin coincidencias para '{entry}'")
+        paths.extend(p for p in candidates if p.lower().endswith(IMAGE_EXTENSIONS) and os.path.isfile(p))
+    return sorted(set(os.path.abspath(p) for p in paths))
+
+
+def _init_worker(bundle_path: str, resolution: str, threshold: Optional[float], origin, log_level: int):
+    """Inicializador del pool: un ScreenRecognizer sin pantalla por proceso, cargado del bundle."""
+    logging.getLogger().setLevel(log_level)  # Los logs por reconocimiento saturarían la consola
+    from screen_recognizer import ScreenRecognizer
+    started = time.perf_counter()
+    kwargs = {'monitor': None, 'resolution': resolution, 'bundle_path': bundle_path}
+    if threshold is not None:
+        kwargs['threshold'] = threshold
+    _WORKER['recognizer'] = ScreenRecognizer(**kwargs)
+    _WORKER['origin'] = origin
+    logger.debug(f"Proceso {os.getpid()}: reconocedor listo en {time.perf_counter() - started:.2f} s")
+
+
+def _worker_ready(_) -> int:
+    return os.getpid()
+
+
+def _classify(task) -> Dict:
+    """Clasifica una imagen en el proceso trabajador."""
+    path, deadline_ms = task
+    started = time.perf_counter()
+    row = {'file': path, 'state': 'error', 'method': 'error', 'confidence': None, 'complete': None,
+           'detection_time_s': None, 'width': None, 'height': None, 'worker': os.getpid(), 'error': None}
+    image = cv2.imread(path, cv2.IMREAD_COLOR)
+    if image is None:
+        row['error'] = "No se pudo leer la imagen"
+    else:
+        h, w = image.shape[:2]
+        left, top = _WORKER['origin']
+        result = _WORKER['recognizer'].recognize_image(
+            image, region={'left': left, 'top': top, 'width': w, 'height': h}, deadline_ms=deadline_ms)
+        confidence = result.get('confidence')
+        row.update({
+            'state': result.get('state'), 'method': result.get('method'),
+            'confidence': round(float(confidence), 4) if confidence is not None else None,
+            'complete': result.get('complete'),
+            'detection_time_s': round(result.get('detection_time_s') or 0.0, 4),
+            'width': w, 'height': h, 'error': result.get('error_message'),
+        })
+    row['total_time_s'] = round(time.perf_counter() - started, 4)
+    return row
+
+
+class _OutputWriter:
+    """Escribe filas en CSV o JSONL (o a stdout si no hay archivo)."""
+
+    def __init__(self, path: Optional[str], fmt: str):
+        self.fmt = fmt
+        self._file = open(path, "w", encoding="utf-8", newline="") if path else sys.stdout
+        self._csv = None
+        if fmt == 'csv':
+            self._csv = csv.DictWriter(self._file, fieldnames=OUTPUT_FIELDS)
+            self._csv.writeheader()
+
+    def write(self, row: Dict) -> None:
+        if self._csv is not None:
+            self._csv.writerow(row)
+        else:
+            self._file.write(json.dumps(row, ensure_ascii=False) + "\n")
+
+    def close(self) -> None:
+        if self._file is not sys.stdout:
+            self._file.close()
+        else:
+            self._file.flush()
+
+
+def _print_stats(rows: List[Dict], wall_s: float, workers: int, startup_s: float) -> None:
+    """Resumen de rendimiento y distribución de estados (por stderr, para no mezclar con la salida)."""
+    out = sys.stderr
+    ok = [r for r in rows if r['method'] != 'error']
+    print(f"\n{len(rows)} imágenes en {wall_s:.1f} s con {workers} procesos "
+          f"({len(rows) / wall_s if wall_s else 0.0:.1f} img/s; arranque del pool {startup_s:.1f} s)", file=out)
+    if ok:
+        times = np.array([r['detection_time_s'] for r in ok]) * 1000
+        print(f"Reconocimiento por imagen: media {times.mean():.1f} ms | p50 {np.percentile(times, 50):.1f} ms | "
+              f"p95 {np.percentile(times, 95):.1f} ms | máx {times.max():.1f} ms", file=out)
+    methods, states = {}, {}
+    for r in rows:
+        methods[r['method']] = methods.get(r['method'], 0) + 1
+        states[r['state']] = states.get(r['state'], 0) + 1
+    print(f"Métodos: {methods}", file=out)
+    print("Estados más frecuentes:", file=out)
+    for state, count in sorted(states.items(), key=lambda item: -item[1])[:15]:
+        print(f"  {state:50} {count}", file=out)
+
+
+def main():
+    """Punto de entrada de línea de comandos."""
+    parser = argparse.ArgumentParser(description="Clasificación por lotes de capturas de pantalla")
+    parser.add_argument("inputs", nargs="+", help="Directorios, archivos o patrones glob")
+    parser.add_argument("-o", "--output", default=None, help="Archivo de salida (.csv o .jsonl; por defecto stdout)")
+    parser.add_argument("--format", choices=("csv", "jsonl"), default=None,
+                        help="Formato de salida (por defecto según la extensión; jsonl en stdout)")
+    parser.add_argument("--recursive", action="store_true", help="Recorrer subdirectorios")
+    parser.add_argument("--workers", type=int, default=None, help="Procesos en paralelo (por defecto, nº de CPUs)")
+    parser.add_argument("--bundle", default=None,
+                        help="Bundle precompilado (si no, se compila la configuración actual)")
+    parser.add_argument("--resolution", default="4K", help="Resolución de las plantillas")
+    parser.add_argument("--threshold", type=float, default=None, help="Umbral global de template matching")
+    parser.add_argument("--origin", default="0,0",
+                        help="Posición absoluta 'x,y' de las capturas (para ROIs/regiones OCR de otros monitores)")
+    parser.add_argument("--deadline-ms", type=float, default=None, help="Presupuesto por imagen (ver recognize)")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Logs de reconocimiento de cada imagen")
+    args = parser.parse_args()
+
+    images = collect_images(args.inputs, args.recursive)
+    if not images:
+        print("No se encontraron imágenes.", file=sys.stderr)
+        return 1
+    try:
+        origin = tuple(int(v) for v in args.origin.split(","))
+        assert len(origin) == 2
+    except (ValueError, AssertionError):
+        print(f"--origin inválido: {args.origin!r} (formato x,y)", file=sys.stderr)
+        return 2
+    fmt = args.format or ('csv' if args.output and args.output.lower().endswith('.csv') else 'jsonl')
+
+    bundle_path = args.bundle
+    if bundle_path is None:
+        bundle = compile_from_config(args.resolution)
+        log_issues(bundle)
+        bundle.save(TEMP_BUNDLE_FILE)
+        bundle_path = TEMP_BUNDLE_FILE
+    workers = args.workers or os.cpu_count() or 1
+    workers = max(1, min(workers, len(images)))
+    log_level = logging.INFO if args.verbose else logging.WARNING
+    logger.info(f"Clasificando {len(images)} imágenes con {workers} procesos (bundle: {bundle_path})")
+
+    writer = _OutputWriter(args.output, fmt)
+    rows = []
+    started = time.perf_counter()
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(bundle_path, args.resolution, args.threshold, origin, log_level)) as pool:
+            # Una tarea trivial por proceso para medir el arranque (carga del bundle y plantillas)
+            list(pool.map(_worker_ready, range(workers)))
+            startup_s = time.perf_counter() - started
+            tasks = [(path, args.deadline_ms) for path in images]
+            chunksize = max(1, len(tasks) // (workers * 8))
+            for row in pool.map(_classify, tasks, chunksize=chunksize):
+                rows.append(row)
+                writer.write(row)
+    finally:
+        writer.close()
+    _print_stats(rows, time.perf_counter() - started, workers, startup_s)
+    if args.output:
+        print(f"Resultados guardados en {args.output}", file=sys.stderr)
+    return 0 if all(r['method'] != 'error' for r in rows) else 1
+
+
+if __name__ == "__main__":
+    if not logging.getLogger().hasHandlers():
+        logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    sys.exit(main())
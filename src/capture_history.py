@@ -0,0 +1,483 @@
+"""
+Historial visual comprimido por deltas para sesiones largas de automatización.
+
+Guardar un PNG 4K por cada reconocimiento de una ejecución nocturna ocupa
+cientos de GB. CaptureHistory guarda cada cierto tiempo un keyframe completo
+y, entre keyframes, sólo las teselas que han cambiado respecto al frame
+anterior. La codificación se hace en un hilo aparte con una cola acotada (si
+se llena, el frame se descarta en lugar de frenar la automatización) y el
+directorio respeta un presupuesto de disco borrando los segmentos más
+antiguos.
+
+El historial se organiza en segmentos (un archivo por keyframe periódico) y
+cada registro lleva su marca de tiempo y los metadatos del reconocimiento,
+así que CaptureHistoryReader puede reconstruir el frame visible en cualquier
+instante aplicando los deltas desde el keyframe anterior.
+
+La comparación se hace contra el frame reconstruido (lo que verá el lector),
+no contra la captura anterior: las diferencias por debajo de pixel_threshold
+no se guardan, pero el error nunca se acumula más allá de ese umbral.
+
+Formato de segmento (little-endian):
+    Cabecera: magic, ancho, alto, canales, tamaño de tesela.
+    Registro: 'HREC', tipo (0 keyframe, 1 delta), timestamp, nº teselas,
+              longitud de metadatos, longitud de datos; metadatos JSON y datos
+              (keyframe: frame zlib; delta: índices uint32 + teselas zlib).
+
+Uso:
+    python capture_history.py info ../logs/history
+    python capture_history.py export ../logs/history --at "2025-04-12 03:14:07" -o frame.png
+    python capture_history.py timeline ../logs/history --since "2025-04-12 03:00:00"
+"""
+
+import argparse
+import bisect
+import json
+import logging
+import os
+import queue
+import struct
+import sys
+import threading
+import time
+import zlib
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger('capture_history')
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HISTORY_DIR = os.path.join(PROJECT_DIR, "logs", "history")
+SEGMENT_EXTENSION = ".efhist"
+
+DEFAULT_TILE_SIZE = 64
+DEFAULT_KEYFRAME_INTERVAL_S = 60.0     # Cada segmento empieza con un keyframe
+DEFAULT_PIXEL_THRESHOLD = 8            # Diferencia por canal que se considera cambio
+DEFAULT_KEYFRAME_CHANGE_RATIO = 0.6    # Con más teselas cambiadas, se guarda un keyframe
+DEFAULT_DISK_BUDGET_BYTES = 20 * 1024 ** 3
+DEFAULT_QUEUE_SIZE = 4
+DEFAULT_ZLIB_LEVEL = 1
+
+KIND_KEYFRAME = 0
+KIND_DELTA = 1
+
+_MAGIC = b"EFHIST1\0"
+_SEGMENT_HEADER = struct.Struct("<8sIIII")   # magic, ancho, alto, canales, tesela
+_RECORD_MAGIC = b"HREC"
+_RECORD_HEADER = struct.Struct("<4sBdIII")   # magic, tipo, ts, nº teselas, len meta, len datos
+
+
+def _segment_name(timestamp: float) -> str:
+    return f"hist_{int(timestamp * 1000):014d}{SEGMENT_EXTENSION}"
+
+
+def _segment_start(path: str) -> Optional[float]:
+    name = os.path.basename(path)
+    try:
+        return int(name[len("hist_"):-len(SEGMENT_EXTENSION)]) / 1000.0
+    except ValueError:
+        return None
+
+
+def parse_timestamp(value: str) -> float:
+    """Acepta un epoch en segundos o una fecha 'YYYY-MM-DD HH:MM:SS' (hora local)."""
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+
+class _TileGrid:
+    """Geometría de las teselas de un frame (las del borde pueden ser parciales)."""
+
+    def __init__(self, height: int, width: int, tile: int):
+        self.height, self.width, self.tile = height, width, tile
+        self.rows = -(-height // tile)
+        self.cols = -(-width // tile)
+
+    def bounds(self, index: int) -> Tuple[int, int, int, int]:
+        row, col = divmod(int(index), self.cols)
+        y0, x0 = row * self.tile, col * self.tile
+        return y0, min(self.height, y0 + self.tile), x0, min(self.width, x0 + self.tile)
+
+    def changed(self, frame: np.ndarray, reference: np.ndarray, threshold: int) -> np.ndarray:
+        """Índices de las teselas con algún píxel que difiere más de ``threshold``."""
+        diff = cv2.absdiff(frame, reference)
+        if diff.ndim == 3:
+            diff = diff.max(axis=2)
+        mask = diff > threshold
+        pad_h, pad_w = self.rows * self.tile - self.height, self.cols * self.tile - self.width
+        if pad_h or pad_w:
+            mask = np.pad(mask, ((0, pad_h), (0, pad_w)))
+        tiles = mask.reshape(self.rows, self.tile, self.cols, self.tile).any(axis=(1, 3))
+        return np.flatnonzero(tiles).astype(np.uint32)
+
+
+class CaptureHistory:
+    """
+    Escritor del historial en segundo plano.
+
+    Puede usarse directamente (add) o como capture_history de ScreenRecognizer,
+    que añade cada frame reconocido y enlaza el registro desde el resultado.
+    """
+
+    def __init__(self, directory: str = HISTORY_DIR, tile_size: int = DEFAULT_TILE_SIZE,
+                 keyframe_interval_s: float = DEFAULT_KEYFRAME_INTERVAL_S,
+                 pixel_threshold: int = DEFAULT_PIXEL_THRESHOLD,
+                 keyframe_change_ratio: float = DEFAULT_KEYFRAME_CHANGE_RATIO,
+                 disk_budget_bytes: int = DEFAULT_DISK_BUDGET_BYTES,
+                 queue_size: int = DEFAULT_QUEUE_SIZE, zlib_level: int = DEFAULT_ZLIB_LEVEL):
+        """
+        Args:
+            directory: Directorio de los segmentos.
+            tile_size: Lado de las teselas en píxeles.
+            keyframe_interval_s: Segundos entre keyframes periódicos (y entre segmentos).
+            pixel_threshold: Diferencia por canal por debajo de la cual un píxel no cuenta como cambio.
+            keyframe_change_ratio: Fracción de teselas cambiadas a partir de la cual se guarda un keyframe.
+            disk_budget_bytes: Tamaño máximo del directorio; se borran los segmentos más antiguos.
+            queue_size: Frames pendientes de codificar antes de empezar a descartar.
+            zlib_level: Nivel de compresión.
+        """
+        self.directory = directory
+        self.tile_size = tile_size
+        self.keyframe_interval_s = keyframe_interval_s
+        self.pixel_threshold = pixel_threshold
+        self.keyframe_change_ratio = keyframe_change_ratio
+        self.disk_budget_bytes = disk_budget_bytes
+        self.zlib_level = zlib_level
+        self.stats = {'frames': 0, 'keyframes': 0, 'deltas': 0, 'dropped': 0, 'tiles_written': 0,
+                      'bytes_written': 0, 'segments_deleted': 0, 'encode_time_s': 0.0}
+
+        self._queue: "queue.Queue[Optional[tuple]]" = queue.Queue(maxsize=queue_size)
+        self._reference: Optional[np.ndarray] = None
+        self._grid: Optional[_TileGrid] = None
+        self._segment_file = None
+        self._segment_path: Optional[str] = None
+        self._segment_started = 0.0
+        self._failed = False
+        self._closed = False
+        os.makedirs(directory, exist_ok=True)
+        self._thread = threading.Thread(target=self._run, name="CaptureHistoryWriter", daemon=True)
+        self._thread.start()
+        logger.info(f"Historial de capturas en {directory} (keyframe cada {keyframe_interval_s:.0f} s, "
+                    f"presupuesto {disk_budget_bytes / 1024 ** 3:.1f} GB)")
+
+    # --- API del productor ---
+
+    def add(self, frame: np.ndarray, timestamp: Optional[float] = None,
+            metadata: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+        """
+        Encola un frame (se copia) para guardarlo en el historial.
+
+        Args:
+            frame: Imagen BGR o gris.
+            timestamp: Instante de la captura (por defecto, time.time()).
+            metadata: Datos del reconocimiento (estado, método...), serializables a JSON.
+
+        Returns:
+            Referencia {'history', 'ts'} para localizar el frame con
+            CaptureHistoryReader.frame_at, o None si se descartó.
+        """
+        if self._closed or self._failed or frame is None:
+            return None
+        timestamp = time.time() if timestamp is None else timestamp
+        try:
+            self._queue.put_nowait((np.array(frame, copy=True), timestamp, metadata or {}))
+        except queue.Full:
+            self.stats['dropped'] += 1
+            return None
+        return {'history': self.directory, 'ts': timestamp}
+
+    def publish(self, frame_bgr: np.ndarray, metadata: Optional[Dict[str, Any]] = None) -> int:
+        """Interfaz de frame_publisher (como FrameBusPublisher)."""
+        return 1 if self.add(frame_bgr, metadata=metadata) else 0
+
+    def close(self, timeout: float = 30.0) -> None:
+        """Codifica lo pendiente y cierra el segmento en curso."""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            logger.warning("El hilo del historial no terminó a tiempo; el último segmento puede quedar incompleto.")
+        logger.info(f"Historial cerrado: {self.stats['frames']} frames ({self.stats['keyframes']} keyframes), "
+                    f"{self.stats['bytes_written'] / 1e6:.1f} MB, {self.stats['dropped']} descartados")
+
+    # --- Hilo codificador ---
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            if self._failed:
+                continue
+            started = time.perf_counter()
+            try:
+                self._encode(*item)
+            except OSError as e:
+                self._failed = True
+                logger.error(f"Error escribiendo el historial en {self.directory}: {e}. Se desactiva.")
+            except Exception as e:
+                logger.exception(f"Error codificando un frame del historial: {e}")
+            self.stats['encode_time_s'] += time.perf_counter() - started
+        self._close_segment()
+
+    def _encode(self, frame: np.ndarray, timestamp: float, metadata: Dict[str, Any]) -> None:
+        shape_changed = self._reference is None or self._reference.shape != frame.shape
+        if shape_changed or timestamp - self._segment_started >= self.keyframe_interval_s:
+            self._open_segment(frame, timestamp)
+            self._write_keyframe(frame, timestamp, metadata)
+            return
+        changed = self._grid.changed(frame, self._reference, self.pixel_threshold)
+        if len(changed) > self.keyframe_change_ratio * self._grid.rows * self._grid.cols:
+            self._write_keyframe(frame, timestamp, metadata)  # Cambio de pantalla: más barato completo
+            return
+        tiles = []
+        for index in changed:
+            y0, y1, x0, x1 = self._grid.bounds(index)
+            tile = frame[y0:y1, x0:x1]
+            self._reference[y0:y1, x0:x1] = tile
+            tiles.append(tile.tobytes())
+        data = changed.tobytes() + (zlib.compress(b"".join(tiles), self.zlib_level) if tiles else b"")
+        self._write_record(KIND_DELTA, timestamp, len(changed), metadata, data)
+        self.stats['deltas'] += 1
+        self.stats['tiles_written'] += len(changed)
+
+    def _write_keyframe(self, frame: np.ndarray, timestamp: float, metadata: Dict[str, Any]) -> None:
+        self._reference = frame
+        data = zlib.compress(memoryview(np.ascontiguousarray(frame)).cast('B'), self.zlib_level)
+        self._write_record(KIND_KEYFRAME, timestamp, 0, metadata, data)
+        self.stats['keyframes'] += 1
+
+    def _write_record(self, kind: int, timestamp: float, tiles: int, metadata: Dict[str, Any], data: bytes) -> None:
+        meta = json.dumps(metadata, ensure_ascii=False, default=str).encode("utf-8") if metadata else b""
+        header = _RECORD_HEADER.pack(_RECORD_MAGIC, kind, timestamp, tiles, len(meta), len(data))
+        self._segment_file.write(header + meta)
+        self._segment_file.write(data)
+        self._segment_file.flush()  # Registros completos en disco aunque el proceso muera
+        self.stats['frames'] += 1
+        self.stats['bytes_written'] += len(header) + len(meta) + len(data)
+
+    def _open_segment(self, frame: np.ndarray, timestamp: float) -> None:
+        self._close_segment()
+        height, width = frame.shape[:2]
+        channels = frame.shape[2] if frame.ndim == 3 else 1
+        self._grid = _TileGrid(height, width, self.tile_size)
+        self._segment_path = os.path.join(self.directory, _segment_name(timestamp))
+        self._segment_file = open(self._segment_path, "wb")
+        self._segment_file.write(_SEGMENT_HEADER.pack(_MAGIC, width, height, channels, self.tile_size))
+        self._segment_started = timestamp
+        self._enforce_budget()
+
+    def _close_segment(self) -> None:
+        if self._segment_file is not None:
+            self._segment_file.close()
+            self._segment_file = None
+
+    def _enforce_budget(self) -> None:
+        """Borra los segmentos más antiguos (nunca el actual) hasta cumplir el presupuesto."""
+        segments = sorted(p for p in (os.path.join(self.directory, n) for n in os.listdir(self.directory))
+                          if p.endswith(SEGMENT_EXTENSION))
+        sizes = {p: os.path.getsize(p) for p in segments}
+        total = sum(sizes.values())
+        for path in segments:
+            if total <= self.disk_budget_bytes or path == self._segment_path:
+                break
+            try:
+                os.remove(path)
+                total -= sizes[path]
+                self.stats['segments_deleted'] += 1
+                logger.info(f"Presupuesto de disco: borrado {os.path.basename(path)}")
+            except OSError as e:
+                logger.warning(f"No se pudo borrar {path}: {e}")
+                break
+
+
+class CaptureHistoryReader:
+    """
+    Lectura del historial: índice de registros y reconstrucción de frames por timestamp.
+    """
+
+    def __init__(self, directory: str = HISTORY_DIR):
+        self.directory = directory
+        self._indexes: Dict[str, tuple] = {}  # ruta -> (tamaño indexado, cabecera, registros)
+        self._cache: Optional[Tuple[str, int, np.ndarray]] = None  # (segmento, nº registro, frame)
+        self.refresh()
+
+    def refresh(self) -> None:
+        """Vuelve a listar los segmentos (el escritor puede seguir añadiendo)."""
+        segments = []
+        for name in os.listdir(self.directory) if os.path.isdir(self.directory) else []:
+            start = _segment_start(name) if name.endswith(SEGMENT_EXTENSION) else None
+            if start is not None:
+                segments.append((start, os.path.join(self.directory, name)))
+        segments.sort()
+        self._segments = segments
+        self._starts = [start for start, _ in segments]
+
+    def _index(self, path: str):
+        """(cabecera, registros) del segmento; los registros son (ts, tipo, teselas, offset meta, len meta, len datos)."""
+        size = os.path.getsize(path)
+        cached = self._indexes.get(path)
+        if cached is not None and cached[0] == size:
+            return cached[1], cached[2]
+        records = []
+        with open(path, "rb") as f:
+            raw_header = f.read(_SEGMENT_HEADER.size)
+            if len(raw_header) < _SEGMENT_HEADER.size or raw_header[:8] != _MAGIC:
+                raise ValueError(f"{path}: no es un segmento de historial")
+            header = _SEGMENT_HEADER.unpack(raw_header)[1:]
+            offset = _SEGMENT_HEADER.size
+            while offset + _RECORD_HEADER.size <= size:
+                f.seek(offset)
+                magic, kind, ts, tiles, meta_len, data_len = _RECORD_HEADER.unpack(f.read(_RECORD_HEADER.size))
+                end = offset + _RECORD_HEADER.size + meta_len + data_len
+                if magic != _RECORD_MAGIC or end > size:
+                    break  # Registro a medio escribir
+                records.append((ts, kind, tiles, offset + _RECORD_HEADER.size, meta_len, data_len))
+                offset = end
+        self._indexes[path] = (size, header, records)
+        return header, records
+
+    def _read(self, path: str, offset: int, length: int) -> bytes:
+        with open(path, "rb") as f:
+            f.seek(offset)
+            return f.read(length)
+
+    def timeline(self, start: Optional[float] = None, end: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Registros (ts, tipo, teselas y metadatos) entre start y end."""
+        entries = []
+        for seg_start, path in self._segments:
+            _, records = self._index(path)
+            for ts, kind, tiles, meta_offset, meta_len, _ in records:
+                if (start is not None and ts < start) or (end is not None and ts > end):
+                    continue
+                meta = json.loads(self._read(path, meta_offset, meta_len)) if meta_len else {}
+                entries.append({'ts': ts, 'keyframe': kind == KIND_KEYFRAME, 'tiles': tiles, 'metadata': meta})
+        return entries
+
+    def frame_at(self, timestamp: float) -> Tuple[Optional[np.ndarray], Optional[float], Dict[str, Any]]:
+        """
+        Reconstruye el frame visible en ``timestamp`` (el último registrado en o antes de ese instante).
+
+        Returns:
+            (frame, timestamp del registro, metadatos), o (None, None, {}) si no hay historial
+            para ese instante (anterior al primer segmento conservado).
+        """
+        position = bisect.bisect_right(self._starts, timestamp) - 1
+        if position < 0:
+            return None, None, {}
+        path = self._segments[position][1]
+        try:
+            (width, height, channels, tile), records = self._index(path)
+        except (OSError, ValueError) as e:
+            logger.error(f"No se pudo leer el segmento {path}: {e}")
+            return None, None, {}
+        target = bisect.bisect_right([r[0] for r in records], timestamp) - 1
+        if target < 0:
+            return None, None, {}
+        # Último keyframe en o antes del registro pedido
+        key = max(i for i in range(target + 1) if records[i][1] == KIND_KEYFRAME)
+        shape = (height, width, channels) if channels > 1 else (height, width)
+        cache = self._cache
+        if cache is not None and cache[0] == path and key <= cache[1] <= target:
+            first, frame = cache[1] + 1, cache[2].copy()
+        else:
+            first, frame = key, None
+        grid = _TileGrid(height, width, tile)
+        with open(path, "rb") as f:
+            for index in range(first, target + 1):
+                ts, kind, tiles, meta_offset, meta_len, data_len = records[index]
+                f.seek(meta_offset + meta_len)
+                data = f.read(data_len)
+                if kind == KIND_KEYFRAME:
+                    frame = np.frombuffer(zlib.decompress(data), dtype=np.uint8).reshape(shape).copy()
+                    continue
+                if not tiles:
+                    continue
+                indices = np.frombuffer(data[:4 * tiles], dtype=np.uint32)
+                pixels = zlib.decompress(data[4 * tiles:])
+                cursor = 0
+                for tile_index in indices:
+                    y0, y1, x0, x1 = grid.bounds(tile_index)
+                    tile_shape = (y1 - y0, x1 - x0) + shape[2:]
+                    size = int(np.prod(tile_shape))
+                    frame[y0:y1, x0:x1] = np.frombuffer(pixels, np.uint8, size, cursor).reshape(tile_shape)
+                    cursor += size
+        self._cache = (path, target, frame)
+        ts, _, _, meta_offset, meta_len, _ = records[target]
+        meta = json.loads(self._read(path, meta_offset, meta_len)) if meta_len else {}
+        return frame.copy(), ts, meta
+
+    def summary(self) -> Dict[str, Any]:
+        frames = keyframes = size = 0
+        for _, path in self._segments:
+            _, records = self._index(path)
+            frames += len(records)
+            keyframes += sum(1 for r in records if r[1] == KIND_KEYFRAME)
+            size += os.path.getsize(path)
+        first = self._segments[0][0] if self._segments else None
+        last = None
+        if self._segments:
+            _, records = self._index(self._segments[-1][1])
+            last = records[-1][0] if records else self._segments[-1][0]
+        return {'segments': len(self._segments), 'frames': frames, 'keyframes': keyframes,
+                'bytes': size, 'first_ts': first, 'last_ts': last}
+
+
+def _format_ts(ts: Optional[float]) -> str:
+    return datetime.fromtimestamp(ts).strftime("%Y-%m-%d %H:%M:%S.%f")[:-3] if ts is not None else "-"
+
+
+def main():
+    """Punto de entrada de línea de comandos."""
+    parser = argparse.ArgumentParser(description="Historial de capturas comprimido por deltas")
+    subparsers = parser.add_subparsers(dest="command")
+    info_parser = subparsers.add_parser("info", help="Resumen del historial")
+    info_parser.add_argument("directory", nargs="?", default=HISTORY_DIR)
+    export_parser = subparsers.add_parser("export", help="Reconstruir el frame de un instante")
+    export_parser.add_argument("directory", nargs="?", default=HISTORY_DIR)
+    export_parser.add_argument("--at", required=True, help="Epoch en segundos o 'YYYY-MM-DD HH:MM:SS'")
+    export_parser.add_argument("-o", "--output", default="history_frame.png")
+    timeline_parser = subparsers.add_parser("timeline", help="Registros con sus metadatos")
+    timeline_parser.add_argument("directory", nargs="?", default=HISTORY_DIR)
+    timeline_parser.add_argument("--since", default=None)
+    timeline_parser.add_argument("--until", default=None)
+    args = parser.parse_args()
+
+    if args.command is None:
+        parser.print_help()
+        return 1
+    reader = CaptureHistoryReader(args.directory)
+    if args.command == "info":
+        summary = reader.summary()
+        print(f"{args.directory}: {summary['segments']} segmentos, {summary['frames']} frames "
+              f"({summary['keyframes']} keyframes), {summary['bytes'] / 1e6:.1f} MB")
+        print(f"Desde {_format_ts(summary['first_ts'])} hasta {_format_ts(summary['last_ts'])}")
+        return 0
+    if args.command == "export":
+        frame, ts, meta = reader.frame_at(parse_timestamp(args.at))
+        if frame is None:
+            print("No hay historial para ese instante.", file=sys.stderr)
+            return 1
+        cv2.imwrite(args.output, frame)
+        print(f"Frame de {_format_ts(ts)} ({meta.get('state', '-')}) guardado en {args.output}")
+        return 0
+    since = parse_timestamp(args.since) if args.since else None
+    until = parse_timestamp(args.until) if args.until else None
+    for entry in reader.timeline(since, until):
+        meta = entry['metadata']
+        print(f"{_format_ts(entry['ts'])} {'K' if entry['keyframe'] else 'D'} {entry['tiles']:5d} "
+              f"{meta.get('state', '-'):45} {meta.get('method', '')}")
+    return 0
+
+
+if __name__ == "__main__":
+    if not logging.getLogger().hasHandlers():
+        logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    sys.exit(main())
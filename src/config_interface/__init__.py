@@ -4,7 +4,8 @@ Módulo de inicialización para el paquete de interfaz de configuración.
 Este módulo permite importar las clases principales del paquete de configuración.
 """
 
-from .config_manager import ConfigManager, SequenceBuilder, ActionSequence, ActionExecutor
+from .config_manager import ConfigManager, SequenceBuilder, ActionSequence, ActionExecutor, describe_action
+from .sequence_program import SequenceProgram, ProgramCache, compile_sequence
 from .config_cli import ConfigCLI
 
 __all__ = [
@@ -12,5 +13,9 @@ __all__ = [
     'SequenceBuilder',
     'ActionSequence',
     'ActionExecutor',
+    'describe_action',
+    'SequenceProgram',
+    'ProgramCache',
+    'compile_sequence',
     'ConfigCLI'
 ]
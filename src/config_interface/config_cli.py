@@ -15,7 +15,9 @@ from typing import List, Dict, Any, Optional
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 # Importar el gestor de configuraciones
-from config_interface.config_manager import ConfigManager, SequenceBuilder, ActionSequence
+from config_interface.config_manager import (ConfigManager, SequenceBuilder, ActionSequence, ACTION_LABELS,
+                                             describe_action, action_depths)
+from config_interface.sequence_program import compile_sequence
 
 # Configuración de logging
 logging.basicConfig(
@@ -24,6 +26,102 @@ logging.basicConfig(
 )
 logger = logging.getLogger('config_interface.cli')
 
+# Acciones básicas (menú 1-4) y de estado/control (5-11); las usa también el modo CLI del asistente
+BASIC_ACTION_CHOICES = ('button_press', 'wait_for_image', 'move_cursor', 'wait')
+STATE_ACTION_CHOICES = ('wait_for_state', 'if_state', 'else', 'end_if', 'loop', 'end_loop', 'press_until_state')
+ACTION_CHOICES = BASIC_ACTION_CHOICES + STATE_ACTION_CHOICES
+
+
+def print_action_menu() -> str:
+    """
+    Muestra el menú de tipos de acción.
+    
+    Returns:
+        Número de la opción "Guardar y salir"
+    """
+    print("\nTipos de acciones disponibles:")
+    for i, action_type in enumerate(ACTION_CHOICES, 1):
+        print(f"{i}. {ACTION_LABELS[action_type]}")
+    save_choice = str(len(ACTION_CHOICES) + 1)
+    print(f"{save_choice}. Guardar y salir")
+    return save_choice
+
+
+def print_actions(actions: List[Dict[str, Any]]) -> None:
+    """
+    Muestra las acciones de una secuencia, sangrando los bloques if_state/loop.
+    """
+    for i, (action, depth) in enumerate(zip(actions, action_depths(actions)), 1):
+        details = describe_action(action)
+        label = ACTION_LABELS.get(action['type'], action['type'])
+        print(f"{i}. {'    ' * depth}{label}{': ' + details if details else ''}")
+
+
+def _input_states(prompt: str, required: bool = True) -> List[str]:
+    states = [state.strip() for state in input(prompt).split(",") if state.strip()]
+    if required and not states:
+        raise ValueError("Indica al menos un estado")
+    return states
+
+
+def _input_number(prompt: str, default, cast=float):
+    value = input(prompt)
+    try:
+        return cast(value) if value else default
+    except ValueError:
+        print(f"Valor no válido, usando valor por defecto ({default})")
+        return default
+
+
+def add_state_action(sequence_builder: SequenceBuilder, action_type: str) -> None:
+    """
+    Añade interactivamente una acción de estado o de control (ver STATE_ACTION_CHOICES).
+    
+    Args:
+        sequence_builder: Constructor con la secuencia activa
+        action_type: Tipo de acción a añadir
+    """
+    if action_type == 'wait_for_state':
+        states = _input_states("Estados aceptados (separados por comas): ")
+        timeout = _input_number("Tiempo máximo de espera (segundos, por defecto 10): ", 10.0)
+        keep_going = input("¿Continuar si no se alcanza? (s/n, por defecto n): ").strip().lower() == 's'
+        sequence_builder.add_wait_for_state(states, timeout, 'continue' if keep_going else 'fail')
+        print(f"Acción añadida: Esperar estado {', '.join(states)} (timeout: {timeout}s)")
+    
+    elif action_type == 'if_state':
+        states = _input_states("Estados (separados por comas): ")
+        timeout = _input_number("Tiempo de espera antes de decidir (segundos, por defecto 0): ", 0.0)
+        sequence_builder.add_if_state(states, timeout)
+        print(f"Acción añadida: Si estado {', '.join(states)} (cierra el bloque con 'Fin si')")
+    
+    elif action_type == 'else':
+        sequence_builder.add_else()
+        print("Acción añadida: Si no")
+    
+    elif action_type == 'end_if':
+        sequence_builder.add_end_if()
+        print("Acción añadida: Fin si")
+    
+    elif action_type == 'loop':
+        count = _input_number("Número máximo de repeticiones (por defecto 3): ", 3, int)
+        until_states = _input_states("Terminar antes si se llega a los estados (opcional, separados por comas): ",
+                                     required=False)
+        sequence_builder.add_loop(count, until_states or None)
+        print(f"Acción añadida: Repetir {count} veces (cierra el bloque con 'Fin repetir')")
+    
+    elif action_type == 'end_loop':
+        sequence_builder.add_end_loop()
+        print("Acción añadida: Fin repetir")
+    
+    elif action_type == 'press_until_state':
+        button = input("Botón a pulsar: ").upper()
+        states = _input_states("Estados objetivo (separados por comas): ")
+        interval = _input_number("Espera máxima tras cada pulsación (segundos, por defecto 1): ", 1.0)
+        max_presses = _input_number("Pulsaciones como máximo (por defecto 10): ", 10, int)
+        sequence_builder.add_press_until_state(button, states, interval, max_presses)
+        print(f"Acción añadida: Pulsar {button} hasta {', '.join(states)} (máx. {max_presses})")
+
+
 class ConfigCLI:
     """
     Interfaz de línea de comandos para la configuración de acciones.
@@ -123,17 +221,22 @@ class ConfigCLI:
         print(f"Creando secuencia '{name}'")
         print("Añade acciones a la secuencia. Escribe 'fin' para terminar.")
         
+        self._add_actions_loop()
+        
+        # Guardar secuencia
+        self.sequence_builder.save_current_sequence()
+        print(f"Secuencia '{name}' guardada correctamente.")
+    
+    def _add_actions_loop(self):
+        """
+        Pide acciones hasta que el usuario elige guardar (o escribe 'fin').
+        """
         while True:
-            print("\nTipos de acciones disponibles:")
-            print("1. Pulsar botón")
-            print("2. Esperar imagen")
-            print("3. Mover cursor")
-            print("4. Esperar tiempo")
-            print("5. Guardar y salir")
+            save_choice = print_action_menu()
             
-            choice = input("\nSelecciona una acción (1-5): ")
+            choice = input(f"\nSelecciona una acción (1-{save_choice}): ")
             
-            if choice == '5' or choice.lower() == 'fin':
+            if choice == save_choice or choice.lower() == 'fin':
                 break
             
             try:
@@ -145,14 +248,18 @@ class ConfigCLI:
                     self._add_move_cursor()
                 elif choice == '4':
                     self._add_wait()
+                elif choice.isdigit() and 1 <= int(choice) <= len(ACTION_CHOICES):
+                    add_state_action(self.sequence_builder, ACTION_CHOICES[int(choice) - 1])
                 else:
                     print("Opción no válida.")
             except Exception as e:
                 print(f"Error: {str(e)}")
         
-        # Guardar secuencia
-        self.sequence_builder.save_current_sequence()
-        print(f"Secuencia '{name}' guardada correctamente.")
+        # Avisar de bloques sin cerrar o acciones no válidas (se guarda igualmente)
+        try:
+            compile_sequence(self.sequence_builder.current_sequence)
+        except ValueError as e:
+            print(f"Aviso: la secuencia no se podrá ejecutar: {e}")
     
     def _add_button_press(self):
         """
@@ -260,24 +367,7 @@ class ConfigCLI:
         print(f"Descripción: {sequence.description}")
         print("\nAcciones actuales:")
         
-        for i, action in enumerate(sequence.actions, 1):
-            action_type = action['type']
-            params = action['params']
-            
-            if action_type == 'button_press':
-                print(f"{i}. Pulsar botón {params['button']} durante {params.get('duration', 0.1)} segundos")
-            elif action_type == 'wait_for_image':
-                print(f"{i}. Esperar imagen {params['image_name']} (timeout: {params.get('timeout', 10.0)}s)")
-            elif action_type == 'move_cursor':
-                target_type = params['target_type']
-                if target_type == 'image':
-                    print(f"{i}. Mover cursor a imagen {params['image_name']}")
-                elif target_type == 'coordinates':
-                    print(f"{i}. Mover cursor a coordenadas ({params['x']}, {params['y']})")
-                elif target_type == 'element':
-                    print(f"{i}. Mover cursor a elemento {params['element_id']}")
-            elif action_type == 'wait':
-                print(f"{i}. Esperar {params['seconds']} segundos")
+        print_actions(sequence.actions)
         
         print("\nOpciones:")
         print("1. Mantener acciones actuales y añadir nuevas")
@@ -295,32 +385,7 @@ class ConfigCLI:
         # Añadir nuevas acciones
         print("\nAñade nuevas acciones a la secuencia. Escribe 'fin' para terminar.")
         
-        while True:
-            print("\nTipos de acciones disponibles:")
-            print("1. Pulsar botón")
-            print("2. Esperar imagen")
-            print("3. Mover cursor")
-            print("4. Esperar tiempo")
-            print("5. Guardar y salir")
-            
-            choice = input("\nSelecciona una acción (1-5): ")
-            
-            if choice == '5' or choice.lower() == 'fin':
-                break
-            
-            try:
-                if choice == '1':
-                    self._add_button_press()
-                elif choice == '2':
-                    self._add_wait_for_image()
-                elif choice == '3':
-                    self._add_move_cursor()
-                elif choice == '4':
-                    self._add_wait()
-                else:
-                    print("Opción no válida.")
-            except Exception as e:
-                print(f"Error: {str(e)}")
+        self._add_actions_loop()
         
         # Guardar secuencia
         self.sequence_builder.save_current_sequence()
@@ -360,24 +425,7 @@ class ConfigCLI:
         print(f"Descripción: {sequence.description}")
         print("\nAcciones:")
         
-        for i, action in enumerate(sequence.actions, 1):
-            action_type = action['type']
-            params = action['params']
-            
-            if action_type == 'button_press':
-                print(f"{i}. Pulsar botón {params['button']} durante {params.get('duration', 0.1)} segundos")
-            elif action_type == 'wait_for_image':
-                print(f"{i}. Esperar imagen {params['image_name']} (timeout: {params.get('timeout', 10.0)}s)")
-            elif action_type == 'move_cursor':
-                target_type = params['target_type']
-                if target_type == 'image':
-                    print(f"{i}. Mover cursor a imagen {params['image_name']}")
-                elif target_type == 'coordinates':
-                    print(f"{i}. Mover cursor a coordenadas ({params['x']}, {params['y']})")
-                elif target_type == 'element':
-                    print(f"{i}. Mover cursor a elemento {params['element_id']}")
-            elif action_type == 'wait':
-                print(f"{i}. Esperar {params['seconds']} segundos")
+        print_actions(sequence.actions)
     
     def _manage_settings(self, args):
         """
@@ -17,7 +17,9 @@ from typing import Dict, List, Any, Optional, Tuple
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 # Importar el gestor de configuraciones
-from config_interface.config_manager import ConfigManager, SequenceBuilder, ActionSequence
+from config_interface.config_manager import (ConfigManager, SequenceBuilder, ActionSequence, ACTION_TYPES,
+                                             describe_action, action_depths)
+from config_interface.sequence_program import compile_sequence
 
 # Configuración de logging
 logging.basicConfig(
@@ -163,27 +165,10 @@ class ConfigGUI:
         if not self.current_sequence:
             return
         
-        for i, action in enumerate(self.current_sequence.actions):
-            action_type = action['type']
-            params = action['params']
-            
-            details = ""
-            if action_type == 'button_press':
-                details = f"Botón: {params['button']}, Duración: {params.get('duration', 0.1)}s"
-            elif action_type == 'wait_for_image':
-                details = f"Imagen: {params['image_name']}, Timeout: {params.get('timeout', 10.0)}s"
-            elif action_type == 'move_cursor':
-                target_type = params['target_type']
-                if target_type == 'image':
-                    details = f"A imagen: {params['image_name']}"
-                elif target_type == 'coordinates':
-                    details = f"A coordenadas: ({params['x']}, {params['y']})"
-                elif target_type == 'element':
-                    details = f"A elemento: {params['element_id']}"
-            elif action_type == 'wait':
-                details = f"Tiempo: {params['seconds']}s"
-            
-            self.actions_tree.insert("", tk.END, values=(action_type, details))
+        actions = self.current_sequence.actions
+        for action, depth in zip(actions, action_depths(actions)):
+            # Sangrar el tipo según el bloque (if_state/loop) en el que está la acción
+            self.actions_tree.insert("", tk.END, values=("    " * depth + action['type'], describe_action(action)))
     
     def _new_sequence(self):
         """
@@ -377,6 +362,12 @@ class ConfigGUI:
         if not self.current_sequence:
             return
         
+        # Avisar de acciones no válidas o bloques sin cerrar (se guarda igualmente para seguir editando)
+        try:
+            compile_sequence(self.current_sequence)
+        except ValueError as e:
+            messagebox.showwarning("Secuencia incompleta", f"La secuencia no se podrá ejecutar:\n{e}")
+        
         self.sequence_builder.current_sequence = self.current_sequence
         self.sequence_builder.save_current_sequence()
         self._update_sequence_list()
@@ -518,7 +509,7 @@ class ActionDialog:
             self.type_var.set(action_type)
         
         type_combo = ttk.Combobox(self.top, textvariable=self.type_var, state="readonly")
-        type_combo["values"] = ("button_press", "wait_for_image", "move_cursor", "wait")
+        type_combo["values"] = ACTION_TYPES
         type_combo.grid(row=0, column=1, padx=5, pady=5)
         type_combo.bind("<<ComboboxSelected>>", self._on_type_change)
         
@@ -563,6 +554,13 @@ class ActionDialog:
             self._create_move_cursor_params()
         elif action_type == "wait":
             self._create_wait_params()
+        elif action_type in ("wait_for_state", "if_state"):
+            self._create_state_params(action_type)
+        elif action_type == "loop":
+            self._create_loop_params()
+        elif action_type == "press_until_state":
+            self._create_press_until_state_params()
+        # else, end_if y end_loop no tienen parámetros
     
     def _create_button_press_params(self):
         """
@@ -698,6 +696,80 @@ class ActionDialog:
         
         ttk.Entry(self.params_frame, textvariable=self.wait_seconds_var, width=10).grid(row=0, column=1, padx=5, pady=5, sticky=tk.W)
     
+    def _create_states_entry(self, row, key="states", label="Estados:"):
+        """
+        Crea un campo de estados separados por comas y devuelve su variable.
+        """
+        ttk.Label(self.params_frame, text=label).grid(row=row, column=0, sticky=tk.W, padx=5, pady=5)
+        
+        states_var = tk.StringVar()
+        states = self.params.get(key)
+        if states:
+            states_var.set(states if isinstance(states, str) else ", ".join(states))
+        
+        ttk.Entry(self.params_frame, textvariable=states_var, width=30).grid(row=row, column=1, padx=5, pady=5)
+        return states_var
+    
+    def _create_state_params(self, action_type):
+        """
+        Crea los widgets para los parámetros de wait_for_state e if_state.
+        """
+        self.states_var = self._create_states_entry(0)
+        
+        ttk.Label(self.params_frame, text="Timeout (s):").grid(row=1, column=0, sticky=tk.W, padx=5, pady=5)
+        
+        self.state_timeout_var = tk.StringVar()
+        default_timeout = "10.0" if action_type == "wait_for_state" else "0.0"
+        self.state_timeout_var.set(str(self.params.get('timeout', default_timeout)))
+        
+        ttk.Entry(self.params_frame, textvariable=self.state_timeout_var, width=10).grid(row=1, column=1, padx=5, pady=5, sticky=tk.W)
+        
+        if action_type == "wait_for_state":
+            self.continue_on_timeout_var = tk.BooleanVar(value=self.params.get('on_timeout') == 'continue')
+            ttk.Checkbutton(self.params_frame, text="Continuar si no se alcanza",
+                            variable=self.continue_on_timeout_var).grid(row=2, column=0, columnspan=2, sticky=tk.W, padx=5, pady=5)
+    
+    def _create_loop_params(self):
+        """
+        Crea los widgets para los parámetros de un bucle.
+        """
+        ttk.Label(self.params_frame, text="Veces (máx.):").grid(row=0, column=0, sticky=tk.W, padx=5, pady=5)
+        
+        self.loop_count_var = tk.StringVar()
+        self.loop_count_var.set(str(self.params.get('count', 3)))
+        
+        ttk.Entry(self.params_frame, textvariable=self.loop_count_var, width=10).grid(row=0, column=1, padx=5, pady=5, sticky=tk.W)
+        
+        self.until_states_var = self._create_states_entry(1, 'until_states', "Hasta estados (opcional):")
+    
+    def _create_press_until_state_params(self):
+        """
+        Crea los widgets para los parámetros de pulsar hasta un estado.
+        """
+        self._create_button_press_params()
+        self.states_var = self._create_states_entry(2)
+        
+        ttk.Label(self.params_frame, text="Intervalo (s):").grid(row=3, column=0, sticky=tk.W, padx=5, pady=5)
+        
+        self.interval_var = tk.StringVar()
+        self.interval_var.set(str(self.params.get('interval', 1.0)))
+        
+        ttk.Entry(self.params_frame, textvariable=self.interval_var, width=10).grid(row=3, column=1, padx=5, pady=5, sticky=tk.W)
+        
+        ttk.Label(self.params_frame, text="Pulsaciones (máx.):").grid(row=4, column=0, sticky=tk.W, padx=5, pady=5)
+        
+        self.max_presses_var = tk.StringVar()
+        self.max_presses_var.set(str(self.params.get('max_presses', 10)))
+        
+        ttk.Entry(self.params_frame, textvariable=self.max_presses_var, width=10).grid(row=4, column=1, padx=5, pady=5, sticky=tk.W)
+    
+    @staticmethod
+    def _parse_states(text):
+        """
+        Convierte un texto de estados separados por comas en una lista.
+        """
+        return [state.strip() for state in text.split(",") if state.strip()]
+    
     def _browse_image(self):
         """
         Abre un diálogo para seleccionar una imagen.
@@ -779,6 +851,36 @@ class ActionDialog:
             
             elif action_type == "wait":
                 params['seconds'] = float(self.wait_seconds_var.get())
+            
+            elif action_type in ("wait_for_state", "if_state"):
+                states = self._parse_states(self.states_var.get())
+                if not states:
+                    messagebox.showerror("Error", "Especifica al menos un estado")
+                    return
+                
+                params['states'] = states
+                params['timeout'] = float(self.state_timeout_var.get())
+                if action_type == "wait_for_state":
+                    params['on_timeout'] = 'continue' if self.continue_on_timeout_var.get() else 'fail'
+            
+            elif action_type == "loop":
+                params['count'] = int(self.loop_count_var.get())
+                until_states = self._parse_states(self.until_states_var.get())
+                if until_states:
+                    params['until_states'] = until_states
+            
+            elif action_type == "press_until_state":
+                button = self.button_var.get()
+                states = self._parse_states(self.states_var.get())
+                if not button or not states:
+                    messagebox.showerror("Error", "Selecciona un botón y al menos un estado")
+                    return
+                
+                params['button'] = button
+                params['duration'] = float(self.duration_var.get())
+                params['states'] = states
+                params['interval'] = float(self.interval_var.get())
+                params['max_presses'] = int(self.max_presses_var.get())
         
         except ValueError:
             messagebox.showerror("Error", "Valor numérico no válido")
@@ -19,6 +19,91 @@ logging.basicConfig(
 )
 logger = logging.getLogger('config_interface')
 
+# Tipos de acción de las secuencias y su nombre en los editores (GUI, CLI y asistente)
+ACTION_LABELS = {
+    'button_press': 'Pulsar botón',
+    'wait_for_image': 'Esperar imagen',
+    'move_cursor': 'Mover cursor',
+    'wait': 'Esperar tiempo',
+    'wait_for_state': 'Esperar estado',
+    'if_state': 'Si estado',
+    'else': 'Si no',
+    'end_if': 'Fin si',
+    'loop': 'Repetir',
+    'end_loop': 'Fin repetir',
+    'press_until_state': 'Pulsar hasta estado',
+}
+ACTION_TYPES = tuple(ACTION_LABELS)
+# Acciones que abren y cierran bloques (para sangrar las listas de acciones)
+BLOCK_OPENERS = ('if_state', 'loop')
+BLOCK_CLOSERS = ('end_if', 'end_loop')
+
+
+def _format_states(states: Any) -> str:
+    return states if isinstance(states, str) else ", ".join(str(s) for s in states or [])
+
+
+def describe_action(action: Dict[str, Any]) -> str:
+    """
+    Resume los parámetros de una acción para mostrarla en los editores.
+    
+    Args:
+        action: Acción de una secuencia ({'type', 'params'})
+        
+    Returns:
+        Texto con los detalles (vacío para else/end_if/end_loop)
+    """
+    action_type = action['type']
+    params = action.get('params') or {}
+    
+    if action_type == 'button_press':
+        return f"Botón: {params['button']}, Duración: {params.get('duration', 0.1)}s"
+    elif action_type == 'wait_for_image':
+        return f"Imagen: {params['image_name']}, Timeout: {params.get('timeout', 10.0)}s"
+    elif action_type == 'move_cursor':
+        target_type = params['target_type']
+        if target_type == 'image':
+            return f"A imagen: {params['image_name']}"
+        elif target_type == 'coordinates':
+            return f"A coordenadas: ({params['x']}, {params['y']})"
+        elif target_type == 'element':
+            return f"A elemento: {params['element_id']}"
+    elif action_type == 'wait':
+        return f"Tiempo: {params['seconds']}s"
+    elif action_type == 'wait_for_state':
+        details = f"Estados: {_format_states(params.get('states'))}, Timeout: {params.get('timeout', 10.0)}s"
+        if params.get('on_timeout') == 'continue':
+            details += " (continuar si no llega)"
+        return details
+    elif action_type == 'if_state':
+        return f"Estados: {_format_states(params.get('states'))}, Timeout: {params.get('timeout', 0.0)}s"
+    elif action_type == 'loop':
+        details = f"Veces: {params.get('count')}"
+        if params.get('until_states'):
+            details += f", Hasta: {_format_states(params['until_states'])}"
+        return details
+    elif action_type == 'press_until_state':
+        return (f"Botón: {params.get('button')}, Estados: {_format_states(params.get('states'))}, "
+                f"Cada: {params.get('interval', 1.0)}s, Máx.: {params.get('max_presses', 10)}")
+    return ""
+
+
+def action_depths(actions: List[Dict[str, Any]]) -> List[int]:
+    """
+    Nivel de anidamiento de cada acción (if_state/loop abren un nivel; else se muestra al nivel del if).
+    """
+    depths = []
+    depth = 0
+    for action in actions:
+        action_type = action.get('type')
+        if action_type in BLOCK_CLOSERS:
+            depth = max(0, depth - 1)
+        depths.append(max(0, depth - 1) if action_type == 'else' else depth)
+        if action_type in BLOCK_OPENERS:
+            depth += 1
+    return depths
+
+
 class ActionSequence:
     """
     Clase que representa una secuencia de acciones para un escenario específico.
@@ -107,6 +192,9 @@ class ConfigManager:
         # Cargar configuración global
         self.settings = self._load_settings()
         
+        # Programas compilados de las secuencias (se recompilan si cambia el archivo)
+        self._program_cache = None
+        
     def _load_settings(self) -> Dict[str, Any]:
         """
         Carga la configuración global desde el archivo settings.yaml.
@@ -211,6 +299,30 @@ class ConfigManager:
         
         return ActionSequence.from_dict(data)
     
+    def load_program(self, name: str):
+        """
+        Obtiene la secuencia compilada (SequenceProgram), usando la caché si el archivo no ha cambiado.
+        
+        Args:
+            name: Nombre de la secuencia
+            
+        Returns:
+            Programa compilado o None si la secuencia no existe
+            
+        Raises:
+            ValueError: Si la secuencia contiene acciones no válidas
+        """
+        from .sequence_program import ProgramCache
+        
+        file_path = self.get_sequence_path(name)
+        if not os.path.exists(file_path):
+            logger.warning(f"No se encontró la secuencia '{name}'")
+            return None
+        
+        if self._program_cache is None:
+            self._program_cache = ProgramCache()
+        return self._program_cache.get(file_path)
+    
     def list_sequences(self) -> List[str]:
         """
         Lista todas las secuencias disponibles.
@@ -337,6 +449,96 @@ class SequenceBuilder:
         
         self.current_sequence.add_action('wait', seconds=seconds)
     
+    def add_wait_for_state(self, states: Union[str, List[str]], timeout: float = 10.0,
+                           on_timeout: str = 'fail') -> None:
+        """
+        Añade una espera hasta que la pantalla esté en alguno de los estados indicados.
+        
+        Args:
+            states: Estado o lista de estados aceptados
+            timeout: Tiempo máximo de espera en segundos
+            on_timeout: 'fail' (la secuencia falla) o 'continue' si no se alcanza
+        """
+        if self.current_sequence is None:
+            raise ValueError("No hay una secuencia activa")
+        
+        self.current_sequence.add_action('wait_for_state', states=states, timeout=timeout, on_timeout=on_timeout)
+    
+    def add_if_state(self, states: Union[str, List[str]], timeout: float = 0.0) -> None:
+        """
+        Abre un bloque que sólo se ejecuta si la pantalla está en alguno de los estados.
+        
+        Args:
+            states: Estado o lista de estados
+            timeout: Tiempo que se espera al estado antes de decidir (0 = un solo reconocimiento)
+        """
+        if self.current_sequence is None:
+            raise ValueError("No hay una secuencia activa")
+        
+        self.current_sequence.add_action('if_state', states=states, timeout=timeout)
+    
+    def add_else(self) -> None:
+        """
+        Inicia la rama alternativa del bloque if_state abierto.
+        """
+        if self.current_sequence is None:
+            raise ValueError("No hay una secuencia activa")
+        
+        self.current_sequence.add_action('else')
+    
+    def add_end_if(self) -> None:
+        """
+        Cierra el bloque if_state abierto.
+        """
+        if self.current_sequence is None:
+            raise ValueError("No hay una secuencia activa")
+        
+        self.current_sequence.add_action('end_if')
+    
+    def add_loop(self, count: int, until_states: Optional[Union[str, List[str]]] = None) -> None:
+        """
+        Abre un bucle acotado.
+        
+        Args:
+            count: Número máximo de iteraciones
+            until_states: Si se indica, el bucle termina antes cuando al final de una
+                iteración la pantalla está en alguno de estos estados
+        """
+        if self.current_sequence is None:
+            raise ValueError("No hay una secuencia activa")
+        
+        params = {'count': count}
+        if until_states:
+            params['until_states'] = until_states
+        self.current_sequence.add_action('loop', **params)
+    
+    def add_end_loop(self) -> None:
+        """
+        Cierra el bucle abierto.
+        """
+        if self.current_sequence is None:
+            raise ValueError("No hay una secuencia activa")
+        
+        self.current_sequence.add_action('end_loop')
+    
+    def add_press_until_state(self, button: str, states: Union[str, List[str]], interval: float = 1.0,
+                              max_presses: int = 10, duration: float = 0.1) -> None:
+        """
+        Añade una acción que pulsa un botón hasta que la pantalla llega a alguno de los estados.
+        
+        Args:
+            button: Nombre del botón (A, B, X, Y, etc.)
+            states: Estado o lista de estados objetivo
+            interval: Tiempo máximo que se espera al estado tras cada pulsación
+            max_presses: Pulsaciones como máximo antes de dar la acción por fallida
+            duration: Duración de cada pulsación en segundos
+        """
+        if self.current_sequence is None:
+            raise ValueError("No hay una secuencia activa")
+        
+        self.current_sequence.add_action('press_until_state', button=button, states=states, interval=interval,
+                                         max_presses=max_presses, duration=duration)
+    
     def save_current_sequence(self) -> None:
         """
         Guarda la secuencia actual.
@@ -386,8 +588,9 @@ class ActionExecutor:
             
             # Cargar screen_recognizer
             try:
-                from src.screen_recognizer import ScreenRecognizer
-                self.screen_recognizer = ScreenRecognizer()
+                # Usa el servicio de reconocimiento si EFOOTBALL_RECOGNIZER_ADDR está definida
+                from src.recognizer_service import create_recognizer
+                self.screen_recognizer = create_recognizer()
             except ImportError:
                 logger.error("No se pudo cargar el módulo screen_recognizer")
                 raise
@@ -402,50 +605,46 @@ class ActionExecutor:
         Returns:
             True si la ejecución fue exitosa, False en caso contrario
         """
+        from .sequence_program import run_program
+        
         self._load_dependencies()
         
-        sequence = self.config_manager.load_sequence(sequence_name)
-        if sequence is None:
+        try:
+            program = self.config_manager.load_program(sequence_name)
+        except ValueError as e:
+            logger.error(f"Secuencia no válida: {e}")
+            return False
+        if program is None:
             logger.error(f"No se encontró la secuencia '{sequence_name}'")
             return False
         
-        logger.info(f"Ejecutando secuencia '{sequence_name}'")
+        logger.info(f"Ejecutando secuencia '{sequence_name}' ({len(program.opcodes)} operaciones, "
+                    f"{program.duration_s:.2f} s sin contar esperas de pantalla)")
         
-        for i, action in enumerate(sequence.actions):
-            action_type = action['type']
-            params = action['params']
-            
-            logger.info(f"Ejecutando acción {i+1}/{len(sequence.actions)}: {action_type}")
-            
-            try:
-                if action_type == 'button_press':
-                    self._execute_button_press(params)
-                elif action_type == 'wait_for_image':
-                    self._execute_wait_for_image(params)
-                elif action_type == 'move_cursor':
-                    self._execute_move_cursor(params)
-                elif action_type == 'wait':
-                    self._execute_wait(params)
-                else:
-                    logger.warning(f"Tipo de acción desconocido: {action_type}")
-            except Exception as e:
-                logger.error(f"Error al ejecutar acción {action_type}: {str(e)}")
-                return False
+        try:
+            run_program(program, self.gamepad_controller, self._execute_sync_action, self.screen_recognizer)
+        except Exception as e:
+            logger.error(f"Error al ejecutar la secuencia '{sequence_name}': {str(e)}")
+            return False
         
         logger.info(f"Secuencia '{sequence_name}' ejecutada correctamente")
         return True
     
-    def _execute_button_press(self, params: Dict[str, Any]) -> None:
+    def _execute_sync_action(self, opcode: int, operand: Any) -> None:
         """
-        Ejecuta una acción de pulsación de botón.
+        Ejecuta una acción de sincronización de un programa compilado.
         
         Args:
-            params: Parámetros de la acción
+            opcode: OP_WAIT_IMAGE u OP_MOVE_CURSOR
+            operand: Operando compilado de la acción
         """
-        button = params['button']
-        duration = params.get('duration', 0.1)
+        from .sequence_program import OP_WAIT_IMAGE, OP_MOVE_CURSOR
         
-        self.gamepad_controller.press_button(button, duration)
+        if opcode == OP_WAIT_IMAGE:
+            image_name, timeout = operand
+            self._execute_wait_for_image({'image_name': image_name, 'timeout': timeout})
+        elif opcode == OP_MOVE_CURSOR:
+            self._execute_move_cursor(operand)
     
     def _execute_wait_for_image(self, params: Dict[str, Any]) -> None:
         """
@@ -478,17 +677,6 @@ class ActionExecutor:
         elif target_type == 'element':
             element_id = params['element_id']
             self.screen_recognizer.move_to_element(element_id)
-    
-    def _execute_wait(self, params: Dict[str, Any]) -> None:
-        """
-        Ejecuta una acción de espera.
-        
-        Args:
-            params: Parámetros de la acción
-        """
-        import time
-        seconds = params['seconds']
-        time.sleep(seconds)
 
 
 # Ejemplo de uso
@@ -0,0 +1,420 @@
+"""
+Compilación de secuencias de acciones en programas de entradas temporizadas.
+
+ActionExecutor interpretaba cada secuencia en tiempo de ejecución: releía el
+JSON, comparaba el tipo de cada acción como cadena y hacía una llamada
+bloqueante por acción, con lo que las esperas y pulsaciones acumulaban
+retraso. compile_sequence valida la secuencia una sola vez y la convierte en
+un SequenceProgram inmutable:
+
+    - opcodes: tupla de enteros (OP_PRESS, OP_RELEASE, OP_TRIGGER, ...),
+    - operands: el botón ya resuelto al valor de GamepadButton, el
+      (gatillo, valor), los parámetros de las acciones de sincronización o
+      el índice de destino de los saltos,
+    - offsets: instante de cada operación en segundos desde el último punto
+      de sincronización.
+
+Las esperas ('wait') no generan operaciones, sólo desplazan los offsets.
+Las acciones que dependen de la pantalla (wait_for_image, move_cursor,
+wait_for_state, press_until_state) y las de control (if_state/else/end_if,
+loop/end_loop) son puntos de sincronización: run_program espera a que
+terminen las entradas anteriores, las ejecuta y vuelve a tomar el reloj.
+
+Las acciones de estado usan el reconocedor (ScreenRecognizer o el cliente
+del servicio) con wait_for_state, que vuelve en cuanto la pantalla está en
+alguno de los estados pedidos: la secuencia avanza al ritmo del juego en
+lugar de esperar tiempos fijos pensados para el peor caso.
+
+    wait_for_state     {states, timeout=10, on_timeout='fail'|'continue'}
+    if_state           {states, timeout=0}   ... [else] ... end_if
+    loop               {count, until_states=None}   ... end_loop
+    press_until_state  {button, states, interval=1.0, max_presses=10, duration=0.1}
+
+ProgramCache guarda los programas por ruta y los recompila sólo cuando
+cambia la fecha de modificación del archivo.
+"""
+
+import json
+import os
+import threading
+import time
+from collections import namedtuple
+from types import MappingProxyType
+from typing import Any, Callable, Dict, List, Optional
+
+from async_runtime import wait_future, workflow_sleep
+
+from .config_manager import ActionSequence
+
+OP_PRESS = 0
+OP_RELEASE = 1
+OP_TRIGGER = 2
+OP_WAIT_IMAGE = 3
+OP_MOVE_CURSOR = 4
+OP_WAIT_STATE = 5     # (states, timeout, fail_on_timeout)
+OP_BRANCH_STATE = 6   # (states, timeout, destino si no está en el estado)
+OP_JUMP = 7           # destino
+OP_LOOP_INIT = 8      # (contador, iteraciones)
+OP_LOOP_NEXT = 9      # (contador, inicio del cuerpo, until_states o None)
+OP_PRESS_UNTIL = 10   # (botón, states, interval, max_presses, duration)
+OP_SYNC = 11          # Sólo espera a su offset (cierre de un bloque con tiempo pendiente)
+OP_END = 12
+
+OP_NAMES = ('press', 'release', 'trigger', 'wait_for_image', 'move_cursor', 'wait_for_state',
+            'branch_state', 'jump', 'loop_init', 'loop_next', 'press_until_state', 'sync', 'end')
+SYNC_OPS = frozenset((OP_WAIT_IMAGE, OP_MOVE_CURSOR))  # Las que ejecuta el sync_handler de run_program
+STATE_OPS = frozenset((OP_WAIT_STATE, OP_BRANCH_STATE, OP_LOOP_NEXT, OP_PRESS_UNTIL))
+
+MAX_LOOP_COUNT = 1000
+
+# Nombres aceptados en las secuencias (los de settings.yaml) -> valor de GamepadButton.
+# También se aceptan directamente los valores de GamepadButton ('a', 'dpad_up', ...).
+BUTTON_ALIASES = {
+    'A': 'a', 'B': 'b', 'X': 'x', 'Y': 'y',
+    'START': 'start', 'BACK': 'back', 'SELECT': 'back',
+    'DPAD_UP': 'dpad_up', 'DPAD_DOWN': 'dpad_down', 'DPAD_LEFT': 'dpad_left', 'DPAD_RIGHT': 'dpad_right',
+    'LB': 'left_shoulder', 'RB': 'right_shoulder',
+    'LT': 'left_trigger', 'RT': 'right_trigger',
+    'LEFT_THUMB': 'left_thumb', 'RIGHT_THUMB': 'right_thumb', 'L3': 'left_thumb', 'R3': 'right_thumb',
+}
+BUTTON_VALUES = frozenset(BUTTON_ALIASES.values())
+# Los gatillos son ejes (0-255), no botones de GamepadController.button_mapping
+TRIGGER_BUTTONS = {'left_trigger': 'left', 'right_trigger': 'right'}
+TRIGGER_FULL = 255
+
+clock = time.perf_counter  # El mismo reloj que input_scheduler.clock
+
+CURSOR_TARGET_KEYS = {'image': ('image_name',), 'coordinates': ('x', 'y'), 'element': ('element_id',)}
+
+# Programa compilado: nombre, mtime (ns) del archivo de origen (None si no viene de
+# archivo), tuplas paralelas opcodes/operands/offsets (la última operación es OP_END),
+# duración en segundos de las pulsaciones y esperas fijas tal como aparecen en la
+# secuencia (cada bucle una vez, sin contar las acciones de sincronización), número
+# de contadores de bucle y si necesita un reconocedor.
+SequenceProgram = namedtuple('SequenceProgram',
+                             'name mtime_ns opcodes operands offsets duration_s loop_slots needs_recognizer')
+
+
+def resolve_button(name: Any) -> str:
+    """
+    Resuelve el nombre de un botón de una secuencia al valor de GamepadButton.
+
+    Raises:
+        ValueError: Si el botón no existe.
+    """
+    if isinstance(name, str):
+        if name in BUTTON_VALUES:
+            return name
+        value = BUTTON_ALIASES.get(name.strip().upper())
+        if value is not None:
+            return value
+    raise ValueError(f"Botón no soportado: {name!r}")
+
+
+def _number(params: Dict[str, Any], key: str, default: Optional[float] = None, positive: bool = False) -> float:
+    value = params.get(key, default)
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise ValueError(f"'{key}' debe ser un número (recibido {value!r})")
+    if value < 0 or (positive and value == 0):
+        raise ValueError(f"'{key}' debe ser {'mayor que' if positive else 'mayor o igual que'} 0 (recibido {value})")
+    return float(value)
+
+
+def _count(params: Dict[str, Any], key: str, default: Optional[int] = None, maximum: Optional[int] = None) -> int:
+    value = params.get(key, default)
+    if isinstance(value, bool) or not isinstance(value, int) or value < 1:
+        raise ValueError(f"'{key}' debe ser un entero mayor que 0 (recibido {value!r})")
+    if maximum is not None and value > maximum:
+        raise ValueError(f"'{key}' no puede ser mayor que {maximum} (recibido {value})")
+    return value
+
+
+def _states(params: Dict[str, Any], key: str = 'states', required: bool = True) -> Optional[tuple]:
+    value = params.get(key)
+    if value is None and not required:
+        return None
+    if isinstance(value, str):
+        value = [value]
+    if not isinstance(value, (list, tuple)) or not value or not all(isinstance(v, str) and v for v in value):
+        raise ValueError(f"'{key}' debe ser un estado o una lista de estados (recibido {value!r})")
+    return tuple(value)
+
+
+def compile_sequence(sequence: ActionSequence, mtime_ns: Optional[int] = None) -> SequenceProgram:
+    """
+    Valida una secuencia y la compila en un SequenceProgram.
+
+    Args:
+        sequence: Secuencia a compilar.
+        mtime_ns: Fecha de modificación del archivo de origen (para la caché).
+
+    Returns:
+        Programa inmutable.
+
+    Raises:
+        ValueError: Si alguna acción no es válida o los bloques no están bien
+                    anidados (el mensaje indica la acción).
+    """
+    opcodes: List[int] = []
+    operands: List[Any] = []
+    offsets: List[float] = []
+    blocks: List[Dict[str, Any]] = []  # Bloques if_state/loop abiertos
+    loop_slots = 0
+    t = 0.0       # Offset desde el último punto de sincronización
+    total = 0.0   # Tiempo fijo acumulado en toda la secuencia
+
+    def emit(opcode: int, operand: Any, offset: float) -> int:
+        opcodes.append(opcode)
+        operands.append(operand)
+        offsets.append(offset)
+        return len(opcodes) - 1
+
+    def patch(index: int, position: int, target: int) -> None:
+        operand = list(operands[index])
+        operand[position] = target
+        operands[index] = tuple(operand)
+
+    for i, action in enumerate(sequence.actions):
+        action_type = action.get('type') if isinstance(action, dict) else None
+        params = (action.get('params') or {}) if isinstance(action, dict) else {}
+        try:
+            if action_type == 'button_press':
+                button = resolve_button(params.get('button'))
+                duration = _number(params, 'duration', 0.1)
+                if button in TRIGGER_BUTTONS:
+                    side = TRIGGER_BUTTONS[button]
+                    emit(OP_TRIGGER, (side, TRIGGER_FULL), t)
+                    emit(OP_TRIGGER, (side, 0), t + duration)
+                else:
+                    emit(OP_PRESS, button, t)
+                    emit(OP_RELEASE, button, t + duration)
+                t += duration
+                total += duration
+            elif action_type == 'wait':
+                seconds = _number(params, 'seconds')
+                t += seconds
+                total += seconds
+            elif action_type == 'wait_for_image':
+                image_name = params.get('image_name')
+                if not isinstance(image_name, str) or not image_name:
+                    raise ValueError("'image_name' es obligatorio")
+                emit(OP_WAIT_IMAGE, (image_name, _number(params, 'timeout', 10.0, positive=True)), t)
+                t = 0.0
+            elif action_type == 'move_cursor':
+                target_type = params.get('target_type')
+                if target_type not in CURSOR_TARGET_KEYS:
+                    raise ValueError(f"'target_type' no válido: {target_type!r} "
+                                     f"(válidos: {tuple(CURSOR_TARGET_KEYS)})")
+                missing = [key for key in CURSOR_TARGET_KEYS[target_type] if key not in params]
+                if missing:
+                    raise ValueError(f"Faltan parámetros para move_cursor/{target_type}: {missing}")
+                emit(OP_MOVE_CURSOR, MappingProxyType(dict(params)), t)
+                t = 0.0
+            elif action_type == 'wait_for_state':
+                on_timeout = params.get('on_timeout', 'fail')
+                if on_timeout not in ('fail', 'continue'):
+                    raise ValueError(f"'on_timeout' debe ser 'fail' o 'continue' (recibido {on_timeout!r})")
+                emit(OP_WAIT_STATE, (_states(params), _number(params, 'timeout', 10.0, positive=True),
+                                     on_timeout == 'fail'), t)
+                t = 0.0
+            elif action_type == 'press_until_state':
+                button = resolve_button(params.get('button'))
+                if button in TRIGGER_BUTTONS:
+                    raise ValueError("press_until_state no admite gatillos (LT/RT)")
+                emit(OP_PRESS_UNTIL, (button, _states(params), _number(params, 'interval', 1.0, positive=True),
+                                      _count(params, 'max_presses', 10, MAX_LOOP_COUNT),
+                                      _number(params, 'duration', 0.1)), t)
+                t = 0.0
+            elif action_type == 'if_state':
+                # El destino (rama else o fin del bloque) se fija al cerrarlo
+                index = emit(OP_BRANCH_STATE, (_states(params), _number(params, 'timeout', 0.0), None), t)
+                blocks.append({'kind': 'if', 'action': i, 'branch': index, 'jump': None})
+                t = 0.0
+            elif action_type == 'else':
+                if not blocks or blocks[-1]['kind'] != 'if' or blocks[-1]['jump'] is not None:
+                    raise ValueError("'else' sin 'if_state' abierto")
+                block = blocks[-1]
+                block['jump'] = emit(OP_JUMP, (None,), t)
+                patch(block['branch'], 2, len(opcodes))
+                t = 0.0
+            elif action_type == 'end_if':
+                if not blocks or blocks[-1]['kind'] != 'if':
+                    raise ValueError("'end_if' sin 'if_state' abierto")
+                block = blocks.pop()
+                if t > 0:
+                    emit(OP_SYNC, None, t)
+                    t = 0.0
+                if block['jump'] is not None:
+                    patch(block['jump'], 0, len(opcodes))
+                else:
+                    patch(block['branch'], 2, len(opcodes))
+            elif action_type == 'loop':
+                slot = loop_slots
+                loop_slots += 1
+                emit(OP_LOOP_INIT, (slot, _count(params, 'count', maximum=MAX_LOOP_COUNT)), t)
+                blocks.append({'kind': 'loop', 'action': i, 'slot': slot, 'start': len(opcodes),
+                               'until': _states(params, 'until_states', required=False)})
+                t = 0.0
+            elif action_type == 'end_loop':
+                if not blocks or blocks[-1]['kind'] != 'loop':
+                    raise ValueError("'end_loop' sin 'loop' abierto")
+                block = blocks.pop()
+                emit(OP_LOOP_NEXT, (block['slot'], block['start'], block['until']), t)
+                t = 0.0
+            else:
+                raise ValueError(f"Tipo de acción desconocido: {action_type!r}")
+        except ValueError as e:
+            raise ValueError(f"Secuencia '{sequence.name}', acción {i + 1} ({action_type}): {e}") from None
+
+    if blocks:
+        block = blocks[-1]
+        closing = 'end_if' if block['kind'] == 'if' else 'end_loop'
+        raise ValueError(f"Secuencia '{sequence.name}', acción {block['action'] + 1}: "
+                         f"bloque sin cerrar (falta '{closing}')")
+    emit(OP_END, None, t)
+
+    needs_recognizer = any(op in STATE_OPS and (op != OP_LOOP_NEXT or operand[2] is not None)
+                           for op, operand in zip(opcodes, operands))
+    return SequenceProgram(sequence.name, mtime_ns, tuple(opcodes), tuple(operands), tuple(offsets),
+                           total, loop_slots, needs_recognizer)
+
+
+def compile_file(path: str) -> SequenceProgram:
+    """Carga y compila una secuencia guardada en JSON."""
+    mtime_ns = os.stat(path).st_mtime_ns
+    with open(path, 'r') as f:
+        data = json.load(f)
+    return compile_sequence(ActionSequence.from_dict(data), mtime_ns)
+
+
+class ProgramCache:
+    """
+    Programas compilados por ruta, invalidados por la fecha de modificación del archivo.
+    """
+
+    def __init__(self):
+        self._programs: Dict[str, SequenceProgram] = {}
+        self._lock = threading.Lock()
+
+    def get(self, path: str) -> SequenceProgram:
+        """
+        Devuelve el programa de un archivo, recompilándolo si ha cambiado.
+
+        Raises:
+            FileNotFoundError: Si el archivo no existe.
+            ValueError: Si la secuencia no es válida.
+        """
+        mtime_ns = os.stat(path).st_mtime_ns
+        with self._lock:
+            program = self._programs.get(path)
+        if program is not None and program.mtime_ns == mtime_ns:
+            return program
+        program = compile_file(path)
+        with self._lock:
+            self._programs[path] = program
+        return program
+
+    def invalidate(self, path: Optional[str] = None) -> None:
+        """Olvida un programa (o todos)."""
+        with self._lock:
+            if path is None:
+                self._programs.clear()
+            else:
+                self._programs.pop(path, None)
+
+
+def run_program(program: SequenceProgram, gamepad_controller, sync_handler: Callable[[int, Any], None],
+                recognizer=None) -> None:
+    """
+    Ejecuta un programa en el planificador de entradas del controlador.
+
+    Args:
+        program: Programa compilado.
+        gamepad_controller: GamepadController (usa su InputScheduler).
+        sync_handler: Función (opcode, operand) que ejecuta las acciones de
+                      sincronización (OP_WAIT_IMAGE, OP_MOVE_CURSOR).
+        recognizer: Reconocedor con wait_for_state (obligatorio si el programa
+                    tiene acciones de estado).
+
+    Raises:
+        TimeoutError: Si wait_for_state (con on_timeout='fail') o press_until_state
+                      no llegan al estado pedido.
+        WorkflowCancelled: Si el flujo que lo ejecuta se cancela (se descartan las
+                           entradas pendientes, soltando lo pulsado).
+    """
+    if program.needs_recognizer and recognizer is None:
+        raise ValueError(f"La secuencia '{program.name}' usa acciones de estado y no hay reconocedor")
+
+    scheduler = gamepad_controller.scheduler
+    # Valor -> GamepadButton del propio controlador (puede venir importado como src.gamepad_controller)
+    buttons = {button.value: button for button in gamepad_controller.button_mapping}
+    opcodes, operands, offsets = program.opcodes, program.operands, program.offsets
+    counters = [0] * program.loop_slots
+    t0 = clock()
+    last = None
+    pc = 0
+
+    def settle(offset: float) -> None:
+        # Espera (cancelable dentro de un flujo) a que se apliquen las entradas programadas y llegue el offset
+        if last is not None:
+            wait_future(last)
+        remaining = t0 + offset - clock()
+        if remaining > 0:
+            workflow_sleep(remaining)
+
+    def in_state(states, timeout: float) -> bool:
+        result = recognizer.wait_for_state(list(states), timeout=timeout)
+        return bool(result.get('matched'))
+
+    try:
+        while True:
+            opcode, operand, offset = opcodes[pc], operands[pc], offsets[pc]
+            pc += 1
+            if opcode == OP_PRESS or opcode == OP_RELEASE:
+                last = scheduler.schedule('press' if opcode == OP_PRESS else 'release', at=t0 + offset,
+                                          button=buttons.get(operand, operand))
+                continue
+            if opcode == OP_TRIGGER:
+                last = scheduler.schedule('trigger', at=t0 + offset, trigger=operand[0], value=operand[1])
+                continue
+
+            settle(offset)
+            if opcode == OP_END:
+                return
+            if opcode in SYNC_OPS:
+                sync_handler(opcode, operand)
+            elif opcode == OP_WAIT_STATE:
+                states, timeout, fail = operand
+                if not in_state(states, timeout) and fail:
+                    raise TimeoutError(f"No se alcanzó ningún estado de {list(states)} en {timeout} s")
+            elif opcode == OP_BRANCH_STATE:
+                states, timeout, otherwise = operand
+                if not in_state(states, timeout):
+                    pc = otherwise
+            elif opcode == OP_JUMP:
+                pc = operand[0]
+            elif opcode == OP_LOOP_INIT:
+                counters[operand[0]] = operand[1]
+            elif opcode == OP_LOOP_NEXT:
+                slot, start, until = operand
+                counters[slot] -= 1
+                if counters[slot] > 0 and not (until is not None and in_state(until, 0.0)):
+                    pc = start
+            elif opcode == OP_PRESS_UNTIL:
+                value, states, interval, max_presses, duration = operand
+                button = buttons.get(value, value)
+                if not in_state(states, 0.0):
+                    for _ in range(max_presses):
+                        # La espera del estado empieza con la pulsación ya en marcha
+                        scheduler.schedule('press', button=button, notify={'duration': duration})
+                        last = scheduler.schedule('release', at=clock() + duration, button=button)
+                        if in_state(states, interval):
+                            break
+                    else:
+                        raise TimeoutError(f"No se alcanzó ningún estado de {list(states)} "
+                                           f"tras {max_presses} pulsaciones de {value}")
+            # Los offsets siguientes cuentan desde que termina la sincronización
+            t0 = clock()
+    except BaseException:
+        scheduler.cancel_pending()
+        raise
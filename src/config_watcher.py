@@ -0,0 +1,127 @@
+"""
+Vigilante de config/ e images/ para recargas incrementales del reconocedor.
+
+Sondea periódicamente la fecha y el tamaño de los JSON de configuración
+(incluidos los ajustes de recognition_tuning.json) y de las imágenes de
+plantilla (sin dependencias externas).
+Cuando detecta un cambio espera a que los archivos dejen de modificarse
+(las GUIs escriben el JSON y las imágenes en pasos separados) y llama a
+ScreenRecognizer.reload_data(), que compara los mappings y sólo vuelve a
+decodificar las plantillas de los estados afectados.
+"""
+
+import logging
+import os
+import threading
+import time
+from typing import Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger('config_watcher')
+
+DEFAULT_POLL_INTERVAL = 1.0
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp')
+
+
+class ConfigWatcher:
+    """
+    Hilo en segundo plano que recarga el reconocedor cuando cambian sus archivos.
+    """
+
+    def __init__(self, recognizer, interval: float = DEFAULT_POLL_INTERVAL,
+                 on_reload: Optional[Callable[[Dict], None]] = None):
+        """
+        Inicializa el vigilante.
+
+        Args:
+            recognizer: ScreenRecognizer a recargar.
+            interval: Segundos entre sondeos.
+            on_reload: Función opcional llamada con el resumen de cambios tras cada recarga.
+        """
+        # Importación diferida para evitar el ciclo screen_recognizer <-> config_watcher
+        from screen_recognizer import (IMAGES_DIR, TEMPLATE_MAPPING_FILE, OCR_MAPPING_FILE,
+                                       STATE_TRANSITIONS_FILE, STATE_ROIS_FILE, RECOGNITION_TUNING_FILE)
+        self.recognizer = recognizer
+        self.interval = interval
+        self.on_reload = on_reload
+        self.config_files = (TEMPLATE_MAPPING_FILE, OCR_MAPPING_FILE, STATE_TRANSITIONS_FILE, STATE_ROIS_FILE,
+                             RECOGNITION_TUNING_FILE)
+        self.images_dir = IMAGES_DIR
+        self.reload_count = 0
+        self._snapshot = self._take_snapshot()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def _take_snapshot(self) -> Dict[str, Tuple[int, int]]:
+        """{ruta: (mtime_ns, tamaño)} de los JSON de configuración y de las imágenes."""
+        snapshot = {}
+        for path in self.config_files:
+            try:
+                st = os.stat(path)
+                snapshot[path] = (st.st_mtime_ns, st.st_size)
+            except OSError:
+                pass
+        for root, _, files in os.walk(self.images_dir):
+            for file_name in files:
+                if file_name.lower().endswith(IMAGE_EXTENSIONS):
+                    path = os.path.join(root, file_name)
+                    try:
+                        st = os.stat(path)
+                        snapshot[path] = (st.st_mtime_ns, st.st_size)
+                    except OSError:
+                        pass  # Borrado durante el recorrido
+        return snapshot
+
+    def check_now(self) -> Optional[Dict]:
+        """
+        Comprueba una vez si hubo cambios y, en ese caso, recarga.
+
+        Returns:
+            Resumen de cambios devuelto por reload_data(), o None si no hubo cambios.
+        """
+        snapshot = self._take_snapshot()
+        if snapshot == self._snapshot:
+            return None
+        # Esperar a que termine la escritura (varios archivos o escritura en curso)
+        while not self._stop_event.wait(min(self.interval, 0.5)):
+            settled = self._take_snapshot()
+            if settled == snapshot:
+                break
+            snapshot = settled
+        changed_files = sorted(path for path in set(snapshot) | set(self._snapshot)
+                               if snapshot.get(path) != self._snapshot.get(path))
+        self._snapshot = snapshot
+        logger.info(f"Cambios detectados en {len(changed_files)} archivo(s): "
+                    f"{[os.path.basename(p) for p in changed_files[:10]]}{' ...' if len(changed_files) > 10 else ''}")
+        changes = self.recognizer.reload_data()
+        self.reload_count += 1
+        if self.on_reload is not None:
+            try:
+                self.on_reload(changes)
+            except Exception as e:
+                logger.warning(f"Error en el callback on_reload: {e}")
+        return changes
+
+    def _run(self) -> None:
+        while not self._stop_event.wait(self.interval):
+            try:
+                self.check_now()
+            except Exception as e:
+                logger.exception(f"Error en el vigilante de configuración: {e}")
+
+    def start(self) -> None:
+        """Arranca el hilo de vigilancia (no hace nada si ya está activo)."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._snapshot = self._take_snapshot()
+        self._thread = threading.Thread(target=self._run, name="config-watcher", daemon=True)
+        self._thread.start()
+        logger.info(f"Vigilando {os.path.dirname(self.config_files[0])} y {self.images_dir} "
+                    f"cada {self.interval:.1f} s")
+
+    def stop(self) -> None:
+        """Detiene el hilo de vigilancia."""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval + 1.0)
+            self._thread = None
@@ -7,13 +7,14 @@ y algoritmos de movimiento optimizados.
 """
 
 import os
-import time
 import logging
 import numpy as np
 import cv2
 import pyautogui
 from typing import Tuple, List, Dict, Any, Optional, Union
 
+from async_runtime import workflow_sleep
+
 # Configuración de logging
 logging.basicConfig(
     level=logging.INFO,
@@ -99,13 +100,15 @@ class CursorNavigator:
             import sys
             import importlib.util
             
-            base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-            sys.path.append(base_dir)
+            # Los módulos de src/ se importan entre sí sin prefijo de paquete
+            src_dir = os.path.dirname(os.path.abspath(__file__))
+            if src_dir not in sys.path:
+                sys.path.append(src_dir)
             
             # Cargar gamepad_controller si no se proporcionó
             if self.gamepad_controller is None:
                 try:
-                    from src.gamepad_controller import GamepadController
+                    from gamepad_controller import GamepadController
                     self.gamepad_controller = GamepadController()
                     logger.info("GamepadController cargado dinámicamente")
                 except ImportError:
@@ -115,8 +118,9 @@ class CursorNavigator:
             # Cargar screen_recognizer si no se proporcionó
             if self.screen_recognizer is None:
                 try:
-                    from src.screen_recognizer import ScreenRecognizer
-                    self.screen_recognizer = ScreenRecognizer()
+                    # Usa el servicio de reconocimiento si EFOOTBALL_RECOGNIZER_ADDR está definida
+                    from recognizer_service import create_recognizer
+                    self.screen_recognizer = create_recognizer()
                     logger.info("ScreenRecognizer cargado dinámicamente")
                 except ImportError:
                     logger.error("No se pudo cargar el módulo screen_recognizer")
@@ -302,7 +306,7 @@ class CursorNavigator:
                 self.current_position = (next_x, next_y)
                 
                 # Pequeña pausa entre movimientos
-                time.sleep(self.config['move_delay'])
+                workflow_sleep(self.config['move_delay'])
             
             # Movimiento final para asegurar precisión
             if success and hasattr(self.gamepad_controller, 'move_cursor_to'):
@@ -466,55 +470,78 @@ class CursorNavigator:
         return self.click_at_current_position()
     
     def navigate_menu_by_dpad(self, target_option: str, menu_options: List[str], 
-                             current_option: str = None, layout: str = 'vertical') -> bool:
+                             current_option: str = None, layout: str = 'vertical',
+                             menu_region: Dict[str, int] = None, detector=None,
+                             timeout: float = 15.0, total: Optional[int] = None,
+                             scrollbar_region: Dict[str, int] = None) -> bool:
         """
         Navega por un menú usando el D-pad.
         
+        Si se indica la región del menú (o un detector), la navegación es en
+        lazo cerrado (ver dpad_navigation.py): las pulsaciones se envían al
+        ritmo máximo del menú mientras otro hilo detecta la opción resaltada
+        (highlight_detector.py) y corrige en cuanto el cursor se desvía.
+        Sin región se pulsa a ciegas desde la opción actual indicada (o la primera).
+        
         Args:
             target_option: Opción de menú objetivo
             menu_options: Lista de opciones de menú en orden
-            current_option: Opción de menú actual (si se conoce)
+            current_option: Opción de menú actual (si se conoce; en listas con desplazamiento
+                fija el desplazamiento inicial)
             layout: Disposición del menú ('vertical' u 'horizontal')
+            menu_region: Región absoluta del bloque de opciones {'left', 'top', 'width', 'height'}
+            detector: HighlightDetector a usar (por defecto, uno por brillo para menu_region
+                con todas las opciones visibles)
+            timeout: Tiempo máximo de la navegación en lazo cerrado (segundos)
+            total: Opciones de la lista completa si sólo se ven detector.options_count a la vez
+                (por defecto, len(menu_options))
+            scrollbar_region: Región absoluta de la barra de desplazamiento, para verificar
+                también el desplazamiento de la lista
             
         Returns:
             True si la navegación fue exitosa, False en caso contrario
         """
+        from gamepad_controller import GamepadButton
+        from highlight_detector import HighlightDetector
+        from dpad_navigation import DpadNavigator
+        
         if target_option not in menu_options:
             logger.error(f"La opción objetivo '{target_option}' no está en la lista de opciones")
             return False
-        
-        # Si no se conoce la opción actual, intentar detectarla
-        if current_option is None:
-            # Aquí podríamos implementar lógica para detectar la opción actual
-            # basándonos en el reconocimiento de pantalla
-            current_option = menu_options[0]  # Asumir que estamos en la primera opción
-        
-        if current_option not in menu_options:
+        if current_option is not None and current_option not in menu_options:
             logger.error(f"La opción actual '{current_option}' no está en la lista de opciones")
             return False
         
-        # Calcular número de movimientos necesarios
-        current_index = menu_options.index(current_option)
         target_index = menu_options.index(target_option)
-        steps = target_index - current_index
-        
-        if steps == 0:
-            # Ya estamos en la opción objetivo
-            return True
-        
-        # Determinar dirección de navegación
         if layout == 'vertical':
-            direction = 'DPAD_DOWN' if steps > 0 else 'DPAD_UP'
+            forward, backward = GamepadButton.DPAD_DOWN, GamepadButton.DPAD_UP
         else:  # horizontal
-            direction = 'DPAD_RIGHT' if steps > 0 else 'DPAD_LEFT'
-        
-        # Navegar al objetivo
-        for _ in range(abs(steps)):
-            self.gamepad_controller.press_button(direction)
-            time.sleep(0.2)  # Pequeña pausa entre pulsaciones
+            forward, backward = GamepadButton.DPAD_RIGHT, GamepadButton.DPAD_LEFT
+        
+        if menu_region is not None:
+            if detector is None:
+                detector = HighlightDetector(len(menu_options), layout)
+            navigator = DpadNavigator.for_screen(self.gamepad_controller, self.screen_recognizer, detector,
+                                                 menu_region, total=total if total is not None else len(menu_options),
+                                                 scrollbar_region=scrollbar_region, buttons=(backward, forward))
+            current_index = menu_options.index(current_option) if current_option is not None else None
+            outcome = navigator.navigate(target_index, current=current_index, timeout_s=timeout)
+            if not outcome['success']:
+                logger.error(f"No se pudo llevar el cursor a '{target_option}' "
+                             f"(posición {outcome['position']}, {outcome['corrections']} correcciones)")
+                return False
+            logger.info(f"Cursor en '{target_option}' en {outcome['elapsed_s']:.2f} s "
+                        f"({outcome['presses']} pulsaciones, {outcome['corrections']} correcciones)")
+        else:
+            # Sin región del menú no se puede verificar: pulsar a ciegas
+            current_index = menu_options.index(current_option) if current_option is not None else 0
+            steps = target_index - current_index
+            for _ in range(abs(steps)):
+                self.gamepad_controller.press_button(forward if steps > 0 else backward)
+                workflow_sleep(0.2)  # Pequeña pausa entre pulsaciones
         
         # Seleccionar la opción
-        self.gamepad_controller.press_button('A')
+        self.gamepad_controller.press_button(GamepadButton.A)
         
         return True
     
@@ -579,7 +606,7 @@ class CursorNavigator:
                 return False
             
             # Esperar a que se cargue el siguiente menú
-            time.sleep(0.5)
+            workflow_sleep(0.5)
         
         return True
 
@@ -0,0 +1,458 @@
+"""
+Navegación en lazo cerrado por menús con el D-pad.
+
+En lugar de pulsar y esperar un tiempo fijo a ciegas, DpadNavigator envía
+las pulsaciones al ritmo máximo que acepta el juego mientras un hilo
+(HighlightWatcher) captura sólo la región del menú y detecta la opción
+resaltada frame a frame (highlight_detector.py). Cada observación se
+compara con la posición prevista a partir de las pulsaciones anteriores a
+la captura (descontando el retardo de entrada): si no coincide (pulsación
+perdida, repetición descartada, menú que no se movió...) se corrige en el
+momento desde la posición observada, sin terminar la secuencia a ciegas.
+
+En listas largas con desplazamiento (p.ej. la lista de jugadores) el
+detector sólo ve la franja resaltada entre las visibles; la posición
+absoluta se sigue con un modelo de desplazamiento: el resaltado se mueve
+hasta el borde y a partir de ahí se desplaza la lista. Con el resaltado
+fijo en el borde una pulsación perdida no se distingue de un
+desplazamiento, así que en esas listas conviene observar también la barra
+de desplazamiento (scrollbar_offset): observe devuelve entonces
+(franja, desplazamiento) y la posición absoluta se verifica directamente.
+
+El subcomando bench compara, sobre un menú simulado con retardo de entrada,
+límite de repetición y pulsaciones perdidas, el tiempo hasta el objetivo
+de la navegación a ciegas (pulsación + 0,2 s) y la de lazo cerrado.
+
+Uso:
+    python dpad_navigation.py bench --items 100 --visible 10 --trials 30
+"""
+
+import argparse
+import collections
+import logging
+import random
+import sys
+import threading
+import time
+from collections import namedtuple
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import numpy as np
+
+from async_runtime import current_token, workflow_sleep
+
+logger = logging.getLogger('dpad_navigation')
+
+DEFAULT_REPEAT_INTERVAL_S = 0.12  # Ritmo máximo de pulsaciones que acepta el menú
+DEFAULT_PRESS_DURATION_S = 0.04
+DEFAULT_INPUT_LAG_S = 0.1         # Desde la pulsación hasta que el resaltado se ve movido
+FIRST_OBSERVATION_TIMEOUT_S = 1.0
+
+# slot: franja resaltada (o None); ts: time.monotonic() al iniciar la captura;
+# offset: primera opción visible según la barra de desplazamiento (o None si no se observa)
+Observation = namedtuple('Observation', 'slot ts offset')
+
+
+def scrollbar_offset(image: np.ndarray, total: int, visible: int, layout: str = 'vertical') -> Optional[int]:
+    """
+    Desplazamiento de una lista a partir de la posición del cursor de su barra de desplazamiento.
+
+    Args:
+        image: Recorte BGR (o gris) de la barra de desplazamiento.
+        total: Opciones de la lista completa.
+        visible: Opciones visibles a la vez.
+        layout: 'vertical' u 'horizontal'.
+
+    Returns:
+        Índice de la primera opción visible, o None si no se distingue el cursor.
+    """
+    if total <= visible:
+        return 0
+    gray = image.max(axis=2) if image.ndim == 3 else image
+    profile = gray.mean(axis=1 if layout == 'vertical' else 0)
+    low, high = float(profile.min()), float(profile.max())
+    if high - low < 16:
+        return None
+    thumb = np.flatnonzero(profile >= (low + high) / 2)
+    free = len(profile) - (thumb[-1] - thumb[0] + 1)
+    if free <= 0:
+        return 0
+    return int(round(thumb[0] / free * (total - visible)))
+
+
+class HighlightWatcher:
+    """
+    Hilo que observa continuamente la opción resaltada.
+    """
+
+    def __init__(self, observe: Callable[[], Optional[int]], interval_s: float = 0.0,
+                 release: Optional[Callable[[], None]] = None):
+        """
+        Args:
+            observe: Función que captura y devuelve la franja resaltada (o None), o
+                     (franja, desplazamiento) si también observa la barra de desplazamiento.
+            interval_s: Pausa entre observaciones (0 = tan rápido como permita la captura).
+            release: Se llama desde el hilo al terminar (p.ej. para cerrar su sesión de captura).
+        """
+        self.observe = observe
+        self.interval_s = interval_s
+        self.release = release
+        self.latest: Optional[Observation] = None
+        self.seq = 0
+        self.observations = 0
+        self._cond = threading.Condition()
+        self._running = False
+        self._thread = None
+
+    def start(self) -> 'HighlightWatcher':
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="HighlightWatcher", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(1.0)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _run(self) -> None:
+        try:
+            while self._running:
+                started = time.monotonic()
+                offset = None
+                try:
+                    slot = self.observe()
+                    if isinstance(slot, tuple):
+                        slot, offset = slot
+                except Exception as e:
+                    logger.error(f"Error observando el menú: {e}")
+                    slot = None
+                with self._cond:
+                    self.latest = Observation(slot, started, offset)
+                    self.seq += 1
+                    self.observations += 1
+                    self._cond.notify_all()
+                if self.interval_s:
+                    time.sleep(self.interval_s)
+        finally:
+            if self.release is not None:
+                try:
+                    self.release()
+                except Exception as e:
+                    logger.debug(f"Error liberando la captura del observador: {e}")
+
+    def wait_newer(self, seq: int, timeout: float) -> Tuple[int, Optional[Observation]]:
+        """Espera una observación posterior a ``seq`` (o el timeout) y la devuelve con su número."""
+        deadline = time.monotonic() + max(0.0, timeout)
+        with self._cond:
+            while self.seq <= seq and self._running:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            return self.seq, self.latest
+
+
+class _ScrollModel:
+    """Posición absoluta y desplazamiento de una lista con ``visible`` franjas de ``total`` opciones."""
+
+    def __init__(self, total: int, visible: int):
+        self.total = total
+        self.visible = visible
+
+    def step(self, position: int, offset: int, step: int) -> Tuple[int, int]:
+        position = min(max(position + step, 0), self.total - 1)
+        if position < offset:
+            offset = position
+        elif position >= offset + self.visible:
+            offset = position - self.visible + 1
+        return position, offset
+
+    def replay(self, position: int, offset: int, steps) -> Tuple[int, int]:
+        for step in steps:
+            position, offset = self.step(position, offset, step)
+        return position, offset
+
+
+class DpadNavigator:
+    """
+    Lleva el resaltado de un menú a una opción con pulsaciones verificadas en paralelo.
+    """
+
+    def __init__(self, gamepad, observe: Callable[[], Optional[int]], visible: int, total: Optional[int] = None,
+                 layout: str = 'vertical', buttons: Optional[Tuple[Any, Any]] = None,
+                 repeat_interval_s: float = DEFAULT_REPEAT_INTERVAL_S,
+                 press_duration_s: float = DEFAULT_PRESS_DURATION_S, input_lag_s: float = DEFAULT_INPUT_LAG_S):
+        """
+        Args:
+            gamepad: GamepadController (o cualquier objeto con press_button(botón, duration)).
+            observe: Función que devuelve la franja resaltada visible, o (franja,
+                     desplazamiento) en listas con barra de desplazamiento (ver for_screen).
+            visible: Opciones visibles a la vez (franjas del detector).
+            total: Opciones de la lista completa (por defecto, visible: menú sin desplazamiento).
+            layout: 'vertical' u 'horizontal' (elige los botones del D-pad).
+            buttons: (retroceder, avanzar) explícitos; por defecto, los del D-pad según layout.
+            repeat_interval_s: Intervalo mínimo entre pulsaciones (ritmo máximo aceptado por el menú).
+            press_duration_s: Duración de cada pulsación.
+            input_lag_s: Retardo desde la pulsación hasta que el resaltado se ve movido.
+        """
+        self.gamepad = gamepad
+        self.observe = observe
+        self.model = _ScrollModel(total or visible, visible)
+        if buttons is None:
+            from gamepad_controller import GamepadButton
+            buttons = (GamepadButton.DPAD_UP, GamepadButton.DPAD_DOWN) if layout == 'vertical' \
+                else (GamepadButton.DPAD_LEFT, GamepadButton.DPAD_RIGHT)
+        self.buttons = buttons
+        self.repeat_interval_s = repeat_interval_s
+        self.press_duration_s = press_duration_s
+        self.input_lag_s = input_lag_s
+        self.offset = 0  # Primera opción visible (listas con desplazamiento)
+        self.release_observer: Optional[Callable[[], None]] = None  # Se llama al terminar el hilo observador
+
+    @classmethod
+    def for_screen(cls, gamepad, recognizer, detector, region: Dict[str, int], total: Optional[int] = None,
+                   scrollbar_region: Optional[Dict[str, int]] = None, **kwargs) -> 'DpadNavigator':
+        """
+        Navegador que observa ``region`` en pantalla con un HighlightDetector.
+
+        Args:
+            total: Opciones de la lista completa (listas con desplazamiento).
+            scrollbar_region: Región absoluta de la barra de desplazamiento, para
+                              verificar también el desplazamiento de la lista.
+        """
+        visible = detector.options_count
+
+        def observe():
+            slot = detector.detect_on_screen(recognizer, region).index
+            if scrollbar_region is None or total is None:
+                return slot
+            image = recognizer.capture_screen(region=scrollbar_region)
+            return slot, scrollbar_offset(image, total, visible, detector.layout) if image is not None else None
+
+        navigator = cls(gamepad, observe, visible, total, layout=detector.layout, **kwargs)
+        # Cada navegación observa desde un hilo nuevo: su sesión mss se cierra al terminar
+        navigator.release_observer = getattr(recognizer, 'release_thread_session', None)
+        return navigator
+
+    @staticmethod
+    def _matches(observation: Observation, predicted: Tuple[int, int]) -> bool:
+        position, offset = predicted
+        if observation.offset is not None:
+            return observation.offset == offset and observation.slot == position - offset
+        return observation.slot == position - offset
+
+    def navigate(self, target: int, current: Optional[int] = None, timeout_s: float = 15.0) -> Dict[str, Any]:
+        """
+        Lleva el resaltado hasta la opción ``target`` (índice absoluto en la lista).
+
+        Args:
+            target: Índice de la opción objetivo.
+            current: Índice absoluto de la opción resaltada, si se conoce (en listas con
+                     desplazamiento fija el desplazamiento inicial); si no, se usa la
+                     franja observada más self.offset.
+            timeout_s: Tiempo máximo.
+
+        Returns:
+            dict: {'success', 'position', 'presses', 'corrections', 'observations', 'elapsed_s'}
+
+        Raises:
+            WorkflowCancelled: Si el flujo que navega se cancela (el observador se detiene).
+        """
+        token = current_token()
+        target = min(max(target, 0), self.model.total - 1)
+        started = time.monotonic()
+        deadline = started + timeout_s
+        outcome = {'success': False, 'position': None, 'presses': 0, 'corrections': 0,
+                   'observations': 0, 'elapsed_s': 0.0}
+        with HighlightWatcher(self.observe, release=self.release_observer) as watcher:
+            seq, observation = watcher.wait_newer(0, FIRST_OBSERVATION_TIMEOUT_S)
+            while observation is not None and observation.slot is None and time.monotonic() < started + FIRST_OBSERVATION_TIMEOUT_S:
+                seq, observation = watcher.wait_newer(seq, FIRST_OBSERVATION_TIMEOUT_S)
+            if observation is None or observation.slot is None:
+                logger.warning("No se detecta la opción resaltada: navegación cancelada.")
+                outcome['elapsed_s'] = time.monotonic() - started
+                return outcome
+            if current is not None:
+                self.offset = max(0, current - observation.slot)
+            confirmed = (self.offset + observation.slot, self.offset)  # (posición, desplazamiento) observados
+            pending = collections.deque()  # (instante, paso) de pulsaciones aún no vistas en pantalla
+            next_press_at = time.monotonic()
+
+            while True:
+                if token is not None:
+                    token.check()
+                now = time.monotonic()
+                if now > deadline:
+                    logger.warning(f"Tiempo agotado navegando a la opción {target}.")
+                    break
+                expected = self.model.replay(*confirmed, (step for _, step in pending))[0]
+                if expected == target and not pending and confirmed[0] == target:
+                    outcome['success'] = True
+                    break
+                if expected != target and now >= next_press_at:
+                    step = 1 if target > expected else -1
+                    self.gamepad.press_button(self.buttons[step > 0], duration=self.press_duration_s)
+                    pending.append((now, step))
+                    outcome['presses'] += 1
+                    next_press_at = now + self.repeat_interval_s
+                    continue
+
+                wait = (next_press_at - now) if expected != target else self.input_lag_s
+                new_seq, observation = watcher.wait_newer(seq, min(wait, deadline - now))
+                if new_seq == seq or observation is None or observation.slot is None:
+                    continue
+                seq = new_seq
+                # Pulsaciones que ya deberían verse en esta captura; las posteriores
+                # pueden verse o no todavía (el retardo real varía)
+                cutoff = observation.ts - self.input_lag_s
+                applied = []
+                while pending and pending[0][0] <= cutoff:
+                    applied.append(pending.popleft()[1])
+                position, offset = self.model.replay(*confirmed, applied)
+                predicted, matched = (position, offset), None
+                for extra in range(len(pending) + 1):
+                    if extra:
+                        predicted = self.model.step(*predicted, pending[extra - 1][1])
+                    if self._matches(observation, predicted):
+                        matched = extra
+                        break
+                if matched is not None:
+                    for _ in range(matched):
+                        pending.popleft()
+                    confirmed = predicted
+                    continue
+                # El menú no está donde se esperaba: corregir desde lo observado
+                outcome['corrections'] += 1
+                if observation.offset is not None:
+                    offset = observation.offset
+                confirmed = (offset + observation.slot, offset)
+                logger.debug(f"Resaltado en {confirmed[0]} (previsto {position}); corrigiendo")
+            outcome['observations'] = watcher.observations
+
+        self.offset = confirmed[1]
+        outcome['position'] = confirmed[0]
+        outcome['elapsed_s'] = time.monotonic() - started
+        return outcome
+
+
+class SimulatedMenu:
+    """
+    Menú simulado para el benchmark: retardo de entrada, límite de repetición,
+    pulsaciones perdidas y coste de captura.
+    """
+
+    def __init__(self, total: int, visible: int, start: int = 0, input_lag_s: float = 0.08,
+                 min_repeat_s: float = 0.1, drop_rate: float = 0.02, capture_s: float = 0.006,
+                 scrollbar: bool = False, seed: int = 0):
+        self.scrollbar = scrollbar
+        self.model = _ScrollModel(total, visible)
+        self.position, self.offset = start, max(0, start - visible + 1)
+        self.input_lag_s = input_lag_s
+        self.min_repeat_s = min_repeat_s
+        self.drop_rate = drop_rate
+        self.capture_s = capture_s
+        self._random = random.Random(seed)
+        self._scheduled = collections.deque()
+        self._last_accepted = -1.0
+        self._lock = threading.Lock()
+
+    def press_button(self, button, duration: float = 0.1) -> None:
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last_accepted >= self.min_repeat_s and self._random.random() >= self.drop_rate:
+                self._last_accepted = now
+                self._scheduled.append((now + self.input_lag_s, 1 if button == 'down' else -1))
+        workflow_sleep(duration)
+
+    def _apply(self) -> None:
+        now = time.monotonic()
+        with self._lock:
+            while self._scheduled and self._scheduled[0][0] <= now:
+                step = self._scheduled.popleft()[1]
+                self.position, self.offset = self.model.step(self.position, self.offset, step)
+
+    def observe(self):
+        self._apply()
+        slot, offset = self.position - self.offset, self.offset
+        workflow_sleep(self.capture_s)
+        return (slot, offset) if self.scrollbar else slot
+
+    def settled_position(self) -> int:
+        workflow_sleep(self.input_lag_s)
+        self._apply()
+        return self.position
+
+
+def _blind_navigation(menu: SimulatedMenu, current: int, target: int) -> Dict[str, Any]:
+    """Navegación anterior: pulsación y pausa fija de 0,2 s sin verificar."""
+    started = time.monotonic()
+    for _ in range(abs(target - current)):
+        menu.press_button('down' if target > current else 'up', duration=0.1)
+        workflow_sleep(0.2)
+    position = menu.settled_position()
+    return {'success': position == target, 'elapsed_s': time.monotonic() - started}
+
+
+def _summary(name: str, runs) -> str:
+    times = np.array([r['elapsed_s'] for r in runs])
+    ok = sum(r['success'] for r in runs)
+    return (f"{name:12} éxito {ok}/{len(runs)} | tiempo hasta el objetivo: media {times.mean():.2f} s | "
+            f"p50 {np.percentile(times, 50):.2f} s | p95 {np.percentile(times, 95):.2f} s")
+
+
+def main():
+    """Punto de entrada de línea de comandos."""
+    parser = argparse.ArgumentParser(description="Navegación en lazo cerrado por menús con el D-pad")
+    subparsers = parser.add_subparsers(dest="command")
+    bench = subparsers.add_parser("bench", help="Benchmark sobre un menú simulado")
+    bench.add_argument("--items", type=int, default=100, help="Opciones de la lista")
+    bench.add_argument("--visible", type=int, default=10, help="Opciones visibles")
+    bench.add_argument("--trials", type=int, default=10)
+    bench.add_argument("--drop-rate", type=float, default=0.02, help="Probabilidad de perder una pulsación")
+    bench.add_argument("--input-lag", type=float, default=0.08)
+    bench.add_argument("--min-repeat", type=float, default=0.1, help="Intervalo mínimo aceptado por el menú")
+    bench.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    if args.command != "bench":
+        parser.print_help()
+        return 1
+
+    rng = random.Random(args.seed)
+    pairs = [(rng.randrange(args.items), rng.randrange(args.items)) for _ in range(args.trials)]
+    blind, closed, scrolled = [], [], []
+    for i, (start, target) in enumerate(pairs):
+        options = dict(input_lag_s=args.input_lag, min_repeat_s=args.min_repeat, drop_rate=args.drop_rate,
+                       seed=args.seed + i)
+        blind.append(_blind_navigation(SimulatedMenu(args.items, args.visible, start, **options), start, target))
+        for runs, scrollbar in ((closed, False), (scrolled, True)):
+            menu = SimulatedMenu(args.items, args.visible, start, scrollbar=scrollbar, **options)
+            navigator = DpadNavigator(menu, menu.observe, args.visible, args.items, buttons=('up', 'down'),
+                                      repeat_interval_s=args.min_repeat * 1.2, input_lag_s=args.input_lag * 1.25)
+            outcome = navigator.navigate(target, current=start)
+            outcome['success'] = outcome['success'] and menu.settled_position() == target
+            runs.append(outcome)
+    distance = np.mean([abs(t - s) for s, t in pairs])
+    print(f"{args.trials} navegaciones en una lista de {args.items} opciones ({args.visible} visibles), "
+          f"distancia media {distance:.1f}, pérdida de pulsaciones {args.drop_rate:.0%}")
+    print(_summary("A ciegas", blind))
+    print(_summary("Lazo cerrado", closed))
+    print(_summary("+ barra", scrolled))
+    for name, runs in (("Lazo cerrado", closed), ("+ barra", scrolled)):
+        print(f"{name}: {np.mean([r['corrections'] for r in runs]):.2f} correcciones y "
+              f"{np.mean([r['observations'] for r in runs]):.0f} observaciones por navegación")
+    return 0
+
+
+if __name__ == "__main__":
+    if not logging.getLogger().hasHandlers():
+        logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    sys.exit(main())
@@ -0,0 +1,260 @@
+"""
+Registro de confirmaciones y correcciones del tester como datos etiquetados.
+
+Cada confirmación, negación o corrección del Screen Tester se guarda como una
+línea JSON en logs/recognition_feedback.jsonl con el hash del frame, las
+puntuaciones de plantilla de todos los estados evaluados y el estado correcto.
+
+A partir de esos registros, el ajustador calcula para cada estado el umbral
+de aceptación más bajo que mantiene la tasa de falsos positivos por debajo
+del objetivo: cuanto más bajo el umbral, menos frames caen en el OCR lento.
+Los umbrales se escriben en la sección 'thresholds' de
+config/recognition_tuning.json, que el reconocedor recarga en caliente.
+
+Uso:
+    python feedback_store.py stats
+    python feedback_store.py fit --target-error 0.01
+    python feedback_store.py fit --target-error 0.01 --write
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional
+
+from recognition_bundle import PROJECT_DIR, load_tuning, update_tuning
+
+logger = logging.getLogger('feedback_store')
+
+FEEDBACK_FILE = os.path.join(PROJECT_DIR, "logs", "recognition_feedback.jsonl")
+
+EVENT_CONFIRM = 'confirm'  # La detección era correcta
+EVENT_DENY = 'deny'        # La detección era incorrecta (estado correcto aún desconocido)
+EVENT_CORRECT = 'correct'  # Corrección manual con el estado correcto
+
+# Mismos valores por defecto que screen_recognizer (sin importar mss/pytesseract)
+DEFAULT_TEMPLATE_THRESHOLD = 0.75
+OCR_FALLBACK_THRESHOLD = 0.60
+
+DEFAULT_TARGET_ERROR = 0.01 # Fracción máxima de frames de otros estados aceptados por error
+DEFAULT_MIN_POSITIVES = 3   # Confirmaciones mínimas de un estado para ajustar su umbral
+DEFAULT_MIN_NEGATIVES = 5   # Frames de otros estados mínimos (sin ellos el umbral caería al suelo)
+MAX_THRESHOLD = 0.99
+
+
+def frame_hash(image) -> Optional[str]:
+    """Hash corto del contenido de una captura (identifica el mismo frame repetido)."""
+    if image is None:
+        return None
+    digest = hashlib.blake2b(digest_size=8)
+    digest.update(str(image.shape).encode("ascii"))
+    digest.update(memoryview(image).cast('B') if image.flags['C_CONTIGUOUS'] else image.tobytes())
+    return digest.hexdigest()
+
+
+class FeedbackStore:
+    """
+    Almacén JSONL (sólo anexado) de resultados de reconocimiento etiquetados.
+    """
+
+    def __init__(self, path: str = FEEDBACK_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def record(self, result: Dict[str, Any], event: str, correct_state: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Añade un registro a partir de un resultado de recognize_screen_for_test().
+
+        Args:
+            result: Resultado del reconocimiento (usa 'state', 'method', 'confidence',
+                    'state_scores', 'captured_image' y 'frame_id').
+            event: EVENT_CONFIRM, EVENT_DENY o EVENT_CORRECT.
+            correct_state: Estado correcto (implícito en una confirmación).
+
+        Returns:
+            El registro escrito.
+        """
+        if event == EVENT_CONFIRM:
+            correct_state = result.get('state')
+        entry = {
+            'ts': time.time(),
+            'event': event,
+            'frame_hash': frame_hash(result.get('captured_image')),
+            'frame_id': result.get('frame_id'),
+            'detected_state': result.get('state'),
+            'method': result.get('method'),
+            'confidence': result.get('confidence'),
+            'correct_state': correct_state,
+            'state_scores': result.get('state_scores') or {},
+        }
+        with self._lock:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        logger.info(f"Feedback '{event}' registrado: detectado '{entry['detected_state']}', correcto '{correct_state}'")
+        return entry
+
+    def iter_records(self) -> Iterator[Dict[str, Any]]:
+        """Recorre los registros válidos (ignora líneas corruptas o truncadas)."""
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line_no, line in enumerate(f, 1):
+                    if not line.strip():
+                        continue
+                    try:
+                        yield json.loads(line)
+                    except json.JSONDecodeError:
+                        logger.warning(f"{self.path}:{line_no}: línea inválida, se ignora.")
+        except FileNotFoundError:
+            return
+
+    def labelled_records(self) -> List[Dict[str, Any]]:
+        """
+        Registros utilizables para ajustar umbrales, uno por frame.
+
+        Si un mismo frame se confirmó o corrigió varias veces prevalece el último
+        registro. Las negaciones sin corrección sólo aportan un negativo para el
+        estado detectado.
+        """
+        by_frame = {}
+        anonymous = []
+        for entry in self.iter_records():
+            if not entry.get('state_scores'):
+                continue
+            key = entry.get('frame_hash')
+            if key is None:
+                anonymous.append(entry)
+                continue
+            previous = by_frame.get(key)
+            # Una negación no sustituye a una corrección del mismo frame
+            if previous is not None and entry['event'] == EVENT_DENY and previous['event'] == EVENT_CORRECT:
+                continue
+            by_frame[key] = entry
+        return anonymous + list(by_frame.values())
+
+
+def fit_thresholds(records: List[Dict[str, Any]], target_error: float = DEFAULT_TARGET_ERROR,
+                   min_positives: int = DEFAULT_MIN_POSITIVES, default: float = DEFAULT_TEMPLATE_THRESHOLD,
+                   floor: float = OCR_FALLBACK_THRESHOLD,
+                   min_negatives: int = DEFAULT_MIN_NEGATIVES) -> Dict[str, Dict[str, Any]]:
+    """
+    Calcula el umbral de aceptación de cada estado.
+
+    Para el estado S, las puntuaciones de S en frames cuyo estado correcto es S
+    son positivas; en frames de otros estados (o con S negado) son negativas.
+    Se elige el umbral más bajo cuya tasa de negativos aceptados no supera
+    target_error, lo que minimiza los positivos que caen en el OCR.
+
+    Args:
+        records: Registros de FeedbackStore.labelled_records().
+        target_error: Fracción máxima de negativos por encima del umbral.
+        min_positives: Positivos mínimos para ajustar un estado (si no, se omite).
+        default: Umbral global actual (para estimar la mejora).
+        floor: Umbral mínimo admitido (por debajo decide el fallback OCR).
+        min_negatives: Negativos mínimos para ajustar un estado. Sin negativos no hay
+            nada que separar y el umbral bajaría al suelo; el estado se omite y
+            conserva su umbral actual.
+
+    Returns:
+        { estado: {'threshold', 'positives', 'negatives', 'false_accept_rate',
+                   'ocr_rate_default', 'ocr_rate_fitted'} }
+    """
+    positives, negatives = {}, {}
+    for entry in records:
+        correct = entry.get('correct_state')
+        denied = entry.get('detected_state') if entry.get('event') == EVENT_DENY else None
+        for state, score in entry['state_scores'].items():
+            if correct is not None and state == correct:
+                positives.setdefault(state, []).append(score)
+            elif correct is not None or state == denied:
+                negatives.setdefault(state, []).append(score)
+
+    fitted = {}
+    for state, pos in positives.items():
+        neg = sorted(negatives.get(state, []), reverse=True)
+        if len(pos) < min_positives or len(neg) < min_negatives:
+            continue
+        # Número de negativos que se pueden aceptar sin superar el objetivo
+        allowed = int(target_error * len(neg))
+        # Umbral justo por encima del negativo (allowed+1)-ésimo más alto
+        threshold = neg[allowed] + 1e-3 if len(neg) > allowed else floor
+        threshold = min(max(threshold, floor), MAX_THRESHOLD)
+        fitted[state] = {
+            'threshold': round(threshold, 3),
+            'positives': len(pos),
+            'negatives': len(neg),
+            'false_accept_rate': round(sum(n >= threshold for n in neg) / len(neg), 4) if neg else 0.0,
+            'ocr_rate_default': round(sum(p < default for p in pos) / len(pos), 3),
+            'ocr_rate_fitted': round(sum(p < threshold for p in pos) / len(pos), 3),
+        }
+    return fitted
+
+
+def _print_stats(store: FeedbackStore) -> None:
+    counts, states = {}, {}
+    for entry in store.iter_records():
+        counts[entry.get('event')] = counts.get(entry.get('event'), 0) + 1
+        if entry.get('correct_state'):
+            states[entry['correct_state']] = states.get(entry['correct_state'], 0) + 1
+    print(f"Registros en {store.path}: {counts or 'ninguno'}")
+    for state, n in sorted(states.items(), key=lambda item: -item[1]):
+        print(f"  {state:50} {n}")
+
+
+def main():
+    """Punto de entrada de línea de comandos."""
+    parser = argparse.ArgumentParser(description="Feedback etiquetado del tester y ajuste de umbrales por estado")
+    parser.add_argument("--file", default=FEEDBACK_FILE, help="Archivo JSONL de feedback")
+    subparsers = parser.add_subparsers(dest="command")
+    subparsers.add_parser("stats", help="Resumen de los registros")
+    fit_parser = subparsers.add_parser("fit", help="Ajustar umbrales por estado")
+    fit_parser.add_argument("--target-error", type=float, default=DEFAULT_TARGET_ERROR,
+                            help="Tasa máxima de aceptaciones erróneas por estado")
+    fit_parser.add_argument("--min-positives", type=int, default=DEFAULT_MIN_POSITIVES)
+    fit_parser.add_argument("--min-negatives", type=int, default=DEFAULT_MIN_NEGATIVES,
+                            help="Frames de otros estados mínimos para ajustar un estado")
+    fit_parser.add_argument("--threshold", type=float, default=DEFAULT_TEMPLATE_THRESHOLD, help="Umbral global actual")
+    fit_parser.add_argument("--write", action="store_true",
+                            help="Guardar los umbrales en recognition_tuning.json (se combinan con los existentes)")
+    args = parser.parse_args()
+
+    store = FeedbackStore(args.file)
+    if args.command is None:
+        parser.print_help()
+        return 1
+    if args.command == "stats":
+        _print_stats(store)
+        return 0
+
+    records = store.labelled_records()
+    fitted = fit_thresholds(records, args.target_error, args.min_positives, args.threshold,
+                            min_negatives=args.min_negatives)
+    if not fitted:
+        print(f"Sin datos suficientes: {len(records)} frames etiquetados "
+              f"(se necesitan {args.min_positives} confirmaciones y {args.min_negatives} "
+              f"frames de otros estados por estado).")
+        return 1
+    print(f"{len(records)} frames etiquetados; objetivo de error {args.target_error:.1%}\n")
+    print(f"{'Estado':50} {'umbral':>6} {'pos':>4} {'neg':>4} {'FA':>6} {'OCR act':>7} {'OCR nuevo':>9}")
+    for state, fit in sorted(fitted.items()):
+        print(f"{state[:50]:50} {fit['threshold']:>6.3f} {fit['positives']:>4} {fit['negatives']:>4} "
+              f"{fit['false_accept_rate']:>6.1%} {fit['ocr_rate_default']:>7.0%} {fit['ocr_rate_fitted']:>9.0%}")
+
+    if args.write:
+        thresholds = dict(load_tuning().get('thresholds') or {})
+        thresholds.update({state: fit['threshold'] for state, fit in fitted.items()})
+        update_tuning('thresholds', thresholds,
+                      f"feedback_store fit ({len(records)} frames, error objetivo {args.target_error})")
+        print(f"\n{len(fitted)} umbrales guardados en recognition_tuning.json")
+    return 0
+
+
+if __name__ == "__main__":
+    if not logging.getLogger().hasHandlers():
+        logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    sys.exit(main())
@@ -0,0 +1,175 @@
+"""
+Pool de buffers de frame reutilizables para la captura de pantalla.
+
+Cada captura 4K ocupa ~25 MB en BGR. En lugar de reservar arrays nuevos
+(BGRA, BGR y gris) en cada llamada, el pool mantiene un pequeño anillo de
+buffers preasignados y convierte la captura BGRA directamente sobre ellos.
+Los consumidores reciben vistas de solo lectura o un identificador de frame
+y sólo materializan una copia cuando la necesitan de verdad.
+"""
+
+import itertools
+import logging
+import threading
+import time
+from typing import Optional
+
+import cv2
+import numpy as np
+
+from frame_pyramid import FramePyramid
+
+logger = logging.getLogger('frame_buffer')
+
+DEFAULT_POOL_SLOTS = 3
+
+
+def _read_only(array: np.ndarray) -> np.ndarray:
+    """Devuelve una vista de solo lectura del array (sin copiar datos)."""
+    view = array.view()
+    view.flags.writeable = False
+    return view
+
+
+class FrameSlot:
+    """
+    Buffers preasignados (BGR y gris) de un frame dentro del pool.
+
+    El contenido de un slot se sobrescribe cuando el pool da la vuelta, por lo
+    que ``frame_id`` identifica qué captura contiene en cada momento.
+    """
+    __slots__ = ('frame_id', 'timestamp', 'region', 'metadata', 'bgr', 'gray', 'pyramid')
+
+    def __init__(self, height: int, width: int):
+        self.frame_id = None
+        self.timestamp = 0.0
+        self.region = None
+        self.metadata = None  # Metadatos externos (p.ej. del bus de frames)
+        self.bgr = np.empty((height, width, 3), dtype=np.uint8)
+        self.gray = np.empty((height, width), dtype=np.uint8)
+        self.pyramid = None   # FramePyramid del frame actual (representaciones derivadas memorizadas)
+
+    @property
+    def shape(self):
+        """(alto, ancho) del frame."""
+        return self.gray.shape
+
+    def bgr_view(self) -> np.ndarray:
+        """Vista BGR de solo lectura (válida hasta que el slot se reutilice)."""
+        return _read_only(self.bgr)
+
+    def gray_view(self) -> np.ndarray:
+        """Vista en escala de grises de solo lectura."""
+        return _read_only(self.gray)
+
+
+class FrameBufferPool:
+    """
+    Anillo de ``FrameSlot`` reutilizables.
+
+    Un frame sigue disponible (``get``/``materialize``) hasta que se realizan
+    ``slots`` capturas posteriores; a partir de ahí su slot se reutiliza.
+    """
+
+    def __init__(self, slots: int = DEFAULT_POOL_SLOTS):
+        """
+        Inicializa el pool.
+
+        Args:
+            slots: Número de frames que se mantienen vivos simultáneamente.
+        """
+        if slots < 1:
+            raise ValueError(f"El pool necesita al menos 1 slot (recibido: {slots})")
+        self.num_slots = slots
+        self._slots = [None] * slots
+        self._next_index = 0
+        self._frame_ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self.allocations = 0  # Nº de (re)asignaciones de buffers, útil para diagnóstico
+
+    def _acquire(self, height: int, width: int) -> FrameSlot:
+        """Obtiene el siguiente slot del anillo, reasignándolo sólo si cambia el tamaño."""
+        with self._lock:
+            index = self._next_index
+            self._next_index = (index + 1) % self.num_slots
+            slot = self._slots[index]
+            if slot is None or slot.shape != (height, width):
+                slot = FrameSlot(height, width)
+                self._slots[index] = slot
+                self.allocations += 1
+                logger.debug(f"Slot {index} (re)asignado para {width}x{height}")
+            slot.frame_id = None  # Invalida el frame anterior mientras se escribe
+            slot.pyramid = None
+            return slot
+
+    def _publish(self, slot: FrameSlot, region, metadata=None) -> FrameSlot:
+        slot.region = dict(region) if region else None
+        slot.metadata = metadata
+        slot.timestamp = time.time()
+        slot.pyramid = FramePyramid(slot.bgr, slot.gray, region=slot.region)
+        slot.frame_id = next(self._frame_ids)
+        slot.pyramid.frame_id = slot.frame_id
+        return slot
+
+    def fill_from_bgra(self, bgra: np.ndarray, region=None) -> FrameSlot:
+        """
+        Convierte una captura BGRA (p.ej. de mss) directamente a BGR y gris
+        sobre los buffers de un slot, sin arrays intermedios.
+
+        Args:
+            bgra: Array (alto, ancho, 4) en formato BGRA.
+            region: Geometría absoluta capturada (opcional, informativa).
+
+        Returns:
+            FrameSlot con el frame convertido.
+        """
+        height, width = bgra.shape[:2]
+        slot = self._acquire(height, width)
+        cv2.cvtColor(bgra, cv2.COLOR_BGRA2BGR, dst=slot.bgr)
+        cv2.cvtColor(bgra, cv2.COLOR_BGRA2GRAY, dst=slot.gray)
+        return self._publish(slot, region)
+
+    def fill_from_bgr(self, bgr: np.ndarray, region=None, metadata=None) -> FrameSlot:
+        """
+        Copia una imagen BGR externa (fichero, bus de frames...) a un slot y
+        calcula su versión en gris.
+
+        Args:
+            bgr: Array (alto, ancho, 3) en formato BGR.
+            region: Geometría absoluta asociada (opcional).
+            metadata: Metadatos del origen del frame (opcional).
+
+        Returns:
+            FrameSlot con el frame.
+        """
+        height, width = bgr.shape[:2]
+        slot = self._acquire(height, width)
+        np.copyto(slot.bgr, bgr)
+        cv2.cvtColor(slot.bgr, cv2.COLOR_BGR2GRAY, dst=slot.gray)
+        return self._publish(slot, region, metadata)
+
+    def get(self, frame_id) -> Optional[FrameSlot]:
+        """Devuelve el slot que contiene ``frame_id`` o None si ya se reutilizó."""
+        if frame_id is None:
+            return None
+        with self._lock:
+            for slot in self._slots:
+                if slot is not None and slot.frame_id == frame_id:
+                    return slot
+        return None
+
+    def materialize(self, frame_id) -> Optional[np.ndarray]:
+        """
+        Devuelve una copia BGR propia del frame indicado.
+
+        Returns:
+            numpy.ndarray o None si el frame ya no está en el pool.
+        """
+        slot = self.get(frame_id)
+        if slot is None:
+            logger.debug(f"Frame {frame_id} ya no está disponible en el pool.")
+            return None
+        image = slot.bgr.copy()
+        if slot.frame_id != frame_id:  # Reutilizado mientras se copiaba
+            return None
+        return image
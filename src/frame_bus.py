@@ -0,0 +1,341 @@
+"""
+Bus de frames en memoria compartida entre la automatización y las GUIs.
+
+Un único proceso captura la pantalla (la automatización de main.py o el
+capturador independiente de este módulo) y publica el último frame junto con
+sus metadatos en un anillo de memoria compartida con nombre. El tester, el
+gestor de plantillas y el asistente de secuencias lo leen sin capturar, de
+modo que varios observadores cuestan una sola captura y pueden mostrar
+exactamente el frame sobre el que decidió la automatización.
+
+Formato del segmento (little-endian):
+    Cabecera global: magic, versión, nº slots, ancho máx., alto máx.,
+                     canales, último nº de secuencia publicado.
+    Slot i:          seq_inicio, timestamp, ancho, alto, longitud metadatos,
+                     seq_fin, metadatos JSON (META_MAX_BYTES), píxeles BGR.
+
+Cada slot funciona como un seqlock: el escritor marca seq_inicio, escribe y
+marca seq_fin; el lector descarta la lectura si ambos no coinciden.
+
+Uso del capturador independiente:
+    python frame_bus.py serve --name efootball_frames --interval 0.1
+"""
+
+import argparse
+import json
+import logging
+import os
+import struct
+import time
+from multiprocessing import shared_memory
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger('frame_bus')
+
+DEFAULT_BUS_NAME = "efootball_frames"
+FRAME_BUS_ENV_VAR = "EFOOTBALL_FRAME_BUS"  # Si está definida, las GUIs leen del bus con ese nombre
+DEFAULT_BUS_SLOTS = 3
+DEFAULT_MAX_WIDTH = 3840
+DEFAULT_MAX_HEIGHT = 2160
+META_MAX_BYTES = 4096
+
+_MAGIC = b"EFBUS01\0"
+_VERSION = 1
+_HEADER = struct.Struct("<8sIIIIIQ")       # magic, version, slots, max_w, max_h, channels, latest_seq
+_SLOT_HEADER = struct.Struct("<QdIIIQ")    # seq_start, timestamp, width, height, meta_len, seq_end
+_HEADER_SIZE = 64                           # Cabecera global reservada (>= _HEADER.size)
+_SLOT_HEADER_SIZE = 48                      # Cabecera de slot reservada (>= _SLOT_HEADER.size)
+_LATEST_SEQ_OFFSET = _HEADER.size - 8
+_SEQ_END_OFFSET = _SLOT_HEADER.size - 8
+_CHANNELS = 3
+
+
+def _slot_size(max_width: int, max_height: int) -> int:
+    return _SLOT_HEADER_SIZE + META_MAX_BYTES + max_width * max_height * _CHANNELS
+
+
+def _untrack(shm: shared_memory.SharedMemory) -> None:
+    """
+    Evita que el resource_tracker de POSIX elimine un segmento que este proceso
+    sólo ha abierto (no creado) al terminar. En Windows no es necesario.
+    """
+    if os.name == "nt":
+        return
+    try:
+        from multiprocessing import resource_tracker
+        resource_tracker.unregister(shm._name, "shared_memory")  # noqa: SLF001
+    except Exception:
+        pass
+
+
+class FrameBusPublisher:
+    """
+    Extremo escritor del bus. Crea (o reutiliza) el segmento y publica frames BGR.
+    Sólo debe existir un publicador por nombre de bus.
+    """
+
+    def __init__(self, name: str = DEFAULT_BUS_NAME, max_width: int = DEFAULT_MAX_WIDTH,
+                 max_height: int = DEFAULT_MAX_HEIGHT, slots: int = DEFAULT_BUS_SLOTS):
+        """
+        Inicializa el publicador.
+
+        Args:
+            name: Nombre del segmento de memoria compartida.
+            max_width: Ancho máximo de frame admitido.
+            max_height: Alto máximo de frame admitido.
+            slots: Nº de frames que mantiene el anillo.
+        """
+        self.name = name
+        self.max_width = max_width
+        self.max_height = max_height
+        self.slots = slots
+        self._slot_size = _slot_size(max_width, max_height)
+        size = _HEADER_SIZE + slots * self._slot_size
+        try:
+            self._shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        except FileExistsError:
+            # Segmento huérfano de una ejecución anterior: reutilizarlo si cabe
+            self._shm = shared_memory.SharedMemory(name=name)
+            if self._shm.size < size:
+                self._shm.close()
+                raise ValueError(f"El bus '{name}' ya existe con un tamaño incompatible ({self._shm.size} < {size})")
+            logger.warning(f"Reutilizando segmento de memoria compartida existente '{name}'.")
+        self._seq = 0
+        _HEADER.pack_into(self._shm.buf, 0, _MAGIC, _VERSION, slots, max_width, max_height, _CHANNELS, 0)
+        logger.info(f"Bus de frames '{name}' publicado ({slots} slots, máx. {max_width}x{max_height}).")
+
+    def publish(self, frame_bgr: np.ndarray, metadata: Optional[Dict[str, Any]] = None) -> int:
+        """
+        Publica un frame BGR y sus metadatos.
+
+        Args:
+            frame_bgr: Imagen (alto, ancho, 3) uint8.
+            metadata: Diccionario serializable a JSON (estado decidido, región, etc.).
+
+        Returns:
+            Número de secuencia asignado al frame, o 0 si no se pudo publicar.
+        """
+        if frame_bgr is None or frame_bgr.ndim != 3 or frame_bgr.shape[2] != _CHANNELS:
+            logger.warning("Frame inválido para publicar en el bus (se espera BGR de 3 canales).")
+            return 0
+        height, width = frame_bgr.shape[:2]
+        if width > self.max_width or height > self.max_height:
+            logger.warning(f"Frame {width}x{height} supera el máximo del bus ({self.max_width}x{self.max_height}).")
+            return 0
+        meta_bytes = json.dumps(metadata or {}, ensure_ascii=False, default=str).encode("utf-8")
+        if len(meta_bytes) > META_MAX_BYTES:
+            logger.warning(f"Metadatos del frame truncados ({len(meta_bytes)} > {META_MAX_BYTES} bytes).")
+            meta_bytes = json.dumps({"truncated": True}).encode("utf-8")
+
+        self._seq += 1
+        seq = self._seq
+        offset = _HEADER_SIZE + ((seq - 1) % self.slots) * self._slot_size
+        buf = self._shm.buf
+        # seq_fin=0 mientras se escribe: los lectores descartan el slot
+        _SLOT_HEADER.pack_into(buf, offset, seq, time.time(), width, height, len(meta_bytes), 0)
+        meta_offset = offset + _SLOT_HEADER_SIZE
+        buf[meta_offset:meta_offset + len(meta_bytes)] = meta_bytes
+        data_offset = meta_offset + META_MAX_BYTES
+        dest = np.ndarray((height, width, _CHANNELS), dtype=np.uint8, buffer=buf, offset=data_offset)
+        np.copyto(dest, frame_bgr)
+        struct.pack_into("<Q", buf, offset + _SEQ_END_OFFSET, seq)  # seq_fin
+        struct.pack_into("<Q", buf, _LATEST_SEQ_OFFSET, seq)      # último publicado
+        return seq
+
+    def close(self, unlink: bool = True) -> None:
+        """Libera el segmento (y lo elimina del sistema si unlink=True)."""
+        try:
+            self._shm.close()
+            if unlink:
+                self._shm.unlink()
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.warning(f"Error cerrando el bus de frames '{self.name}': {e}")
+
+
+class FrameBusReader:
+    """
+    Extremo lector del bus. Devuelve vistas de solo lectura (o copias) del último frame.
+    """
+
+    def __init__(self, name: str = DEFAULT_BUS_NAME):
+        """
+        Abre un bus existente.
+
+        Args:
+            name: Nombre del segmento publicado por FrameBusPublisher.
+
+        Raises:
+            FileNotFoundError: Si no hay ningún publicador con ese nombre.
+            ValueError: Si el segmento no tiene el formato esperado.
+        """
+        self.name = name
+        self._shm = shared_memory.SharedMemory(name=name)
+        _untrack(self._shm)
+        magic, version, slots, max_w, max_h, channels, _ = _HEADER.unpack_from(self._shm.buf, 0)
+        if magic != _MAGIC or version != _VERSION:
+            self._shm.close()
+            raise ValueError(f"El segmento '{name}' no es un bus de frames compatible.")
+        self.slots = slots
+        self.max_width = max_w
+        self.max_height = max_h
+        self._slot_size = _slot_size(max_w, max_h)
+        self.last_seq = 0
+
+    def latest_seq(self) -> int:
+        """Número de secuencia del último frame publicado (0 si ninguno)."""
+        return struct.unpack_from("<Q", self._shm.buf, _LATEST_SEQ_OFFSET)[0]
+
+    def read_latest(self, copy: bool = True, retries: int = 3) -> Tuple[Optional[np.ndarray], Dict[str, Any]]:
+        """
+        Lee el último frame publicado.
+
+        Args:
+            copy: Si False devuelve una vista de solo lectura sobre la memoria
+                  compartida (válida hasta que el publicador da la vuelta al anillo).
+            retries: Reintentos si el escritor sobrescribe el slot durante la lectura.
+
+        Returns:
+            Tupla (frame_bgr, metadatos). frame_bgr es None si no hay frame disponible.
+            Los metadatos incluyen 'bus_seq' y 'bus_timestamp'.
+        """
+        buf = self._shm.buf
+        for _ in range(max(1, retries)):
+            seq = self.latest_seq()
+            if seq == 0:
+                return None, {}
+            offset = _HEADER_SIZE + ((seq - 1) % self.slots) * self._slot_size
+            seq_start, timestamp, width, height, meta_len, seq_end = _SLOT_HEADER.unpack_from(buf, offset)
+            if seq_start != seq or seq_end != seq:
+                continue  # Slot en escritura
+            meta_offset = offset + _SLOT_HEADER_SIZE
+            meta_raw = bytes(buf[meta_offset:meta_offset + meta_len])
+            view = np.ndarray((height, width, _CHANNELS), dtype=np.uint8, buffer=buf,
+                              offset=meta_offset + META_MAX_BYTES)
+            frame = view.copy() if copy else view
+            # Comprobar que el escritor no tocó el slot mientras copiábamos
+            if _SLOT_HEADER.unpack_from(buf, offset)[0] != seq:
+                continue
+            if not copy:
+                frame.flags.writeable = False
+            try:
+                metadata = json.loads(meta_raw.decode("utf-8")) if meta_raw else {}
+            except ValueError:
+                metadata = {}
+            metadata['bus_seq'] = seq
+            metadata['bus_timestamp'] = timestamp
+            self.last_seq = seq
+            return frame, metadata
+        logger.debug(f"No se pudo leer un frame consistente del bus '{self.name}'.")
+        return None, {}
+
+    def wait_for_new(self, timeout: float = 1.0, poll_interval: float = 0.005) -> bool:
+        """Espera hasta que se publique un frame posterior al último leído."""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.latest_seq() > self.last_seq:
+                return True
+            time.sleep(poll_interval)
+        return False
+
+    def close(self) -> None:
+        """Desconecta el lector (el segmento sigue existiendo)."""
+        try:
+            self._shm.close()
+        except Exception:
+            pass
+
+
+def frame_matches_monitor(metadata: Dict[str, Any], monitor: Optional[Dict[str, int]]) -> bool:
+    """
+    Indica si un frame del bus es una captura completa del monitor indicado.
+
+    Args:
+        metadata: Metadatos devueltos por read_latest (con la 'region' capturada).
+        monitor: Geometría del monitor (left, top, width, height), p.ej. de mss.
+
+    Returns:
+        bool: False si falta alguna de las dos geometrías o no coinciden.
+    """
+    region = metadata.get('region') if metadata else None
+    if not region or not monitor:
+        return False
+    return all(region.get(key) == monitor.get(key) for key in ('left', 'top', 'width', 'height'))
+
+
+def open_reader_from_env() -> Optional[FrameBusReader]:
+    """
+    Abre el bus indicado en la variable de entorno EFOOTBALL_FRAME_BUS.
+
+    Returns:
+        FrameBusReader o None si la variable no está definida o el bus no existe.
+    """
+    name = os.environ.get(FRAME_BUS_ENV_VAR)
+    if not name:
+        return None
+    try:
+        reader = FrameBusReader(name)
+        logger.info(f"Leyendo frames del bus compartido '{name}'.")
+        return reader
+    except (FileNotFoundError, ValueError) as e:
+        logger.warning(f"No se pudo abrir el bus de frames '{name}' ({e}). Se capturará directamente.")
+        return None
+
+
+def serve(name: str = DEFAULT_BUS_NAME, interval: float = 0.1, monitor: int = 1) -> None:
+    """
+    Capturador independiente: captura el monitor y publica cada frame en el bus
+    hasta Ctrl+C.
+
+    Args:
+        name: Nombre del bus.
+        interval: Segundos entre capturas.
+        monitor: Índice del monitor a capturar (1-based).
+    """
+    from screen_recognizer import ScreenRecognizer
+
+    recognizer = ScreenRecognizer(monitor=monitor)
+    region = recognizer._get_monitor_region()
+    if region is None:
+        logger.error("No hay monitor disponible para capturar.")
+        return
+    publisher = FrameBusPublisher(name, max_width=region['width'], max_height=region['height'])
+    published = 0
+    try:
+        while True:
+            start = time.monotonic()
+            frame = recognizer.capture_frame()
+            if frame is not None:
+                publisher.publish(frame.bgr, {'frame_id': frame.frame_id, 'region': frame.region,
+                                              'source': 'capturer'})
+                published += 1
+            time.sleep(max(0.0, interval - (time.monotonic() - start)))
+    except KeyboardInterrupt:
+        logger.info(f"Capturador detenido tras publicar {published} frames.")
+    finally:
+        publisher.close()
+
+
+def main():
+    """Punto de entrada de línea de comandos."""
+    parser = argparse.ArgumentParser(description="Bus de frames en memoria compartida")
+    subparsers = parser.add_subparsers(dest="command")
+    serve_parser = subparsers.add_parser("serve", help="Capturar y publicar frames en el bus")
+    serve_parser.add_argument("--name", default=DEFAULT_BUS_NAME, help="Nombre del bus")
+    serve_parser.add_argument("--interval", type=float, default=0.1, help="Segundos entre capturas")
+    serve_parser.add_argument("--monitor", type=int, default=1, help="Monitor a capturar (1-based)")
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        serve(args.name, args.interval, args.monitor)
+    else:
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    if not logging.getLogger().hasHandlers():
+        logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    main()
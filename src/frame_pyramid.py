@@ -0,0 +1,166 @@
+"""
+Pirámide de representaciones de un frame, calculadas bajo demanda.
+
+El matching, el OCR, la detección de cambios y las previsualizaciones de las
+GUIs necesitan versiones distintas de la misma captura 4K (gris, mitad,
+cuarto, miniatura, ajustada al canvas...). FramePyramid las calcula la
+primera vez que se piden y las memoriza, de modo que cada representación se
+obtiene como mucho una vez por frame. Las ROIs se devuelven como vistas, sin
+copiar datos.
+"""
+
+import logging
+import threading
+from typing import Dict, Optional, Tuple
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger('frame_pyramid')
+
+LEVEL_FACTORS = (1, 2, 4)  # Completo, mitad y cuarto
+THUMBNAIL_WIDTH = 320      # Ancho de la miniatura (detección de cambios, listas)
+
+
+def _read_only(array: np.ndarray) -> np.ndarray:
+    view = array.view()
+    view.flags.writeable = False
+    return view
+
+
+class FramePyramid:
+    """
+    Representaciones derivadas (memorizadas) de un frame BGR.
+
+    El frame original no se copia: la pirámide es válida mientras lo sea el
+    buffer del que procede (p.ej. hasta que el pool de frames reutiliza el slot).
+    """
+
+    def __init__(self, bgr: np.ndarray, gray: Optional[np.ndarray] = None, frame_id=None, region=None):
+        """
+        Args:
+            bgr: Frame BGR (alto, ancho, 3).
+            gray: Versión en gris ya calculada (opcional; si no, se calcula al pedirla).
+            frame_id: Identificador del frame (informativo).
+            region: Geometría absoluta del frame {'left', 'top', 'width', 'height'} (opcional).
+        """
+        self.frame_id = frame_id
+        self.region = region
+        self._cache: Dict[tuple, np.ndarray] = {('level', 1, False): bgr}
+        if gray is not None:
+            self._cache[('level', 1, True)] = gray
+        self._lock = threading.RLock()  # Reentrante: un nivel se calcula a partir de otro
+        self.computed = 0  # Representaciones calculadas (diagnóstico)
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        """(alto, ancho) del frame completo."""
+        return self._cache[('level', 1, False)].shape[:2]
+
+    @property
+    def bgr(self) -> np.ndarray:
+        return _read_only(self._cache[('level', 1, False)])
+
+    @property
+    def gray(self) -> np.ndarray:
+        return self.level(1, gray=True)
+
+    @property
+    def half(self) -> np.ndarray:
+        return self.level(2)
+
+    @property
+    def quarter(self) -> np.ndarray:
+        return self.level(4)
+
+    def _memo(self, key: tuple, compute) -> np.ndarray:
+        image = self._cache.get(key)
+        if image is None:
+            with self._lock:
+                image = self._cache.get(key)
+                if image is None:
+                    image = compute()
+                    image.flags.writeable = False
+                    self._cache[key] = image
+                    self.computed += 1
+        return image
+
+    def level(self, factor: int = 1, gray: bool = False) -> np.ndarray:
+        """
+        Frame reducido ``factor`` veces (1, 2 o 4), en BGR o gris.
+
+        Cada nivel se obtiene del anterior (el cuarto a partir de la mitad).
+        """
+        if factor not in LEVEL_FACTORS:
+            raise ValueError(f"Nivel no soportado: {factor} (válidos: {LEVEL_FACTORS})")
+        if factor == 1:
+            if gray:
+                return _read_only(self._memo(('level', 1, True),
+                                             lambda: cv2.cvtColor(self._cache[('level', 1, False)], cv2.COLOR_BGR2GRAY)))
+            return self.bgr
+
+        def compute():
+            source = self.level(factor // 2, gray)
+            h, w = source.shape[:2]
+            return cv2.resize(source, (max(1, w // 2), max(1, h // 2)), interpolation=cv2.INTER_AREA)
+        return self._memo(('level', factor, gray), compute)
+
+    def thumbnail(self, gray: bool = False) -> np.ndarray:
+        """Miniatura de THUMBNAIL_WIDTH píxeles de ancho (a partir del nivel cuarto)."""
+        return self.fit(THUMBNAIL_WIDTH, THUMBNAIL_WIDTH, gray=gray)
+
+    def fit(self, max_width: int, max_height: int, rgb: bool = False, gray: bool = False) -> np.ndarray:
+        """
+        Frame escalado para caber en max_width x max_height manteniendo el aspecto.
+
+        Se parte del nivel más pequeño que siga siendo mayor o igual que el
+        tamaño pedido, así que una previsualización nunca redimensiona el 4K completo.
+
+        Args:
+            max_width, max_height: Caja en la que debe caber la imagen.
+            rgb: Devolver en RGB (para PIL/Tkinter) en lugar de BGR.
+            gray: Devolver en gris (ignora rgb).
+        """
+        h, w = self.shape
+        scale = min(max_width / w, max_height / h)
+        size = (max(1, int(w * scale)), max(1, int(h * scale)))
+        if size == (w, h) and not rgb:
+            return self.level(1, gray)
+        mode = 'gray' if gray else ('rgb' if rgb else 'bgr')
+
+        def compute():
+            if mode == 'rgb':
+                return cv2.cvtColor(self.fit(max_width, max_height), cv2.COLOR_BGR2RGB)
+            factor = 1
+            for candidate in LEVEL_FACTORS:
+                if w // candidate >= size[0] and h // candidate >= size[1]:
+                    factor = candidate
+            source = self.level(factor, gray)
+            if source.shape[1] == size[0] and source.shape[0] == size[1]:
+                return source.copy()
+            interpolation = cv2.INTER_AREA if scale < 1.0 else cv2.INTER_CUBIC
+            return cv2.resize(source, size, interpolation=interpolation)
+        return self._memo(('fit', size, mode), compute)
+
+    def roi(self, rect, factor: int = 1, gray: bool = True) -> Optional[np.ndarray]:
+        """
+        Vista (sin copia) de un rectángulo del frame.
+
+        Args:
+            rect: (left, top, width, height) en coordenadas del frame completo,
+                  relativas a su esquina superior izquierda.
+            factor: Nivel de la pirámide del que se toma la vista.
+            gray: Vista en gris o en BGR.
+
+        Returns:
+            numpy.ndarray de solo lectura, o None si el rectángulo queda fuera del frame.
+        """
+        image = self.level(factor, gray)
+        h, w = image.shape[:2]
+        x0 = max(0, int(rect[0]) // factor)
+        y0 = max(0, int(rect[1]) // factor)
+        x1 = min(w, (int(rect[0]) + int(rect[2])) // factor)
+        y1 = min(h, (int(rect[1]) + int(rect[3])) // factor)
+        if x1 <= x0 or y1 <= y0:
+            return None
+        return _read_only(image[y0:y1, x0:x1])
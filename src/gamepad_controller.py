@@ -8,9 +8,13 @@ Utiliza la biblioteca vgamepad para crear y manipular un gamepad virtual en Wind
 """
 
 import vgamepad as vg
+import threading
 import time
 from enum import Enum
 
+from async_runtime import current_token, wait_future, workflow_sleep, WorkflowCancelled
+from input_scheduler import InputScheduler, clock
+
 class GamepadType(Enum):
     """Tipos de gamepad soportados"""
     XBOX360 = "xbox360"
@@ -53,6 +57,9 @@ class GamepadController:
             gamepad_type (GamepadType): Tipo de gamepad a emular (por defecto: Xbox 360)
         """
         self.gamepad_type = gamepad_type
+        self._input_listeners = []  # Callbacks notificados con cada entrada enviada
+        self._state_lock = threading.RLock()  # Protege el estado del gamepad frente al planificador
+        self._scheduler = None  # InputScheduler, creado al primer uso
         
         # Crear el gamepad virtual según el tipo seleccionado
         if gamepad_type == GamepadType.XBOX360:
@@ -107,6 +114,33 @@ class GamepadController:
                 GamepadButton.DPAD_RIGHT: vg.DS4_DPAD_DIRECTIONS.DS4_BUTTON_DPAD_EAST,
             }
     
+    def add_input_listener(self, callback):
+        """
+        Registra un callback que recibe cada entrada enviada al gamepad.
+        
+        Args:
+            callback (callable): Función que recibe un diccionario con 'ts' (time.time()),
+                'kind' ('press', 'release', 'joystick' o 'trigger') y los parámetros de la entrada
+        """
+        if callback not in self._input_listeners:
+            self._input_listeners.append(callback)
+    
+    def remove_input_listener(self, callback):
+        """Elimina un callback registrado con add_input_listener."""
+        if callback in self._input_listeners:
+            self._input_listeners.remove(callback)
+    
+    def _notify_input(self, kind, **data):
+        """Notifica una entrada a los callbacks registrados (sus errores no interrumpen la entrada)."""
+        if not self._input_listeners:
+            return
+        event = {'ts': time.time(), 'kind': kind, **data}
+        for callback in list(self._input_listeners):
+            try:
+                callback(event)
+            except Exception as e:
+                print(f"Error en listener de entradas del gamepad: {e}")
+    
     def press_button(self, button, duration=0.1):
         """
         Presiona un botón del gamepad y lo suelta después de la duración especificada.
@@ -114,7 +148,45 @@ class GamepadController:
         Args:
             button (GamepadButton): Botón a presionar
             duration (float): Duración en segundos que el botón permanecerá presionado
+        
+        Raises:
+            WorkflowCancelled: Si el flujo que la llama se cancela (el botón se suelta igualmente).
+        """
+        self._check_workflow()
+        with self._state_lock:
+            self._apply_press(button)
+            # Actualizar el estado del gamepad
+            self.gamepad.update()
+        self._notify_input('press', button=button.value, duration=duration)
+        
+        # Esperar la duración especificada y soltar el botón
+        try:
+            self._hold(duration)
+        finally:
+            self.release_button(button)
+    
+    @staticmethod
+    def _check_workflow():
+        """Dentro de un flujo, espera si está en pausa y lanza WorkflowCancelled si se ha cancelado."""
+        token = current_token()
+        if token is not None:
+            token.check()
+    
+    @staticmethod
+    def _hold(duration):
+        """
+        Mantiene una entrada ``duration`` segundos. Dentro de un flujo la
+        cancelación la interrumpe; la pausa no, para que lo pulsado se suelte
+        antes de detenerse (en la siguiente pulsación).
         """
+        token = current_token()
+        if token is None:
+            time.sleep(duration)
+        else:
+            token.sleep(duration, pausable=False)
+    
+    def _apply_press(self, button):
+        """Marca un botón como presionado sin enviar el estado (gamepad.update())."""
         if button not in self.button_mapping:
             raise ValueError(f"Botón no soportado: {button}")
         
@@ -130,15 +202,6 @@ class GamepadController:
                 self.gamepad.directional_pad(direction=mapped_button)
             else:
                 self.gamepad.press_button(button=mapped_button)
-        
-        # Actualizar el estado del gamepad
-        self.gamepad.update()
-        
-        # Esperar la duración especificada
-        time.sleep(duration)
-        
-        # Soltar el botón
-        self.release_button(button)
     
     def release_button(self, button):
         """
@@ -147,6 +210,14 @@ class GamepadController:
         Args:
             button (GamepadButton): Botón a soltar
         """
+        with self._state_lock:
+            self._apply_release(button)
+            # Actualizar el estado del gamepad
+            self.gamepad.update()
+        self._notify_input('release', button=button.value)
+    
+    def _apply_release(self, button):
+        """Marca un botón como suelto sin enviar el estado (gamepad.update())."""
         if button not in self.button_mapping:
             raise ValueError(f"Botón no soportado: {button}")
         
@@ -162,9 +233,6 @@ class GamepadController:
                 self.gamepad.directional_pad(direction=vg.DS4_DPAD_DIRECTIONS.DS4_BUTTON_DPAD_NONE)
             else:
                 self.gamepad.release_button(button=mapped_button)
-        
-        # Actualizar el estado del gamepad
-        self.gamepad.update()
     
     def move_joystick(self, joystick="left", x_value=0, y_value=0, duration=0.1):
         """
@@ -175,8 +243,27 @@ class GamepadController:
             x_value (int): Valor del eje X (-32768 a 32767)
             y_value (int): Valor del eje Y (-32768 a 32767)
             duration (float): Duración en segundos que el joystick permanecerá en la posición
+        
+        Raises:
+            WorkflowCancelled: Si el flujo que la llama se cancela (el joystick vuelve al centro).
         """
+        self._check_workflow()
         # Mover el joystick
+        with self._state_lock:
+            self._apply_joystick(joystick, x_value, y_value)
+            # Actualizar el estado del gamepad
+            self.gamepad.update()
+        self._notify_input('joystick', joystick=joystick.lower(), x=x_value, y=y_value, duration=duration)
+        
+        # Esperar la duración especificada y volver a la posición central
+        if duration > 0:
+            try:
+                self._hold(duration)
+            finally:
+                self.reset_joystick(joystick)
+    
+    def _apply_joystick(self, joystick, x_value, y_value):
+        """Fija la posición de un joystick sin enviar el estado (gamepad.update())."""
         if self.gamepad_type in [GamepadType.XBOX360, GamepadType.XBOXONE]:
             if joystick.lower() == "left":
                 self.gamepad.left_joystick(x_value=x_value, y_value=y_value)
@@ -191,16 +278,6 @@ class GamepadController:
                 self.gamepad.right_joystick_float(x_value=x_value/32767.0, y_value=y_value/32767.0)
             else:
                 raise ValueError(f"Joystick no válido: {joystick}. Debe ser 'left' o 'right'")
-        
-        # Actualizar el estado del gamepad
-        self.gamepad.update()
-        
-        # Esperar la duración especificada
-        time.sleep(duration)
-        
-        # Volver a la posición central
-        if duration > 0:
-            self.reset_joystick(joystick)
     
     def reset_joystick(self, joystick="left"):
         """
@@ -209,23 +286,10 @@ class GamepadController:
         Args:
             joystick (str): Joystick a resetear ("left" o "right")
         """
-        if self.gamepad_type in [GamepadType.XBOX360, GamepadType.XBOXONE]:
-            if joystick.lower() == "left":
-                self.gamepad.left_joystick(x_value=0, y_value=0)
-            elif joystick.lower() == "right":
-                self.gamepad.right_joystick(x_value=0, y_value=0)
-            else:
-                raise ValueError(f"Joystick no válido: {joystick}. Debe ser 'left' o 'right'")
-        elif self.gamepad_type == GamepadType.DS4:
-            if joystick.lower() == "left":
-                self.gamepad.left_joystick_float(x_value=0.0, y_value=0.0)
-            elif joystick.lower() == "right":
-                self.gamepad.right_joystick_float(x_value=0.0, y_value=0.0)
-            else:
-                raise ValueError(f"Joystick no válido: {joystick}. Debe ser 'left' o 'right'")
-        
-        # Actualizar el estado del gamepad
-        self.gamepad.update()
+        with self._state_lock:
+            self._apply_joystick(joystick, 0, 0)
+            # Actualizar el estado del gamepad
+            self.gamepad.update()
     
     def trigger_press(self, trigger="left", value=255, duration=0.1):
         """
@@ -235,8 +299,27 @@ class GamepadController:
             trigger (str): Gatillo a presionar ("left" o "right")
             value (int): Valor de presión (0-255 para Xbox, 0-255 para DS4)
             duration (float): Duración en segundos que el gatillo permanecerá presionado
+        
+        Raises:
+            WorkflowCancelled: Si el flujo que la llama se cancela (el gatillo se suelta).
         """
+        self._check_workflow()
         # Presionar el gatillo
+        with self._state_lock:
+            self._apply_trigger(trigger, value)
+            # Actualizar el estado del gamepad
+            self.gamepad.update()
+        self._notify_input('trigger', trigger=trigger.lower(), value=value, duration=duration)
+        
+        # Esperar la duración especificada y soltar el gatillo
+        if duration > 0:
+            try:
+                self._hold(duration)
+            finally:
+                self.trigger_release(trigger)
+    
+    def _apply_trigger(self, trigger, value):
+        """Fija la presión de un gatillo sin enviar el estado (gamepad.update())."""
         if self.gamepad_type in [GamepadType.XBOX360, GamepadType.XBOXONE]:
             if trigger.lower() == "left":
                 self.gamepad.left_trigger(value=value)
@@ -251,16 +334,6 @@ class GamepadController:
                 self.gamepad.right_trigger_float(value=value/255.0)
             else:
                 raise ValueError(f"Gatillo no válido: {trigger}. Debe ser 'left' o 'right'")
-        
-        # Actualizar el estado del gamepad
-        self.gamepad.update()
-        
-        # Esperar la duración especificada
-        time.sleep(duration)
-        
-        # Soltar el gatillo
-        if duration > 0:
-            self.trigger_release(trigger)
     
     def trigger_release(self, trigger="left"):
         """
@@ -270,28 +343,79 @@ class GamepadController:
             trigger (str): Gatillo a soltar ("left" o "right")
         """
         # Soltar el gatillo
-        if self.gamepad_type in [GamepadType.XBOX360, GamepadType.XBOXONE]:
-            if trigger.lower() == "left":
-                self.gamepad.left_trigger(value=0)
-            elif trigger.lower() == "right":
-                self.gamepad.right_trigger(value=0)
-            else:
-                raise ValueError(f"Gatillo no válido: {trigger}. Debe ser 'left' o 'right'")
-        elif self.gamepad_type == GamepadType.DS4:
-            if trigger.lower() == "left":
-                self.gamepad.left_trigger_float(value=0.0)
-            elif trigger.lower() == "right":
-                self.gamepad.right_trigger_float(value=0.0)
-            else:
-                raise ValueError(f"Gatillo no válido: {trigger}. Debe ser 'left' o 'right'")
+        with self._state_lock:
+            self._apply_trigger(trigger, 0)
+            # Actualizar el estado del gamepad
+            self.gamepad.update()
+    
+    @property
+    def scheduler(self):
+        """Planificador de entradas con plazos precisos (se crea al primer uso)."""
+        if self._scheduler is None:
+            self._scheduler = InputScheduler(self)
+        return self._scheduler
+    
+    def schedule_press(self, button, duration=0.1, at=None):
+        """
+        Programa una pulsación sin bloquear.
+        
+        Args:
+            button (GamepadButton): Botón a presionar
+            duration (float): Duración en segundos que el botón permanecerá presionado
+            at (float): Instante de la pulsación en el reloj input_scheduler.clock() (None = ya)
+        
+        Returns:
+            Future: Se completa al soltar el botón, con el jitter (s) de la suelta
+        """
+        start = clock() if at is None else at
+        self.scheduler.schedule('press', at=start, button=button, notify={'duration': duration})
+        return self.scheduler.schedule('release', at=start + duration, button=button)
+    
+    def schedule_joystick(self, joystick="left", x_value=0, y_value=0, duration=0.1, at=None):
+        """
+        Programa un movimiento de joystick sin bloquear (vuelve al centro tras duration si es > 0).
+        
+        Returns:
+            Future: Se completa al aplicar la última entrada programada
+        """
+        start = clock() if at is None else at
+        future = self.scheduler.schedule('joystick', at=start, joystick=joystick, x=x_value, y=y_value,
+                                         notify={'duration': duration})
+        if duration > 0:
+            future = self.scheduler.schedule('joystick', at=start + duration, joystick=joystick, x=0, y=0)
+        return future
+    
+    def schedule_trigger(self, trigger="left", value=255, duration=0.1, at=None):
+        """
+        Programa una pulsación de gatillo sin bloquear (se suelta tras duration si es > 0).
         
-        # Actualizar el estado del gamepad
-        self.gamepad.update()
+        Returns:
+            Future: Se completa al aplicar la última entrada programada
+        """
+        start = clock() if at is None else at
+        future = self.scheduler.schedule('trigger', at=start, trigger=trigger, value=value,
+                                         notify={'duration': duration})
+        if duration > 0:
+            future = self.scheduler.schedule('trigger', at=start + duration, trigger=trigger, value=0)
+        return future
     
-    def execute_sequence(self, sequence):
+    def close(self):
+        """Detiene el planificador de entradas (cancela lo pendiente) y deja el gamepad en reposo."""
+        if self._scheduler is not None:
+            self._scheduler.close()
+            self._scheduler = None
+        with self._state_lock:
+            self.gamepad.reset()
+            self.gamepad.update()
+    
+    def execute_sequence(self, sequence, wait=True):
         """
         Ejecuta una secuencia de comandos del gamepad.
         
+        Los comandos se programan en el planificador con plazos absolutos desde
+        el inicio de la secuencia, así que el retraso de un paso no se acumula
+        en los siguientes.
+        
         Args:
             sequence (list): Lista de diccionarios con comandos a ejecutar
                 Ejemplo: [
@@ -299,34 +423,60 @@ class GamepadController:
                     {"type": "joystick", "joystick": "left", "x": 32767, "y": 0, "duration": 0.5},
                     {"type": "wait", "duration": 1.0}
                 ]
+            wait (bool): Esperar a que termine la secuencia; si es False se devuelve un Future
+        
+        Returns:
+            Future: Si wait es False, se completa al terminar la secuencia (None si no hay entradas)
         """
+        t = clock()
+        last = None
         for command in sequence:
             cmd_type = command.get("type", "")
             
             if cmd_type == "button":
-                button = command.get("button")
                 duration = command.get("duration", 0.1)
-                self.press_button(button, duration)
+                last = self.schedule_press(command.get("button"), duration, at=t)
+                t += duration
             
             elif cmd_type == "joystick":
-                joystick = command.get("joystick", "left")
-                x_value = command.get("x", 0)
-                y_value = command.get("y", 0)
                 duration = command.get("duration", 0.1)
-                self.move_joystick(joystick, x_value, y_value, duration)
+                last = self.schedule_joystick(command.get("joystick", "left"), command.get("x", 0),
+                                              command.get("y", 0), duration, at=t)
+                t += duration
             
             elif cmd_type == "trigger":
-                trigger = command.get("trigger", "left")
-                value = command.get("value", 255)
                 duration = command.get("duration", 0.1)
-                self.trigger_press(trigger, value, duration)
+                last = self.schedule_trigger(command.get("trigger", "left"), command.get("value", 255),
+                                             duration, at=t)
+                t += duration
             
             elif cmd_type == "wait":
-                duration = command.get("duration", 0.5)
-                time.sleep(duration)
+                t += command.get("duration", 0.5)
             
             else:
                 print(f"Tipo de comando desconocido: {cmd_type}")
+        
+        if not wait:
+            return last
+        self._wait_scheduled(last, t)
+    
+    def _wait_scheduled(self, future, until):
+        """
+        Espera a que se aplique ``future`` y a que el reloj llegue a ``until``.
+        
+        Dentro de un flujo la espera es cancelable: al cancelarse se descartan las
+        entradas pendientes (soltando lo pulsado) y se propaga WorkflowCancelled.
+        """
+        try:
+            if future is not None:
+                wait_future(future)
+            # Las esperas finales también forman parte de la secuencia
+            remaining = until - clock()
+            if remaining > 0:
+                workflow_sleep(remaining)
+        except WorkflowCancelled:
+            self.scheduler.cancel_pending()
+            raise
 
 # Ejemplos de secuencias predefinidas para eFootball
 class EFootballSequences:
@@ -0,0 +1,292 @@
+"""
+Detección de la opción resaltada en menús que se recorren con el D-pad.
+
+En los menús del juego la opción seleccionada se distingue por un color de
+selección, por ser más brillante que el resto o por un marco. HighlightDetector
+localiza la opción resaltada en una sola pasada sobre la región del menú
+reducida de escala: proyecta la región sobre el eje del menú (perfil 1-D),
+la divide en tantas franjas como opciones y elige la franja con más
+puntuación:
+
+- 'color': fracción de píxeles cercanos al color de selección.
+- 'brightness': brillo medio (máximo de los canales BGR).
+- 'template': posición de una plantilla pequeña del resaltado.
+
+La detección se rechaza (index None) si la mejor franja no destaca lo
+suficiente sobre la segunda, p.ej. durante una animación.
+
+Las regiones de los menús pueden guardarse en config/menu_layouts.json. El
+fichero es opcional y no se incluye en el repositorio (depende de la
+resolución de cada equipo); sin él se indican --region y --options:
+
+    {"menu_miequipo_jugadores_lista": {"region": {"left": 400, "top": 500, "width": 900, "height": 1200},
+                                       "options": 10, "layout": "vertical",
+                                       "highlight_color": [40, 220, 250], "color_tolerance": 40}}
+
+Uso:
+    python highlight_detector.py captura.png --layout-name menu_miequipo_jugadores_lista
+    python highlight_detector.py captura.png --region 400,500,900,1200 --options 10
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+from collections import namedtuple
+from typing import Any, Dict, List, Optional, Sequence
+
+import cv2
+import numpy as np
+
+from recognition_bundle import CONFIG_DIR, IMAGES_DIR
+
+logger = logging.getLogger('highlight_detector')
+
+MENU_LAYOUTS_FILE = os.path.join(CONFIG_DIR, "menu_layouts.json")
+DEFAULT_SCALE = 0.25            # Reducción de la región antes de analizarla
+DEFAULT_COLOR_TOLERANCE = 40    # Diferencia máxima por canal con el color de selección
+DEFAULT_MIN_MARGIN = 0.15       # Ventaja relativa mínima de la mejor franja sobre la segunda
+DEFAULT_BAND_TRIM = 0.15        # Fracción de cada franja que se ignora en sus bordes
+LAYOUTS = ('vertical', 'horizontal')
+
+# index: opción resaltada (0-based) o None; confidence: ventaja relativa; scores: puntuación por franja
+Highlight = namedtuple('Highlight', 'index confidence scores')
+
+
+class MenuLayout:
+    """
+    Geometría de un menú: región absoluta, número de opciones, orientación y
+    cómo se ve el resaltado.
+    """
+
+    def __init__(self, region: Dict[str, int], options: Sequence[str], layout: str = 'vertical',
+                 highlight_color: Optional[Sequence[int]] = None, color_tolerance: int = DEFAULT_COLOR_TOLERANCE,
+                 template: Optional[str] = None):
+        """
+        Args:
+            region: {'left', 'top', 'width', 'height'} absolutos del bloque de opciones.
+            options: Nombres de las opciones visibles en orden.
+            layout: 'vertical' u 'horizontal'.
+            highlight_color: Color BGR de selección (si no, se usa el brillo).
+            color_tolerance: Diferencia máxima por canal con highlight_color.
+            template: Plantilla del resaltado (relativa a images/), alternativa al color.
+        """
+        if layout not in LAYOUTS:
+            raise ValueError(f"Disposición no válida: {layout!r} (válidas: {LAYOUTS})")
+        self.region = dict(region)
+        self.options = list(options)
+        self.layout = layout
+        self.highlight_color = tuple(highlight_color) if highlight_color is not None else None
+        self.color_tolerance = color_tolerance
+        self.template = template
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'MenuLayout':
+        options = data['options']
+        if isinstance(options, int):
+            options = [str(i) for i in range(options)]
+        return cls(data['region'], options, data.get('layout', 'vertical'), data.get('highlight_color'),
+                   data.get('color_tolerance', DEFAULT_COLOR_TOLERANCE), data.get('template'))
+
+
+def load_menu_layouts(path: str = MENU_LAYOUTS_FILE) -> Dict[str, MenuLayout]:
+    """Carga config/menu_layouts.json ({} si no existe; las entradas inválidas se omiten)."""
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError) as e:
+        logger.error(f"No se pudo leer {path}: {e}")
+        return {}
+    layouts = {}
+    for name, entry in data.items():
+        try:
+            layouts[name] = MenuLayout.from_dict(entry)
+        except (KeyError, TypeError, ValueError) as e:
+            logger.warning(f"Menú '{name}' inválido en {path}: {e}")
+    return layouts
+
+
+class HighlightDetector:
+    """
+    Localiza la opción resaltada dentro de la región de un menú.
+    """
+
+    def __init__(self, options_count: int, layout: str = 'vertical', highlight_color: Optional[Sequence[int]] = None,
+                 color_tolerance: int = DEFAULT_COLOR_TOLERANCE, template: Optional[np.ndarray] = None,
+                 scale: float = DEFAULT_SCALE, min_margin: float = DEFAULT_MIN_MARGIN,
+                 band_trim: float = DEFAULT_BAND_TRIM):
+        """
+        Args:
+            options_count: Número de opciones (franjas) del menú.
+            layout: 'vertical' (opciones apiladas) u 'horizontal'.
+            highlight_color: Color BGR de selección; si no se indica (ni plantilla), se usa el brillo.
+            color_tolerance: Diferencia máxima por canal con highlight_color.
+            template: Plantilla BGR o gris del resaltado (a escala completa).
+            scale: Factor de reducción de la región antes de analizarla.
+            min_margin: Ventaja relativa mínima sobre la segunda franja para aceptar la detección.
+            band_trim: Fracción de cada franja ignorada en sus bordes (separadores, sombras).
+        """
+        if options_count < 1:
+            raise ValueError("El menú necesita al menos una opción")
+        if layout not in LAYOUTS:
+            raise ValueError(f"Disposición no válida: {layout!r} (válidas: {LAYOUTS})")
+        self.options_count = options_count
+        self.layout = layout
+        self.highlight_color = np.array(highlight_color, dtype=np.int16) if highlight_color is not None else None
+        self.color_tolerance = color_tolerance
+        self.scale = scale
+        self.min_margin = min_margin
+        self.band_trim = band_trim
+        self.template = None
+        if template is not None:
+            gray = cv2.cvtColor(template, cv2.COLOR_BGR2GRAY) if template.ndim == 3 else template
+            if float(gray.std()) < 1.0:
+                raise ValueError("La plantilla de resaltado es uniforme: incluye el borde o el texto del resaltado")
+            self.template = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA) \
+                if scale < 1.0 else gray
+        self.method = 'template' if self.template is not None else ('color' if self.highlight_color is not None
+                                                                     else 'brightness')
+
+    @classmethod
+    def from_layout(cls, layout: MenuLayout, **kwargs) -> 'HighlightDetector':
+        """Detector para un MenuLayout (p.ej. de load_menu_layouts())."""
+        template = None
+        if layout.template:
+            template = cv2.imread(os.path.join(IMAGES_DIR, layout.template), cv2.IMREAD_COLOR)
+            if template is None:
+                logger.warning(f"No se pudo leer la plantilla de resaltado {layout.template}; se usa el color/brillo.")
+        return cls(len(layout.options), layout.layout, layout.highlight_color, layout.color_tolerance,
+                   template, **kwargs)
+
+    def _bands(self, profile: np.ndarray, reduce=np.mean) -> np.ndarray:
+        """Media (o ``reduce``) del perfil 1-D en cada franja, recortando sus bordes."""
+        edges = np.linspace(0, len(profile), self.options_count + 1)
+        scores = np.empty(self.options_count, dtype=np.float64)
+        for i in range(self.options_count):
+            start, end = edges[i], edges[i + 1]
+            trim = (end - start) * self.band_trim
+            lo, hi = int(round(start + trim)), int(round(end - trim))
+            scores[i] = reduce(profile[lo:max(hi, lo + 1)])
+        return scores
+
+    def detect(self, image: np.ndarray) -> Highlight:
+        """
+        Detecta la opción resaltada en una imagen de la región del menú.
+
+        Args:
+            image: Recorte BGR (o en grises) de la región del menú (a escala completa).
+
+        Returns:
+            Highlight(index, confidence, scores). index es None si ninguna franja destaca.
+        """
+        small = cv2.resize(image, None, fx=self.scale, fy=self.scale, interpolation=cv2.INTER_AREA) \
+            if self.scale < 1.0 else image
+        axis = 1 if self.layout == 'vertical' else 0  # Se promedia el eje transversal al menú
+        reduce = np.mean
+
+        if self.method == 'template':
+            gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY) if small.ndim == 3 else small
+            th, tw = self.template.shape[:2]
+            if gray.shape[0] < th or gray.shape[1] < tw:
+                return Highlight(None, 0.0, [])
+            response = cv2.matchTemplate(gray, self.template, cv2.TM_CCOEFF_NORMED)
+            # Mejor respuesta por posición a lo largo del menú (centrada en la plantilla)
+            profile = response.max(axis=axis)
+            offset = (th if self.layout == 'vertical' else tw) // 2
+            length = gray.shape[0] if self.layout == 'vertical' else gray.shape[1]
+            full = np.full(length, profile.min(), dtype=np.float32)
+            full[offset:offset + len(profile)] = profile
+            profile = np.clip(full, 0.0, None)
+            reduce = np.max  # El pico de la plantilla es estrecho: la media lo diluiría
+        elif self.method == 'color':
+            if small.ndim == 2:
+                small = cv2.cvtColor(small, cv2.COLOR_GRAY2BGR)
+            diff = np.abs(small.astype(np.int16) - self.highlight_color)
+            mask = (diff <= self.color_tolerance).all(axis=2)
+            profile = mask.mean(axis=axis)
+        else:
+            profile = small.max(axis=2).mean(axis=axis) if small.ndim == 3 else small.mean(axis=axis)
+
+        scores = self._bands(profile, reduce)
+        if self.options_count == 1:
+            return Highlight(0, 1.0, scores.tolist())
+        order = np.argsort(scores)[::-1]
+        best, second = scores[order[0]], scores[order[1]]
+        confidence = float((best - second) / best) if best > 0 else 0.0
+        index = int(order[0]) if confidence >= self.min_margin else None
+        return Highlight(index, confidence, scores.tolist())
+
+    def detect_on_screen(self, recognizer, region: Dict[str, int]) -> Highlight:
+        """
+        Captura sólo la región del menú con el reconocedor y detecta la opción resaltada.
+
+        Sirve el ScreenRecognizer local o el cliente del servicio (ambos tienen
+        capture_screen); si la captura falla devuelve index None.
+        """
+        capture = getattr(recognizer, 'capture_screen', None)
+        image = capture(region=region) if capture is not None else None
+        if image is None:
+            return Highlight(None, 0.0, [])
+        return self.detect(image)
+
+
+def _parse_region(value: str) -> Dict[str, int]:
+    left, top, width, height = (int(v) for v in value.split(","))
+    return {'left': left, 'top': top, 'width': width, 'height': height}
+
+
+def main():
+    """Punto de entrada de línea de comandos."""
+    parser = argparse.ArgumentParser(description="Detector de la opción resaltada en menús")
+    parser.add_argument("image", help="Captura de pantalla completa")
+    parser.add_argument("--layout-name", default=None, help="Menú de config/menu_layouts.json (opcional)")
+    parser.add_argument("--region", default=None, help="Región x,y,ancho,alto (relativa a la captura)")
+    parser.add_argument("--options", type=int, default=None, help="Número de opciones")
+    parser.add_argument("--layout", choices=LAYOUTS, default='vertical')
+    parser.add_argument("--color", default=None, help="Color de selección B,G,R")
+    parser.add_argument("--scale", type=float, default=DEFAULT_SCALE)
+    args = parser.parse_args()
+
+    image = cv2.imread(args.image, cv2.IMREAD_COLOR)
+    if image is None:
+        print(f"No se pudo leer {args.image}")
+        return 1
+    if args.layout_name:
+        layouts = load_menu_layouts()
+        if args.layout_name not in layouts:
+            print(f"Menú '{args.layout_name}' no definido en {MENU_LAYOUTS_FILE}")
+            return 1
+        menu = layouts[args.layout_name]
+        detector = HighlightDetector.from_layout(menu, scale=args.scale)
+        region = menu.region
+        options: List[str] = menu.options
+    elif args.region and args.options:
+        region = _parse_region(args.region)
+        color = [int(v) for v in args.color.split(",")] if args.color else None
+        detector = HighlightDetector(args.options, args.layout, color, scale=args.scale)
+        options = [str(i) for i in range(args.options)]
+    else:
+        parser.error("Indica --layout-name o --region y --options")
+    crop = image[region['top']:region['top'] + region['height'], region['left']:region['left'] + region['width']]
+
+    started = time.perf_counter()
+    result = detector.detect(crop)
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    scores = ", ".join(f"{s:.3f}" for s in result.scores)
+    if result.index is None:
+        print(f"Sin opción resaltada clara (método {detector.method}, ventaja {result.confidence:.2f}; "
+              f"franjas: {scores}) en {elapsed_ms:.2f} ms")
+        return 1
+    print(f"Opción resaltada: {result.index} ({options[result.index]}) | método {detector.method} | "
+          f"ventaja {result.confidence:.2f} | {elapsed_ms:.2f} ms\nFranjas: {scores}")
+    return 0
+
+
+if __name__ == "__main__":
+    if not logging.getLogger().hasHandlers():
+        logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    sys.exit(main())
@@ -0,0 +1,373 @@
+"""
+Planificador de entradas con plazos precisos para GamepadController.
+
+press_button, move_joystick y trigger_press bloquean con time.sleep(duration)
+y execute_sequence encadena los comandos uno tras otro, así que en macros
+largas el retraso de cada sleep se acumula. InputScheduler recibe eventos
+con marca de tiempo (pulsar, soltar, joystick, gatillo) y un hilo los aplica
+en su plazo absoluto:
+
+- Espera híbrida: time.sleep hasta SPIN_THRESHOLD_S antes del plazo y espera
+  activa el resto (en Windows time.sleep tiene una granularidad de ~15 ms si
+  no se sube la resolución del temporizador con timeBeginPeriod).
+- Todos los eventos que vencen en la misma iteración (dentro de
+  COALESCE_WINDOW_S) se aplican al estado del gamepad y se envían con un
+  único gamepad.update().
+- Cada evento devuelve un concurrent.futures.Future que se completa con el
+  retraso real respecto a su plazo (jitter, en segundos).
+- stats() resume el jitter medido (media, p95, máximo).
+
+El reloj es time.perf_counter (en Windows time.monotonic usa GetTickCount64,
+con resolución de ~15 ms).
+
+Uso:
+    python input_scheduler.py bench --events 500
+"""
+
+import argparse
+import atexit
+import heapq
+import itertools
+import logging
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger('input_scheduler')
+
+SPIN_THRESHOLD_S = 0.002    # Último tramo antes del plazo en espera activa
+COALESCE_WINDOW_S = 0.0005  # Eventos con plazos así de próximos salen en el mismo update()
+JITTER_HISTORY = 1000       # Muestras de jitter guardadas para las estadísticas
+CLOSE_TIMEOUT_S = 2.0
+
+EVENT_KINDS = ('press', 'release', 'joystick', 'trigger')
+
+clock = time.perf_counter
+
+
+def _raise_timer_resolution() -> bool:
+    """Sube la resolución del temporizador de Windows a 1 ms (sin efecto en otros sistemas)."""
+    if sys.platform != 'win32':
+        return False
+    try:
+        import ctypes
+        return ctypes.windll.winmm.timeBeginPeriod(1) == 0
+    except Exception as e:
+        logger.debug(f"No se pudo ajustar la resolución del temporizador: {e}")
+        return False
+
+
+def _restore_timer_resolution() -> None:
+    try:
+        import ctypes
+        ctypes.windll.winmm.timeEndPeriod(1)
+    except Exception:
+        pass
+
+
+class InputScheduler:
+    """
+    Hilo que aplica entradas del gamepad en plazos absolutos (reloj clock()).
+    """
+
+    def __init__(self, controller, spin_threshold_s: float = SPIN_THRESHOLD_S,
+                 coalesce_window_s: float = COALESCE_WINDOW_S):
+        """
+        Args:
+            controller: GamepadController cuyo estado se modifica (sus métodos _apply_*
+                        y gamepad.update(), bajo controller._state_lock).
+            spin_threshold_s: Tramo final de cada espera que se hace en espera activa.
+            coalesce_window_s: Margen para agrupar eventos en un único update().
+        """
+        self.controller = controller
+        self.spin_threshold_s = spin_threshold_s
+        self.coalesce_window_s = coalesce_window_s
+        self._heap: List[tuple] = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._closed = False
+        self._jitter = deque(maxlen=JITTER_HISTORY)
+        self._counters = {'events': 0, 'updates': 0, 'errors': 0, 'cancelled': 0}
+        self._timer_raised = _raise_timer_resolution()
+        self._thread = threading.Thread(target=self._run, name="InputScheduler", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def _validate(self, kind: str, params: Dict[str, Any]) -> None:
+        if kind in ('press', 'release'):
+            if params.get('button') not in self.controller.button_mapping:
+                raise ValueError(f"Botón no soportado: {params.get('button')}")
+        elif kind == 'joystick':
+            if str(params.get('joystick', '')).lower() not in ('left', 'right'):
+                raise ValueError(f"Joystick no válido: {params.get('joystick')}. Debe ser 'left' o 'right'")
+        elif kind == 'trigger':
+            if str(params.get('trigger', '')).lower() not in ('left', 'right'):
+                raise ValueError(f"Gatillo no válido: {params.get('trigger')}. Debe ser 'left' o 'right'")
+        else:
+            raise ValueError(f"Tipo de evento no válido: {kind} (válidos: {EVENT_KINDS})")
+
+    def schedule(self, kind: str, at: Optional[float] = None, **params) -> Future:
+        """
+        Programa un evento de entrada.
+
+        Args:
+            kind: 'press', 'release' (button=GamepadButton), 'joystick'
+                  (joystick='left'/'right', x, y) o 'trigger' (trigger='left'/'right', value).
+            at: Plazo en el reloj clock(); None = lo antes posible.
+            **params: Parámetros del evento. 'notify' (dict) se añade a la
+                      notificación de entrada del controlador (p.ej. duration).
+
+        Returns:
+            Future que se completa con el jitter (s) al aplicar el evento.
+
+        Raises:
+            ValueError: Si el evento no es válido o el planificador está cerrado.
+        """
+        self._validate(kind, params)
+        future = Future()
+        deadline = clock() if at is None else at
+        with self._cond:
+            if self._closed:
+                raise ValueError("Planificador de entradas cerrado")
+            heapq.heappush(self._heap, (deadline, next(self._seq), kind, params, future))
+            self._cond.notify_all()
+        return future
+
+    def pending(self) -> int:
+        """Número de eventos aún no aplicados."""
+        with self._cond:
+            return len(self._heap)
+
+    @staticmethod
+    def _is_neutral(kind: str, params: Dict[str, Any]) -> bool:
+        """Eventos que devuelven un control a reposo (soltar, joystick centrado, gatillo a 0)."""
+        if kind == 'release':
+            return True
+        if kind == 'joystick':
+            return not params.get('x', 0) and not params.get('y', 0)
+        if kind == 'trigger':
+            return not params.get('value', 255)
+        return False
+
+    def cancel_pending(self) -> int:
+        """
+        Cancela los eventos pendientes sin dejar controles pulsados.
+
+        Las pulsaciones y movimientos pendientes se cancelan; las vueltas a reposo
+        pendientes (soltar botón, centrar joystick, gatillo a 0) se aplican ya, en un
+        único update(), porque su pulsación puede haberse aplicado antes.
+
+        Returns:
+            Número de eventos cancelados (sin contar los aplicados ahora).
+        """
+        with self._cond:
+            pending = self._heap
+            self._heap = []
+            self._cond.notify_all()
+        now = clock()
+        neutral = [(now, seq, kind, params, future) for _, seq, kind, params, future in sorted(pending)
+                   if self._is_neutral(kind, params)]
+        cancelled = [entry for entry in pending if not self._is_neutral(entry[2], entry[3])]
+        self._counters['cancelled'] += len(cancelled)
+        for entry in cancelled:
+            entry[4].cancel()
+        if neutral:
+            try:
+                self._apply(neutral)
+            except Exception as e:
+                logger.exception(f"Error soltando las entradas canceladas: {e}")
+        return len(cancelled)
+
+    def _wait_until(self, deadline: float) -> bool:
+        """Espera hasta el plazo; devuelve False si llega antes un evento más urgente o el cierre."""
+        while True:
+            remaining = deadline - clock()
+            if remaining <= self.spin_threshold_s:
+                break
+            with self._cond:
+                if self._closed or (self._heap and self._heap[0][0] < deadline):
+                    return False
+                self._cond.wait(remaining - self.spin_threshold_s)
+        while clock() < deadline:
+            pass
+        return True
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._heap and not self._closed:
+                    self._cond.wait()
+                if self._closed:
+                    return
+                deadline = self._heap[0][0]
+            if not self._wait_until(deadline):
+                continue
+            with self._cond:
+                horizon = clock() + self.coalesce_window_s
+                due, targets = [], set()
+                while self._heap and self._heap[0][0] <= horizon:
+                    # Dos cambios del mismo control (p.ej. pulsar y soltar) nunca en el mismo update()
+                    target = self._target(self._heap[0][2], self._heap[0][3])
+                    if target in targets:
+                        break
+                    targets.add(target)
+                    due.append(heapq.heappop(self._heap))
+            if due:
+                try:
+                    self._apply(due)
+                except Exception as e:
+                    logger.exception(f"Error aplicando entradas programadas: {e}")
+
+    @staticmethod
+    def _target(kind: str, params: Dict[str, Any]) -> tuple:
+        if kind in ('press', 'release'):
+            return ('button', params['button'])
+        if kind == 'joystick':
+            return ('joystick', params['joystick'].lower())
+        return ('trigger', params['trigger'].lower())
+
+    def _apply(self, due: List[tuple]) -> None:
+        controller = self.controller
+        applied = []
+        with controller._state_lock:
+            for deadline, _, kind, params, future in due:
+                if not future.set_running_or_notify_cancel():
+                    continue
+                try:
+                    if kind == 'press':
+                        controller._apply_press(params['button'])
+                    elif kind == 'release':
+                        controller._apply_release(params['button'])
+                    elif kind == 'joystick':
+                        controller._apply_joystick(params['joystick'], params.get('x', 0), params.get('y', 0))
+                    else:
+                        controller._apply_trigger(params['trigger'], params.get('value', 255))
+                    applied.append((deadline, kind, params, future))
+                except Exception as e:
+                    self._counters['errors'] += 1
+                    future.set_exception(e)
+            if applied:
+                controller.gamepad.update()
+        if not applied:
+            return
+        sent = clock()
+        self._counters['updates'] += 1
+        for deadline, kind, params, future in applied:
+            jitter = sent - deadline
+            self._jitter.append(jitter)
+            self._counters['events'] += 1
+            future.set_result(jitter)
+            controller._notify_input(kind, **self._describe(kind, params))
+
+    @staticmethod
+    def _describe(kind: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        if kind in ('press', 'release'):
+            data = {'button': getattr(params['button'], 'value', params['button'])}
+        elif kind == 'joystick':
+            data = {'joystick': params['joystick'].lower(), 'x': params.get('x', 0), 'y': params.get('y', 0)}
+        else:
+            data = {'trigger': params['trigger'].lower(), 'value': params.get('value', 255)}
+        data.update(params.get('notify') or {})
+        return data
+
+    def stats(self) -> Dict[str, Any]:
+        """Contadores y jitter medido (ms) sobre las últimas JITTER_HISTORY entradas."""
+        samples = sorted(self._jitter)
+        result: Dict[str, Any] = dict(self._counters)
+        if samples:
+            result.update({
+                'jitter_mean_ms': round(sum(samples) / len(samples) * 1000, 3),
+                'jitter_p95_ms': round(samples[min(len(samples) - 1, int(len(samples) * 0.95))] * 1000, 3),
+                'jitter_max_ms': round(samples[-1] * 1000, 3),
+            })
+        return result
+
+    def report(self) -> str:
+        """Resumen legible de stats()."""
+        s = self.stats()
+        if 'jitter_mean_ms' not in s:
+            return f"Planificador de entradas: {s['events']} eventos aplicados"
+        return (f"Planificador de entradas: {s['events']} eventos en {s['updates']} updates, "
+                f"jitter medio {s['jitter_mean_ms']:.3f} ms, p95 {s['jitter_p95_ms']:.3f} ms, "
+                f"máx {s['jitter_max_ms']:.3f} ms, {s['errors']} errores")
+
+    def close(self, timeout: float = CLOSE_TIMEOUT_S) -> None:
+        """Cancela los eventos pendientes (soltando lo pulsado) y detiene el hilo."""
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify_all()
+        self.cancel_pending()
+        self._thread.join(timeout)
+        if self._timer_raised:
+            _restore_timer_resolution()
+        # Cerrado a mano: el hook de salida ya no debe retener la instancia
+        atexit.unregister(self.close)
+
+
+class _FakeGamepad:
+    """Gamepad sin efecto para el banco de pruebas (cuenta los update())."""
+
+    def __init__(self):
+        self.updates = 0
+
+    def update(self):
+        self.updates += 1
+
+
+class _FakeController:
+    def __init__(self):
+        self.gamepad = _FakeGamepad()
+        self.button_mapping = {'a': 'a'}
+        self._state_lock = threading.RLock()
+
+    def _apply_press(self, button):
+        pass
+
+    _apply_release = _apply_press
+
+    def _notify_input(self, kind, **data):
+        pass
+
+
+def _bench(args) -> int:
+    """Compara el desfase acumulado con sleeps encadenados frente a plazos absolutos."""
+    interval = args.interval_ms / 1000.0
+    started = clock()
+    for _ in range(args.events):
+        time.sleep(interval)
+    serial_drift = clock() - started - args.events * interval
+
+    controller = _FakeController()
+    scheduler = InputScheduler(controller)
+    started = clock()
+    futures = [scheduler.schedule('press' if i % 2 == 0 else 'release', at=started + (i + 1) * interval,
+                                  button='a') for i in range(args.events)]
+    futures[-1].result()
+    scheduled_drift = clock() - started - args.events * interval
+    scheduler.close()
+
+    print(f"{args.events} eventos cada {args.interval_ms} ms")
+    print(f"  sleep encadenado:  desfase acumulado {serial_drift * 1000:.2f} ms")
+    print(f"  plazos absolutos:  desfase final {scheduled_drift * 1000:.2f} ms")
+    print(f"  {scheduler.report()}")
+    return 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Planificador de entradas del gamepad")
+    sub = parser.add_subparsers(dest='command', required=True)
+    bench = sub.add_parser('bench', help="Medir jitter y desfase con un gamepad simulado")
+    bench.add_argument('--events', type=int, default=500)
+    bench.add_argument('--interval-ms', type=float, default=5.0)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    return _bench(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -9,11 +9,17 @@ Permite:
 2. Realizar entrenamientos de habilidad a jugadores
 3. Jugar partidos contra la CPU hasta cumplir objetivos de eventos
 4. Saltar banners iniciales al iniciar el juego
+
+El comando 'all' ejecuta los pasos como un grafo reanudable (task_graph.py):
+si la ejecución se interrumpe, la siguiente retoma desde el último checkpoint.
+Con --watchdog, un vigilante (stall_watchdog.py) detecta las pantallas
+bloqueadas y las recupera, hasta reiniciar el paso en curso.
 """
 
 import os
 import sys
 import argparse
+import asyncio
 import time
 
 # Importar los módulos desarrollados
@@ -23,18 +29,34 @@ from banner_skipper import BannerSkipper
 from player_signer import PlayerSigner
 from player_trainer import PlayerTrainer
 from match_player import MatchPlayer
+from frame_bus import FrameBusPublisher, FRAME_BUS_ENV_VAR
+from capture_history import CaptureHistory
+from transition_model import TransitionModel, TransitionObserver
+from async_runtime import AsyncRuntime
+from menu_navigator import MenuNavigator, MAIN_MENU_STATES
+from stall_watchdog import StallWatchdog
+from task_graph import TaskGraph, TaskJournal, TaskStep, STATUS_DONE, STATUS_RESUMED, STATUS_LABELS
 
 class EFootballAutomation:
     """
     Clase principal que integra todas las funcionalidades para la automatización de eFootball.
     """
     
-    def __init__(self, gamepad_type="xbox360"):
+    def __init__(self, gamepad_type="xbox360", frame_bus=None, history_dir=None, history_budget_gb=20.0,
+                 trace_path=None, watchdog=False):
         """
         Inicializa la aplicación de automatización de eFootball.
         
         Args:
             gamepad_type (str): Tipo de gamepad a emular ("xbox360", "xboxone", "dualshock4")
+            frame_bus (str, optional): Nombre del bus de frames en memoria compartida donde
+                publicar cada captura reconocida para las GUIs (ver frame_bus.py)
+            history_dir (str, optional): Directorio donde guardar el historial de capturas
+                comprimido por deltas de toda la ejecución (ver capture_history.py)
+            history_budget_gb (float): Espacio máximo del historial en GB
+            trace_path (str, optional): Archivo JSON Lines con la traza de las ejecuciones
+                asíncronas (pasos, reconocimientos y entradas; ver async_runtime.py)
+            watchdog (bool): Vigilar bloqueos y recuperarlos (ver stall_watchdog.py)
         """
         print("Inicializando aplicación de automatización de eFootball...")
         
@@ -52,8 +74,22 @@ class EFootballAutomation:
         # Inicializar el controlador de gamepad
         self.gamepad = GamepadController(self.gamepad_type)
         
+        # Publicar las capturas en el bus compartido para que las GUIs no capturen por su cuenta
+        self.frame_publisher = FrameBusPublisher(frame_bus) if frame_bus else None
+        if self.frame_publisher:
+            print(f"Publicando frames en el bus '{frame_bus}' (en las GUIs: {FRAME_BUS_ENV_VAR}={frame_bus})")
+        
+        # Historial visual de la ejecución para post-mortem (enlazado desde el log del reconocedor)
+        self.capture_history = None
+        if history_dir:
+            self.capture_history = CaptureHistory(history_dir, disk_budget_bytes=int(history_budget_gb * 1024 ** 3))
+            print(f"Guardando historial de capturas en {history_dir} (máx. {history_budget_gb:.1f} GB)")
+        
         # Inicializar el reconocedor de pantalla
-        self.recognizer = ScreenRecognizer()
+        self.recognizer = ScreenRecognizer(frame_publisher=self.frame_publisher, capture_history=self.capture_history)
+        
+        # Aprender las latencias y botones de cada transición de pantalla (los usa la navegación)
+        self.transition_observer = TransitionObserver(TransitionModel.load(), self.gamepad, self.recognizer)
         
         # Inicializar los módulos de funcionalidad
         self.banner_skipper = BannerSkipper(self.gamepad, self.recognizer)
@@ -61,10 +97,26 @@ class EFootballAutomation:
         self.player_trainer = PlayerTrainer(self.gamepad, self.recognizer)
         self.match_player = MatchPlayer(self.gamepad, self.recognizer)
         
+        # Runtime asyncio de las variantes *_async (reconocimiento, entradas, capturas y traza)
+        self.runtime = AsyncRuntime(self.gamepad, self.recognizer, trace_path=trace_path)
+        
         # Directorio para logs
         self.logs_dir = "/home/ubuntu/efootball_automation/logs"
         os.makedirs(self.logs_dir, exist_ok=True)
         
+        # Diario de run_all para retomar tras una caída o un reinicio
+        self.journal_path = os.path.join(self.logs_dir, "run_journal.jsonl")
+        self.task_graph = None  # Grafo de run_all en ejecución (el vigilante reinicia su paso)
+        
+        # Vigilante de pantallas bloqueadas: atrás, menú principal y, por último, reiniciar el paso
+        self.watchdog = None
+        if watchdog:
+            self.watchdog = StallWatchdog(self.gamepad, self.recognizer,
+                                          navigator=MenuNavigator(self.gamepad, self.recognizer),
+                                          on_restart=self._restart_current_step,
+                                          on_pause=self._pause_current_step).start()
+            print("Vigilante de bloqueos activado")
+        
         print(f"Aplicación inicializada con gamepad tipo: {self.gamepad_type.value}")
     
     def skip_banners(self):
@@ -176,49 +228,146 @@ class EFootballAutomation:
             print(f"Error al jugar partidos: {e}")
             return False
     
-    def run_all(self):
+    def _task_graph(self):
+        """
+        Grafo de pasos de run_all con sus pantallas previas/posteriores y dependencias.
+        """
+        filters = {
+            "position": "Delantero",
+            "club": "Barcelona",
+            "price_max": 100000
+        }
+        steps = [
+            # Tras reiniciar el juego vuelven a salir los banners: este paso se repite siempre
+            TaskStep("skip_banners", "Saltar banners iniciales", self.skip_banners,
+                     post_states=MAIN_MENU_STATES, checkpoint=False),
+            TaskStep("sign_player", "Fichar jugador", self.sign_player, {"filters": filters, "player_index": 0},
+                     depends=("skip_banners",), pre_states=MAIN_MENU_STATES),
+            TaskStep("train_player", "Entrenar jugador", self.train_player, {"player_name": "Raquel"},
+                     depends=("skip_banners",), pre_states=MAIN_MENU_STATES),
+            TaskStep("play_matches", "Jugar partidos", self.play_matches,
+                     {"max_matches": 5, "event_mode": True, "difficulty": "normal"},
+                     depends=("skip_banners",), pre_states=MAIN_MENU_STATES),
+        ]
+        return TaskGraph(steps, TaskJournal(self.journal_path), recognizer=self.recognizer,
+                         navigator=MenuNavigator(self.gamepad, self.recognizer))
+    
+    def _restart_current_step(self, reason):
+        """Callback del vigilante: repite desde el principio el paso en curso de run_all."""
+        graph = self.task_graph
+        step = graph.restart_current(reason) if graph is not None else None
+        if step is not None:
+            print(f"\nReiniciando el paso '{step}' ({reason})")
+        return step
+    
+    def _pause_current_step(self, paused):
+        """Callback del vigilante: detiene (o reanuda) el paso en curso mientras recupera."""
+        graph = self.task_graph
+        return graph.pause_current(paused) if graph is not None else None
+    
+    @staticmethod
+    def _announce_step(number, step):
+        print(f"\nPaso {number}: {step.label}")
+    
+    def run_all(self, resume=True):
         """
-        Ejecuta todas las funcionalidades en secuencia.
+        Ejecuta todas las funcionalidades como grafo reanudable.
+        
+        Args:
+            resume (bool): Retomar la última ejecución si quedó a medias (False = empezar de cero)
         
         Returns:
             dict: Resultados de cada funcionalidad
         """
         print("\n=== INICIANDO PROCESO COMPLETO DE AUTOMATIZACIÓN ===")
         
-        results = {
-            "skip_banners": False,
-            "sign_player": False,
-            "train_player": False,
-            "play_matches": False
-        }
+        self.task_graph = self._task_graph()
+        try:
+            results = self.task_graph.run(resume=resume, on_step=self._announce_step)
+        finally:
+            self.task_graph = None
         
-        # 1. Saltar banners iniciales
-        print("\nPaso 1: Saltar banners iniciales")
-        results["skip_banners"] = self.skip_banners()
+        return self._print_results(results)
+    
+    def _print_results(self, results):
+        """Muestra el resumen de resultados de run_all y los devuelve como éxito/fallo."""
+        print("\n=== RESUMEN DE RESULTADOS ===")
+        for task, status in results.items():
+            print(f"{task}: {STATUS_LABELS.get(status, status)}")
+        if not all(status in (STATUS_DONE, STATUS_RESUMED) for status in results.values()):
+            print(f"Ejecución incompleta: se retomará en la siguiente (diario: {self.journal_path})")
+        return {task: status in (STATUS_DONE, STATUS_RESUMED) for task, status in results.items()}
+    
+    # --- Variantes asíncronas (ver async_runtime.py) ---
+    
+    async def _run_step_async(self, name, method, timeout=None, **kwargs):
+        """
+        Ejecuta un paso en el runtime asyncio: cancelable y con timeout opcional.
         
-        # 2. Fichar un jugador
-        print("\nPaso 2: Fichar jugador")
-        filters = {
-            "position": "Delantero",
-            "club": "Barcelona",
-            "price_max": 100000
-        }
-        results["sign_player"] = self.sign_player(filters=filters, player_index=0)
+        Returns:
+            bool: Resultado del paso (False si vence el timeout)
+        """
+        try:
+            return await self.runtime.run_workflow(name, method, timeout=timeout, **kwargs)
+        except asyncio.TimeoutError:
+            print(f"Tiempo agotado en '{name}' ({timeout} s)")
+            return False
+    
+    async def skip_banners_async(self, timeout=None):
+        """Variante asíncrona de skip_banners (timeout en segundos, None = sin límite)."""
+        return await self._run_step_async("skip_banners", self.skip_banners, timeout)
+    
+    async def sign_player_async(self, player_name=None, filters=None, player_index=0, timeout=None):
+        """Variante asíncrona de sign_player (timeout en segundos, None = sin límite)."""
+        return await self._run_step_async("sign_player", self.sign_player, timeout, player_name=player_name,
+                                          filters=filters, player_index=player_index)
+    
+    async def train_player_async(self, player_name, timeout=None):
+        """Variante asíncrona de train_player (timeout en segundos, None = sin límite)."""
+        return await self._run_step_async("train_player", self.train_player, timeout, player_name=player_name)
+    
+    async def play_matches_async(self, max_matches=10, event_mode=True, difficulty="normal", timeout=None):
+        """Variante asíncrona de play_matches (timeout en segundos, None = sin límite)."""
+        return await self._run_step_async("play_matches", self.play_matches, timeout, max_matches=max_matches,
+                                          event_mode=event_mode, difficulty=difficulty)
+    
+    async def run_all_async(self, step_timeout=None, resume=True):
+        """
+        Variante asíncrona de run_all. Cancelar la tarea detiene el paso en curso
+        en su siguiente espera; la siguiente ejecución lo retoma.
         
-        # 3. Entrenar un jugador
-        print("\nPaso 3: Entrenar jugador")
-        results["train_player"] = self.train_player("Raquel")
+        Args:
+            step_timeout (float, optional): Tiempo máximo de cada paso en segundos
+            resume (bool): Retomar la última ejecución si quedó a medias
         
-        # 4. Jugar partidos
-        print("\nPaso 4: Jugar partidos")
-        results["play_matches"] = self.play_matches(max_matches=5, event_mode=True, difficulty="normal")
+        Returns:
+            dict: Resultados de cada funcionalidad
+        """
+        print("\n=== INICIANDO PROCESO COMPLETO DE AUTOMATIZACIÓN (asyncio) ===")
         
-        # Resumen de resultados
-        print("\n=== RESUMEN DE RESULTADOS ===")
-        for task, result in results.items():
-            print(f"{task}: {'Éxito' if result else 'Fallido'}")
+        self.task_graph = self._task_graph()
+        try:
+            results = await self.task_graph.run_async(self.runtime, step_timeout=step_timeout, resume=resume,
+                                                       on_step=self._announce_step)
+        finally:
+            self.task_graph = None
         
-        return results
+        return self._print_results(results)
+    
+    def close(self):
+        """Libera los recursos compartidos (capturas pendientes, bus de frames, historial y modelo de transiciones)."""
+        if self.watchdog:
+            self.watchdog.close()
+            print(self.watchdog.report())
+        self.runtime.shutdown()
+        self.transition_observer.close()
+        if self.recognizer.screenshot_writer:
+            self.recognizer.screenshot_writer.close()
+        self.recognizer.close()
+        if self.capture_history:
+            self.capture_history.close()
+        if self.frame_publisher:
+            self.frame_publisher.close()
 
 def parse_arguments():
     """
@@ -234,6 +383,28 @@ def parse_arguments():
                         choices=["xbox360", "xboxone", "dualshock4", "ds4"],
                         help="Tipo de gamepad a emular (default: xbox360)")
     
+    # Argumento para compartir las capturas con las GUIs
+    parser.add_argument("--frame-bus", type=str, default=None, metavar="NOMBRE",
+                        help="Publicar cada captura en un bus de memoria compartida con este nombre")
+    
+    # Argumentos para el historial de capturas
+    parser.add_argument("--history-dir", type=str, default=None, metavar="DIR",
+                        help="Guardar el historial de capturas (keyframes y deltas) en este directorio")
+    parser.add_argument("--history-budget-gb", type=float, default=20.0,
+                        help="Espacio máximo del historial de capturas en GB (default: 20)")
+    
+    # Argumentos para el runtime asyncio
+    parser.add_argument("--async", dest="async_mode", action="store_true",
+                        help="Ejecutar los flujos en el runtime asyncio (cancelables con Ctrl+C y con timeout)")
+    parser.add_argument("--step-timeout", type=float, default=None, metavar="SEGUNDOS",
+                        help="Con --async: tiempo máximo de cada paso")
+    parser.add_argument("--trace", type=str, default=None, metavar="ARCHIVO",
+                        help="Con --async: escribir la traza de la ejecución en este archivo JSON Lines")
+    
+    # Vigilante de bloqueos
+    parser.add_argument("--watchdog", action="store_true",
+                        help="Detectar pantallas bloqueadas y recuperarlas (atrás, menú principal, reiniciar el paso)")
+    
     # Subparsers para los diferentes comandos
     subparsers = parser.add_subparsers(dest="command", help="Comando a ejecutar")
     
@@ -262,6 +433,8 @@ def parse_arguments():
     
     # Comando para ejecutar todo
     all_parser = subparsers.add_parser("all", help="Ejecutar todas las funcionalidades")
+    all_parser.add_argument("--fresh", action="store_true",
+                            help="Empezar de cero en lugar de retomar la última ejecución incompleta")
     
     return parser.parse_args()
 
@@ -271,9 +444,21 @@ def main():
     args = parse_arguments()
     
     # Inicializar la aplicación
-    app = EFootballAutomation(gamepad_type=args.gamepad)
-    
-    # Ejecutar el comando correspondiente
+    app = EFootballAutomation(gamepad_type=args.gamepad, frame_bus=args.frame_bus,
+                              history_dir=args.history_dir, history_budget_gb=args.history_budget_gb,
+                              trace_path=args.trace, watchdog=args.watchdog)
+    try:
+        if args.async_mode:
+            asyncio.run(_run_command_async(app, args))
+        else:
+            _run_command(app, args)
+    except KeyboardInterrupt:
+        print("\nEjecución cancelada")
+    finally:
+        app.close()
+
+def _run_command(app, args):
+    """Ejecuta el comando indicado en la línea de comandos."""
     if args.command == "skip":
         app.skip_banners()
     
@@ -297,11 +482,42 @@ def main():
         app.play_matches(max_matches=args.max, event_mode=args.event, difficulty=args.difficulty)
     
     elif args.command == "all":
-        app.run_all()
+        app.run_all(resume=not args.fresh)
     
     else:
         print("Comando no reconocido. Use --help para ver los comandos disponibles.")
 
+async def _run_command_async(app, args):
+    """Ejecuta el comando indicado en el runtime asyncio (Ctrl+C cancela el paso en curso)."""
+    timeout = args.step_timeout
+    async with app.runtime:
+        if args.command == "skip":
+            await app.skip_banners_async(timeout=timeout)
+        
+        elif args.command == "sign":
+            filters = {}
+            if args.position:
+                filters["position"] = args.position
+            if args.club:
+                filters["club"] = args.club
+            if args.price:
+                filters["price_max"] = args.price
+            await app.sign_player_async(player_name=args.name, filters=filters if filters else None,
+                                        player_index=args.index, timeout=timeout)
+        
+        elif args.command == "train":
+            await app.train_player_async(args.name, timeout=timeout)
+        
+        elif args.command == "play":
+            await app.play_matches_async(max_matches=args.max, event_mode=args.event,
+                                         difficulty=args.difficulty, timeout=timeout)
+        
+        elif args.command == "all":
+            await app.run_all_async(step_timeout=timeout, resume=not args.fresh)
+        
+        else:
+            print("Comando no reconocido. Use --help para ver los comandos disponibles.")
+
 if __name__ == "__main__":
     print("Aplicación de automatización de eFootball")
     print("Esta aplicación permite automatizar diversas tareas en eFootball")
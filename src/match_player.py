@@ -11,8 +11,11 @@ Utiliza los módulos de control de gamepad y reconocimiento de pantalla.
 import time
 import os
 import random
+from async_runtime import workflow_sleep
 from gamepad_controller import GamepadController, GamepadButton, EFootballSequences
 from screen_recognizer import ScreenRecognizer, GameScreen, ScreenElement
+from menu_navigator import MenuNavigator, MAIN_MENU_STATES
+from task_graph import current_progress
 
 class MatchPlayer:
     """
@@ -39,6 +42,8 @@ class MatchPlayer:
         else:
             self.recognizer = screen_recognizer
         
+        self.navigator = MenuNavigator(self.gamepad, self.recognizer)
+        
         # Directorio para guardar capturas de pantalla
         self.screenshots_dir = "/home/ubuntu/efootball_automation/screenshots/matches"
         os.makedirs(self.screenshots_dir, exist_ok=True)
@@ -83,7 +88,7 @@ class MatchPlayer:
                     self.gamepad.execute_sequence(EFootballSequences.navegar_menu_principal_a_partido())
                     
                     # Esperar a que cambie la pantalla
-                    time.sleep(wait_time)
+                    workflow_sleep(wait_time)
                     
                     # Verificar si hemos llegado al menú de partidos
                     new_screen = self.recognizer.recognize_screen()
@@ -94,7 +99,7 @@ class MatchPlayer:
                     print("Opción de partido no encontrada, intentando con secuencia predefinida...")
                     # Si no encontramos la opción, intentar con una secuencia predefinida
                     self.gamepad.execute_sequence(EFootballSequences.navegar_menu_principal_a_partido())
-                    time.sleep(wait_time)
+                    workflow_sleep(wait_time)
                     
                     # Verificar si hemos llegado al menú de partidos
                     new_screen = self.recognizer.recognize_screen()
@@ -105,10 +110,9 @@ class MatchPlayer:
                 print(f"No estamos en el menú principal, estamos en: {current_screen.value}")
                 print("Intentando volver al menú principal...")
                 
-                # Intentar volver al menú principal presionando B varias veces
-                for _ in range(3):
-                    self.gamepad.press_button(GamepadButton.B, duration=0.2)
-                    time.sleep(1.0)
+                # Volver al menú principal por el camino más corto del grafo de transiciones
+                # (pulsa B si la pantalla actual no tiene camino conocido)
+                self.navigator.navigate(MAIN_MENU_STATES)
                 
                 # Verificar si hemos vuelto al menú principal
                 new_screen = self.recognizer.recognize_screen()
@@ -155,30 +159,30 @@ class MatchPlayer:
             print("Seleccionando modo evento...")
             # Navegar al modo evento (simulación)
             self.gamepad.press_button(GamepadButton.DPAD_RIGHT, duration=0.2)
-            time.sleep(wait_time)
+            workflow_sleep(wait_time)
             self.gamepad.press_button(GamepadButton.DPAD_RIGHT, duration=0.2)
-            time.sleep(wait_time)
+            workflow_sleep(wait_time)
             self.gamepad.press_button(GamepadButton.A, duration=0.2)
-            time.sleep(wait_time * 2)
+            workflow_sleep(wait_time * 2)
         else:
             print("Seleccionando partido amistoso contra CPU...")
             # Navegar al modo amistoso (simulación)
             self.gamepad.press_button(GamepadButton.DPAD_DOWN, duration=0.2)
-            time.sleep(wait_time)
+            workflow_sleep(wait_time)
             self.gamepad.press_button(GamepadButton.A, duration=0.2)
-            time.sleep(wait_time * 2)
+            workflow_sleep(wait_time * 2)
         
         # Seleccionar CPU como oponente (simulación)
         print("Seleccionando CPU como oponente...")
         self.gamepad.press_button(GamepadButton.DPAD_DOWN, duration=0.2)
-        time.sleep(wait_time)
+        workflow_sleep(wait_time)
         self.gamepad.press_button(GamepadButton.A, duration=0.2)
-        time.sleep(wait_time * 2)
+        workflow_sleep(wait_time * 2)
         
         # Confirmar selección
         print("Confirmando selección...")
         self.gamepad.press_button(GamepadButton.A, duration=0.2)
-        time.sleep(wait_time * 2)
+        workflow_sleep(wait_time * 2)
         
         # Guardar una captura de pantalla después de seleccionar el partido
         self.recognizer.save_screenshot("partido_seleccionado.png", self.screenshots_dir)
@@ -208,31 +212,31 @@ class MatchPlayer:
         
         # Navegar a la opción de dificultad (simulación)
         self.gamepad.press_button(GamepadButton.DPAD_DOWN, duration=0.2)
-        time.sleep(wait_time)
+        workflow_sleep(wait_time)
         self.gamepad.press_button(GamepadButton.DPAD_DOWN, duration=0.2)
-        time.sleep(wait_time)
+        workflow_sleep(wait_time)
         self.gamepad.press_button(GamepadButton.A, duration=0.2)
-        time.sleep(wait_time)
+        workflow_sleep(wait_time)
         
         # Seleccionar dificultad según el parámetro
         if difficulty == "easy":
             # Navegar a dificultad fácil (simulación)
             self.gamepad.press_button(GamepadButton.DPAD_UP, duration=0.2)
-            time.sleep(wait_time)
+            workflow_sleep(wait_time)
         elif difficulty == "hard":
             # Navegar a dificultad difícil (simulación)
             self.gamepad.press_button(GamepadButton.DPAD_DOWN, duration=0.2)
-            time.sleep(wait_time)
+            workflow_sleep(wait_time)
         # Para "normal" no hacemos nada, asumimos que es la opción por defecto
         
         # Confirmar selección de dificultad
         self.gamepad.press_button(GamepadButton.A, duration=0.2)
-        time.sleep(wait_time)
+        workflow_sleep(wait_time)
         
         # Confirmar configuración y comenzar partido
         print("Confirmando configuración y comenzando partido...")
         self.gamepad.press_button(GamepadButton.START, duration=0.2)
-        time.sleep(wait_time * 3)  # Esperar más tiempo para la carga del partido
+        workflow_sleep(wait_time * 3)  # Esperar más tiempo para la carga del partido
         
         # Guardar una captura de pantalla después de configurar el partido
         self.recognizer.save_screenshot("despues_configuracion.png", self.screenshots_dir)
@@ -287,7 +291,7 @@ class MatchPlayer:
             self.gamepad.move_joystick("left", x_value, y_value, duration=random.uniform(0.2, 0.5))
             
             # Esperar un tiempo aleatorio entre acciones
-            time.sleep(random.uniform(0.1, 0.5))
+            workflow_sleep(random.uniform(0.1, 0.5))
             
             # Cada 30 segundos, verificar si el partido ha terminado
             if (time.time() - start_time) % 30 < 1:
@@ -306,21 +310,21 @@ class MatchPlayer:
             
             # Pausar el partido
             self.gamepad.press_button(GamepadButton.START, duration=0.2)
-            time.sleep(2.0)
+            workflow_sleep(2.0)
             
             # Navegar a la opción de abandonar (simulación)
             self.gamepad.press_button(GamepadButton.DPAD_DOWN, duration=0.2)
-            time.sleep(1.0)
+            workflow_sleep(1.0)
             self.gamepad.press_button(GamepadButton.DPAD_DOWN, duration=0.2)
-            time.sleep(1.0)
+            workflow_sleep(1.0)
             self.gamepad.press_button(GamepadButton.A, duration=0.2)
-            time.sleep(2.0)
+            workflow_sleep(2.0)
             
             # Confirmar abandono
             self.gamepad.press_button(GamepadButton.DPAD_LEFT, duration=0.2)
-            time.sleep(1.0)
+            workflow_sleep(1.0)
             self.gamepad.press_button(GamepadButton.A, duration=0.2)
-            time.sleep(3.0)
+            workflow_sleep(3.0)
         
         # Guardar una captura de pantalla al final del partido
         self.recognizer.save_screenshot("fin_partido.png", self.screenshots_dir)
@@ -331,7 +335,7 @@ class MatchPlayer:
         # Presionar A varias veces para pasar pantallas de resultados, recompensas, etc.
         for _ in range(5):
             self.gamepad.press_button(GamepadButton.A, duration=0.2)
-            time.sleep(2.0)
+            workflow_sleep(2.0)
         
         print("Partido jugado correctamente")
         return True
@@ -380,8 +384,12 @@ class MatchPlayer:
         """
         print(f"Iniciando proceso para jugar hasta {max_matches} partidos contra CPU...")
         
-        matches_played = 0
+        # Dentro de run_all los partidos jugados se guardan en el diario y se retoman tras un reinicio
+        progress = current_progress()
+        matches_played = progress.get('matches_played', 0) if progress else 0
         objective_completed = False
+        if matches_played:
+            print(f"Retomando tras {matches_played} partidos jugados")
         
         while matches_played < max_matches and not objective_completed:
             print(f"\n=== Partido {matches_played + 1}/{max_matches} ===")
@@ -408,6 +416,8 @@ class MatchPlayer:
             
             # Incrementar contador de partidos jugados
             matches_played += 1
+            if progress:
+                progress.set('matches_played', matches_played)
             
             # Paso 5: Verificar si se ha completado el objetivo
             objective_completed = self.check_event_completion()
@@ -419,7 +429,7 @@ class MatchPlayer:
             print(f"Objetivo no completado aún. Partidos jugados: {matches_played}/{max_matches}")
             
             # Esperar un momento antes del siguiente partido
-            time.sleep(5.0)
+            workflow_sleep(5.0)
         
         if objective_completed:
             print("Proceso completado exitosamente: objetivo del evento alcanzado")
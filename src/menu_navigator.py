@@ -0,0 +1,338 @@
+"""
+Navegación entre menús por el camino más corto del grafo de transiciones.
+
+state_transitions.json describe qué pantallas se alcanzan desde cada una.
+Cuando una transición indica el botón que la produce y su latencia
+({"state": destino, "button": "dpad_right", "latency_s": 0.4}), el grafo
+permite planificar: MenuGraph calcula con Dijkstra el camino de menor coste
+(latencia esperada + coste de cada pulsación) y MenuNavigator lo ejecuta
+salto a salto, verificando con el reconocedor que se llega a cada pantalla
+y replanificando desde donde esté si el juego acaba en otra.
+
+La latencia de cada arista es la medida en ejecuciones anteriores
+(transition_model.py), la configurada en el JSON o DEFAULT_EDGE_LATENCY_S;
+con mediciones, la espera de cada salto sale de su p95.
+
+Las transiciones sin botón siguen sirviendo para el contexto del
+reconocedor, pero sólo se pueden ejecutar si el modelo de transiciones ha
+aprendido qué botón las produce: el informe lista las pendientes.
+
+Uso:
+    python menu_navigator.py plan menu_home_sel menu_partido_eventos_sel
+    python menu_navigator.py report
+    python menu_navigator.py go menu_home_contrato_sel
+"""
+
+import argparse
+import heapq
+import logging
+import sys
+import time
+from collections import namedtuple
+from typing import Any, Callable, Dict, Iterable, List, Optional, Union
+
+from async_runtime import workflow_sleep
+from recognition_bundle import TransitionEdge, parse_edge
+from transition_model import TransitionModel
+
+logger = logging.getLogger('menu_navigator')
+
+# Pantalla principal con cualquiera de sus opciones resaltada
+MAIN_MENU_STATES = ('menu_home_sel', 'menu_home_partido_sel', 'menu_home_estrategia_sel',
+                    'menu_home__miequipo_sel', 'menu_home_contrato_sel', 'menu_home_premijuego_sel')
+DEFAULT_EDGE_LATENCY_S = 1.0  # Latencia supuesta de una transición sin medir ni configurar
+PRESS_COST_S = 0.15           # Coste añadido por pulsación (desempata hacia menos entradas)
+PRESS_DURATION_S = 0.1
+INTER_PRESS_S = 0.15          # Pausa entre botones de un mismo salto
+HOP_TIMEOUT_FACTOR = 3.0      # Espera por salto = factor x latencia esperada ...
+MIN_HOP_TIMEOUT_S = 1.5       # ... con este mínimo
+RECOVERY_SETTLE_S = 1.0       # Espera tras pulsar el botón de recuperación
+
+# Salto de un plan: estado origen, destino, botones a pulsar y segundos esperados
+Hop = namedtuple('Hop', 'source target buttons expected_s')
+
+
+def _as_set(states: Union[str, Iterable[str]]) -> frozenset:
+    return frozenset((states,)) if isinstance(states, str) else frozenset(states)
+
+
+class MenuGraph:
+    """
+    Grafo dirigido de pantallas con aristas etiquetadas por botón y latencia.
+    """
+
+    def __init__(self, edges: Dict[str, Iterable[TransitionEdge]],
+                 latency_source: Optional[Callable[[str, str], Optional[float]]] = None,
+                 default_latency_s: float = DEFAULT_EDGE_LATENCY_S, press_cost_s: float = PRESS_COST_S):
+        """
+        Args:
+            edges: { estado: (TransitionEdge, ...) } (RecognitionBundle.edges).
+            latency_source: Función (origen, destino) -> segundos medidos o None.
+            default_latency_s: Latencia de las aristas sin medir ni configurar.
+            press_cost_s: Coste añadido por cada pulsación de la arista.
+        """
+        self.edges = {state: tuple(state_edges) for state, state_edges in edges.items()}
+        self.latency_source = latency_source
+        self.default_latency_s = default_latency_s
+        self.press_cost_s = press_cost_s
+
+    @classmethod
+    def from_transitions(cls, state_transitions: Dict[str, Any], **kwargs) -> 'MenuGraph':
+        """Grafo a partir del contenido de state_transitions.json (sin validar contra las plantillas)."""
+        edges = {}
+        for state, entries in (state_transitions or {}).items():
+            parsed = [parse_edge(entry)[0] for entry in entries or []]
+            edges[state] = tuple(edge for edge in parsed if edge is not None)
+        return cls(edges, **kwargs)
+
+    @classmethod
+    def from_recognizer(cls, recognizer, **kwargs) -> 'MenuGraph':
+        """Grafo del bundle del reconocedor (o de sus transiciones si es un cliente del servicio)."""
+        bundle = getattr(recognizer, 'bundle', None)
+        if bundle is not None:
+            return cls(bundle.edges, **kwargs)
+        return cls.from_transitions(recognizer.state_transitions, **kwargs)
+
+    def latency(self, source: str, edge: TransitionEdge) -> float:
+        """Latencia esperada de una arista: medida, configurada o por defecto."""
+        if self.latency_source is not None:
+            measured = self.latency_source(source, edge.target)
+            if measured is not None:
+                return measured
+        return edge.latency_s if edge.latency_s is not None else self.default_latency_s
+
+    def plan(self, source: str, target: Union[str, Iterable[str]]) -> Optional[List[Hop]]:
+        """
+        Camino de menor coste desde un estado hasta el destino más cercano (Dijkstra).
+
+        Sólo se usan aristas con botones. No hay heurística admisible (las
+        pantallas no tienen coordenadas), así que A* no aportaría nada.
+
+        Args:
+            source: Estado de partida.
+            target: Estado o colección de estados aceptados como destino.
+
+        Returns:
+            Lista de Hop (vacía si ya se está en el destino), o None si no hay camino.
+        """
+        targets = _as_set(target)
+        if source in targets:
+            return []
+        reached = None
+        best = {source: 0.0}
+        previous = {}
+        heap = [(0.0, 0, source)]
+        while heap:
+            cost, presses, state = heapq.heappop(heap)
+            if state in targets:
+                reached = state
+                break
+            if cost > best.get(state, float('inf')):
+                continue
+            for edge in self.edges.get(state, ()):
+                if not edge.buttons:
+                    continue
+                latency = self.latency(state, edge)
+                new_cost = cost + latency + self.press_cost_s * len(edge.buttons)
+                if new_cost < best.get(edge.target, float('inf')):
+                    best[edge.target] = new_cost
+                    previous[edge.target] = Hop(state, edge.target, edge.buttons, latency)
+                    heapq.heappush(heap, (new_cost, presses + len(edge.buttons), edge.target))
+        if reached is None:
+            return None
+        hops = []
+        state = reached
+        while state != source:
+            hop = previous[state]
+            hops.append(hop)
+            state = hop.source
+        hops.reverse()
+        return hops
+
+    def report(self) -> Dict[str, Any]:
+        """Cobertura del grafo: aristas ejecutables, aristas sin botón y estados sin salida."""
+        labelled = [(s, e.target) for s, edges in self.edges.items() for e in edges if e.buttons]
+        unlabelled = [(s, e.target) for s, edges in self.edges.items() for e in edges if not e.buttons]
+        states = set(self.edges) | {e.target for edges in self.edges.values() for e in edges}
+        dead_ends = sorted(s for s in states if not any(e.buttons for e in self.edges.get(s, ())))
+        return {'states': len(states), 'labelled': labelled, 'unlabelled': unlabelled, 'dead_ends': dead_ends}
+
+
+class MenuNavigator:
+    """
+    Ejecuta planes de MenuGraph con el gamepad y los verifica con el reconocedor.
+    """
+
+    def __init__(self, gamepad, recognizer, graph: Optional[MenuGraph] = None,
+                 model: Optional[TransitionModel] = None,
+                 press_duration: float = PRESS_DURATION_S, hop_timeout_factor: float = HOP_TIMEOUT_FACTOR,
+                 min_hop_timeout_s: float = MIN_HOP_TIMEOUT_S, max_replans: int = 5,
+                 recovery_button: Optional[str] = 'b', max_recoveries: int = 3,
+                 on_hop: Optional[Callable[[Hop, float, bool], None]] = None):
+        """
+        Args:
+            gamepad: GamepadController.
+            recognizer: ScreenRecognizer o cliente del servicio de reconocimiento.
+            graph: Grafo a usar. Por defecto se construye del reconocedor en cada
+                   navegación (así refleja las recargas de configuración).
+            model: Modelo de transiciones aprendido que completa el grafo por defecto
+                   (botones y latencias medidas) y fija las esperas por salto.
+                   Por defecto se carga transition_model.MODEL_FILE.
+            press_duration: Segundos que se mantiene cada botón.
+            hop_timeout_factor, min_hop_timeout_s: Espera máxima de cada salto.
+            max_replans: Saltos fallidos admitidos antes de abandonar.
+            recovery_button: Botón a pulsar si no hay camino desde la pantalla actual
+                             (p.ej. pantalla desconocida); None para no intentarlo.
+            max_recoveries: Pulsaciones de recuperación admitidas.
+            on_hop: Callback (salto, segundos hasta verificarlo, éxito) tras cada salto.
+        """
+        self.gamepad = gamepad
+        self.recognizer = recognizer
+        self.graph = graph
+        self.model = model if model is not None else TransitionModel.load()
+        self.press_duration = press_duration
+        self.hop_timeout_factor = hop_timeout_factor
+        self.min_hop_timeout_s = min_hop_timeout_s
+        self.max_replans = max_replans
+        self.recovery_button = recovery_button
+        self.max_recoveries = max_recoveries
+        self.on_hop = on_hop
+
+    def _graph(self) -> MenuGraph:
+        if self.graph is not None:
+            return self.graph
+        self.model.reload()  # Otro proceso (o el observador) puede haberlo actualizado
+        edges = MenuGraph.from_recognizer(self.recognizer).edges
+        return MenuGraph(self.model.augment(edges), latency_source=self.model.latency)
+
+    def _hop_timeout(self, hop: Hop) -> float:
+        measured = self.model.timeout(hop.source, hop.target)
+        if measured is not None:
+            return max(self.min_hop_timeout_s, measured)
+        return max(self.min_hop_timeout_s, self.hop_timeout_factor * hop.expected_s)
+
+    def _press(self, buttons) -> None:
+        from gamepad_controller import GamepadButton
+        for i, name in enumerate(buttons):
+            if i:
+                workflow_sleep(INTER_PRESS_S)
+            self.gamepad.press_button(GamepadButton(name), duration=self.press_duration)
+
+    def plan(self, target: Union[str, Iterable[str]], source: Optional[str] = None) -> Optional[List[Hop]]:
+        """Plan desde ``source`` (por defecto, la pantalla actual) hasta ``target``."""
+        if source is None:
+            source = self.recognizer.recognize().get('state')
+        return self._graph().plan(source, target)
+
+    def navigate(self, target: Union[str, Iterable[str]], timeout_s: float = 60.0) -> Dict[str, Any]:
+        """
+        Lleva el juego hasta la pantalla ``target`` (o la más cercana de una colección).
+
+        Dentro de un flujo, las esperas son cancelables (WorkflowCancelled).
+
+        Returns:
+            dict: {'success', 'state' (pantalla final), 'hops' (saltos verificados),
+                   'inputs' (pulsaciones), 'replans', 'recoveries', 'elapsed_s', 'path'}
+        """
+        started = time.monotonic()
+        outcome = {'success': False, 'state': None, 'hops': 0, 'inputs': 0, 'replans': 0,
+                   'recoveries': 0, 'elapsed_s': 0.0, 'path': []}
+        targets = _as_set(target)
+        graph = self._graph()
+        state = self.recognizer.recognize().get('state')
+        outcome['path'].append(state)
+        while state not in targets and time.monotonic() - started < timeout_s:
+            plan = graph.plan(state, targets)
+            if not plan:
+                if self.recovery_button is None or outcome['recoveries'] >= self.max_recoveries:
+                    logger.warning(f"Sin camino de '{state}' a '{target}'.")
+                    break
+                logger.info(f"Sin camino de '{state}' a '{target}': pulsando '{self.recovery_button}'.")
+                self._press((self.recovery_button,))
+                outcome['recoveries'] += 1
+                outcome['inputs'] += 1
+                workflow_sleep(RECOVERY_SETTLE_S)
+                state = self.recognizer.recognize().get('state')
+                outcome['path'].append(state)
+                continue
+
+            hop = plan[0]
+            logger.info(f"{hop.source} -> {hop.target} con {list(hop.buttons)} "
+                        f"({len(plan)} saltos restantes, ~{sum(h.expected_s for h in plan):.1f} s)")
+            hop_started = time.monotonic()
+            self._press(hop.buttons)
+            outcome['inputs'] += len(hop.buttons)
+            result = self.recognizer.wait_for_state(hop.target, timeout=self._hop_timeout(hop), poll_interval=0.1)
+            elapsed = time.monotonic() - hop_started
+            state = result.get('state')
+            outcome['path'].append(state)
+            if self.on_hop is not None:
+                self.on_hop(hop, elapsed, bool(result.get('matched')))
+            if result.get('matched'):
+                outcome['hops'] += 1
+                continue
+            outcome['replans'] += 1
+            logger.info(f"Se esperaba '{hop.target}' y la pantalla es '{state}'; replanificando "
+                        f"({outcome['replans']}/{self.max_replans}).")
+            if outcome['replans'] > self.max_replans:
+                break
+
+        outcome.update({'success': state in targets, 'state': state, 'elapsed_s': time.monotonic() - started})
+        log = logger.info if outcome['success'] else logger.warning
+        log(f"Navegación a '{target}' {'completada' if outcome['success'] else 'fallida'} en "
+            f"{outcome['elapsed_s']:.1f} s ({outcome['inputs']} pulsaciones, {outcome['replans']} replanificaciones)")
+        return outcome
+
+
+def _load_graph() -> MenuGraph:
+    from recognition_bundle import compile_from_config
+    model = TransitionModel.load()
+    return MenuGraph(model.augment(compile_from_config().edges), latency_source=model.latency)
+
+
+def main():
+    """Punto de entrada de línea de comandos."""
+    parser = argparse.ArgumentParser(description="Planificador de navegación entre menús")
+    subparsers = parser.add_subparsers(dest="command")
+    plan_parser = subparsers.add_parser("plan", help="Camino más corto entre dos estados")
+    plan_parser.add_argument("source")
+    plan_parser.add_argument("target")
+    subparsers.add_parser("report", help="Aristas ejecutables y pendientes de etiquetar")
+    go_parser = subparsers.add_parser("go", help="Navegar en el juego hasta un estado")
+    go_parser.add_argument("target")
+    go_parser.add_argument("--timeout", type=float, default=60.0)
+    args = parser.parse_args()
+
+    if args.command == "plan":
+        plan = _load_graph().plan(args.source, args.target)
+        if plan is None:
+            print(f"No hay camino ejecutable de '{args.source}' a '{args.target}'.")
+            return 1
+        for hop in plan:
+            print(f"{hop.source:40} -> {hop.target:40} {'+'.join(hop.buttons):25} ~{hop.expected_s:.2f} s")
+        print(f"\n{len(plan)} saltos, {sum(len(h.buttons) for h in plan)} pulsaciones, "
+              f"~{sum(h.expected_s for h in plan):.1f} s")
+        return 0
+    if args.command == "report":
+        report = _load_graph().report()
+        print(f"{report['states']} estados, {len(report['labelled'])} aristas ejecutables, "
+              f"{len(report['unlabelled'])} sin botón")
+        for source, target in report['unlabelled']:
+            print(f"  sin botón: {source} -> {target}")
+        if report['dead_ends']:
+            print(f"Estados sin salida ejecutable: {', '.join(report['dead_ends'])}")
+        return 0
+    if args.command == "go":
+        from gamepad_controller import GamepadController
+        from recognizer_service import create_recognizer
+        outcome = MenuNavigator(GamepadController(), create_recognizer()).navigate(args.target, args.timeout)
+        print(outcome)
+        return 0 if outcome['success'] else 1
+    parser.print_help()
+    return 1
+
+
+if __name__ == "__main__":
+    if not logging.getLogger().hasHandlers():
+        logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    sys.exit(main())
@@ -6,6 +6,7 @@ import logging
 from PIL import Image, ImageTk, ImageDraw, ImageFont # Pillow para manejo avanzado de imágenes
 import cv2 # OpenCV para conversión inicial BGR -> RGB
 import numpy as np
+from frame_pyramid import FramePyramid # Reducciones memorizadas: sin cv2.resize en cada redibujado
 
 # Importar constantes de color y tamaño desde el módulo principal o definirlas aquí
 # Es mejor si se pueden importar para consistencia. Asumiremos que existen en main_app
@@ -53,6 +54,7 @@ class ImagePreviewPanel(ttk.LabelFrame):
 
         # --- Estado Interno ---
         self.current_image_numpy = None # Imagen original NumPy BGR
+        self.current_pyramid = None     # FramePyramid de la imagen actual (caché de tamaños de canvas)
         self.current_ocr_regions = []   # Lista de dicts de regiones [{region:{}, expected_text:[]}, ...]
         self.selected_indices = []      # Lista de índices (0-based) de regiones seleccionadas
         self.tk_img_preview = None      # Referencia a PhotoImage para Tkinter (¡VITAL!)
@@ -111,6 +113,10 @@ class ImagePreviewPanel(ttk.LabelFrame):
             selected_indices (list | None): Lista de índices (0-based) de las regiones
                                            en ocr_regions que deben resaltarse.
         """
+        if image_numpy is None:
+            self.current_pyramid = None
+        elif image_numpy is not self.current_image_numpy or self.current_pyramid is None:
+            self.current_pyramid = FramePyramid(image_numpy) # Imagen nueva: se descarta la caché anterior
         self.current_image_numpy = image_numpy
         self.current_ocr_regions = ocr_regions if ocr_regions else []
         self.selected_indices = selected_indices if selected_indices is not None else []
@@ -161,13 +167,13 @@ class ImagePreviewPanel(ttk.LabelFrame):
 
             if new_w < 1 or new_h < 1: raise ValueError("Tamaño redimensionado inválido")
 
-            # Redimensionar con OpenCV
-            interpolation = cv2.INTER_AREA if self.display_scale < 1.0 else cv2.INTER_CUBIC
-            resized_img = cv2.resize(self.current_image_numpy, (new_w, new_h), interpolation=interpolation)
-
-            # Convertir a formato PIL RGB
-            img_rgb = cv2.cvtColor(resized_img, cv2.COLOR_BGR2RGB)
-            pil_img = Image.fromarray(img_rgb)
+            # Redimensionar y convertir a RGB (memorizado por tamaño: los redibujados por
+            # cambio de selección o de regiones no vuelven a reducir la imagen)
+            if self.current_pyramid is None:
+                self.current_pyramid = FramePyramid(self.current_image_numpy)
+            img_rgb = self.current_pyramid.fit(canvas_width, canvas_height, rgb=True)
+            new_h, new_w = img_rgb.shape[:2]
+            pil_img = Image.fromarray(img_rgb.copy()) # Copia: se dibujan las regiones encima
 
             # --- 3. Dibujar Regiones OCR sobre la imagen PIL redimensionada ---
             draw = ImageDraw.Draw(pil_img)
@@ -245,6 +251,7 @@ class ImagePreviewPanel(ttk.LabelFrame):
         """Limpia el canvas y resetea el estado interno relacionado."""
         logging.debug("Limpiando previsualización.")
         self.current_image_numpy = None
+        self.current_pyramid = None
         self.current_ocr_regions = []
         self.selected_indices = []
         self._draw_canvas_content() # Redibuja (mostrará "Sin Imagen")
@@ -6,6 +6,7 @@ import logging
 from PIL import Image, ImageTk, ImageDraw, ImageFont # Pillow para manejo avanzado de imágenes
 import cv2 # OpenCV para posible conversión inicial BGR -> RGB
 import numpy as np
+from frame_pyramid import FramePyramid # Reducciones memorizadas de capturas grandes
 
 class PreviewPanel(ttk.LabelFrame):
     """
@@ -28,6 +29,7 @@ class PreviewPanel(ttk.LabelFrame):
 
         # --- Estado Interno ---
         self.current_image_pil = None # Imagen original en formato PIL (para redimensionar)
+        self.current_pyramid = None   # Capturas numpy: FramePyramid (cada tamaño se calcula una vez)
         self.current_image_tk = None  # Imagen convertida para Tkinter (¡NECESARIO MANTENER REFERENCIA!)
         self.current_canvas_image_id = None # ID del item imagen en el canvas
         self.info_label_var = tk.StringVar(value="-")
@@ -65,6 +67,7 @@ class PreviewPanel(ttk.LabelFrame):
         Args:
             image_source: La fuente de la imagen. Puede ser:
                           - numpy.ndarray (BGR, como de cv2 o mss)
+                          - FramePyramid (p.ej. result['frame_pyramid'] del reconocedor)
                           - str (ruta a un archivo de imagen)
                           - PIL.Image.Image
                           - None (para limpiar la previsualización)
@@ -75,6 +78,7 @@ class PreviewPanel(ttk.LabelFrame):
         self._clear_canvas_image()
         self.info_label_var.set("-") # Resetear info por defecto
 
+        self.current_pyramid = None
         if image_source is None:
             self.current_image_pil = None # Asegurar que no hay imagen guardada
             logging.debug("Fuente de imagen es None, limpiando previsualización.")
@@ -84,10 +88,13 @@ class PreviewPanel(ttk.LabelFrame):
         img_pil = None
         original_size = (0, 0)
         try:
-            if isinstance(image_source, np.ndarray):
-                # Asumir BGR de OpenCV/MSS y convertir a RGB para PIL
+            if isinstance(image_source, FramePyramid):
+                self.current_pyramid = image_source
+                original_size = (image_source.shape[1], image_source.shape[0])
+            elif isinstance(image_source, np.ndarray):
+                # Asumir BGR de OpenCV/MSS: se reduce y convierte a RGB sólo al tamaño del canvas
                 if image_source.ndim == 3 and image_source.shape[2] == 3:
-                    img_pil = Image.fromarray(cv2.cvtColor(image_source, cv2.COLOR_BGR2RGB))
+                    self.current_pyramid = FramePyramid(image_source)
                     original_size = (image_source.shape[1], image_source.shape[0]) # (width, height)
                 else:
                      logging.warning(f"Formato numpy array inesperado: {image_source.shape}. No se puede mostrar.")
@@ -122,7 +129,7 @@ class PreviewPanel(ttk.LabelFrame):
                 return
 
             # Guardar la imagen PIL original para redimensionamientos posteriores
-            self.current_image_pil = img_pil
+            self.current_image_pil = img_pil if self.current_pyramid is None else None
             # Actualizar info (si no se proporcionó una específica)
             if info_text == "-":
                  self.info_label_var.set(f"Original: {original_size[0]}x{original_size[1]}px")
@@ -140,10 +147,14 @@ class PreviewPanel(ttk.LabelFrame):
         except Exception as e:
             logging.exception(f"Error inesperado procesando la fuente de imagen: {e}")
             self.current_image_pil = None
+            self.current_pyramid = None
             self.info_label_var.set("Error procesando imagen")
 
     def _draw_image_on_canvas(self):
         """Redimensiona y dibuja la imagen PIL actual en el canvas."""
+        if self.current_pyramid is not None:
+            self._draw_pyramid_on_canvas()
+            return
         if not self.current_image_pil:
             return # No hay imagen para dibujar
 
@@ -200,6 +211,25 @@ class PreviewPanel(ttk.LabelFrame):
             self._clear_canvas_image()
             self.info_label_var.set("Error dibujando imagen")
 
+    def _draw_pyramid_on_canvas(self):
+        """Dibuja una captura a partir de su pirámide (la reducción a cada tamaño se memoriza)."""
+        canvas_width = self.preview_canvas.winfo_width()
+        canvas_height = self.preview_canvas.winfo_height()
+        if canvas_width <= 1 or canvas_height <= 1:
+            return
+        try:
+            img_rgb = self.current_pyramid.fit(canvas_width, canvas_height, rgb=True)
+            new_height, new_width = img_rgb.shape[:2]
+            self.current_image_tk = ImageTk.PhotoImage(Image.fromarray(img_rgb))
+            self._clear_canvas_image()
+            self.current_canvas_image_id = self.preview_canvas.create_image(
+                (canvas_width - new_width) // 2, (canvas_height - new_height) // 2, anchor=tk.NW, image=self.current_image_tk
+            )
+        except Exception as e:
+            logging.exception(f"Error al dibujar la captura en el canvas: {e}")
+            self._clear_canvas_image()
+            self.info_label_var.set("Error dibujando imagen")
+
     def _clear_canvas_image(self):
         """Elimina la imagen actual del canvas si existe."""
         if self.current_canvas_image_id:
@@ -217,6 +247,7 @@ class PreviewPanel(ttk.LabelFrame):
         logging.debug("Limpiando previsualización completa.")
         self._clear_canvas_image()
         self.current_image_pil = None
+        self.current_pyramid = None
         self.current_image_tk = None # Liberar referencia a PhotoImage anterior
         self.info_label_var.set("-")
 
@@ -225,8 +256,8 @@ class PreviewPanel(ttk.LabelFrame):
         Se llama cuando el tamaño del canvas cambia. Redibuja la imagen actual
         para que se ajuste al nuevo tamaño.
         """
-        # Comprobar si tenemos una imagen PIL cargada para redibujar
-        if self.current_image_pil:
+        # Comprobar si tenemos una imagen (PIL o pirámide) cargada para redibujar
+        if self.current_image_pil or self.current_pyramid is not None:
             # logging.debug(f"Canvas redimensionado a {event.width}x{event.height}. Redibujando imagen.")
             self._draw_image_on_canvas()
         # else:
@@ -8,10 +8,11 @@ buscando jugadores y completando el proceso de compra.
 Utiliza los módulos de control de gamepad y reconocimiento de pantalla.
 """
 
-import time
 import os
+from async_runtime import workflow_sleep
 from gamepad_controller import GamepadController, GamepadButton, EFootballSequences
 from screen_recognizer import ScreenRecognizer, GameScreen, ScreenElement
+from menu_navigator import MenuNavigator, MAIN_MENU_STATES
 
 class PlayerSigner:
     """
@@ -38,6 +39,8 @@ class PlayerSigner:
         else:
             self.recognizer = screen_recognizer
         
+        self.navigator = MenuNavigator(self.gamepad, self.recognizer)
+        
         # Directorio para guardar capturas de pantalla
         self.screenshots_dir = "/home/ubuntu/efootball_automation/screenshots"
         os.makedirs(self.screenshots_dir, exist_ok=True)
@@ -82,7 +85,7 @@ class PlayerSigner:
                     self.gamepad.execute_sequence(EFootballSequences.navegar_menu_principal_a_contratos())
                     
                     # Esperar a que cambie la pantalla
-                    time.sleep(wait_time)
+                    workflow_sleep(wait_time)
                     
                     # Verificar si hemos llegado al menú de contratos
                     new_screen = self.recognizer.recognize_screen()
@@ -93,7 +96,7 @@ class PlayerSigner:
                     print("Opción de contrato no encontrada, intentando con secuencia predefinida...")
                     # Si no encontramos la opción, intentar con una secuencia predefinida
                     self.gamepad.execute_sequence(EFootballSequences.navegar_menu_principal_a_contratos())
-                    time.sleep(wait_time)
+                    workflow_sleep(wait_time)
                     
                     # Verificar si hemos llegado al menú de contratos
                     new_screen = self.recognizer.recognize_screen()
@@ -104,10 +107,9 @@ class PlayerSigner:
                 print(f"No estamos en el menú principal, estamos en: {current_screen.value}")
                 print("Intentando volver al menú principal...")
                 
-                # Intentar volver al menú principal presionando B varias veces
-                for _ in range(3):
-                    self.gamepad.press_button(GamepadButton.B, duration=0.2)
-                    time.sleep(1.0)
+                # Volver al menú principal por el camino más corto del grafo de transiciones
+                # (pulsa B si la pantalla actual no tiene camino conocido)
+                self.navigator.navigate(MAIN_MENU_STATES)
                 
                 # Verificar si hemos vuelto al menú principal
                 new_screen = self.recognizer.recognize_screen()
@@ -157,7 +159,7 @@ class PlayerSigner:
                     self.gamepad.execute_sequence(EFootballSequences.seleccionar_jugadores_normales())
                     
                     # Esperar a que cambie la pantalla
-                    time.sleep(wait_time)
+                    workflow_sleep(wait_time)
                     
                     # Verificar si hemos llegado a la lista de jugadores normales
                     new_screen = self.recognizer.recognize_screen()
@@ -168,7 +170,7 @@ class PlayerSigner:
                     print("Opción de jugadores normales no encontrada, intentando con secuencia predefinida...")
                     # Si no encontramos la opción, intentar con una secuencia predefinida
                     self.gamepad.execute_sequence(EFootballSequences.seleccionar_jugadores_normales())
-                    time.sleep(wait_time)
+                    workflow_sleep(wait_time)
                     
                     # Verificar si hemos llegado a la lista de jugadores normales
                     new_screen = self.recognizer.recognize_screen()
@@ -236,7 +238,7 @@ class PlayerSigner:
         
         # Presionar Y para abrir el menú de filtros
         self.gamepad.press_button(GamepadButton.Y, duration=0.2)
-        time.sleep(1.0)
+        workflow_sleep(1.0)
         
         # Navegar por los filtros y aplicarlos según los valores proporcionados
         # Nota: Esta es una implementación simplificada, en una versión real
@@ -247,68 +249,68 @@ class PlayerSigner:
             print(f"Aplicando filtro de posición: {filters['position']}")
             # Navegar al filtro de posición y seleccionarlo
             self.gamepad.press_button(GamepadButton.DPAD_DOWN, duration=0.2)
-            time.sleep(0.5)
+            workflow_sleep(0.5)
             self.gamepad.press_button(GamepadButton.A, duration=0.2)
-            time.sleep(1.0)
+            workflow_sleep(1.0)
             
             # Seleccionar la posición (simulación)
             self.gamepad.press_button(GamepadButton.DPAD_DOWN, duration=0.2)
-            time.sleep(0.5)
+            workflow_sleep(0.5)
             self.gamepad.press_button(GamepadButton.A, duration=0.2)
-            time.sleep(1.0)
+            workflow_sleep(1.0)
             
             # Volver al menú de filtros
             self.gamepad.press_button(GamepadButton.B, duration=0.2)
-            time.sleep(1.0)
+            workflow_sleep(1.0)
         
         # Club
         if "club" in filters:
             print(f"Aplicando filtro de club: {filters['club']}")
             # Navegar al filtro de club y seleccionarlo
             self.gamepad.press_button(GamepadButton.DPAD_DOWN, duration=0.2)
-            time.sleep(0.5)
+            workflow_sleep(0.5)
             self.gamepad.press_button(GamepadButton.DPAD_DOWN, duration=0.2)
-            time.sleep(0.5)
+            workflow_sleep(0.5)
             self.gamepad.press_button(GamepadButton.A, duration=0.2)
-            time.sleep(1.0)
+            workflow_sleep(1.0)
             
             # Seleccionar el club (simulación)
             self.gamepad.press_button(GamepadButton.DPAD_DOWN, duration=0.2)
-            time.sleep(0.5)
+            workflow_sleep(0.5)
             self.gamepad.press_button(GamepadButton.A, duration=0.2)
-            time.sleep(1.0)
+            workflow_sleep(1.0)
             
             # Volver al menú de filtros
             self.gamepad.press_button(GamepadButton.B, duration=0.2)
-            time.sleep(1.0)
+            workflow_sleep(1.0)
         
         # Precio máximo
         if "price_max" in filters:
             print(f"Aplicando filtro de precio máximo: {filters['price_max']}")
             # Navegar al filtro de precio y seleccionarlo
             self.gamepad.press_button(GamepadButton.DPAD_DOWN, duration=0.2)
-            time.sleep(0.5)
+            workflow_sleep(0.5)
             self.gamepad.press_button(GamepadButton.DPAD_DOWN, duration=0.2)
-            time.sleep(0.5)
+            workflow_sleep(0.5)
             self.gamepad.press_button(GamepadButton.DPAD_DOWN, duration=0.2)
-            time.sleep(0.5)
+            workflow_sleep(0.5)
             self.gamepad.press_button(GamepadButton.A, duration=0.2)
-            time.sleep(1.0)
+            workflow_sleep(1.0)
             
             # Seleccionar el precio máximo (simulación)
             self.gamepad.press_button(GamepadButton.DPAD_RIGHT, duration=0.2)
-            time.sleep(0.5)
+            workflow_sleep(0.5)
             self.gamepad.press_button(GamepadButton.A, duration=0.2)
-            time.sleep(1.0)
+            workflow_sleep(1.0)
             
             # Volver al menú de filtros
             self.gamepad.press_button(GamepadButton.B, duration=0.2)
-            time.sleep(1.0)
+            workflow_sleep(1.0)
         
         # Aplicar los filtros
         print("Aplicando filtros seleccionados...")
         self.gamepad.press_button(GamepadButton.A, duration=0.2)
-        time.sleep(2.0)
+        workflow_sleep(2.0)
         
         # Guardar una captura de pantalla después de aplicar filtros
         self.recognizer.save_screenshot("despues_filtros.png", self.screenshots_dir)
@@ -346,12 +348,12 @@ class PlayerSigner:
         for i in range(player_index):
             print(f"Navegando al jugador {i+1}...")
             self.gamepad.press_button(GamepadButton.DPAD_DOWN, duration=0.2)
-            time.sleep(0.5)
+            workflow_sleep(0.5)
         
         # Seleccionar el jugador
         print(f"Seleccionando jugador {player_index}...")
         self.gamepad.press_button(GamepadButton.A, duration=0.2)
-        time.sleep(wait_time)
+        workflow_sleep(wait_time)
         
         # Verificar si hemos llegado a la pantalla de confirmación de compra
         new_screen = self.recognizer.recognize_screen()
@@ -399,7 +401,7 @@ class PlayerSigner:
                     self.gamepad.execute_sequence(EFootballSequences.confirmar_compra())
                     
                     # Esperar a que cambie la pantalla
-                    time.sleep(wait_time)
+                    workflow_sleep(wait_time)
                     
                     # Verificar si hemos llegado a la pantalla de compra realizada
                     new_screen = self.recognizer.recognize_screen()
@@ -411,14 +413,14 @@ class PlayerSigner:
                         
                         # Presionar A para continuar
                         self.gamepad.press_button(GamepadButton.A, duration=0.2)
-                        time.sleep(wait_time)
+                        workflow_sleep(wait_time)
                         
                         return True
                 else:
                     print("Botón de confirmar no encontrado, intentando con secuencia predefinida...")
                     # Si no encontramos el botón, intentar con una secuencia predefinida
                     self.gamepad.execute_sequence(EFootballSequences.confirmar_compra())
-                    time.sleep(wait_time)
+                    workflow_sleep(wait_time)
                     
                     # Verificar si hemos llegado a la pantalla de compra realizada
                     new_screen = self.recognizer.recognize_screen()
@@ -430,7 +432,7 @@ class PlayerSigner:
                         
                         # Presionar A para continuar
                         self.gamepad.press_button(GamepadButton.A, duration=0.2)
-                        time.sleep(wait_time)
+                        workflow_sleep(wait_time)
                         
                         return True
             else:
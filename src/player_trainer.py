@@ -8,10 +8,11 @@ seleccionando un jugador y realizando el entrenamiento de habilidades.
 Utiliza los módulos de control de gamepad y reconocimiento de pantalla.
 """
 
-import time
 import os
+from async_runtime import workflow_sleep
 from gamepad_controller import GamepadController, GamepadButton, EFootballSequences
 from screen_recognizer import ScreenRecognizer, GameScreen, ScreenElement
+from menu_navigator import MenuNavigator, MAIN_MENU_STATES
 
 class PlayerTrainer:
     """
@@ -38,6 +39,8 @@ class PlayerTrainer:
         else:
             self.recognizer = screen_recognizer
         
+        self.navigator = MenuNavigator(self.gamepad, self.recognizer)
+        
         # Directorio para guardar capturas de pantalla
         self.screenshots_dir = "/home/ubuntu/efootball_automation/screenshots/training"
         os.makedirs(self.screenshots_dir, exist_ok=True)
@@ -82,7 +85,7 @@ class PlayerTrainer:
                     self.gamepad.execute_sequence(EFootballSequences.navegar_menu_principal_a_mi_equipo())
                     
                     # Esperar a que cambie la pantalla
-                    time.sleep(wait_time)
+                    workflow_sleep(wait_time)
                     
                     # Verificar si hemos llegado a Mi Equipo
                     new_screen = self.recognizer.recognize_screen()
@@ -93,7 +96,7 @@ class PlayerTrainer:
                     print("Opción de Mi Equipo no encontrada, intentando con secuencia predefinida...")
                     # Si no encontramos la opción, intentar con una secuencia predefinida
                     self.gamepad.execute_sequence(EFootballSequences.navegar_menu_principal_a_mi_equipo())
-                    time.sleep(wait_time)
+                    workflow_sleep(wait_time)
                     
                     # Verificar si hemos llegado a Mi Equipo
                     new_screen = self.recognizer.recognize_screen()
@@ -104,10 +107,9 @@ class PlayerTrainer:
                 print(f"No estamos en el menú principal, estamos en: {current_screen.value}")
                 print("Intentando volver al menú principal...")
                 
-                # Intentar volver al menú principal presionando B varias veces
-                for _ in range(3):
-                    self.gamepad.press_button(GamepadButton.B, duration=0.2)
-                    time.sleep(1.0)
+                # Volver al menú principal por el camino más corto del grafo de transiciones
+                # (pulsa B si la pantalla actual no tiene camino conocido)
+                self.navigator.navigate(MAIN_MENU_STATES)
                 
                 # Verificar si hemos vuelto al menú principal
                 new_screen = self.recognizer.recognize_screen()
@@ -151,7 +153,7 @@ class PlayerTrainer:
         if current_screen == GameScreen.MY_TEAM:
             print("Navegando a la lista de jugadores...")
             self.gamepad.press_button(GamepadButton.A, duration=0.2)
-            time.sleep(wait_time)
+            workflow_sleep(wait_time)
             
             # Verificar si hemos llegado a la lista de jugadores
             new_screen = self.recognizer.recognize_screen()
@@ -180,7 +182,7 @@ class PlayerTrainer:
             
             # Desplazarse hacia abajo
             self.gamepad.press_button(GamepadButton.DPAD_DOWN, duration=0.2)
-            time.sleep(wait_time)
+            workflow_sleep(wait_time)
         
         # Para la simulación, asumimos que hemos encontrado al jugador
         # En una implementación real, se verificaría si realmente se encontró
@@ -189,7 +191,7 @@ class PlayerTrainer:
         
         # Seleccionar el jugador
         self.gamepad.press_button(GamepadButton.A, duration=0.2)
-        time.sleep(wait_time)
+        workflow_sleep(wait_time)
         
         # Verificar si hemos llegado a la pantalla de acciones del jugador
         new_screen = self.recognizer.recognize_screen()
@@ -242,7 +244,7 @@ class PlayerTrainer:
                     self.gamepad.execute_sequence(EFootballSequences.acceder_a_habilidades())
                     
                     # Esperar a que cambie la pantalla
-                    time.sleep(wait_time)
+                    workflow_sleep(wait_time)
                     
                     # Verificar si hemos llegado a la pantalla de habilidades
                     new_screen = self.recognizer.recognize_screen()
@@ -253,7 +255,7 @@ class PlayerTrainer:
                     print("Opción de habilidades no encontrada, intentando con secuencia predefinida...")
                     # Si no encontramos la opción, intentar con una secuencia predefinida
                     self.gamepad.execute_sequence(EFootballSequences.acceder_a_habilidades())
-                    time.sleep(wait_time)
+                    workflow_sleep(wait_time)
                     
                     # Verificar si hemos llegado a la pantalla de habilidades
                     new_screen = self.recognizer.recognize_screen()
@@ -305,7 +307,7 @@ class PlayerTrainer:
                     self.gamepad.execute_sequence(EFootballSequences.seleccionar_entrenamiento_habilidad())
                     
                     # Esperar a que cambie la pantalla
-                    time.sleep(wait_time)
+                    workflow_sleep(wait_time)
                     
                     # Verificar si hemos llegado a la pantalla de entrenamiento
                     new_screen = self.recognizer.recognize_screen()
@@ -316,7 +318,7 @@ class PlayerTrainer:
                     print("Opción de entrenamiento no encontrada, intentando con secuencia predefinida...")
                     # Si no encontramos la opción, intentar con una secuencia predefinida
                     self.gamepad.execute_sequence(EFootballSequences.seleccionar_entrenamiento_habilidad())
-                    time.sleep(wait_time)
+                    workflow_sleep(wait_time)
                     
                     # Verificar si hemos llegado a la pantalla de entrenamiento
                     new_screen = self.recognizer.recognize_screen()
@@ -358,12 +360,12 @@ class PlayerTrainer:
         # Seleccionar la primera habilidad disponible (simulación)
         print("Seleccionando habilidad para entrenar...")
         self.gamepad.press_button(GamepadButton.A, duration=0.2)
-        time.sleep(wait_time)
+        workflow_sleep(wait_time)
         
         # Confirmar la selección
         print("Confirmando selección de habilidad...")
         self.gamepad.press_button(GamepadButton.A, duration=0.2)
-        time.sleep(wait_time * 2)  # Esperar un poco más para la animación
+        workflow_sleep(wait_time * 2)  # Esperar un poco más para la animación
         
         # Guardar una captura de pantalla después del entrenamiento
         self.recognizer.save_screenshot("despues_entrenamiento.png", self.screenshots_dir)
@@ -371,7 +373,7 @@ class PlayerTrainer:
         # Volver a la pantalla de habilidades
         print("Volviendo a la pantalla de habilidades...")
         self.gamepad.press_button(GamepadButton.B, duration=0.2)
-        time.sleep(wait_time)
+        workflow_sleep(wait_time)
         
         # Verificar si hemos vuelto a la pantalla de habilidades
         new_screen = self.recognizer.recognize_screen()
@@ -0,0 +1,561 @@
+"""
+Compilación de la configuración de reconocimiento en un único bundle.
+
+Los datos de ejecución están repartidos en templates_mapping.json,
+ocr_regions.json, state_transitions.json y state_rois.json. Este módulo los
+valida una sola vez y resuelve sus referencias:
+
+    - plantillas faltantes o nombres de archivo inválidos,
+    - transiciones hacia estados sin plantillas (colgantes), con botones
+      desconocidos o latencias inválidas,
+    - ROIs y regiones OCR con formato inválido, vacías o fuera del monitor.
+
+Además aplica los ajustes de recognition_tuning.json (plantillas podadas,
+umbrales por estado y orden de evaluación de los estados).
+
+El resultado es un RecognitionBundle versionado con identificadores de
+estado y regiones ya normalizadas como tuplas (left, top, width, height),
+de modo que ScreenRecognizer no tiene que comprobar tipos ni claves en cada
+frame.
+
+Uso:
+    python recognition_bundle.py compile            # Valida y escribe config/recognition_bundle.json
+    python recognition_bundle.py compile --check    # Sólo valida (código 1 si hay errores)
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+from collections import namedtuple
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger('recognition_bundle')
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CONFIG_DIR = os.path.join(PROJECT_DIR, "config")
+IMAGES_DIR = os.path.join(PROJECT_DIR, "images")
+BUNDLE_FILE = os.path.join(CONFIG_DIR, "recognition_bundle.json")
+# Ajustes generados por las herramientas de análisis (template_analysis.py):
+#   {"prune": {estado: [archivo, ...]}, "sources": {sección: descripción}, "updated_at": ...}
+TUNING_FILE = os.path.join(CONFIG_DIR, "recognition_tuning.json")
+
+BUNDLE_FORMAT = "efootball-recognition-bundle"
+BUNDLE_VERSION = 1
+_REGION_KEYS = ('left', 'top', 'width', 'height')
+
+# Región OCR normalizada: índice en ocr_regions.json (el que usa la GUI), coordenadas
+# absolutas, la región como dict, los textos esperados y su versión normalizada para comparar.
+OcrRegionSpec = namedtuple('OcrRegionSpec', 'index left top width height region expected expected_norm')
+
+# Transición normalizada: estado destino, botones que la producen (en orden; vacío si
+# no se conocen) y latencia típica en segundos (None si no se ha medido).
+TransitionEdge = namedtuple('TransitionEdge', 'target buttons latency_s')
+
+# Valores de gamepad_controller.GamepadButton (sin importar vgamepad)
+KNOWN_BUTTONS = ('a', 'b', 'x', 'y', 'start', 'back', 'dpad_up', 'dpad_down', 'dpad_left', 'dpad_right',
+                 'left_shoulder', 'right_shoulder', 'left_trigger', 'right_trigger', 'left_thumb', 'right_thumb')
+
+
+class BundleError(Exception):
+    """Bundle ilegible o de una versión no soportada."""
+    pass
+
+
+def _region_tuple(region) -> Optional[tuple]:
+    """Convierte {'left','top','width','height'} en tupla de enteros, o None si es inválida."""
+    if not isinstance(region, dict) or not all(k in region for k in _REGION_KEYS):
+        return None
+    try:
+        return tuple(int(region[k]) for k in _REGION_KEYS)
+    except (TypeError, ValueError):
+        return None
+
+
+def load_tuning(path: str = TUNING_FILE, previous: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Carga los ajustes de reconocimiento ({} si no existen o son inválidos).
+
+    Con ``previous`` (recarga en caliente), un archivo inválido devuelve esos ajustes.
+    """
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            tuning = json.load(f)
+        if not isinstance(tuning, dict):
+            raise ValueError("el contenido no es un objeto JSON")
+        return tuning
+    except (OSError, ValueError) as e:
+        if previous is not None:
+            logger.warning(f"Ajustes de reconocimiento inválidos en {path}: {e}. Se conservan los anteriores.")
+            return previous
+        logger.warning(f"Ajustes de reconocimiento inválidos en {path}: {e}. Se ignoran.")
+        return {}
+
+
+def update_tuning(section: str, values: Any, source: str, path: str = TUNING_FILE) -> Dict[str, Any]:
+    """
+    Sustituye una sección de los ajustes (p.ej. 'prune') conservando el resto.
+
+    Args:
+        section: Nombre de la sección.
+        values: Nuevo contenido de la sección.
+        source: Descripción de qué herramienta/datos la generaron.
+        path: Archivo de ajustes.
+
+    Returns:
+        Los ajustes completos tras la actualización.
+    """
+    tuning = load_tuning(path)
+    tuning[section] = values
+    tuning.setdefault('sources', {})[section] = source
+    tuning['updated_at'] = time.strftime("%Y-%m-%d %H:%M:%S")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(tuning, f, indent=4, ensure_ascii=False)
+    os.replace(tmp_path, path)
+    logger.info(f"Sección '{section}' de {path} actualizada ({source}).")
+    return tuning
+
+
+def apply_prune(template_names_mapping: Dict[str, Any], tuning: Optional[Dict[str, Any]]):
+    """
+    Quita del mapping las plantillas podadas en los ajustes, sin dejar nunca
+    un estado sin plantillas.
+
+    Returns:
+        (mapping efectivo, { estado: (archivos podados, ...) })
+    """
+    prune = (tuning or {}).get('prune') or {}
+    if not isinstance(prune, dict) or not prune:
+        return template_names_mapping, {}
+    effective, pruned = {}, {}
+    for state, files in template_names_mapping.items():
+        to_drop = prune.get(state)
+        if not isinstance(files, list) or not isinstance(to_drop, list):
+            effective[state] = files
+            continue
+        kept = [f for f in files if f not in to_drop]
+        if not kept:
+            kept = files[:1] # Conservar al menos una plantilla
+        effective[state] = kept
+        if len(kept) != len(files):
+            pruned[state] = tuple(f for f in files if f not in kept)
+    return effective, pruned
+
+
+def _clip_to_monitor(rect: tuple, monitor: Optional[Dict[str, int]]):
+    """
+    Recorta un rectángulo absoluto a la geometría del monitor.
+
+    Returns:
+        (rectángulo recortado o None si queda fuera, True si hubo recorte)
+    """
+    if not monitor:
+        return rect, False
+    left, top, width, height = rect
+    mon_left, mon_top = monitor['left'], monitor['top']
+    right = min(left + width, mon_left + monitor['width'])
+    bottom = min(top + height, mon_top + monitor['height'])
+    left, top = max(left, mon_left), max(top, mon_top)
+    if right <= left or bottom <= top:
+        return None, True
+    clipped = (left, top, right - left, bottom - top)
+    return clipped, clipped != rect
+
+
+class RecognitionBundle:
+    """
+    Configuración de reconocimiento validada y normalizada.
+
+    Attributes:
+        states: Nombres de estado ordenados; su índice es el id del estado.
+        state_ids: { estado: id }.
+        template_files: { estado: (archivo, ...) } sólo con nombres válidos.
+        transitions: { estado: (siguiente, ...) } sin transiciones colgantes.
+        edges: { estado: (TransitionEdge, ...) } las mismas transiciones con botones y latencia.
+        rois: { estado: (left, top, width, height) } absolutas, dentro del monitor.
+        ocr_regions: { estado: (OcrRegionSpec, ...) }.
+        pruned: { estado: (archivo, ...) } plantillas descartadas por los ajustes.
+        thresholds: { estado: umbral } umbrales de plantilla propios de cada estado.
+        state_order: Estados reconocibles en el orden de evaluación preferido.
+        issues: Lista de incidencias {'level', 'state', 'kind', 'message'}.
+    """
+
+    def __init__(self, states=(), template_files=None, transitions=None, rois=None,
+                 ocr_regions=None, issues=None, monitor=None, templates_dir=None,
+                 compiled_at=None, version=BUNDLE_VERSION, pruned=None,
+                 thresholds=None, state_order=(), edges=None):
+        self.version = version
+        self.states = tuple(states)
+        self.state_ids = {state: i for i, state in enumerate(self.states)}
+        self.template_files = template_files or {}
+        self.transitions = transitions or {}
+        # Sin aristas explícitas (bundles antiguos), cada transición es una arista sin botones
+        self.edges = edges if edges is not None else {
+            s: tuple(TransitionEdge(n, (), None) for n in nxt) for s, nxt in self.transitions.items()}
+        self.rois = rois or {}
+        self.ocr_regions = ocr_regions or {}
+        self.pruned = pruned or {}
+        self.thresholds = thresholds or {}
+        self.state_order = tuple(state_order)
+        self.issues = issues or []
+        self.monitor = monitor
+        self.templates_dir = templates_dir
+        self.compiled_at = compiled_at or time.time()
+
+    @property
+    def errors(self) -> List[Dict[str, Any]]:
+        return [i for i in self.issues if i['level'] == 'error']
+
+    @property
+    def warnings(self) -> List[Dict[str, Any]]:
+        return [i for i in self.issues if i['level'] == 'warning']
+
+    # --- Serialización (por id de estado) ---
+
+    def to_dict(self) -> Dict[str, Any]:
+        ids = self.state_ids
+        return {
+            'format': BUNDLE_FORMAT,
+            'version': self.version,
+            'compiled_at': self.compiled_at,
+            'monitor': self.monitor,
+            'templates_dir': self.templates_dir,
+            'states': list(self.states),
+            'templates': {str(ids[s]): list(files) for s, files in self.template_files.items()},
+            'transitions': {str(ids[s]): [ids[n] for n in nxt] for s, nxt in self.transitions.items()},
+            'edges': {str(ids[s]): [[ids[e.target], list(e.buttons), e.latency_s] for e in edges]
+                      for s, edges in self.edges.items() if any(e.buttons or e.latency_s for e in edges)},
+            'rois': {str(ids[s]): list(rect) for s, rect in self.rois.items()},
+            'ocr_regions': {str(ids[s]): [[r.index, r.left, r.top, r.width, r.height, list(r.expected)] for r in regions]
+                            for s, regions in self.ocr_regions.items()},
+            'pruned': {str(ids[s]): list(files) for s, files in self.pruned.items()},
+            'thresholds': {str(ids[s]): th for s, th in self.thresholds.items()},
+            'state_order': [ids[s] for s in self.state_order],
+            'issues': self.issues,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'RecognitionBundle':
+        if data.get('format') != BUNDLE_FORMAT:
+            raise BundleError("El archivo no es un bundle de reconocimiento")
+        if data.get('version') != BUNDLE_VERSION:
+            raise BundleError(f"Versión de bundle no soportada: {data.get('version')} (esperada {BUNDLE_VERSION})")
+        states = data['states']
+        name = lambda state_id: states[int(state_id)]
+        ocr_regions = {}
+        for state_id, regions in data.get('ocr_regions', {}).items():
+            specs = []
+            for index, left, top, width, height, expected in regions:
+                region = {'left': left, 'top': top, 'width': width, 'height': height}
+                specs.append(OcrRegionSpec(index, left, top, width, height, region, tuple(expected),
+                                           frozenset(e.lower().strip() for e in expected)))
+            ocr_regions[name(state_id)] = tuple(specs)
+        transitions = {name(i): tuple(states[n] for n in nxt) for i, nxt in data.get('transitions', {}).items()}
+        edges = {s: tuple(TransitionEdge(n, (), None) for n in nxt) for s, nxt in transitions.items()}
+        for state_id, state_edges in data.get('edges', {}).items():
+            edges[name(state_id)] = tuple(TransitionEdge(states[t], tuple(b), lat) for t, b, lat in state_edges)
+        return cls(
+            states=states,
+            template_files={name(i): tuple(f) for i, f in data.get('templates', {}).items()},
+            transitions=transitions,
+            edges=edges,
+            rois={name(i): tuple(rect) for i, rect in data.get('rois', {}).items()},
+            ocr_regions=ocr_regions,
+            pruned={name(i): tuple(f) for i, f in data.get('pruned', {}).items()},
+            thresholds={name(i): float(th) for i, th in data.get('thresholds', {}).items()},
+            state_order=[states[i] for i in data.get('state_order', [])],
+            issues=data.get('issues', []),
+            monitor=data.get('monitor'),
+            templates_dir=data.get('templates_dir'),
+            compiled_at=data.get('compiled_at'),
+        )
+
+    def save(self, path: str = BUNDLE_FILE) -> None:
+        """Escribe el bundle en JSON (escritura atómica)."""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, path)
+        logger.info(f"Bundle de reconocimiento guardado en {path}")
+
+    @classmethod
+    def load(cls, path: str = BUNDLE_FILE) -> 'RecognitionBundle':
+        """Carga un bundle compilado previamente."""
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return cls.from_dict(json.load(f))
+        except (OSError, json.JSONDecodeError, KeyError, IndexError, ValueError) as e:
+            raise BundleError(f"No se pudo cargar el bundle {path}: {e}") from e
+
+    def to_mappings(self) -> Dict[str, Dict[str, Any]]:
+        """Reconstruye los cuatro mappings (ya validados) con el formato de los JSON originales."""
+        return {
+            'template_names_mapping': {s: list(f) for s, f in self.template_files.items()},
+            'ocr_regions_mapping': {s: [{'region': dict(r.region), 'expected_text': list(r.expected)} for r in regions]
+                                    for s, regions in self.ocr_regions.items()},
+            'state_transitions': {s: [_edge_entry(e) for e in edges] for s, edges in self.edges.items()},
+            'state_rois': {s: dict(zip(_REGION_KEYS, rect)) for s, rect in self.rois.items()},
+        }
+
+
+def _edge_entry(edge: TransitionEdge):
+    """Arista en el formato de state_transitions.json (cadena si no tiene botones ni latencia)."""
+    if not edge.buttons and edge.latency_s is None:
+        return edge.target
+    entry = {'state': edge.target}
+    if edge.buttons:
+        entry['button'] = edge.buttons[0] if len(edge.buttons) == 1 else list(edge.buttons)
+    if edge.latency_s is not None:
+        entry['latency_s'] = edge.latency_s
+    return entry
+
+
+def parse_edge(entry) -> tuple:
+    """
+    Normaliza una transición de state_transitions.json.
+
+    Admite el nombre del estado destino o un objeto
+    {"state": destino, "button": "dpad_right" | ["dpad_down", "a"], "latency_s": 0.6}.
+
+    Returns:
+        (TransitionEdge o None, mensaje de error o None)
+    """
+    if isinstance(entry, str):
+        return TransitionEdge(entry, (), None), None
+    if not isinstance(entry, dict) or not isinstance(entry.get('state'), str):
+        return None, f"Transición inválida: {entry!r}"
+    buttons = entry.get('button', entry.get('buttons', ()))
+    if isinstance(buttons, str):
+        buttons = (buttons,)
+    if not isinstance(buttons, (list, tuple)) or not all(isinstance(b, str) for b in buttons):
+        return None, f"Botones inválidos en la transición hacia '{entry['state']}': {buttons!r}"
+    buttons = tuple(b.lower() for b in buttons)
+    unknown = [b for b in buttons if b not in KNOWN_BUTTONS]
+    if unknown:
+        return None, f"Botón desconocido en la transición hacia '{entry['state']}': {unknown}"
+    latency = entry.get('latency_s')
+    if latency is not None and (isinstance(latency, bool) or not isinstance(latency, (int, float)) or latency < 0):
+        return None, f"Latencia inválida en la transición hacia '{entry['state']}': {latency!r}"
+    return TransitionEdge(entry['state'], buttons, float(latency) if latency is not None else None), None
+
+
+def compile_bundle(template_names_mapping: Dict[str, Any], ocr_regions_mapping: Dict[str, Any],
+                   state_transitions: Dict[str, Any], state_rois: Dict[str, Any],
+                   templates_dir: Optional[str] = None,
+                   monitor: Optional[Dict[str, int]] = None,
+                   tuning: Optional[Dict[str, Any]] = None) -> RecognitionBundle:
+    """
+    Valida los cuatro mappings y los normaliza en un RecognitionBundle.
+
+    Las entradas inválidas se descartan y quedan registradas en ``issues``;
+    nunca se lanza una excepción por un error de configuración.
+
+    Args:
+        template_names_mapping: { estado: [archivo.png, ...] }.
+        ocr_regions_mapping: { estado: [{'region': {...}, 'expected_text': [...]}, ...] }.
+        state_transitions: { estado: [siguiente | {'state', 'button', 'latency_s'}, ...] }.
+        state_rois: { estado: {'left', 'top', 'width', 'height'} }.
+        templates_dir: Directorio de imágenes para comprobar que existen (opcional).
+        monitor: Geometría absoluta del monitor para validar ROIs/regiones (opcional).
+        tuning: Ajustes de recognition_tuning.json (opcional).
+    """
+    issues = []
+
+    def issue(level, state, kind, message):
+        issues.append({'level': level, 'state': state, 'kind': kind, 'message': message})
+
+    # --- Plantillas ---
+    template_files = {}
+    for state, files in template_names_mapping.items():
+        if not isinstance(files, list):
+            issue('error', state, 'templates', f"La lista de plantillas no es una lista ({type(files).__name__})")
+            continue
+        valid = []
+        for file_name in files:
+            if not isinstance(file_name, str) or not file_name:
+                issue('error', state, 'templates', f"Nombre de archivo inválido: {file_name!r}")
+            elif templates_dir and not os.path.exists(os.path.join(templates_dir, file_name)):
+                issue('error', state, 'missing_template', f"Plantilla faltante: {file_name}")
+            else:
+                valid.append(file_name)
+        if not valid:
+            issue('warning', state, 'templates', "Estado sin plantillas válidas: sólo reconocible por OCR")
+        template_files[state] = tuple(valid)
+    effective_files, pruned = apply_prune({s: list(f) for s, f in template_files.items()}, tuning)
+    for state, files in pruned.items():
+        issue('info', state, 'pruned', f"{len(files)} plantilla(s) podada(s) por los ajustes: {list(files)}")
+    template_files = {state: tuple(files) for state, files in effective_files.items()}
+    recognizable = {state for state, files in template_files.items() if files}
+
+    # --- Transiciones ---
+    transitions, edges = {}, {}
+    for state, next_states in state_transitions.items():
+        if state not in template_names_mapping:
+            issue('warning', state, 'transitions', "Transiciones definidas para un estado sin plantillas")
+        if next_states is None:
+            continue
+        if not isinstance(next_states, list):
+            issue('error', state, 'transitions', f"Las transiciones no son una lista ({type(next_states).__name__})")
+            continue
+        valid = {}
+        for entry in next_states:
+            edge, error = parse_edge(entry)
+            if error:
+                issue('error', state, 'transitions', error)
+            elif edge.target not in recognizable:
+                issue('warning', state, 'dangling_transition',
+                      f"Transición colgante hacia '{edge.target}' (sin plantillas válidas)")
+            elif edge.target not in valid:
+                valid[edge.target] = edge
+        transitions[state] = tuple(valid)
+        edges[state] = tuple(valid.values())
+
+    # --- ROIs ---
+    rois = {}
+    for state, region in state_rois.items():
+        rect = _region_tuple(region)
+        if rect is None:
+            issue('error', state, 'roi', f"ROI con formato inválido: {region!r}")
+            continue
+        if rect[2] <= 0 or rect[3] <= 0:
+            issue('error', state, 'roi', f"ROI de tamaño nulo o negativo: {region!r}")
+            continue
+        clipped, was_clipped = _clip_to_monitor(rect, monitor)
+        if clipped is None:
+            issue('error', state, 'roi_outside_monitor', f"ROI fuera del monitor {monitor}: {region!r}. Se usará pantalla completa")
+            continue
+        if was_clipped:
+            issue('warning', state, 'roi_outside_monitor', f"ROI recortada al monitor: {rect} -> {clipped}")
+        if state not in template_names_mapping:
+            issue('warning', state, 'roi', "ROI definida para un estado sin plantillas")
+        rois[state] = clipped
+
+    # --- Regiones OCR ---
+    ocr_regions = {}
+    for state, entries in ocr_regions_mapping.items():
+        if not isinstance(entries, list):
+            issue('error', state, 'ocr', f"Las regiones OCR no son una lista ({type(entries).__name__})")
+            continue
+        specs = []
+        for idx, entry in enumerate(entries):
+            rect = _region_tuple(entry.get('region')) if isinstance(entry, dict) else None
+            expected = entry.get('expected_text') if isinstance(entry, dict) else None
+            if rect is None or not isinstance(expected, list):
+                issue('error', state, 'ocr', f"Región OCR {idx} con formato inválido o sin 'expected_text'")
+                continue
+            texts = [t for t in expected if isinstance(t, str) and t.strip()]
+            if len(texts) != len(expected):
+                issue('warning', state, 'ocr', f"Región OCR {idx}: se ignoran textos esperados vacíos o no string")
+            if not texts:
+                issue('error', state, 'ocr', f"Región OCR {idx} sin textos esperados válidos")
+                continue
+            if rect[2] <= 0 or rect[3] <= 0 or _clip_to_monitor(rect, monitor)[0] is None:
+                issue('error', state, 'ocr_outside_monitor', f"Región OCR {idx} vacía o fuera del monitor: {rect}")
+                continue
+            specs.append(OcrRegionSpec(idx, *rect, region=dict(zip(_REGION_KEYS, rect)), expected=tuple(texts),
+                                       expected_norm=frozenset(t.lower().strip() for t in texts)))
+        if specs:
+            ocr_regions[state] = tuple(specs)
+
+    # --- Umbrales por estado y orden de evaluación (ajustes) ---
+    thresholds = {}
+    for state, value in ((tuning or {}).get('thresholds') or {}).items():
+        if state not in recognizable:
+            issue('warning', state, 'thresholds', "Umbral definido para un estado sin plantillas válidas")
+        elif isinstance(value, bool) or not isinstance(value, (int, float)) or not 0 < value <= 1:
+            issue('error', state, 'thresholds', f"Umbral inválido: {value!r} (debe estar en (0, 1])")
+        else:
+            thresholds[state] = float(value)
+    state_order = []
+    for state in (tuning or {}).get('state_order') or []:
+        if state in recognizable and state not in state_order:
+            state_order.append(state)
+
+    states = sorted(set(template_names_mapping) | set(state_transitions) | set(state_rois) | set(ocr_regions_mapping))
+    # Los mappings sólo pueden referenciar estados con id
+    transitions = {s: nxt for s, nxt in transitions.items() if s in states}
+    edges = {s: e for s, e in edges.items() if s in states}
+    return RecognitionBundle(states=states, template_files=template_files, transitions=transitions, edges=edges,
+                             rois=rois, ocr_regions=ocr_regions, issues=issues, monitor=monitor,
+                             templates_dir=templates_dir, pruned=pruned, thresholds=thresholds,
+                             state_order=state_order)
+
+
+def log_issues(bundle: RecognitionBundle, max_lines: int = 50) -> None:
+    """Registra en el log las incidencias de compilación."""
+    for entry in bundle.issues[:max_lines]:
+        level = {'error': logging.ERROR, 'warning': logging.WARNING}.get(entry['level'], logging.INFO)
+        logger.log(level, f"[{entry['kind']}] '{entry['state']}': {entry['message']}")
+    if len(bundle.issues) > max_lines:
+        logger.warning(f"... y {len(bundle.issues) - max_lines} incidencias más.")
+
+
+def _read_json(path: str) -> Dict[str, Any]:
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        content = f.read()
+    return json.loads(content) if content.strip() else {}
+
+
+def compile_from_config(resolution: str = '4K', monitor: Optional[Dict[str, int]] = None,
+                        use_tuning: bool = True) -> RecognitionBundle:
+    """Compila el bundle leyendo los cuatro JSON de config/ (y los ajustes, salvo use_tuning=False)."""
+    resolution_dir = os.path.join(IMAGES_DIR, resolution)
+    templates_dir = resolution_dir if os.path.isdir(resolution_dir) else IMAGES_DIR
+    return compile_bundle(
+        _read_json(os.path.join(CONFIG_DIR, "templates_mapping.json")),
+        _read_json(os.path.join(CONFIG_DIR, "ocr_regions.json")),
+        _read_json(os.path.join(CONFIG_DIR, "state_transitions.json")),
+        _read_json(os.path.join(CONFIG_DIR, "state_rois.json")),
+        templates_dir=templates_dir, monitor=monitor,
+        tuning=load_tuning() if use_tuning else None)
+
+
+def detect_monitor_geometry(index: int) -> Optional[Dict[str, int]]:
+    try:
+        import mss
+        with mss.mss() as sct:
+            monitors = sct.monitors[1:]
+        return dict(monitors[index - 1]) if 0 < index <= len(monitors) else None
+    except Exception as e:
+        logger.warning(f"No se pudo obtener la geometría del monitor ({e}); no se validarán límites.")
+        return None
+
+
+def main():
+    """Punto de entrada de línea de comandos."""
+    parser = argparse.ArgumentParser(description="Compilador del bundle de reconocimiento")
+    subparsers = parser.add_subparsers(dest="command")
+    compile_parser = subparsers.add_parser("compile", help="Validar la configuración y generar el bundle")
+    compile_parser.add_argument("--resolution", default="4K", help="Resolución de las plantillas")
+    compile_parser.add_argument("--monitor", type=int, default=1, help="Monitor para validar ROIs (1-based, 0 = no validar)")
+    compile_parser.add_argument("--output", default=BUNDLE_FILE, help="Ruta del bundle")
+    compile_parser.add_argument("--check", action="store_true", help="Sólo validar, sin escribir el bundle")
+    args = parser.parse_args()
+
+    if args.command != "compile":
+        parser.print_help()
+        return 0
+    monitor = detect_monitor_geometry(args.monitor) if args.monitor > 0 else None
+    bundle = compile_from_config(args.resolution, monitor)
+    log_issues(bundle, max_lines=len(bundle.issues))
+    print(f"{len(bundle.states)} estados, {sum(map(len, bundle.template_files.values()))} plantillas, "
+          f"{len(bundle.rois)} ROIs, {sum(map(len, bundle.ocr_regions.values()))} regiones OCR; "
+          f"{len(bundle.errors)} errores, {len(bundle.warnings)} avisos.")
+    if not args.check:
+        bundle.save(args.output)
+    return 1 if bundle.errors else 0
+
+
+if __name__ == "__main__":
+    if not logging.getLogger().hasHandlers():
+        logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    sys.exit(main())
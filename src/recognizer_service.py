@@ -0,0 +1,634 @@
+"""
+Servicio de reconocimiento de pantalla de larga duración.
+
+Cada punto de entrada (main.py, las GUIs, ActionExecutor, CursorNavigator)
+construía su propio ScreenRecognizer y cargaba todas las plantillas en su
+memoria. Este módulo mantiene un único ScreenRecognizer caliente (plantillas
+cargadas, sesión de captura mss abierta en un hilo dedicado) y lo expone por
+un socket local (TCP loopback o socket Unix) con un protocolo binario compacto.
+
+Formato de cada mensaje (petición y respuesta, big-endian):
+    Cabecera: magic b'ER', versión, opcode, longitud JSON, longitud blob.
+    Cuerpo:   parámetros/resultado en JSON (UTF-8) + blob binario opcional
+              (imagen BGR cruda; su forma va en el JSON como 'image_shape').
+
+Las respuestas usan el mismo opcode de la petición, o OP_ERROR con
+{'error': mensaje} si la operación falla.
+
+RecognizerClient ofrece los mismos nombres de método que ScreenRecognizer
+(recognize_screen_for_test, recognize, locate, wait_for_state, reload_data,
+get_captured_image, capture_screen, save_screenshot), de modo que create_recognizer() puede devolver uno u
+otro según la variable de entorno EFOOTBALL_RECOGNIZER_ADDR.
+
+Uso:
+    python recognizer_service.py serve --address 127.0.0.1:47800
+    python recognizer_service.py serve --address unix:/tmp/efootball_recognizer.sock
+    python recognizer_service.py bench --address 127.0.0.1:47800 -n 200 --recognize
+"""
+
+import argparse
+import json
+import logging
+import os
+import socket
+import socketserver
+import statistics
+import struct
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+
+from async_runtime import current_token
+
+logger = logging.getLogger('recognizer_service')
+
+DEFAULT_ADDRESS = "127.0.0.1:47800"
+RECOGNIZER_ADDR_ENV_VAR = "EFOOTBALL_RECOGNIZER_ADDR"  # Si está definida, create_recognizer usa el servicio
+
+PROTOCOL_VERSION = 1
+_MAGIC = b"ER"
+_HEADER = struct.Struct("!2sBBII")  # magic, versión, opcode, longitud JSON, longitud blob
+MAX_JSON_BYTES = 16 * 1024 * 1024
+
+OP_PING = 0x01
+OP_RECOGNIZE = 0x02
+OP_WATCH = 0x03
+OP_LOCATE = 0x04
+OP_RELOAD = 0x05
+OP_STATES = 0x06
+OP_GET_FRAME = 0x07
+OP_SCREENSHOT = 0x08
+OP_CAPTURE = 0x09
+OP_ERROR = 0xFF
+
+# Operaciones sin efectos que se pueden repetir si la conexión persistente estaba caída
+# (el resto sólo se reintenta si falló la conexión, antes de enviar nada)
+IDEMPOTENT_OPS = frozenset((OP_PING, OP_STATES, OP_GET_FRAME))
+WATCH_SLICE_S = 1.0  # Tramo máximo de 'watch' dentro de un flujo cancelable
+
+
+class RecognizerServiceError(Exception):
+    """Error devuelto por el servicio o fallo del protocolo."""
+    pass
+
+
+def parse_address(address: str):
+    """
+    Interpreta una dirección del servicio.
+
+    Args:
+        address: 'unix:/ruta/socket', 'host:puerto' o sólo 'puerto' (loopback).
+
+    Returns:
+        Tupla (familia, dirección) con familia socket.AF_UNIX o socket.AF_INET.
+    """
+    if address.startswith("unix:"):
+        if not hasattr(socket, "AF_UNIX"):
+            raise ValueError("Los sockets Unix no están disponibles en esta plataforma")
+        return socket.AF_UNIX, address[len("unix:"):]
+    host, _, port = address.rpartition(":")
+    return socket.AF_INET, (host or "127.0.0.1", int(port))
+
+
+def _recv_exact(sock: socket.socket, size: int) -> Optional[bytes]:
+    """Lee exactamente ``size`` bytes; devuelve None si el otro extremo cierra antes."""
+    buf = bytearray(size)
+    view = memoryview(buf)
+    received = 0
+    while received < size:
+        n = sock.recv_into(view[received:], size - received)
+        if n == 0:
+            return None
+        received += n
+    return bytes(buf)
+
+
+def send_message(sock: socket.socket, opcode: int, payload: Optional[Dict[str, Any]] = None,
+                 blob=b"") -> None:
+    """Envía un mensaje (cabecera + JSON + blob) por el socket."""
+    body = json.dumps(payload or {}, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    blob = memoryview(blob).cast("B") if blob is not None and len(blob) else b""
+    sock.sendall(_HEADER.pack(_MAGIC, PROTOCOL_VERSION, opcode, len(body), len(blob)) + body)
+    if blob:
+        sock.sendall(blob)
+
+
+def recv_message(sock: socket.socket) -> Optional[Tuple[int, Dict[str, Any], bytes]]:
+    """
+    Recibe un mensaje completo.
+
+    Returns:
+        (opcode, payload, blob), o None si la conexión se cerró limpiamente.
+    """
+    header = _recv_exact(sock, _HEADER.size)
+    if header is None:
+        return None
+    magic, version, opcode, json_len, blob_len = _HEADER.unpack(header)
+    if magic != _MAGIC or version != PROTOCOL_VERSION:
+        raise RecognizerServiceError(f"Mensaje inválido (magic={magic!r}, versión={version})")
+    if json_len > MAX_JSON_BYTES:
+        raise RecognizerServiceError(f"Cuerpo JSON demasiado grande ({json_len} bytes)")
+    body = _recv_exact(sock, json_len) if json_len else b"{}"
+    blob = _recv_exact(sock, blob_len) if blob_len else b""
+    if body is None or blob is None:
+        raise RecognizerServiceError("Conexión cerrada a mitad de mensaje")
+    return opcode, json.loads(body.decode("utf-8")), blob
+
+
+def _json_safe(value):
+    """Convierte tipos numpy (float32, int64...) y tuplas en tipos serializables."""
+    if isinstance(value, dict):
+        return {str(k): _json_safe(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_json_safe(v) for v in value]
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def _image_blob(image: Optional[np.ndarray]):
+    """Devuelve (forma, buffer) de una imagen BGR para enviarla como blob."""
+    if image is None:
+        return None, b""
+    return list(image.shape), np.ascontiguousarray(image)
+
+
+def _image_from_blob(shape, blob: bytes) -> Optional[np.ndarray]:
+    if not shape or not blob:
+        return None
+    return np.frombuffer(blob, dtype=np.uint8).reshape(shape)
+
+
+# --- Servidor ---
+
+class _RecognizerRequestHandler(socketserver.BaseRequestHandler):
+    """Atiende una conexión: procesa mensajes hasta que el cliente la cierra."""
+
+    def setup(self):
+        if self.request.family == socket.AF_INET:
+            self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def handle(self):
+        service = self.server.service
+        while True:
+            try:
+                message = recv_message(self.request)
+            except (RecognizerServiceError, ValueError) as e:
+                logger.warning(f"Mensaje inválido de {self.client_address}: {e}")
+                return
+            except OSError:
+                return
+            if message is None:
+                return
+            opcode, params, blob = message
+            try:
+                payload, out_blob = service.dispatch(opcode, params, blob)
+                send_message(self.request, opcode, payload, out_blob)
+            except OSError:
+                return
+            except Exception as e:
+                logger.exception(f"Error procesando opcode 0x{opcode:02x}: {e}")
+                try:
+                    send_message(self.request, OP_ERROR, {'error': str(e)})
+                except OSError:
+                    return
+
+
+class _ThreadingTCPServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+if hasattr(socketserver, "ThreadingUnixStreamServer"):
+    class _ThreadingUnixServer(socketserver.ThreadingUnixStreamServer):
+        daemon_threads = True
+else:
+    _ThreadingUnixServer = None
+
+
+class RecognizerService:
+    """
+    Mantiene un ScreenRecognizer caliente y atiende peticiones de varios clientes.
+
+    Todas las llamadas al reconocedor se ejecutan en un único hilo de trabajo:
+    se serializan (ScreenRecognizer no es thread-safe) y la sesión mss de ese
+    hilo permanece abierta entre peticiones de conexiones distintas.
+    """
+
+    def __init__(self, recognizer=None, watch_config: bool = True, **recognizer_kwargs):
+        """
+        Args:
+            recognizer: ScreenRecognizer ya construido (opcional).
+            watch_config: Recargar incrementalmente al cambiar config/ o images/.
+            **recognizer_kwargs: Argumentos para construir uno si no se proporciona.
+        """
+        self._worker = ThreadPoolExecutor(max_workers=1, thread_name_prefix="recognizer")
+        if recognizer is None:
+            from screen_recognizer import ScreenRecognizer
+            recognizer = self._call(ScreenRecognizer, **recognizer_kwargs)
+        self.recognizer = recognizer
+        if watch_config and hasattr(recognizer, 'start_config_watcher'):
+            recognizer.start_config_watcher()
+        self.server = None
+        self.started_at = time.time()
+        self.requests_served = 0
+        self._warm_up()
+
+    def _call(self, fn, *args, **kwargs):
+        """Ejecuta ``fn`` en el hilo del reconocedor y espera su resultado."""
+        return self._worker.submit(fn, *args, **kwargs).result()
+
+    def _warm_up(self):
+        """Abre la sesión de captura y comprueba Tesseract antes de la primera petición."""
+        try:
+            self._call(self.recognizer._get_sct)
+        except Exception as e:
+            logger.warning(f"No se pudo abrir la sesión de captura por adelantado: {e}")
+        try:
+            import pytesseract
+            logger.info(f"Tesseract disponible: {pytesseract.get_tesseract_version()}")
+        except Exception as e:
+            logger.warning(f"Tesseract no disponible, el fallback OCR fallará: {e}")
+
+    # --- Operaciones ---
+
+    def _result_payload(self, result: Dict[str, Any], include_image: bool):
+        result = dict(result)
+        image = result.pop('captured_image', None)
+        result.pop('frame_pyramid', None) # Sólo útil en el mismo proceso
+        out_blob = b""
+        if include_image and image is not None:
+            result['image_shape'], out_blob = _image_blob(image)
+        return _json_safe(result), out_blob
+
+    def _recognize(self, params):
+        result = self.recognizer.recognize_screen_for_test(params.get('deadline_ms'))
+        # La vista del pool se serializa en este mismo hilo, antes de que se reutilice
+        return self._result_payload(result, params.get('include_image', False))
+
+    def _watch(self, params):
+        result = self.recognizer.wait_for_state(
+            params.get('states', []),
+            timeout=float(params.get('timeout', 10.0)),
+            poll_interval=float(params.get('poll_interval', 0.25)))
+        return self._result_payload(result, params.get('include_image', False))
+
+    def _states(self, params):
+        recognizer = self.recognizer
+        return _json_safe({
+            'template_names_mapping': recognizer.template_names_mapping,
+            'loaded_templates': {state: len(tpls) for state, tpls in recognizer.templates.items()},
+            'state_transitions': recognizer.state_transitions,
+            'last_recognized_state': recognizer.last_recognized_state,
+            'tracking': recognizer.get_tracking_stats() if hasattr(recognizer, 'get_tracking_stats') else None,
+        }), b""
+
+    def _get_frame(self, params):
+        image = self.recognizer.get_captured_image(params.get('frame_id'))
+        shape, out_blob = _image_blob(image)
+        return {'frame_id': params.get('frame_id'), 'image_shape': shape}, out_blob
+
+    def _capture(self, params):
+        image = self.recognizer.capture_screen(region=params.get('region'))
+        shape, out_blob = _image_blob(image)
+        return {'image_shape': shape}, out_blob
+
+    def dispatch(self, opcode: int, params: Dict[str, Any], blob: bytes):
+        """
+        Ejecuta una operación del protocolo.
+
+        Returns:
+            Tupla (payload JSON, blob) de la respuesta.
+        """
+        self.requests_served += 1
+        if opcode == OP_PING:
+            return {'pong': True, 'uptime_s': time.time() - self.started_at,
+                    'requests_served': self.requests_served}, b""
+        if opcode == OP_RECOGNIZE:
+            return self._call(self._recognize, params)
+        if opcode == OP_WATCH:
+            return self._call(self._watch, params)
+        if opcode == OP_LOCATE:
+            result = self._call(self.recognizer.locate, params['state'], params.get('threshold'))
+            return _json_safe(result), b""
+        if opcode == OP_RELOAD:
+            changes = self._call(self.recognizer.reload_data, bool(params.get('full', False)))
+            return _json_safe({'reloaded': True, 'changes': changes}), b""
+        if opcode == OP_STATES:
+            return self._call(self._states, params)
+        if opcode == OP_GET_FRAME:
+            return self._call(self._get_frame, params)
+        if opcode == OP_SCREENSHOT:
+            result = {'frame_id': params['frame_id']} if params.get('frame_id') is not None else None
+            path = self._call(self.recognizer.save_screenshot, params['filename'], params.get('directory'), result)
+            return {'path': path}, b""
+        if opcode == OP_CAPTURE:
+            return self._call(self._capture, params)
+        raise RecognizerServiceError(f"Opcode desconocido: 0x{opcode:02x}")
+
+    def serve_forever(self, address: str = DEFAULT_ADDRESS) -> None:
+        """Escucha en ``address`` hasta Ctrl+C o shutdown()."""
+        family, addr = parse_address(address)
+        if family == socket.AF_INET:
+            if addr[0] not in ("127.0.0.1", "localhost", "::1"):
+                logger.warning(f"El servicio escucha en {addr[0]}, fuera de loopback: no tiene autenticación.")
+            self.server = _ThreadingTCPServer(addr, _RecognizerRequestHandler)
+        else:
+            if _ThreadingUnixServer is None:
+                raise ValueError("Servidor de socket Unix no disponible en esta plataforma")
+            if os.path.exists(addr):
+                os.unlink(addr)  # Socket huérfano de una ejecución anterior
+            self.server = _ThreadingUnixServer(addr, _RecognizerRequestHandler)
+        self.server.service = self
+        logger.info(f"Servicio de reconocimiento escuchando en {address}")
+        try:
+            self.server.serve_forever()
+        except KeyboardInterrupt:
+            logger.info("Servicio de reconocimiento detenido por el usuario.")
+        finally:
+            self.server.server_close()
+            if family != socket.AF_INET and os.path.exists(addr):
+                os.unlink(addr)
+            # Las sesiones mss se cierran en el hilo de trabajo, que es el que las abrió
+            self._worker.submit(self.recognizer.close)
+            self._worker.shutdown(wait=False)
+
+    def shutdown(self) -> None:
+        """Detiene serve_forever() desde otro hilo."""
+        if self.server is not None:
+            self.server.shutdown()
+
+
+# --- Cliente ---
+
+class RecognizerClient:
+    """
+    Cliente ligero del servicio con la misma interfaz que ScreenRecognizer.
+
+    Mantiene una conexión persistente (se reabre automáticamente si se cae)
+    y es seguro usarlo desde varios hilos.
+    """
+
+    def __init__(self, address: Optional[str] = None, timeout: float = 30.0, include_images: bool = False):
+        """
+        Args:
+            address: Dirección del servicio (por defecto, la de la variable de entorno o DEFAULT_ADDRESS).
+            timeout: Timeout de socket en segundos (las operaciones 'watch' lo amplían).
+            include_images: Si recognize_screen_for_test() trae la captura ('captured_image').
+        """
+        self.address = address or os.environ.get(RECOGNIZER_ADDR_ENV_VAR) or DEFAULT_ADDRESS
+        self.timeout = timeout
+        self.include_images = include_images
+        self._sock = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> socket.socket:
+        family, addr = parse_address(self.address)
+        sock = socket.socket(family, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        sock.connect(addr)
+        if family == socket.AF_INET:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return sock
+
+    def _request(self, opcode: int, params: Optional[Dict[str, Any]] = None, timeout: Optional[float] = None):
+        """
+        Envía una petición y devuelve (payload, blob).
+
+        Reintenta una vez si falla la conexión, y también si se cae una conexión
+        persistente en una operación idempotente. Las demás (reconocer, esperar,
+        guardar capturas...) no se repiten una vez enviadas: pueden haberse ejecutado.
+        """
+        with self._lock:
+            for attempt in (1, 2):
+                sent = False
+                try:
+                    if self._sock is None:
+                        self._sock = self._connect()
+                    self._sock.settimeout(timeout or self.timeout)
+                    sent = True
+                    send_message(self._sock, opcode, params)
+                    message = recv_message(self._sock)
+                    if message is None:
+                        raise ConnectionError("El servicio cerró la conexión")
+                    break
+                except (OSError, ConnectionError):
+                    self._close_locked()
+                    if attempt == 2 or (sent and opcode not in IDEMPOTENT_OPS):
+                        raise
+        reply_op, payload, blob = message
+        if reply_op == OP_ERROR:
+            raise RecognizerServiceError(payload.get('error', 'Error desconocido del servicio'))
+        return payload, blob
+
+    def _close_locked(self):
+        if self._sock is not None:
+            try:
+                self._sock.close()
+            except OSError:
+                pass
+            self._sock = None
+
+    def close(self) -> None:
+        """Cierra la conexión con el servicio."""
+        with self._lock:
+            self._close_locked()
+
+    @staticmethod
+    def _restore_result(payload: Dict[str, Any], blob: bytes) -> Dict[str, Any]:
+        """Devuelve al resultado la forma que produce ScreenRecognizer (claves int, imagen)."""
+        if isinstance(payload.get('ocr_results'), dict):
+            payload['ocr_results'] = {int(k) if k.isdigit() else k: v
+                                      for k, v in payload['ocr_results'].items()}
+        payload['captured_image'] = _image_from_blob(payload.pop('image_shape', None), blob)
+        return payload
+
+    # --- Interfaz compatible con ScreenRecognizer ---
+
+    def ping(self) -> Dict[str, Any]:
+        """Comprueba que el servicio responde."""
+        return self._request(OP_PING)[0]
+
+    def recognize_screen_for_test(self, deadline_ms: Optional[float] = None,
+                                  include_image: Optional[bool] = None) -> Dict[str, Any]:
+        """Igual que ScreenRecognizer.recognize_screen_for_test, ejecutado en el servicio."""
+        include = self.include_images if include_image is None else include_image
+        return self._restore_result(*self._request(OP_RECOGNIZE, {'include_image': include, 'deadline_ms': deadline_ms}))
+
+    def recognize(self, deadline_ms: Optional[float] = None, include_image: Optional[bool] = None) -> Dict[str, Any]:
+        """Alias de recognize_screen_for_test()."""
+        return self.recognize_screen_for_test(deadline_ms, include_image)
+
+    def wait_for_state(self, states, timeout: float = 10.0, poll_interval: float = 0.25) -> Dict[str, Any]:
+        """
+        Igual que ScreenRecognizer.wait_for_state (operación 'watch' del servicio).
+
+        Dentro de un flujo la espera se divide en tramos de WATCH_SLICE_S y el token
+        se comprueba entre ellos, así que una cancelación no espera al timeout completo.
+        """
+        states = [states] if isinstance(states, str) else list(states)
+        token = current_token()
+        started = time.monotonic()
+        while True:
+            remaining = max(0.0, timeout - (time.monotonic() - started))
+            watch_s = remaining if token is None else min(remaining, WATCH_SLICE_S)
+            params = {'states': states, 'timeout': watch_s, 'poll_interval': poll_interval,
+                      'include_image': self.include_images}
+            result = self._restore_result(*self._request(OP_WATCH, params, timeout=self.timeout + watch_s))
+            result['waited_s'] = time.monotonic() - started
+            if result.get('matched') or watch_s >= remaining:
+                return result
+            token.check()
+
+    def locate(self, state: str, threshold: Optional[float] = None) -> Dict[str, Any]:
+        """Igual que ScreenRecognizer.locate."""
+        return self._request(OP_LOCATE, {'state': state, 'threshold': threshold})[0]
+
+    def reload_data(self, full: bool = False) -> Dict[str, Any]:
+        """Recarga mappings y plantillas en el servicio (incremental salvo full=True)."""
+        return self._request(OP_RELOAD, {'full': full})[0].get('changes', {})
+
+    def get_captured_image(self, result_or_frame_id) -> Optional[np.ndarray]:
+        """Trae del servicio una copia de la captura de un reconocimiento previo."""
+        frame_id = result_or_frame_id.get('frame_id') if isinstance(result_or_frame_id, dict) else result_or_frame_id
+        payload, blob = self._request(OP_GET_FRAME, {'frame_id': frame_id})
+        image = _image_from_blob(payload.get('image_shape'), blob)
+        return image.copy() if image is not None else None
+
+    def save_screenshot(self, filename: str, directory: Optional[str] = None,
+                        result: Optional[Dict[str, Any]] = None) -> Optional[str]:
+        """Igual que ScreenRecognizer.save_screenshot (el archivo se escribe en el servicio)."""
+        params = {'filename': filename, 'directory': directory,
+                  'frame_id': result.get('frame_id') if result else None}
+        return self._request(OP_SCREENSHOT, params)[0].get('path')
+
+    def capture_screen(self, region: Optional[Dict[str, int]] = None) -> Optional[np.ndarray]:
+        """Igual que ScreenRecognizer.capture_screen (captura en el servicio, BGR propio)."""
+        payload, blob = self._request(OP_CAPTURE, {'region': region})
+        image = _image_from_blob(payload.get('image_shape'), blob)
+        return image.copy() if image is not None else None
+
+    def get_states_info(self) -> Dict[str, Any]:
+        """Mappings cargados en el servicio (plantillas por estado, transiciones, último estado)."""
+        return self._request(OP_STATES)[0]
+
+    def get_tracking_stats(self) -> Optional[Dict[str, Any]]:
+        """Contadores de búsqueda local/completa del reconocedor del servicio."""
+        return self.get_states_info().get('tracking')
+
+    @property
+    def template_names_mapping(self) -> Dict[str, Any]:
+        return self.get_states_info()['template_names_mapping']
+
+    @property
+    def state_transitions(self) -> Dict[str, Any]:
+        return self.get_states_info()['state_transitions']
+
+    @property
+    def last_recognized_state(self) -> Optional[str]:
+        return self.get_states_info()['last_recognized_state']
+
+
+def create_recognizer(address: Optional[str] = None, **recognizer_kwargs):
+    """
+    Devuelve un cliente del servicio si hay uno configurado y accesible, o un ScreenRecognizer local.
+
+    Args:
+        address: Dirección del servicio. Por defecto, la variable de entorno EFOOTBALL_RECOGNIZER_ADDR;
+                 si no hay ninguna, se construye un ScreenRecognizer en el proceso.
+        **recognizer_kwargs: Argumentos para el ScreenRecognizer local.
+    """
+    address = address or os.environ.get(RECOGNIZER_ADDR_ENV_VAR)
+    if address:
+        client = RecognizerClient(address)
+        try:
+            client.ping()
+            logger.info(f"Usando el servicio de reconocimiento en {address}")
+            return client
+        except (OSError, RecognizerServiceError, ValueError) as e:
+            logger.warning(f"Servicio de reconocimiento no accesible en {address} ({e}). Usando reconocedor local.")
+            client.close()
+    try:
+        from .screen_recognizer import ScreenRecognizer  # Importado como src.recognizer_service
+    except ImportError:
+        from screen_recognizer import ScreenRecognizer
+    return ScreenRecognizer(**recognizer_kwargs)
+
+
+# --- Benchmark ---
+
+def _summary_ms(samples):
+    ordered = sorted(samples)
+    p99_index = min(len(ordered) - 1, int(round(0.99 * (len(ordered) - 1))))
+    return (f"media={statistics.mean(ordered) * 1000:.3f} ms  p50={statistics.median(ordered) * 1000:.3f} ms  "
+            f"p99={ordered[p99_index] * 1000:.3f} ms")
+
+
+def benchmark(address: str, iterations: int = 200, recognize: bool = False, include_image: bool = False) -> None:
+    """
+    Mide la sobrecarga de ida y vuelta del servicio.
+
+    Args:
+        address: Dirección del servicio.
+        iterations: Número de peticiones por prueba.
+        recognize: Medir también reconocimientos completos (sobrecarga = ida y vuelta - detection_time_s).
+        include_image: Traer la captura en cada reconocimiento.
+    """
+    client = RecognizerClient(address)
+    client.ping()  # Establecer la conexión fuera de la medida
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        client.ping()
+        samples.append(time.perf_counter() - started)
+    print(f"PING       x{iterations}: {_summary_ms(samples)}")
+
+    if recognize:
+        round_trips, overheads = [], []
+        for _ in range(iterations):
+            started = time.perf_counter()
+            result = client.recognize_screen_for_test(include_image=include_image)
+            elapsed = time.perf_counter() - started
+            round_trips.append(elapsed)
+            overheads.append(max(0.0, elapsed - (result.get('detection_time_s') or 0.0)))
+        print(f"RECOGNIZE  x{iterations}: {_summary_ms(round_trips)}")
+        print(f"  sobrecarga del servicio: {_summary_ms(overheads)}")
+    client.close()
+
+
+def main():
+    """Punto de entrada de línea de comandos."""
+    parser = argparse.ArgumentParser(description="Servicio de reconocimiento de pantalla")
+    subparsers = parser.add_subparsers(dest="command")
+    serve_parser = subparsers.add_parser("serve", help="Arrancar el servicio")
+    serve_parser.add_argument("--address", default=DEFAULT_ADDRESS,
+                              help="host:puerto (loopback) o unix:/ruta/socket")
+    serve_parser.add_argument("--monitor", type=int, default=1, help="Monitor a capturar (1-based)")
+    serve_parser.add_argument("--resolution", default="4K", help="Resolución de las plantillas")
+    serve_parser.add_argument("--threshold", type=float, default=None, help="Umbral de template matching")
+    serve_parser.add_argument("--no-watch", action="store_true", help="No vigilar config/ ni images/")
+    bench_parser = subparsers.add_parser("bench", help="Medir la sobrecarga de ida y vuelta")
+    bench_parser.add_argument("--address", default=DEFAULT_ADDRESS)
+    bench_parser.add_argument("-n", "--iterations", type=int, default=200)
+    bench_parser.add_argument("--recognize", action="store_true", help="Medir también reconocimientos")
+    bench_parser.add_argument("--include-image", action="store_true", help="Traer la captura en cada reconocimiento")
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        kwargs = {'monitor': args.monitor, 'resolution': args.resolution}
+        if args.threshold is not None:
+            kwargs['threshold'] = args.threshold
+        RecognizerService(watch_config=not args.no_watch, **kwargs).serve_forever(args.address)
+    elif args.command == "bench":
+        benchmark(args.address, args.iterations, args.recognize, args.include_image)
+    else:
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    if not logging.getLogger().hasHandlers():
+        logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    main()
@@ -8,9 +8,15 @@ import cv2
 import numpy as np
 import mss
 import pytesseract
+import threading
 from enum import Enum
 import logging
 
+from frame_buffer import FrameBufferPool, DEFAULT_POOL_SLOTS
+from screenshot_writer import ScreenshotWriter
+from recognition_bundle import RecognitionBundle, compile_bundle, log_issues, load_tuning, apply_prune, TUNING_FILE
+from async_runtime import workflow_sleep
+
 # --- Configuración del Logging ---
 # Se configura aquí para que el módulo tenga logging si se usa solo,
 # pero si se importa, la configuración de la app principal (tester) prevalecerá.
@@ -32,20 +38,34 @@ if not logging.getLogger().hasHandlers():
 PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 CONFIG_DIR = os.path.join(PROJECT_DIR, "config")
 IMAGES_DIR = os.path.join(PROJECT_DIR, "images")
+SCREENSHOTS_DIR = os.path.join(PROJECT_DIR, "screenshots") # Destino por defecto de save_screenshot
 TEMPLATE_MAPPING_FILE = os.path.join(CONFIG_DIR, "templates_mapping.json")
 OCR_MAPPING_FILE = os.path.join(CONFIG_DIR, "ocr_regions.json")
 STATE_TRANSITIONS_FILE = os.path.join(CONFIG_DIR, "state_transitions.json")
 STATE_ROIS_FILE = os.path.join(CONFIG_DIR, "state_rois.json")
+RECOGNITION_TUNING_FILE = TUNING_FILE # Ajustes generados por template_analysis.py
 
 DEFAULT_TEMPLATE_THRESHOLD = 0.75
 OCR_FALLBACK_THRESHOLD = 0.60 # Umbral más bajo para considerar OCR
 MIN_OCR_TEXT_LEN = 3
+TRACKING_MARGIN = 24 # Píxeles alrededor de la última posición de cada plantilla en la búsqueda local
+OCR_REGION_COST_DEFAULT_S = 0.15 # Coste estimado de una región OCR hasta tener mediciones
+COST_EMA_ALPHA = 0.2 # Peso de la última medición en la media de coste del OCR
 DEFAULT_FONT_SIZE = 11 # Aunque principalmente para GUI, mantenido por importación previa
 
 
 # --- Funciones de Carga/Guardado de Mappings ---
-def load_json_mapping(file_path, file_desc="mapping"):
-   """Carga un mapping JSON desde un archivo con manejo de errores."""
+def load_json_mapping(file_path, file_desc="mapping", previous=None):
+   """
+   Carga un mapping JSON desde un archivo con manejo de errores.
+
+   Args:
+       previous (dict, optional): Mapping vigente. En una recarga, si el archivo está vacío,
+           no se puede leer o su JSON es inválido (p.ej. a medio guardar), se conserva éste
+           en lugar de devolver un diccionario vacío que borraría todos los estados.
+   """
+   fallback = {} if previous is None else previous
+   keep_note = " Se conserva el mapping anterior." if previous is not None else " Usando diccionario vacío."
    if not os.path.exists(file_path):
        logging.warning(f"Archivo de {file_desc} '{file_path}' no encontrado. Usando diccionario vacío.")
        return {}
@@ -54,19 +74,19 @@ def load_json_mapping(file_path, file_desc="mapping"):
            # Permitir archivo vacío devolviendo diccionario vacío
            content = f.read()
            if not content:
-               logging.warning(f"Archivo de {file_desc} '{file_path}' está vacío. Usando diccionario vacío.")
-               return {}
+               logging.warning(f"Archivo de {file_desc} '{file_path}' está vacío.{keep_note}")
+               return fallback
            mapping = json.loads(content)
            if not isinstance(mapping, dict):
-               logging.error(f"El contenido de {file_path} no es un diccionario JSON válido.")
-               return {}
+               logging.error(f"El contenido de {file_path} no es un diccionario JSON válido.{keep_note}")
+               return fallback
            return mapping
    except json.JSONDecodeError:
-       logging.error(f"Error de formato JSON en el archivo {file_path}. Verifique la sintaxis.")
-       return {}
+       logging.error(f"Error de formato JSON en el archivo {file_path}. Verifique la sintaxis.{keep_note}")
+       return fallback
    except Exception as e:
-       logging.error(f"Error inesperado al cargar {file_path}: {e}")
-       return {}
+       logging.error(f"Error inesperado al cargar {file_path}: {e}.{keep_note}")
+       return fallback
 
 def save_json_mapping(mapping, file_path, file_desc="mapping"):
    """Guarda un diccionario de mapping en un archivo JSON."""
@@ -89,18 +109,34 @@ class ScreenRecognizer:
    """
    def __init__(self, monitor=1, resolution='4K', threshold=DEFAULT_TEMPLATE_THRESHOLD,
                 ocr_fallback_threshold=OCR_FALLBACK_THRESHOLD,
-                ocr_lang='spa+eng', ocr_config='', ocr_apply_thresholding=True):
+                ocr_lang='spa+eng', ocr_config='', ocr_apply_thresholding=True,
+                frame_pool_slots=DEFAULT_POOL_SLOTS, frame_source=None, frame_publisher=None,
+                watch_config=False, bundle_path=None, capture_history=None, screenshot_writer=None):
        """
        Inicializa el reconocedor.
 
        Args:
-           monitor (int): Índice del monitor a capturar (1-based).
+           monitor (int | None): Índice del monitor a capturar (1-based). None = sin pantalla
+                                 (sólo frame_source o recognize_image(), p.ej. clasificación offline).
            resolution (str): Resolución objetivo para cargar plantillas (e.g., '4K').
            threshold (float): Umbral de confianza para template matching.
            ocr_fallback_threshold (float): Umbral mínimo para considerar OCR.
            ocr_lang (str): Cadena de idiomas para Tesseract (ej. 'spa+eng').
            ocr_config (str): Opciones de configuración adicionales para Tesseract (ej. '--psm 6').
            ocr_apply_thresholding (bool): Si aplicar umbralización Otsu antes de OCR.
+           frame_pool_slots (int): Nº de frames que se mantienen en el pool de buffers
+                                   reutilizables (ver frame_buffer.FrameBufferPool).
+           frame_source: Origen externo de frames con read_latest(copy) -> (bgr, metadatos),
+                         p.ej. frame_bus.FrameBusReader. Si se indica, no se captura la pantalla.
+           frame_publisher: Destino con publish(bgr, metadatos), p.ej. frame_bus.FrameBusPublisher,
+                            donde se publica cada frame reconocido junto con la decisión tomada.
+           watch_config (bool): Vigilar config/ e images/ y recargar incrementalmente al cambiar.
+           bundle_path (str, optional): Bundle precompilado (recognition_bundle.py compile) a usar
+                                        en lugar de los cuatro JSON de config/.
+           capture_history: capture_history.CaptureHistory donde guardar cada frame reconocido
+                            (historial por deltas para post-mortem); el resultado lo enlaza en 'capture_ref'.
+           screenshot_writer: screenshot_writer.ScreenshotWriter usado por save_screenshot
+                              (por defecto se crea uno al guardar la primera captura).
        """
        self.monitor_index = monitor # Índice del monitor físico (1-based)
        self.resolution = resolution   # Resolución configurada (e.g., '4K', '1080p')
@@ -115,9 +151,32 @@ class ScreenRecognizer:
        self.ocr_regions_mapping = {}   # { state: [{"region": {...}, "expected_text": [...]}, ...] } (cargado de JSON)
        self.state_transitions = {}     # { state: [next_state1, next_state2] } (cargado de JSON)
        self.state_rois = {}            # { state: {"left":...} } (cargado de JSON)
+       self.tuning = {}                # Ajustes de recognition_tuning.json (poda, umbrales...)
        self.last_recognized_state = None # Estado anterior reconocido
-       self.monitors_info = self._detect_monitors()
+       self._template_cache = {}       # { ruta: ((mtime_ns, tamaño), img_gray) } para recargas incrementales
+       self._template_stats = {}       # { state: firma de sus archivos de plantilla }
+       self._corrupt_templates = {}    # { state: [rutas ilegibles] }
+       self._data_lock = threading.RLock() # Protege la sustitución de datos frente a reconocimientos en curso
+       self.config_watcher = None
+       self.bundle_path = bundle_path
+       self.bundle = RecognitionBundle() # Configuración validada y normalizada (ver recognition_bundle)
+       self._state_order = [] # Orden de evaluación sin contexto (state_order de los ajustes, luego el resto)
+       self._last_locations = {} # { (state, índice plantilla): (x, y) en el frame } de la última coincidencia
+       self.tracking_stats = {'local_hits': 0, 'local_misses': 0, 'full_searches': 0}
+       self._ocr_region_cost_ema = OCR_REGION_COST_DEFAULT_S # Segundos por región OCR (media móvil)
+       self.frame_pool = FrameBufferPool(frame_pool_slots) # Buffers reutilizados entre capturas
+       self._sct_local = threading.local() # Sesión mss persistente por hilo
+       self._sct_sessions = [] # Todas las sesiones abiertas (close() las cierra)
+       self._sct_lock = threading.Lock()
+       self.frame_source = frame_source
+       self.frame_publisher = frame_publisher
+       self.capture_history = capture_history
+       self.screenshot_writer = screenshot_writer
+       self._recognition_listeners = [] # Callbacks de add_recognition_listener
+       self.monitors_info = self._detect_monitors() if monitor is not None else []
        self._load_all_data()
+       if watch_config:
+           self.start_config_watcher()
 
    def _detect_monitors(self):
        """Detecta los monitores existentes usando mss."""
@@ -138,6 +197,8 @@ class ScreenRecognizer:
 
    def _get_monitor_region(self):
        """Obtiene la geometría del monitor seleccionado (usando lista 0-based internamente)."""
+       if self.monitor_index is None:
+           return None # Reconocedor sin pantalla
        monitor_zero_based_index = self.monitor_index - 1 # Convertir a 0-based
        if 0 <= monitor_zero_based_index < len(self.monitors_info):
            return self.monitors_info[monitor_zero_based_index]
@@ -155,84 +216,231 @@ class ScreenRecognizer:
                return None # No hay monitor válido
 
    def _load_all_data(self):
-       """Carga o recarga todos los mappings JSON y las plantillas."""
+       """Carga o recarga todos los mappings JSON y decodifica todas las plantillas."""
        logging.info("Cargando/Recargando datos de reconocimiento...")
-       self.template_names_mapping = load_json_mapping(TEMPLATE_MAPPING_FILE, "plantillas")
-       self.ocr_regions_mapping = load_json_mapping(OCR_MAPPING_FILE, "regiones OCR")
-       self.state_transitions = load_json_mapping(STATE_TRANSITIONS_FILE, "transiciones de estado")
-       self.state_rois = load_json_mapping(STATE_ROIS_FILE, "ROIs de estado")
-       self._load_templates()
+       self._template_cache = {}
+       self._apply_data(self._read_mappings(), full=True)
        logging.info("Datos cargados/recargados.")
 
-   def reload_data(self):
-       """Interfaz pública para recargar los datos."""
-       self._load_all_data()
+   def _read_mappings(self):
+       """Lee los cuatro archivos JSON de configuración (o el bundle precompilado, si se indicó)."""
+       if self.bundle_path:
+           # La poda ya está aplicada en el bundle; umbrales y orden se conservan como ajustes
+           bundle = RecognitionBundle.load(self.bundle_path)
+           tuning = {'thresholds': dict(bundle.thresholds), 'state_order': list(bundle.state_order)}
+           return dict(bundle.to_mappings(), tuning=tuning)
+       # En las recargas, un archivo a medio guardar o con errores conserva lo ya cargado
+       reloading = bool(self.template_names_mapping)
+       def previous(mapping):
+           return mapping if reloading else None
+       return {
+           'tuning': load_tuning(RECOGNITION_TUNING_FILE, previous=previous(self.tuning)),
+           'template_names_mapping': load_json_mapping(TEMPLATE_MAPPING_FILE, "plantillas",
+                                                       previous(self.template_names_mapping)),
+           'ocr_regions_mapping': load_json_mapping(OCR_MAPPING_FILE, "regiones OCR",
+                                                    previous(self.ocr_regions_mapping)),
+           'state_transitions': load_json_mapping(STATE_TRANSITIONS_FILE, "transiciones de estado",
+                                                  previous(self.state_transitions)),
+           'state_rois': load_json_mapping(STATE_ROIS_FILE, "ROIs de estado", previous(self.state_rois)),
+       }
+
+   def reload_data(self, full=False):
+       """
+       Interfaz pública para recargar los datos.
 
-   def _load_templates(self):
-       """Carga las imágenes de plantilla en escala de grises."""
-       self.templates = {}
-       loaded_count = 0
-       error_count = 0
-       missing_files = [] # Para seguimiento/logging
-       corrupt_files = [] # Para seguimiento/logging
+       Por defecto la recarga es incremental: se comparan los mappings y la fecha/tamaño
+       de cada imagen, y sólo se vuelven a decodificar las plantillas de los estados que
+       cambiaron. Los nuevos datos se sustituyen de golpe entre dos reconocimientos.
 
-       # Determinar directorio de imágenes según resolución
+       Args:
+           full (bool): Forzar la recarga completa (descarta la caché de plantillas).
+
+       Returns:
+           dict: Estados cambiados por categoría ('templates', 'rois', 'ocr_regions',
+                 'transitions'), secciones de ajustes cambiadas ('tuning') y 'duration_s'.
+       """
+       if full:
+           start_time = time.perf_counter()
+           self._load_all_data()
+           return {'full': True, 'duration_s': time.perf_counter() - start_time}
+       return self._apply_data(self._read_mappings(), full=False)
+
+   def _resolve_templates_dir(self):
+       """Directorio de plantillas según la resolución (o el base como fallback). None si no existe."""
        resolution_dir = os.path.join(IMAGES_DIR, self.resolution)
-       if not os.path.exists(resolution_dir):
-           # Intentar con directorio base como fallback si el específico no existe
-           logging.warning(f"Directorio de resolución '{self.resolution}' ({resolution_dir}) no encontrado. Usando base: {IMAGES_DIR}")
-           templates_dir = IMAGES_DIR
-           if not os.path.exists(templates_dir):
-                logging.error(f"Directorio base de imágenes tampoco encontrado: {IMAGES_DIR}. No se pueden cargar plantillas.")
-                return # Salir si no hay directorio de imágenes
+       if os.path.exists(resolution_dir):
+           return resolution_dir
+       if os.path.exists(IMAGES_DIR):
+           return IMAGES_DIR
+       logging.error(f"Directorio base de imágenes tampoco encontrado: {IMAGES_DIR}. No se pueden cargar plantillas.")
+       return None
+
+   @staticmethod
+   def _template_file_stats(templates_dir, file_list):
+       """
+       Firma de los archivos de plantilla de un estado: ruta, mtime y tamaño de cada uno.
+       Si cambia la firma, hay que volver a decodificar las plantillas del estado.
+       """
+       if not isinstance(file_list, list):
+           return ('<invalid>', repr(file_list))
+       signature = []
+       for file_name in file_list:
+           if not isinstance(file_name, str) or templates_dir is None:
+               signature.append((repr(file_name), None, None))
+               continue
+           template_path = os.path.join(templates_dir, file_name)
+           try:
+               st = os.stat(template_path)
+               signature.append((template_path, st.st_mtime_ns, st.st_size))
+           except OSError:
+               signature.append((template_path, None, None)) # Faltante
+       return tuple(signature)
+
+   @staticmethod
+   def _changed_keys(old_mapping, new_mapping):
+       """Claves (estados) añadidas, eliminadas o modificadas entre dos mappings."""
+       missing = object()
+       return sorted(k for k in set(old_mapping) | set(new_mapping)
+                     if old_mapping.get(k, missing) != new_mapping.get(k, missing))
+
+   def _apply_data(self, mappings, full=False):
+       """
+       Aplica unos mappings recién leídos, decodificando sólo las plantillas de los
+       estados cuya lista de archivos o cuyos archivos han cambiado.
+
+       Args:
+           mappings (dict): Resultado de _read_mappings().
+           full (bool): Decodificar todas las plantillas aunque no hayan cambiado.
+
+       Returns:
+           dict: Estados cambiados por categoría y 'duration_s'.
+       """
+       start_time = time.perf_counter()
+       templates_dir = self._resolve_templates_dir()
+       if templates_dir:
+           logging.info(f"Plantillas en: {templates_dir} (Resolución: {self.resolution})")
+       new_names = mappings['template_names_mapping']
+       active_names, _ = apply_prune(new_names, mappings['tuning']) # Sin las plantillas podadas
+       new_stats = {state: self._template_file_stats(templates_dir, files) for state, files in active_names.items()}
+
+       changes = {
+           'templates': sorted(set(self._template_stats) | set(new_stats)) if full
+                        else self._changed_keys(self._template_stats, new_stats),
+           'rois': self._changed_keys(self.state_rois, mappings['state_rois']),
+           'ocr_regions': self._changed_keys(self.ocr_regions_mapping, mappings['ocr_regions_mapping']),
+           'transitions': self._changed_keys(self.state_transitions, mappings['state_transitions']),
+           'tuning': self._changed_keys(self.tuning, mappings['tuning']),
+       }
+
+       # Reutilizar las plantillas ya decodificadas de los estados sin cambios
+       new_templates = {state: imgs for state, imgs in self.templates.items()
+                        if state in new_names and state not in changes['templates']}
+       new_corrupt = {state: paths for state, paths in self._corrupt_templates.items()
+                      if state in new_names and state not in changes['templates']}
+       decoded_count = 0
+       for state in changes['templates']:
+           if state not in new_names:
+               continue # Estado eliminado del mapping
+           images, corrupt, decoded = self._load_state_templates(state, active_names[state], templates_dir)
+           decoded_count += decoded
+           if images:
+               new_templates[state] = images
+           elif isinstance(new_names[state], list) and new_names[state]:
+               logging.warning(f"No se cargó ninguna plantilla válida para el estado '{state}'.")
+           if corrupt:
+               new_corrupt[state] = corrupt
+
+       # Mantener en caché sólo las imágenes que siguen referenciadas
+       live_paths = {entry[0] for signature in new_stats.values() for entry in signature if isinstance(entry, tuple)}
+       self._template_cache = {path: cached for path, cached in self._template_cache.items() if path in live_paths}
+
+       # Validación y normalización únicas (nada de comprobaciones por frame)
+       bundle = self.bundle
+       if full or any(changes.values()):
+           bundle = compile_bundle(new_names, mappings['ocr_regions_mapping'], mappings['state_transitions'],
+                                   mappings['state_rois'], templates_dir=templates_dir,
+                                   monitor=self._get_monitor_region() if self.monitors_info else None,
+                                   tuning=mappings['tuning'])
+           log_issues(bundle)
+
+       # Orden de evaluación precalculado: primero los estados más discriminables según los ajustes
+       state_order = [s for s in bundle.state_order if s in new_templates]
+       state_order += [s for s in new_templates if s not in state_order]
+
+       # Sustitución atómica respecto a los reconocimientos en curso
+       with self._data_lock:
+           self.bundle = bundle
+           self._state_order = state_order
+           # Las posiciones recordadas dejan de valer si cambian las plantillas o la ROI del estado
+           stale = set(changes['templates']) | set(changes['rois'])
+           self._last_locations = {key: pos for key, pos in self._last_locations.items() if key[0] not in stale}
+           self.templates = new_templates
+           self.template_names_mapping = new_names
+           self.ocr_regions_mapping = mappings['ocr_regions_mapping']
+           self.state_transitions = mappings['state_transitions']
+           self.state_rois = mappings['state_rois']
+           self.tuning = mappings['tuning']
+           self._template_stats = new_stats
+           self._corrupt_templates = new_corrupt
+
+       changes['duration_s'] = time.perf_counter() - start_time
+       if any(changes[k] for k in ('templates', 'rois', 'ocr_regions', 'transitions', 'tuning')):
+           logging.info(
+               f"Recarga {'completa' if full else 'incremental'} en {changes['duration_s'] * 1000:.1f} ms: "
+               f"plantillas {changes['templates'] or '-'} ({decoded_count} imágenes decodificadas), "
+               f"ROIs {changes['rois'] or '-'}, OCR {changes['ocr_regions'] or '-'}, "
+               f"transiciones {changes['transitions'] or '-'}, ajustes {changes['tuning'] or '-'}")
        else:
-           templates_dir = resolution_dir
-           logging.info(f"Cargando plantillas desde: {templates_dir} (Resolución: {self.resolution})")
-
-       for state, file_list in self.template_names_mapping.items():
-           if not isinstance(file_list, list):
-               logging.warning(f"Valor para '{state}' en {TEMPLATE_MAPPING_FILE} no es una lista válida. Saltando.")
-               error_count += 1
-               continue # Saltar a la siguiente entrada del mapping
-
-           loaded_images = []
-           for file_name in file_list:
-               if not isinstance(file_name, str):
-                   logging.warning(f"Nombre de archivo no es string para estado '{state}': {file_name}. Saltando.")
-                   error_count += 1
-                   continue # Saltar al siguiente archivo en la lista
-               template_path = os.path.join(templates_dir, file_name)
-
-               if os.path.exists(template_path):
-                   try:
-                       img = cv2.imread(template_path, cv2.IMREAD_GRAYSCALE)
-                       if img is not None:
-                           loaded_images.append(img)
-                           loaded_count += 1
-                       else:
-                           # cv2.imread devuelve None si el archivo no es una imagen válida o está corrupto
-                           logging.error(f"Error al leer (formato inválido o corrupta?): {template_path}")
-                           corrupt_files.append(template_path)
-                           error_count += 1
-                   except Exception as e:
-                       logging.exception(f"Excepción inesperada al cargar plantilla {template_path}: {e}")
-                       corrupt_files.append(template_path)
-                       error_count += 1
-               else: # Archivo no existe
-                   logging.warning(f"Plantilla faltante: {template_path}")
-                   missing_files.append(template_path)
-                   error_count += 1
-
-           if loaded_images:
-               self.templates[state] = loaded_images
-           elif file_list: # Solo loguear si se esperaban plantillas pero no se cargó ninguna
-                logging.warning(f"No se cargó ninguna plantilla válida para el estado '{state}'.")
-
-
-       logging.info(f"Carga de plantillas completada. {loaded_count} cargadas, {error_count} errores (faltantes/corruptas).")
-
-       # Logging de resumen de errores (más conciso)
-       # Crear archivos de log solo si hay errores
+           logging.info(f"Recarga sin cambios ({changes['duration_s'] * 1000:.1f} ms).")
+       if changes['templates']:
+           self._write_template_error_logs(new_stats, new_corrupt)
+       return changes
+
+   def _load_state_templates(self, state, file_list, templates_dir):
+       """
+       Decodifica en escala de grises las plantillas de un estado (reutilizando la caché
+       por archivo si la imagen no ha cambiado en disco).
+
+       Returns:
+           tuple: (lista de imágenes, lista de rutas corruptas/ilegibles, nº de imágenes decodificadas)
+       """
+       if not isinstance(file_list, list):
+           logging.warning(f"Valor para '{state}' en {TEMPLATE_MAPPING_FILE} no es una lista válida. Saltando.")
+           return [], [], 0
+       loaded_images = []
+       decoded = 0
+       corrupt_files = []
+       for (template_path, mtime_ns, size), file_name in zip(self._template_file_stats(templates_dir, file_list), file_list):
+           if not isinstance(file_name, str):
+               logging.warning(f"Nombre de archivo no es string para estado '{state}': {file_name}. Saltando.")
+               continue
+           if mtime_ns is None:
+               logging.warning(f"Plantilla faltante: {template_path}")
+               continue
+           cached = self._template_cache.get(template_path)
+           if cached is not None and cached[0] == (mtime_ns, size):
+               loaded_images.append(cached[1])
+               continue
+           try:
+               img = cv2.imread(template_path, cv2.IMREAD_GRAYSCALE)
+               if img is not None:
+                   self._template_cache[template_path] = ((mtime_ns, size), img)
+                   decoded += 1
+                   loaded_images.append(img)
+               else:
+                   # cv2.imread devuelve None si el archivo no es una imagen válida o está corrupto
+                   logging.error(f"Error al leer (formato inválido o corrupta?): {template_path}")
+                   corrupt_files.append(template_path)
+           except Exception as e:
+               logging.exception(f"Excepción inesperada al cargar plantilla {template_path}: {e}")
+               corrupt_files.append(template_path)
+       return loaded_images, corrupt_files, decoded
+
+   def _write_template_error_logs(self, template_stats, corrupt_by_state):
+       """Escribe en logs/ las plantillas faltantes y corruptas de todo el mapping."""
+       missing_files = sorted({entry[0] for signature in template_stats.values() for entry in signature
+                               if isinstance(entry, tuple) and entry[1] is None})
+       corrupt_files = sorted({path for paths in corrupt_by_state.values() for path in paths})
        log_dir = os.path.join(PROJECT_DIR, "logs") # Guardar logs en carpeta logs/
        os.makedirs(log_dir, exist_ok=True)
        if missing_files:
@@ -252,18 +460,70 @@ class ScreenRecognizer:
            except Exception as e:
                logging.error(f"No se pudo escribir el log de plantillas corruptas: {e}")
 
+   def start_config_watcher(self, interval=1.0):
+       """
+       Vigila config/ e images/ en segundo plano y aplica recargas incrementales
+       cuando cambian (ver config_watcher.ConfigWatcher).
+       """
+       if self.config_watcher is None:
+           from config_watcher import ConfigWatcher
+           self.config_watcher = ConfigWatcher(self, interval=interval)
+       self.config_watcher.start()
+       return self.config_watcher
+
+   def stop_config_watcher(self):
+       """Detiene el vigilante de configuración si está activo."""
+       if self.config_watcher is not None:
+           self.config_watcher.stop()
+
+   def _get_sct(self):
+       """Devuelve la sesión mss del hilo actual, creándola la primera vez (mss no es thread-safe)."""
+       sct = getattr(self._sct_local, 'sct', None)
+       if sct is None:
+           sct = mss.mss()
+           self._sct_local.sct = sct
+           with self._sct_lock:
+               self._sct_sessions.append(sct)
+       return sct
+
+   def _close_sct(self, sct):
+       with self._sct_lock:
+           if sct in self._sct_sessions:
+               self._sct_sessions.remove(sct)
+       try:
+           sct.close()
+       except Exception as e:
+           logging.debug(f"Error al cerrar la sesión mss: {e}")
+
+   def release_thread_session(self):
+       """Cierra la sesión mss del hilo actual (llamar al terminar un hilo de captura de vida corta)."""
+       sct = getattr(self._sct_local, 'sct', None)
+       if sct is not None:
+           self._sct_local.sct = None
+           self._close_sct(sct)
+
+   def close(self):
+       """Detiene el vigilante de configuración y cierra las sesiones mss de todos los hilos."""
+       self.stop_config_watcher()
+       with self._sct_lock:
+           sessions, self._sct_sessions = self._sct_sessions, []
+       for sct in sessions:
+           try:
+               sct.close()
+           except Exception as e:
+               logging.debug(f"Error al cerrar la sesión mss: {e}")
+       self._sct_local = threading.local()
 
-   def capture_screen(self, region=None):
+   def _resolve_capture_area(self, region=None):
        """
-       Captura la pantalla completa o una región específica del monitor configurado.
+       Calcula el área absoluta a capturar, recortada a los límites del monitor configurado.
 
        Args:
-           region (dict, optional): Diccionario con {'left', 'top', 'width', 'height'}
-                                    para capturar solo esa área. Si es None, captura
-                                    el monitor completo. Coordenadas absolutas.
+           region (dict, optional): {'left', 'top', 'width', 'height'} absolutos, o None
+                                    para el monitor completo.
 
        Returns:
-           numpy.ndarray: Imagen capturada en formato BGR, o None si falla.
+           dict: Área de captura válida, o None si no hay monitor o la región queda fuera.
        """
        monitor_geom = self._get_monitor_region() # Obtener la geometría del monitor seleccionado
        if monitor_geom is None:
@@ -271,58 +531,259 @@ class ScreenRecognizer:
             return None
 
        # Si se pide una región, usarla. Si no, usar la del monitor entero.
-       capture_area = region if region is not None else monitor_geom
+       if not region:
+           return monitor_geom
 
        # Validación y ajuste de la región de captura para que esté DENTRO del monitor físico
        # Esto es crucial porque mss puede fallar si la región sale de los límites
-       if region:
-            mon_left, mon_top = monitor_geom['left'], monitor_geom['top']
-            mon_right = mon_left + monitor_geom['width']
-            mon_bottom = mon_top + monitor_geom['height']
-
-            # Ajustar coordenadas relativas al monitor si es necesario
-            # Asegurar que la región solicitada está dentro del monitor
-            cap_left = max(region['left'], mon_left)
-            cap_top = max(region['top'], mon_top)
-            cap_right = min(region['left'] + region['width'], mon_right)
-            cap_bottom = min(region['top'] + region['height'], mon_bottom)
-
-            # Recalcular width y height válidos
-            cap_width = max(0, cap_right - cap_left)
-            cap_height = max(0, cap_bottom - cap_top)
-
-            if cap_width == 0 or cap_height == 0:
-                logging.warning(f"La región solicitada {region} queda fuera o es inválida dentro del monitor {monitor_geom}. No se puede capturar.")
-                return None
+       mon_left, mon_top = monitor_geom['left'], monitor_geom['top']
+       mon_right = mon_left + monitor_geom['width']
+       mon_bottom = mon_top + monitor_geom['height']
+
+       # Ajustar coordenadas relativas al monitor si es necesario
+       # Asegurar que la región solicitada está dentro del monitor
+       cap_left = max(region['left'], mon_left)
+       cap_top = max(region['top'], mon_top)
+       cap_right = min(region['left'] + region['width'], mon_right)
+       cap_bottom = min(region['top'] + region['height'], mon_bottom)
+
+       # Recalcular width y height válidos
+       cap_width = max(0, cap_right - cap_left)
+       cap_height = max(0, cap_bottom - cap_top)
+
+       if cap_width == 0 or cap_height == 0:
+           logging.warning(f"La región solicitada {region} queda fuera o es inválida dentro del monitor {monitor_geom}. No se puede capturar.")
+           return None
 
-            capture_area = {'left': cap_left, 'top': cap_top, 'width': cap_width, 'height': cap_height}
-            # logging.debug(f"Región ajustada para captura: {capture_area}")
+       return {'left': cap_left, 'top': cap_top, 'width': cap_width, 'height': cap_height}
 
+   def _grab_bgra(self, capture_area):
+       """
+       Captura el área indicada y devuelve una vista BGRA sobre el buffer de mss (sin copiar).
 
+       Returns:
+           numpy.ndarray: Array (alto, ancho, 4) BGRA, o None si falla.
+       """
        try:
-           with mss.mss() as sct: # Usar un contexto 'with' asegura liberación de recursos
-               # logging.debug(f"Capturando área: {capture_area}")
-               sct_img = sct.grab(capture_area)
-               # Convertir a numpy array
-               img = np.array(sct_img)
-               # Convertir de BGRA a BGR (formato común para OpenCV y otras libs)
-               # Si la imagen no tiene canal alfa, `cvtColor` podría fallar o no hacer nada.
-               # Es más seguro chequear los canales. MSS usualmente captura en BGRA.
-               if img.shape[2] == 4:
-                  img_bgr = cv2.cvtColor(img, cv2.COLOR_BGRA2BGR)
-               elif img.shape[2] == 3:
-                  img_bgr = img # Ya está en BGR (o RGB, mss es inconsistente a veces)
-               else:
-                   logging.error(f"Formato de imagen inesperado capturado por MSS (canales={img.shape[2]}).")
-                   return None
-               return img_bgr
+           sct_img = self._get_sct().grab(capture_area)
+           # np.frombuffer evita la copia que hace np.array(sct_img)
+           return np.frombuffer(sct_img.raw, dtype=np.uint8).reshape(sct_img.height, sct_img.width, 4)
        except mss.ScreenShotError as e:
            logging.error(f"Error MSS al capturar {capture_area}: {e}")
+           self._close_sct(self._sct_local.sct)
+           self._sct_local.sct = None # Forzar nueva sesión en el siguiente intento
            return None
        except Exception as e:
            logging.exception(f"Error inesperado durante captura ({capture_area}): {e}")
            return None
 
+   def capture_screen(self, region=None):
+       """
+       Captura la pantalla completa o una región específica del monitor configurado.
+
+       Args:
+           region (dict, optional): Diccionario con {'left', 'top', 'width', 'height'}
+                                    para capturar solo esa área. Si es None, captura
+                                    el monitor completo. Coordenadas absolutas.
+
+       Returns:
+           numpy.ndarray: Imagen capturada en formato BGR (propiedad del llamador), o None si falla.
+       """
+       capture_area = self._resolve_capture_area(region)
+       if capture_area is None:
+           return None
+       img_bgra = self._grab_bgra(capture_area)
+       if img_bgra is None:
+           return None
+       try:
+           return cv2.cvtColor(img_bgra, cv2.COLOR_BGRA2BGR)
+       except cv2.error as cv_err:
+           logging.error(f"Error al convertir la captura BGRA a BGR: {cv_err}")
+           return None
+
+   def capture_frame(self, region=None):
+       """
+       Captura sobre los buffers reutilizables del pool, convirtiendo BGRA
+       directamente a BGR y a gris sin reservar arrays nuevos.
+
+       Args:
+           region (dict, optional): Igual que en capture_screen.
+
+       Returns:
+           FrameSlot: Slot del pool con 'bgr', 'gray' y 'frame_id', o None si falla.
+                      Su contenido es válido hasta que el pool da la vuelta.
+       """
+       if self.frame_source is not None and region is None:
+           return self._frame_from_source()
+       capture_area = self._resolve_capture_area(region)
+       if capture_area is None:
+           return None
+       img_bgra = self._grab_bgra(capture_area)
+       if img_bgra is None:
+           return None
+       try:
+           return self.frame_pool.fill_from_bgra(img_bgra, region=capture_area)
+       except cv2.error as cv_err:
+           logging.error(f"Error al convertir la captura en el pool de frames: {cv_err}")
+           return None
+
+   def _frame_from_source(self):
+       """Toma el último frame del origen externo (bus de frames) en lugar de capturar."""
+       try:
+           frame_bgr, metadata = self.frame_source.read_latest(copy=False)
+       except Exception as e:
+           logging.exception(f"Error leyendo del origen de frames externo: {e}")
+           return None
+       if frame_bgr is None:
+           logging.warning("El origen de frames externo aún no ha publicado ningún frame.")
+           return None
+       region = metadata.get('region') if isinstance(metadata.get('region'), dict) else None
+       try:
+           return self.frame_pool.fill_from_bgr(frame_bgr, region=region, metadata=metadata)
+       except (cv2.error, ValueError) as e:
+           logging.error(f"Frame externo inválido: {e}")
+           return None
+
+   def _publish_frame(self, result):
+       """Publica el frame reconocido y la decisión tomada en el frame_publisher (si hay)."""
+       if self.frame_publisher is None:
+           return
+       frame = self.frame_pool.get(result.get('frame_id'))
+       if frame is None:
+           return
+       metadata = {
+           'frame_id': frame.frame_id, 'region': frame.region, 'source': 'recognizer',
+           'state': result.get('state'), 'method': result.get('method'),
+           'confidence': result.get('confidence'), 'detection_time_s': result.get('detection_time_s'),
+       }
+       try:
+           self.frame_publisher.publish(frame.bgr, metadata)
+       except Exception as e:
+           logging.warning(f"No se pudo publicar el frame en el bus: {e}")
+
+   def _record_history(self, result):
+       """Guarda el frame reconocido en el historial de capturas y lo enlaza desde el resultado."""
+       if self.capture_history is None:
+           return
+       frame = self.frame_pool.get(result.get('frame_id'))
+       if frame is None:
+           return
+       metadata = {'state': result.get('state'), 'method': result.get('method'),
+                   'confidence': result.get('confidence'), 'frame_id': frame.frame_id}
+       ref = self.capture_history.add(frame.bgr, timestamp=frame.timestamp, metadata=metadata)
+       result['capture_ref'] = ref
+       if ref is not None:
+           logging.info(f"Captura en historial: {ref['history']} @ {ref['ts']:.3f}")
+       else:
+           logging.debug("Historial de capturas saturado: frame no guardado.")
+
+   def add_recognition_listener(self, callback):
+       """
+       Registra un callback que recibe cada reconocimiento de pantalla (no los de recognize_image).
+
+       Args:
+           callback (callable): Función que recibe un diccionario con 'ts' (time.time() de la
+               captura del frame), 'state', 'method', 'confidence', 'frame_id' y 'frame_pyramid'
+               (FramePyramid del frame, válida sólo durante el callback: el slot se reutiliza).
+       """
+       if callback not in self._recognition_listeners:
+           self._recognition_listeners.append(callback)
+
+   def remove_recognition_listener(self, callback):
+       """Elimina un callback registrado con add_recognition_listener."""
+       if callback in self._recognition_listeners:
+           self._recognition_listeners.remove(callback)
+
+   def _notify_recognition(self, result, frame):
+       """Notifica un reconocimiento a los callbacks (sus errores no interrumpen el reconocimiento)."""
+       if not self._recognition_listeners:
+           return
+       event = {'ts': frame.timestamp, 'state': result.get('state'), 'method': result.get('method'),
+                'confidence': result.get('confidence'), 'frame_id': result.get('frame_id'),
+                'frame_pyramid': frame.pyramid}
+       for callback in list(self._recognition_listeners):
+           try:
+               callback(event)
+           except Exception as e:
+               logging.error(f"Error en listener de reconocimiento: {e}")
+
+   def get_captured_image(self, result_or_frame_id):
+       """
+       Materializa (copia) la imagen BGR de un reconocimiento previo.
+
+       Args:
+           result_or_frame_id: Diccionario devuelto por recognize_screen_for_test o su 'frame_id'.
+
+       Returns:
+           numpy.ndarray: Copia BGR propia, o None si el slot del frame ya se reutilizó en el
+               pool (su frame_id ya no coincide con el del resultado).
+       """
+       frame_id = result_or_frame_id.get('frame_id') if isinstance(result_or_frame_id, dict) else result_or_frame_id
+       image = self.frame_pool.materialize(frame_id)
+       if image is None and frame_id is not None:
+           logging.warning(f"La captura del frame {frame_id} ya no está en el pool (slot reutilizado)")
+       return image
+
+   def save_screenshot(self, filename, directory=None, result=None):
+       """
+       Guarda una captura de la pantalla sin bloquear: el frame se encola en el
+       ScreenshotWriter y se codifica en su hilo.
+
+       Args:
+           filename (str): Nombre del archivo (la extensión decide el formato salvo que
+                           el escritor tenga uno fijo).
+           directory (str, optional): Directorio de destino. Por defecto, SCREENSHOTS_DIR.
+           result (dict, optional): Resultado de un reconocimiento previo cuyo frame guardar
+                                    en lugar de capturar uno nuevo (si sigue en el pool).
+
+       Returns:
+           str: Ruta en la que se guardará la captura, o None si no se pudo capturar o
+                el escritor la descartó (límite de ritmo).
+       """
+       frame = self.frame_pool.get(result.get('frame_id')) if result else None
+       if frame is None:
+           frame = self.capture_frame() if self.frame_source is not None else self.capture_frame(region=self._get_monitor_region())
+       if frame is None:
+           logging.error(f"save_screenshot: fallo en la captura de pantalla ({filename}).")
+           return None
+       if self.screenshot_writer is None:
+           self.screenshot_writer = ScreenshotWriter()
+       path = self.screenshot_writer.submit(frame.bgr, os.path.join(directory or SCREENSHOTS_DIR, filename))
+       if path is not None:
+           logging.info(f"Captura encolada: {path} (pendientes: {self.screenshot_writer.queue_depth})")
+       return path
+
+   def _state_search_region(self, state, screen_gray_full, monitor_region):
+       """
+       Devuelve la zona de la captura donde buscar las plantillas de un estado (su ROI o la pantalla completa).
+
+       Args:
+           state (str): Estado cuyas plantillas se van a buscar.
+           screen_gray_full (numpy.ndarray): Captura completa en escala de grises.
+           monitor_region (dict): Geometría absoluta de la captura.
+
+       Returns:
+           tuple: (imagen_gris_objetivo, (x_off, y_off) relativo a la captura, texto para logging)
+       """
+       roi = self.bundle.rois.get(state) # (left, top, width, height) ya validada al compilar
+       if roi is None:
+           return screen_gray_full, (0, 0), "Full Screen"
+
+       # Calcular coords relativas a la imagen capturada, usando la geometría del frame como referencia
+       h_screen, w_screen = screen_gray_full.shape[:2]
+       x_abs, y_abs, w_roi, h_roi = roi
+       x_rel = max(0, x_abs - monitor_region['left'])
+       y_rel = max(0, y_abs - monitor_region['top'])
+       # Ajustar ancho/alto para no salirse de la pantalla capturada
+       w_rel = min(w_roi, w_screen - x_rel)
+       h_rel = min(h_roi, h_screen - y_rel)
+       if w_rel <= 0 or h_rel <= 0:
+           # Puede ocurrir si el frame procede de otra geometría (p.ej. bus de frames)
+           logging.warning(f"  ROI para '{state}' queda fuera de la captura. Usando pantalla completa. ROI Abs={roi}")
+           return screen_gray_full, (0, 0), "Full Screen (ROI fuera de la captura)"
+       roi_info_for_log = f"ROI Abs={roi} -> Rel=[{x_rel}:{x_rel+w_rel}, {y_rel}:{y_rel+h_rel}]"
+       return screen_gray_full[y_rel:y_rel + h_rel, x_rel:x_rel + w_rel], (x_rel, y_rel), roi_info_for_log
+
    def find_template_on_screen(self, screen_gray, template_gray):
        """
        Busca una única plantilla en la imagen de pantalla (o ROI) en escala de grises.
@@ -366,12 +827,79 @@ class ScreenRecognizer:
            logging.exception(f"Error inesperado en find_template_on_screen: {e}")
            return None, 0.0
 
-   def recognize_screen_for_test(self):
+   def _find_template_tracked(self, state, index, target_gray, target_offset, template_gray, threshold):
+       """
+       Busca una plantilla empezando por una ventana alrededor de su última posición.
+
+       Los elementos de la UI casi nunca se mueven entre frames: si la búsqueda local
+       alcanza el umbral se evita recorrer toda la ROI/pantalla. Si no, se busca en
+       todo target_gray y se recuerda la nueva posición cuando supera el umbral.
+
+       Args:
+           state (str): Estado de la plantilla.
+           index (int): Índice de la plantilla dentro del estado.
+           target_gray (numpy.ndarray): ROI (o pantalla completa) en gris.
+           target_offset (tuple): (x, y) de target_gray dentro del frame.
+           template_gray (numpy.ndarray): Plantilla en gris.
+           threshold (float): Umbral de aceptación del estado.
+
+       Returns:
+           tuple: (max_loc relativo a target_gray, max_val), como find_template_on_screen.
+       """
+       key = (state, index)
+       last = self._last_locations.get(key)
+       h_tpl, w_tpl = template_gray.shape[:2]
+       h_target, w_target = target_gray.shape[:2]
+       if last is not None:
+           x0 = max(0, last[0] - target_offset[0] - TRACKING_MARGIN)
+           y0 = max(0, last[1] - target_offset[1] - TRACKING_MARGIN)
+           x1 = min(w_target, last[0] - target_offset[0] + w_tpl + TRACKING_MARGIN)
+           y1 = min(h_target, last[1] - target_offset[1] + h_tpl + TRACKING_MARGIN)
+           if x1 - x0 >= w_tpl and y1 - y0 >= h_tpl:
+               loc, match_val = self.find_template_on_screen(target_gray[y0:y1, x0:x1], template_gray)
+               if loc is not None and match_val >= threshold:
+                   self.tracking_stats['local_hits'] += 1
+                   loc = (x0 + loc[0], y0 + loc[1])
+                   self._last_locations[key] = (target_offset[0] + loc[0], target_offset[1] + loc[1])
+                   return loc, match_val
+           self.tracking_stats['local_misses'] += 1
+
+       self.tracking_stats['full_searches'] += 1
+       loc, match_val = self.find_template_on_screen(target_gray, template_gray)
+       if loc is not None and match_val >= threshold:
+           self._last_locations[key] = (target_offset[0] + loc[0], target_offset[1] + loc[1])
+       return loc, match_val
+
+   def get_tracking_stats(self):
+       """
+       Contadores de la búsqueda local por última posición.
+
+       Returns:
+           dict: {'local_hits', 'local_misses', 'full_searches', 'tracked_templates',
+                  'local_hit_rate' (fracción de búsquedas resueltas en la ventana local)}
+       """
+       stats = dict(self.tracking_stats)
+       searches = stats['local_hits'] + stats['full_searches']
+       stats['tracked_templates'] = len(self._last_locations)
+       stats['local_hit_rate'] = stats['local_hits'] / searches if searches else 0.0
+       return stats
+
+   def reset_tracking(self):
+       """Olvida las posiciones recordadas y reinicia los contadores."""
+       self._last_locations = {}
+       self.tracking_stats = {'local_hits': 0, 'local_misses': 0, 'full_searches': 0}
+
+   def recognize_screen_for_test(self, deadline_ms=None):
        """
        Intenta reconocer la pantalla actual con optimizaciones (ROI, contexto)
        y fallback a OCR, devolviendo información detallada para el tester.
        Optimizado para extraer regiones OCR de una única captura inicial.
 
+       Args:
+           deadline_ms (float, optional): Presupuesto de tiempo (captura incluida). Los
+               estados se evalúan en orden de prioridad y la búsqueda se detiene al agotarlo;
+               el OCR se omite si su coste medio no cabe en lo que queda. None = búsqueda completa.
+
        Returns:
            dict: Un diccionario con los resultados:
                'method': 'template', 'ocr', 'error', o 'unknown'.
@@ -381,32 +909,52 @@ class ScreenRecognizer:
                    { region_idx: {'region':..., 'text':..., 'expected':..., 'match_expected':...}}
                'error_message': Mensaje de error si method es 'error'.
                'detection_time_s': Tiempo total de detección en segundos (float).
-               'captured_image': Imagen BGR completa capturada (numpy.ndarray), o None si falló.
+               'captured_image': Vista BGR de solo lectura de la captura (numpy.ndarray), o None si falló.
+                                 Válida hasta que el pool de frames se reutiliza.
+               'frame_id': Identificador del frame en el pool (para get_captured_image).
+               'frame_pyramid': FramePyramid del frame (gris, mitad, cuarto, miniatura y vistas
+                                de ROI memorizadas), para previsualizaciones y otros consumidores.
+               'state_scores': { estado: mejor confianza de plantilla } de los estados evaluados
+                               (la parada temprana por contexto deja fuera el resto).
+               'complete': False si el presupuesto impidió evaluar todos los candidatos
+                           (el estado devuelto es el mejor encontrado hasta entonces).
+               'unevaluated_states': Estados cuyas plantillas no llegaron a evaluarse.
+               'ocr_skipped': Candidatos OCR omitidos por falta de presupuesto.
+               'source_metadata': Metadatos del bus de frames (estado decidido por la
+                                  automatización), sólo si se usa frame_source.
+               'capture_ref': {'history', 'ts'} del frame en el historial de capturas
+                              (capture_history.CaptureHistoryReader.frame_at), sólo si se usa
+                              capture_history; None si el historial descartó el frame.
        """
        logging.info(f"--- Iniciando Reconocimiento (Último estado: {self.last_recognized_state}) ---")
        start_time = time.time()
+       deadline = time.perf_counter() + deadline_ms / 1000.0 if deadline_ms is not None else None
 
        # Inicializar resultado con valores por defecto
        result = {
            'method': 'unknown', 'state': 'unknown',
            'confidence': None, 'ocr_results': None, 'error_message': None,
-           'detection_time_s': 0.0, 'captured_image': None
+           'detection_time_s': 0.0, 'captured_image': None, 'frame_id': None,
+           'state_scores': {}, 'complete': True, 'unevaluated_states': [], 'ocr_skipped': []
        }
 
-       # --- 0. Captura ÚNICA de Pantalla Completa ---
-       monitor_region = self._get_monitor_region()
-       if monitor_region is None:
-           logging.error("No se pudo obtener la región del monitor. Abortando reconocimiento.")
-           result.update({
-               'method': 'error', 'state': 'error',
-               'error_message': "No se pudo obtener la región del monitor."
-           })
-           result['detection_time_s'] = time.time() - start_time
-           return result
-
-       # Usar la geometría del monitor para la captura completa
-       screen_bgr_full = self.capture_screen(region=monitor_region)
-       if screen_bgr_full is None:
+       # --- 0. Captura ÚNICA de Pantalla Completa (o último frame del bus compartido) ---
+       if self.frame_source is not None:
+           frame = self.capture_frame()
+       else:
+           monitor_region = self._get_monitor_region()
+           if monitor_region is None:
+               logging.error("No se pudo obtener la región del monitor. Abortando reconocimiento.")
+               result.update({
+                   'method': 'error', 'state': 'error',
+                   'error_message': "No se pudo obtener la región del monitor."
+               })
+               result['detection_time_s'] = time.time() - start_time
+               return result
+           # Usar la geometría del monitor para la captura completa (sobre el pool de buffers)
+           frame = self.capture_frame(region=monitor_region)
+
+       if frame is None:
            logging.error("Fallo captura inicial de pantalla completa.")
            result.update({
                'method': 'error', 'state': 'error',
@@ -415,39 +963,168 @@ class ScreenRecognizer:
            result['detection_time_s'] = time.time() - start_time
            return result
 
-       # Guardar la imagen capturada en el resultado para la GUI
-       result['captured_image'] = screen_bgr_full.copy() # Copiar para evitar modificaciones accidentales
+       with self._data_lock: # Las recargas sólo se aplican entre reconocimientos
+           result = self._recognize_frame(frame, result, start_time, deadline)
+       self._publish_frame(result)
+       self._record_history(result)
+       self._notify_recognition(result, frame)
+       return result
 
-       try:
-           screen_gray_full = cv2.cvtColor(screen_bgr_full, cv2.COLOR_BGR2GRAY)
-           h_screen, w_screen = screen_gray_full.shape[:2] # Dimensiones de la imagen capturada
-       except cv2.error as cv_err:
-            logging.error(f"Error al convertir la captura a escala de grises: {cv_err}")
-            result.update({
-               'method': 'error', 'state': 'error',
-               'error_message': f"Error al convertir la captura a escala de grises: {cv_err}"
-            })
-            result['detection_time_s'] = time.time() - start_time
-            return result
+   def recognize_image(self, image_bgr, region=None, use_context=False, deadline_ms=None):
+       """
+       Reconoce una imagen ya cargada (captura guardada, informe de error...) sin capturar.
+
+       Args:
+           image_bgr (numpy.ndarray): Imagen BGR (o BGRA) completa de la pantalla.
+           region (dict, optional): Geometría absoluta de la imagen {'left', 'top', 'width', 'height'},
+               para situar ROIs y regiones OCR. Por defecto, origen (0, 0).
+           use_context (bool): Priorizar según el estado reconocido anteriormente y actualizarlo,
+               igual que la captura en vivo. Desactivado por defecto: imágenes sueltas no tienen
+               relación entre sí y no deben alterar el contexto ni el seguimiento de la pantalla real.
+           deadline_ms (float, optional): Presupuesto de tiempo (ver recognize_screen_for_test).
+
+       Returns:
+           dict: Igual que recognize_screen_for_test().
+       """
+       start_time = time.time()
+       deadline = time.perf_counter() + deadline_ms / 1000.0 if deadline_ms is not None else None
+       result = {
+           'method': 'unknown', 'state': 'unknown',
+           'confidence': None, 'ocr_results': None, 'error_message': None,
+           'detection_time_s': 0.0, 'captured_image': None, 'frame_id': None,
+           'state_scores': {}, 'complete': True, 'unevaluated_states': [], 'ocr_skipped': []
+       }
+       if image_bgr is None or image_bgr.ndim != 3 or image_bgr.shape[2] not in (3, 4):
+           result.update({'method': 'error', 'state': 'error', 'error_message': "Imagen inválida (se espera BGR o BGRA)."})
+           return result
+       h_img, w_img = image_bgr.shape[:2]
+       if region is None:
+           region = {'left': 0, 'top': 0, 'width': w_img, 'height': h_img}
+       if image_bgr.shape[2] == 4:
+           frame = self.frame_pool.fill_from_bgra(image_bgr, region=region)
+       else:
+           frame = self.frame_pool.fill_from_bgr(image_bgr, region=region)
+       with self._data_lock:
+           result = self._recognize_frame(frame, result, start_time, deadline, use_context=use_context)
+       return result
+
+   def recognize(self, deadline_ms=None):
+       """Alias de recognize_screen_for_test() (nombre usado por el servicio de reconocimiento)."""
+       return self.recognize_screen_for_test(deadline_ms)
+
+   def locate(self, state, threshold=None):
+       """
+       Busca las plantillas de un estado concreto (dentro de su ROI si la tiene) en una captura nueva.
 
+       Args:
+           state (str): Estado cuyas plantillas se buscan.
+           threshold (float, optional): Umbral de confianza. Por defecto, el umbral del estado
+               en los ajustes o, si no tiene, self.threshold.
+
+       Returns:
+           dict: {'state', 'found' (bool), 'confidence', 'template_index',
+                  'location': {'left', 'top', 'width', 'height'} absolutos o None, 'frame_id'}
+       """
+       result = {'state': state, 'found': False, 'confidence': 0.0,
+                 'template_index': None, 'location': None, 'frame_id': None}
+       if not self.templates.get(state):
+           logging.warning(f"locate: sin plantillas cargadas para el estado '{state}'.")
+           return result
+       frame = self.capture_frame() if self.frame_source is not None else self.capture_frame(region=self._get_monitor_region())
+       if frame is None:
+           logging.error("locate: fallo en la captura de pantalla.")
+           return result
+       result['frame_id'] = frame.frame_id
+       h_screen, w_screen = frame.gray.shape[:2]
+       monitor_region = frame.region or {'left': 0, 'top': 0, 'width': w_screen, 'height': h_screen}
+
+       with self._data_lock: # Plantillas, ROIs y seguimiento compartidos con recognize/recargas
+           if threshold is None:
+               threshold = self.bundle.thresholds.get(state, self.threshold)
+           template_list = self.templates.get(state) or []
+           target_gray, (x_off, y_off), _ = self._state_search_region(state, frame.gray, monitor_region)
+           for i, template_gray in enumerate(template_list):
+               if template_gray is None or template_gray.size == 0:
+                   continue
+               loc, match_val = self._find_template_tracked(state, i, target_gray, (x_off, y_off), template_gray, threshold)
+               if loc is not None and match_val > result['confidence']:
+                   h_tpl, w_tpl = template_gray.shape[:2]
+                   result.update({
+                       'confidence': match_val, 'template_index': i,
+                       'location': {'left': monitor_region['left'] + x_off + loc[0],
+                                    'top': monitor_region['top'] + y_off + loc[1],
+                                    'width': w_tpl, 'height': h_tpl}
+                   })
+       result['found'] = result['confidence'] >= threshold
+       return result
+
+   def wait_for_state(self, states, timeout=10.0, poll_interval=0.25):
+       """
+       Reconoce repetidamente hasta que la pantalla esté en alguno de los estados indicados.
+
+       Las pausas entre reconocimientos son cancelables dentro de un flujo (workflow_sleep).
+
+       Args:
+           states (str | list): Estado o lista de estados aceptados.
+           timeout (float): Tiempo máximo de espera en segundos.
+           poll_interval (float): Pausa entre reconocimientos en segundos.
+
+       Returns:
+           dict: Último resultado de reconocimiento, con 'matched' (bool) y 'waited_s'.
+       """
+       wanted = {states} if isinstance(states, str) else set(states)
+       start = time.time()
+       while True:
+           result = self.recognize_screen_for_test()
+           result['waited_s'] = time.time() - start
+           result['matched'] = result.get('state') in wanted
+           if result['matched'] or result['waited_s'] >= timeout:
+               return result
+           workflow_sleep(max(0.0, min(poll_interval, timeout - result['waited_s'])))
+
+   def _recognize_frame(self, frame, result, start_time, deadline=None, use_context=True):
+       """
+       Template matching con contexto/ROI y fallback OCR sobre un frame del pool.
+
+       Args:
+           frame (FrameSlot): Frame capturado (o recibido del bus de frames).
+           result (dict): Resultado inicial a completar.
+           start_time (float): Instante de inicio para 'detection_time_s'.
+           deadline (float, optional): Límite en time.perf_counter() (ver recognize_screen_for_test).
+           use_context (bool): Usar y actualizar last_recognized_state y las posiciones seguidas.
+               Con False el frame se evalúa aislado y no modifica el estado del reconocedor.
+
+       Returns:
+           dict: El resultado completado (ver recognize_screen_for_test).
+       """
+       # La GUI recibe una vista de solo lectura del buffer (sin copia de ~25 MB en 4K).
+       # Quien necesite conservarla más allá de unas pocas capturas usa get_captured_image().
+       result['frame_id'] = frame.frame_id
+       result['captured_image'] = frame.bgr_view()
+       result['frame_pyramid'] = frame.pyramid
+       if frame.metadata:
+           result['source_metadata'] = frame.metadata # Decisión publicada por la automatización
+
+       screen_bgr_full = frame.bgr
+       screen_gray_full = frame.gray # Convertida directamente desde BGRA en el pool
+       h_screen, w_screen = screen_gray_full.shape[:2] # Dimensiones de la imagen capturada
+       # Geometría absoluta del frame, para traducir ROIs/regiones OCR a coordenadas relativas
+       monitor_region = frame.region or {'left': 0, 'top': 0, 'width': w_screen, 'height': h_screen}
 
        # --- Determinar Orden de Estados (Contexto) ---
-       states_to_check = list(self.templates.keys())
+       states_to_check = list(self._state_order)
        prioritized_states = []
-       if self.last_recognized_state and self.last_recognized_state in self.state_transitions:
-           possible_next = self.state_transitions[self.last_recognized_state]
-           if isinstance(possible_next, list):
-               # Filtrar solo estados que realmente existen en las plantillas cargadas
-               prioritized_states = [s for s in possible_next if s in self.templates]
-               if prioritized_states:
-                   logging.info(f"Aplicando contexto. Priorizados: {prioritized_states}")
-                   # Asegurarse que los priorizados estén al inicio, seguidos del resto sin duplicados
-                   other_states = [s for s in states_to_check if s not in prioritized_states]
-                   states_to_check = prioritized_states + other_states
-               else:
-                   logging.info(f"Contexto encontrado para '{self.last_recognized_state}', pero sin plantillas válidas para los estados siguientes.")
-           elif possible_next is not None: # Permitir None, pero no otros tipos
-               logging.warning(f"Transiciones para '{self.last_recognized_state}' no es una lista válida (es {type(possible_next)}). Ignorando contexto.")
+       context_state = self.last_recognized_state if use_context else None
+       if context_state in self.bundle.transitions:
+           # Las transiciones ya vienen validadas y sin estados colgantes; filtrar por plantillas cargadas
+           prioritized_states = [s for s in self.bundle.transitions[context_state] if s in self.templates]
+           if prioritized_states:
+               logging.info(f"Aplicando contexto. Priorizados: {prioritized_states}")
+               # Asegurarse que los priorizados estén al inicio, seguidos del resto sin duplicados
+               other_states = [s for s in states_to_check if s not in prioritized_states]
+               states_to_check = prioritized_states + other_states
+           else:
+               logging.info(f"Contexto encontrado para '{context_state}', pero sin plantillas válidas para los estados siguientes.")
 
        if not prioritized_states:
            logging.info("No se aplica contexto (sin estado previo válido o sin transiciones/plantillas válidas).")
@@ -458,7 +1135,14 @@ class ScreenRecognizer:
        potential_ocr_states = [] # Almacena tuplas (state, confidence)
 
        logging.debug(f"Orden de chequeo de plantillas: {states_to_check}")
-       for state in states_to_check:
+       for position, state in enumerate(states_to_check):
+           # --- Presupuesto: parar al agotarlo (el exceso queda acotado por el coste de un estado) ---
+           if deadline is not None and time.perf_counter() >= deadline:
+               result['complete'] = False
+               result['unevaluated_states'] = [s for s in states_to_check[position:] if s in self.templates]
+               logging.info(f"Presupuesto agotado: {len(result['unevaluated_states'])} estados sin evaluar.")
+               break
+
            if state not in self.templates: # Seguridad extra
                logging.warning(f"Estado '{state}' listado para chequeo pero sin plantillas cargadas. Saltando.")
                continue
@@ -469,43 +1153,10 @@ class ScreenRecognizer:
                 continue
 
            # --- Determinar ROI para este estado ---
-           search_roi_coords = self.state_rois.get(state)
-           target_screen_gray = screen_gray_full # Por defecto, buscar en toda la pantalla capturada
-           roi_info_for_log = "Full Screen" # Para logging
-           using_roi = False
-
-           if search_roi_coords and isinstance(search_roi_coords, dict) and all(k in search_roi_coords for k in ('left', 'top', 'width', 'height')):
-               # Extraer ROI de la CAPTURA COMPLETA (screen_gray_full)
-               x_abs, y_abs = search_roi_coords['left'], search_roi_coords['top']
-               w_roi, h_roi = search_roi_coords['width'], search_roi_coords['height']
-
-               # Calcular coords relativas a la imagen capturada (screen_gray_full)
-               # Usando la geometría del monitor capturado como referencia
-               x_rel = max(0, x_abs - monitor_region['left'])
-               y_rel = max(0, y_abs - monitor_region['top'])
-               # Ajustar ancho/alto para no salirse de la pantalla capturada
-               w_rel = min(w_roi, w_screen - x_rel)
-               h_rel = min(h_roi, h_screen - y_rel)
-
-               if w_rel > 0 and h_rel > 0:
-                   try:
-                       target_screen_gray = screen_gray_full[y_rel : y_rel + h_rel, x_rel : x_rel + w_rel]
-                       roi_info_for_log = f"ROI Abs={search_roi_coords} -> Rel=[{x_rel}:{x_rel+w_rel}, {y_rel}:{y_rel+h_rel}]"
-                       using_roi = True
-                       # logging.debug(f"  Usando {roi_info_for_log} para '{state}'") # Verboso
-                   except Exception as roi_slice_error:
-                       logging.error(f"Error al extraer ROI para '{state}' ({roi_info_for_log}): {roi_slice_error}. Usando pantalla completa.")
-                       target_screen_gray = screen_gray_full # Fallback
-                       roi_info_for_log = "Full Screen (ROI Slice Error)"
-                       using_roi = False
-               else:
-                   logging.warning(f"  ROI para '{state}' resulta en tamaño 0 o negativo relativo a la captura. Usando pantalla completa. ROI Abs={search_roi_coords}")
-                   target_screen_gray = screen_gray_full # Fallback a pantalla completa
-                   roi_info_for_log = "Full Screen (Invalid ROI Dims)"
-                   using_roi = False
-           # else: logging.debug(f"  Sin ROI definida o inválida para '{state}'.") # Puede ser verboso
+           target_screen_gray, roi_offset, roi_info_for_log = self._state_search_region(state, screen_gray_full, monitor_region)
 
            # --- Buscar TODAS las plantillas para este estado dentro del target_screen_gray ---
+           state_threshold = self.bundle.thresholds.get(state, self.threshold)
            current_state_best_val = 0.0
            current_state_best_loc = None
            for i, template_gray in enumerate(template_list):
@@ -513,8 +1164,11 @@ class ScreenRecognizer:
                     logging.warning(f"Plantilla inválida (None o vacía) encontrada para estado '{state}', índice {i}. Saltando.")
                     continue
 
-               # find_template_on_screen opera sobre la imagen que le pases (ROI o full)
-               loc, match_val = self.find_template_on_screen(target_screen_gray, template_gray)
+               # Primero en una ventana junto a la última posición de la plantilla, luego en toda la ROI/pantalla
+               if use_context:
+                   loc, match_val = self._find_template_tracked(state, i, target_screen_gray, roi_offset, template_gray, state_threshold)
+               else:
+                   loc, match_val = self.find_template_on_screen(target_screen_gray, template_gray)
 
                # logging.debug(f"    Comparando '{state}' (tpl {i+1}/{len(template_list)}) en {roi_info_for_log}: Conf={match_val:.4f}") # Verboso
 
@@ -522,8 +1176,10 @@ class ScreenRecognizer:
                    current_state_best_val = match_val
                    current_state_best_loc = loc # Guardar posición por si se necesita
 
-           # --- Evaluar resultado agregado para este estado ---
-           if current_state_best_val >= self.threshold:
+           result['state_scores'][state] = round(float(current_state_best_val), 4) # Para feedback_store
+
+           # --- Evaluar resultado agregado para este estado (umbral propio si está ajustado) ---
+           if current_state_best_val >= state_threshold:
                # Si es mejor que el mejor global encontrado hasta ahora
                if current_state_best_val > best_match_val:
                    best_match_val = current_state_best_val
@@ -550,102 +1206,76 @@ class ScreenRecognizer:
                'confidence': best_match_val
            })
            logging.info(f"Estado final detectado (Template): '{result['state']}' (Confianza: {result['confidence']:.4f})")
-           self.last_recognized_state = best_match_state
+           if use_context:
+               self.last_recognized_state = best_match_state
            result['detection_time_s'] = time.time() - start_time
            return result
 
        # --- 2. OCR Fallback (Si no hubo match claro por template) ---
        if not potential_ocr_states:
            logging.warning("No se encontró coincidencia de plantilla por encima del umbral y no hay candidatos para OCR fallback.")
-           self.last_recognized_state = None # Resetear estado si no se reconoce nada
+           if use_context and result['complete']: # Sin presupuesto no hay evidencia para olvidar el contexto
+               self.last_recognized_state = None # Resetear estado si no se reconoce nada
            result['detection_time_s'] = time.time() - start_time
            return result # Devuelve 'unknown'
 
-       logging.info(f"No se encontró match claro por plantilla (mejor < {self.threshold}). Intentando OCR fallback con {len(potential_ocr_states)} candidatos...")
+       logging.info(f"No se encontró match claro por plantilla (ningún estado alcanzó su umbral). Intentando OCR fallback con {len(potential_ocr_states)} candidatos...")
        # Ordenar candidatos OCR por su confianza de template matching (descendente)
        potential_ocr_states.sort(key=lambda item: item[1], reverse=True)
        logging.debug(f"Candidatos OCR ordenados por conf. template: {[(s, f'{c:.3f}') for s, c in potential_ocr_states]}")
 
+       ocr_tried = set()
        for state_candidate, template_score in potential_ocr_states:
-           # Verificar si hay regiones OCR definidas para este candidato
-           if state_candidate in self.ocr_regions_mapping:
-               regions_data_list = self.ocr_regions_mapping[state_candidate]
-
-               # Validar que sea una lista
-               if not isinstance(regions_data_list, list):
-                   logging.warning(f"Regiones OCR para '{state_candidate}' en {OCR_MAPPING_FILE} no son una lista válida. Saltando candidato.")
-                   continue
-               if not regions_data_list:
-                    logging.info(f"  Candidato '{state_candidate}' tiene una lista vacía de regiones OCR. Saltando.")
-                    continue
-
-
+           # Regiones OCR ya validadas y normalizadas al compilar el bundle
+           regions_specs = self.bundle.ocr_regions.get(state_candidate)
+           if regions_specs and deadline is not None and \
+                   deadline - time.perf_counter() < self._ocr_region_cost_ema * len(regions_specs):
+               # El OCR no cabe en el presupuesto restante: se omite este candidato y los siguientes
+               result['complete'] = False
+               result['ocr_skipped'] = [s for s, _ in potential_ocr_states if s not in ocr_tried]
+               logging.info(f"Presupuesto insuficiente para OCR (~{self._ocr_region_cost_ema * 1000:.0f} ms/región). "
+                            f"Omitidos: {result['ocr_skipped']}")
+               break
+           ocr_tried.add(state_candidate)
+           if regions_specs:
                ocr_results_for_state = {} # Guardará los resultados OCR para este candidato {idx: details}
                at_least_one_region_matched = False # Flag para saber si encontramos un texto esperado
 
-               logging.info(f"  Probando OCR para candidato: '{state_candidate}' (Score Template: {template_score:.3f}) con {len(regions_data_list)} regiones...")
-
-               for idx, region_data in enumerate(regions_data_list):
-                   # Validar formato de cada entrada de la región
-                   if not (isinstance(region_data, dict) and
-                           'region' in region_data and isinstance(region_data['region'], dict) and
-                           all(k in region_data['region'] for k in ('left', 'top', 'width', 'height')) and
-                           'expected_text' in region_data and isinstance(region_data['expected_text'], list)):
-                       logging.warning(f"    Formato inválido o falta 'expected_text' en región OCR '{state_candidate}', índice {idx}. Saltando esta región: {region_data}")
-                       # Guardar info de error para la GUI si se desea
-                       ocr_results_for_state[idx] = {
-                           'region': region_data.get('region', 'INVALID'),
-                           'text': 'ERROR_INVALID_REGION_FORMAT',
-                           'expected': region_data.get('expected_text', []),
-                           'match_expected': False
-                       }
-                       continue # Saltar a la siguiente región
-
-                   region_coords = region_data['region'] # Coordenadas ABSOLUTAS de pantalla
-                   expected_texts = region_data['expected_text'] # Lista de textos esperados
-
-                   # --- **OPTIMIZACIÓN**: Extraer región de la captura completa (screen_bgr_full) ---
-                   x_abs, y_abs = region_coords['left'], region_coords['top']
-                   w_ocr, h_ocr = region_coords['width'], region_coords['height']
+               logging.info(f"  Probando OCR para candidato: '{state_candidate}' (Score Template: {template_score:.3f}) con {len(regions_specs)} regiones...")
+
+               for spec in regions_specs:
+                   idx = spec.index # Índice en ocr_regions.json (usado por la GUI)
+                   region_coords = spec.region # Coordenadas ABSOLUTAS de pantalla
+                   expected_texts = list(spec.expected) # Lista de textos esperados
 
                    # Mapear coords absolutas a relativas de la imagen capturada (screen_bgr_full)
-                   x_rel = max(0, x_abs - monitor_region['left'])
-                   y_rel = max(0, y_abs - monitor_region['top'])
+                   x_rel = max(0, spec.left - monitor_region['left'])
+                   y_rel = max(0, spec.top - monitor_region['top'])
                    # Calcular fin relativo, asegurando que no exceda las dimensiones de screen_bgr_full
-                   x_rel_end = min(x_rel + w_ocr, w_screen) # w_screen es de la imagen gray
-                   y_rel_end = min(y_rel + h_ocr, h_screen) # h_screen es de la imagen gray
+                   x_rel_end = min(x_rel + spec.width, w_screen) # w_screen es de la imagen gray
+                   y_rel_end = min(y_rel + spec.height, h_screen) # h_screen es de la imagen gray
 
-                   region_img_bgr = None
+                   region_img_gray = None
                    if x_rel < x_rel_end and y_rel < y_rel_end: # Comprobar tamaño válido
-                       try:
-                            # Extraer de la imagen BGR original capturada
-                            region_img_bgr = screen_bgr_full[y_rel:y_rel_end, x_rel:x_rel_end]
-                            # logging.debug(f"    Extrayendo Región OCR {idx} para '{state_candidate}': Abs={region_coords} -> Rel=[{x_rel}:{x_rel_end}, {y_rel}:{y_rel_end}]")
-                       except Exception as slice_err:
-                            logging.error(f"Error al extraer slice para región OCR {idx} ('{state_candidate}'): {slice_err}. Saltando OCR para esta región.")
-                            region_img_bgr = None # Asegurar que es None
+                       # Vista en gris de la pirámide del frame: sin recortes ni conversiones por región
+                       region_img_gray = frame.pyramid.roi((x_rel, y_rel, x_rel_end - x_rel, y_rel_end - y_rel))
                    else:
                        logging.warning(f"    Región OCR {idx} para '{state_candidate}' resulta en tamaño 0 o negativo relativo a la captura. Saltando OCR para esta región. Abs={region_coords}")
-                   # -----------------------------------------------------------------------------
 
-                   # Extraer texto (maneja None internamente)
-                   extracted_text = self._extract_and_clean_text(region_img_bgr)
+                   # Extraer texto (maneja None internamente) y actualizar el coste medio del OCR
+                   ocr_start = time.perf_counter()
+                   extracted_text = self._extract_and_clean_text(region_img_gray)
+                   if region_img_gray is not None:
+                       self._ocr_region_cost_ema += COST_EMA_ALPHA * (time.perf_counter() - ocr_start - self._ocr_region_cost_ema)
 
                    # --- Comparación ---
                    match_expected = False # Por defecto no hay match
                    if extracted_text: # Solo comparar si se extrajo algo
                        # Comparación insensible a mayúsculas/minúsculas y espacios extra
-                       extracted_clean = extracted_text.lower().strip()
-                       if extracted_clean: # No comparar si solo son espacios
-                           for expected in expected_texts:
-                               if isinstance(expected, str):
-                                   # Comparar ignorando case y espacios al inicio/fin
-                                   if expected.lower().strip() == extracted_clean:
-                                       match_expected = True
-                                       at_least_one_region_matched = True # Marcar que al menos una coincidió
-                                       break # Suficiente con encontrar uno esperado
-                               else:
-                                    logging.warning(f"Texto esperado no es string en región {idx} de '{state_candidate}': {expected}. Ignorando.")
+                       # (los textos esperados ya vienen normalizados en el bundle)
+                       if extracted_text.lower().strip() in spec.expected_norm:
+                           match_expected = True
+                           at_least_one_region_matched = True # Marcar que al menos una coincidió
 
                    # --- Log detallado ---
                    logging.info(f"    Región OCR {idx} ({region_coords}): Texto='{extracted_text}', Esperado={expected_texts}, Coincide={match_expected}")
@@ -669,20 +1299,22 @@ class ScreenRecognizer:
                        'ocr_results': ocr_results_for_state
                    })
                    logging.info(f"Estado final detectado (OCR Fallback Verificado): '{result['state']}' (al menos una región coincidió)")
-                   self.last_recognized_state = state_candidate
+                   if use_context:
+                       self.last_recognized_state = state_candidate
                    result['detection_time_s'] = time.time() - start_time
                    return result # ¡Éxito! Salir del bucle de candidatos
 
                else:
                    logging.info(f"  Candidato '{state_candidate}': Ninguna región OCR coincidió con el texto esperado.")
 
-           else: # El estado candidato no tenía regiones OCR definidas en el mapping
-               logging.debug(f"  Candidato '{state_candidate}' no tiene regiones OCR definidas en {OCR_MAPPING_FILE}. Saltando.")
+           else: # El estado candidato no tenía regiones OCR válidas en el mapping
+               logging.debug(f"  Candidato '{state_candidate}' no tiene regiones OCR válidas en {OCR_MAPPING_FILE}. Saltando.")
            # Fin del bucle FOR de candidatos OCR
 
        # --- Resultado Final: No se pudo identificar ---
        logging.warning("No se pudo detectar el estado mediante template ni OCR verificado.")
-       self.last_recognized_state = None # Resetear estado si no se reconoce
+       if use_context and result['complete']:
+           self.last_recognized_state = None # Resetear estado si no se reconoce
        result['detection_time_s'] = time.time() - start_time
        # Devuelve el 'result' inicial que tiene method='unknown', state='unknown'
        return result
@@ -690,11 +1322,11 @@ class ScreenRecognizer:
 
    def _extract_and_clean_text(self, image_bgr):
        """
-       Extrae texto de una imagen BGR usando Tesseract, lo limpia y aplica
-       preprocesamiento opcional.
+       Extrae texto de una imagen BGR (o ya en gris) usando Tesseract, lo limpia
+       y aplica preprocesamiento opcional.
 
        Args:
-           image_bgr (numpy.ndarray): Imagen en formato BGR o None.
+           image_bgr (numpy.ndarray): Imagen en formato BGR, en gris (2D) o None.
 
        Returns:
            str: Texto extraído y limpiado, o "" si la imagen es None o falla el OCR.
@@ -706,8 +1338,8 @@ class ScreenRecognizer:
            return text # Devuelve ""
 
        try:
-           # Convertir a escala de grises para preprocesamiento y OCR
-           gray = cv2.cvtColor(image_bgr, cv2.COLOR_BGR2GRAY)
+           # Convertir a escala de grises para preprocesamiento y OCR (salvo que ya lo esté)
+           gray = image_bgr if image_bgr.ndim == 2 else cv2.cvtColor(image_bgr, cv2.COLOR_BGR2GRAY)
 
            # --- Preprocesamiento Opcional ---
            if self.ocr_apply_thresholding:
@@ -37,6 +37,9 @@ try:
         CONFIG_DIR,
         PROJECT_DIR # Usar PROJECT_DIR de screen_recognizer
     )
+    from frame_bus import open_reader_from_env # Bus de frames compartido con la automatización
+    from frame_pyramid import FramePyramid
+    from feedback_store import FeedbackStore, EVENT_CONFIRM, EVENT_DENY, EVENT_CORRECT # Feedback etiquetado
     # Importar paneles desde el subdirectorio 'panels' dentro de 'src'
     from panels.control_panel import ControlPanel
     from panels.result_panel import ResultPanel
@@ -112,6 +115,7 @@ class ScreenTesterGUI(tk.Tk):
         self.recognizer = None
         self.last_recognition_result = None
         self.current_template_name = None # Estado detectado o corregido actual
+        self.feedback_store = FeedbackStore() # Confirmaciones/correcciones para ajustar umbrales
         self.status_label_var = tk.StringVar(value="Inicializando...")
 
         # --- Referencias a Paneles ---
@@ -123,10 +127,13 @@ class ScreenTesterGUI(tk.Tk):
 
         # --- Inicializar ScreenRecognizer ---
         try:
+            # Si la automatización publica en el bus (EFOOTBALL_FRAME_BUS), leer de ahí en vez de capturar
             self.recognizer = ScreenRecognizer(
                 monitor=1, resolution='4K', threshold=0.75,
                 ocr_fallback_threshold=0.60, ocr_lang='spa+eng',
-                ocr_config='--psm 6', ocr_apply_thresholding=True
+                ocr_config='--psm 6', ocr_apply_thresholding=True,
+                frame_source=open_reader_from_env(),
+                watch_config=True # Aplica las ediciones del gestor de plantillas sin recargar a mano
             )
             logging.info("Instancia de ScreenRecognizer creada.")
         except Exception as e:
@@ -278,6 +285,12 @@ class ScreenTesterGUI(tk.Tk):
         start_rec_time = time.time()
         try:
             result = self.recognizer.recognize_screen_for_test()
+            # 'captured_image' es una vista del pool que se sobrescribe a las pocas capturas:
+            # el tester conserva el resultado (correcciones, feedback), así que se materializa
+            if result.get('frame_id') is not None:
+                image = self.recognizer.get_captured_image(result)
+                result['captured_image'] = image
+                result['frame_pyramid'] = FramePyramid(image, frame_id=result['frame_id']) if image is not None else None
             self.last_recognition_result = result
             rec_time = result.get('detection_time_s', time.time() - start_rec_time)
             logging.info(f"Reconocimiento completado en {rec_time:.3f}s.")
@@ -285,10 +298,14 @@ class ScreenTesterGUI(tk.Tk):
             # 3. Actualizar paneles con resultado
             if self.results_panel: self.results_panel.update_results(result)
             if self.preview_panel:
-                capture = result.get('captured_image')
+                # La pirámide del frame evita reducir la captura 4K en cada redibujado
+                capture = result.get('frame_pyramid') or result.get('captured_image')
                 state_name = result.get('state', 'N/A')
                 method = result.get('method', 'N/A')
                 info = f"Captura ({method} -> {state_name})"
+                bus_meta = result.get('source_metadata')
+                if bus_meta and bus_meta.get('state'):
+                    info += f" | Automatización: {bus_meta.get('state')} (frame #{bus_meta.get('bus_seq')})"
                 self.preview_panel.update_preview(capture, info_text=info)
 
             # 4. Mostrar/Ocultar panel OCR según el método <--- MODIFICADO
@@ -345,6 +362,7 @@ class ScreenTesterGUI(tk.Tk):
              return
         detected_state = self.last_recognition_result.get('state')
         logging.info(f"CONFIRMACIÓN: Estado '{detected_state}' detectado correctamente.")
+        self._record_feedback(EVENT_CONFIRM)
         self.status_message(f"Detección '{detected_state}' confirmada.")
         if self.results_panel: self.results_panel.disable_confirm_deny()
         if self.correction_panel: self.correction_panel.hide()
@@ -359,6 +377,7 @@ class ScreenTesterGUI(tk.Tk):
              return
         original_state = self.last_recognition_result.get('state')
         logging.info(f"NEGACIÓN: Detección '{original_state}' incorrecta.")
+        self._record_feedback(EVENT_DENY)
         self.status_message(f"Detección '{original_state}' negada. Seleccione corrección.")
 
         if self.results_panel:
@@ -410,11 +429,21 @@ class ScreenTesterGUI(tk.Tk):
         if selected_state:
             log_message = f"CORRECCIÓN MANUAL: Detección original '{original_state}' -> Corregido a '{selected_state}'"
             logging.info(log_message)
+            self._record_feedback(EVENT_CORRECT, selected_state)
             self.status_message(f"Corrección a '{selected_state}' registrada en log.")
         else:
             messagebox.showwarning("Sin Selección", "Seleccione un estado correcto antes de registrar.")
             self.status_message("Seleccione un estado para registrar.", level=logging.WARNING)
 
+    def _record_feedback(self, event, correct_state=None):
+        """Guarda la confirmación/corrección como dato etiquetado (ver feedback_store.py)."""
+        if not self.last_recognition_result:
+            return
+        try:
+            self.feedback_store.record(self.last_recognition_result, event, correct_state)
+        except Exception as e:
+            logging.warning(f"No se pudo registrar el feedback '{event}': {e}")
+
     # --- Métodos OCR (IMPLEMENTADOS) ---
 
     def confirm_ocr_text(self, selected_details):
@@ -786,6 +815,7 @@ class ScreenTesterGUI(tk.Tk):
         logging.info("Solicitud de cierre...")
         if force or messagebox.askokcancel("Salir", "¿Está seguro de que desea salir?"):
             logging.info(f"{'='*20} Aplicación cerrada {'='*20}")
+            if self.recognizer: self.recognizer.close()
             self.destroy()
 
 # --- Punto de Entrada Principal ---
@@ -0,0 +1,204 @@
+"""
+Escritura asíncrona de capturas de pantalla.
+
+Los flujos (BannerSkipper, MatchPlayer, PlayerSigner, PlayerTrainer...)
+guardan capturas en puntos clave. Codificar un PNG 4K lleva más de 100 ms,
+así que ScreenshotWriter sólo copia el frame en la cola y un hilo aparte lo
+codifica y escribe (de forma atómica: archivo temporal y os.replace).
+
+- Límite de ritmo: se descartan las capturas que llegan antes de
+  min_interval_s desde la anterior aceptada para la misma ruta.
+- Sobrecarga: con la cola llena se descarta la captura más antigua.
+- Al salir del proceso se vacía la cola (atexit) antes de terminar.
+"""
+
+import atexit
+import collections
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, Optional
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger('screenshot_writer')
+
+DEFAULT_QUEUE_SIZE = 8
+DEFAULT_MIN_INTERVAL_S = 0.5   # Misma ruta: como mucho una captura cada medio segundo
+DEFAULT_PNG_COMPRESSION = 1    # 0-9: 1 es mucho más rápido que el 3 por defecto de OpenCV
+DEFAULT_JPEG_QUALITY = 90
+EXIT_FLUSH_TIMEOUT_S = 10.0
+ENCODE_EMA_ALPHA = 0.2
+
+FORMATS = ('png', 'jpg', 'webp')
+
+
+class ScreenshotWriter:
+    """
+    Cola de capturas con un hilo codificador.
+    """
+
+    def __init__(self, image_format: Optional[str] = None, png_compression: int = DEFAULT_PNG_COMPRESSION,
+                 jpeg_quality: int = DEFAULT_JPEG_QUALITY, queue_size: int = DEFAULT_QUEUE_SIZE,
+                 min_interval_s: float = DEFAULT_MIN_INTERVAL_S):
+        """
+        Args:
+            image_format: 'png', 'jpg' o 'webp'. Si se indica, sustituye la extensión
+                          del nombre pedido; si no, se usa la del nombre.
+            png_compression: Nivel de compresión PNG (0-9).
+            jpeg_quality: Calidad JPEG/WebP (0-100).
+            queue_size: Capturas pendientes como máximo (se descarta la más antigua).
+            min_interval_s: Intervalo mínimo entre capturas aceptadas para una misma ruta.
+        """
+        if image_format is not None and image_format.lower() not in FORMATS:
+            raise ValueError(f"Formato no soportado: {image_format} (válidos: {FORMATS})")
+        self.image_format = image_format.lower() if image_format else None
+        self.png_compression = png_compression
+        self.jpeg_quality = jpeg_quality
+        self.min_interval_s = min_interval_s
+        self.stats = {'queued': 0, 'written': 0, 'dropped': 0, 'rate_limited': 0, 'errors': 0,
+                      'encode_time_s': 0.0, 'last_encode_s': 0.0, 'encode_ema_s': 0.0}
+
+        self._queue = collections.deque()
+        self._queue_size = queue_size
+        self._cond = threading.Condition()
+        self._in_flight = 0
+        self._last_accepted: Dict[str, float] = {}
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="ScreenshotWriter", daemon=True)
+        self._thread.start()
+        atexit.register(self.close, EXIT_FLUSH_TIMEOUT_S)
+
+    def _resolve_path(self, path: str) -> str:
+        if self.image_format is None:
+            return path if os.path.splitext(path)[1] else f"{path}.png"
+        return f"{os.path.splitext(path)[0]}.{self.image_format}"
+
+    def _encode_params(self, extension: str):
+        if extension == '.png':
+            return [cv2.IMWRITE_PNG_COMPRESSION, self.png_compression]
+        if extension in ('.jpg', '.jpeg'):
+            return [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality]
+        if extension == '.webp':
+            return [cv2.IMWRITE_WEBP_QUALITY, self.jpeg_quality]
+        return []
+
+    def submit(self, image: np.ndarray, path: str, copy: bool = True) -> Optional[str]:
+        """
+        Encola una imagen para guardarla.
+
+        Args:
+            image: Imagen BGR o gris.
+            path: Ruta de destino (la extensión puede cambiar según image_format).
+            copy: Copiar la imagen (necesario si el buffer se reutiliza, p.ej. el pool de frames).
+
+        Returns:
+            Ruta final del archivo, o None si se descartó por el límite de ritmo o
+            el escritor está cerrado.
+        """
+        path = self._resolve_path(path)
+        now = time.monotonic()
+        with self._cond:
+            if self._closed:
+                logger.warning(f"Escritor de capturas cerrado: no se guarda {path}")
+                return None
+            last = self._last_accepted.get(path)
+            if last is not None and now - last < self.min_interval_s:
+                self.stats['rate_limited'] += 1
+                return None
+            self._last_accepted[path] = now
+            if len(self._queue) >= self._queue_size:
+                dropped = self._queue.popleft()
+                self.stats['dropped'] += 1
+                logger.warning(f"Cola de capturas llena: se descarta {dropped[1]}")
+            self._queue.append((np.array(image, copy=True) if copy else image, path))
+            self.stats['queued'] += 1
+            self._cond.notify_all()
+        return path
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._queue and not self._closed:
+                    self._cond.wait()
+                if not self._queue:
+                    return  # Cerrado y vacío
+                image, path = self._queue.popleft()
+                self._in_flight += 1
+            try:
+                self._write(image, path)
+            finally:
+                with self._cond:
+                    self._in_flight -= 1
+                    self._cond.notify_all()
+
+    def _write(self, image: np.ndarray, path: str) -> None:
+        started = time.perf_counter()
+        extension = os.path.splitext(path)[1].lower()
+        try:
+            ok, encoded = cv2.imencode(extension, image, self._encode_params(extension))
+            if not ok:
+                raise ValueError("cv2.imencode falló")
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            temp_path = f"{path}.tmp"
+            with open(temp_path, "wb") as f:
+                f.write(encoded.tobytes())
+            os.replace(temp_path, path)
+            self.stats['written'] += 1
+            logger.debug(f"Captura guardada: {path}")
+        except (OSError, ValueError, cv2.error) as e:
+            self.stats['errors'] += 1
+            logger.error(f"No se pudo guardar la captura {path}: {e}")
+        elapsed = time.perf_counter() - started
+        self.stats['encode_time_s'] += elapsed
+        self.stats['last_encode_s'] = elapsed
+        ema = self.stats['encode_ema_s']
+        self.stats['encode_ema_s'] = elapsed if ema == 0.0 else ema + ENCODE_EMA_ALPHA * (elapsed - ema)
+
+    @property
+    def queue_depth(self) -> int:
+        """Capturas pendientes (en cola y codificándose)."""
+        with self._cond:
+            return len(self._queue) + self._in_flight
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Contadores, profundidad de cola y tiempos de codificación."""
+        stats = dict(self.stats)
+        stats['queue_depth'] = self.queue_depth
+        stats['mean_encode_s'] = stats['encode_time_s'] / stats['written'] if stats['written'] else 0.0
+        return stats
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """
+        Espera a que se escriban todas las capturas pendientes.
+
+        Returns:
+            True si la cola quedó vacía antes del timeout.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self._queue or self._in_flight:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def close(self, timeout: Optional[float] = EXIT_FLUSH_TIMEOUT_S) -> None:
+        """Escribe lo pendiente y detiene el hilo (idempotente; también se llama al salir)."""
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            logger.warning(f"Quedaron {self.queue_depth} capturas sin guardar al cerrar.")
+        try:
+            atexit.unregister(self.close)
+        except Exception:
+            pass
@@ -23,10 +23,14 @@ from typing import Dict, List, Any, Optional, Tuple, Union
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 # Importar módulos necesarios
-from config_interface.config_manager import ConfigManager, SequenceBuilder, ActionSequence
+from config_interface.config_manager import ConfigManager, SequenceBuilder, ActionSequence, describe_action, action_depths
+from config_interface.config_gui import ActionDialog
+from config_interface.config_cli import print_action_menu, add_state_action, ACTION_CHOICES
 from src.screen_recognizer import ScreenRecognizer
 from src.gamepad_controller import GamepadController
 from src.cursor_navigator import CursorNavigator
+from frame_bus import open_reader_from_env
+from session_recorder import SessionRecorder, COMPRESSION_ZLIB, new_session_path
 
 # Configuración de logging
 logging.basicConfig(
@@ -48,11 +52,13 @@ class SequenceWizard:
         self.screen_recognizer = ScreenRecognizer()
         self.gamepad_controller = GamepadController()
         self.cursor_navigator = CursorNavigator(self.gamepad_controller, self.screen_recognizer)
+        self.frame_bus = open_reader_from_env()  # Frames de la automatización, si está publicando
         
         # Estado del asistente
         self.current_sequence = None
         self.recording = False
         self.last_screenshot = None
+        self.session_recorder = None  # Frames y entradas de la grabación en curso
         self.selected_elements = []
         self.recorded_actions = []
         
@@ -63,7 +69,8 @@ class SequenceWizard:
             'auto_save_interval': 60,  # segundos
             'max_recording_time': 300,  # segundos
             'image_save_dir': os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'images'),
-            'temp_dir': os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'temp')
+            'temp_dir': os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'temp'),
+            'session_dir': os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'temp', 'sessions')
         }
         
         # Crear directorios si no existen
@@ -180,6 +187,12 @@ class SequenceWizard:
             self.current_sequence = self.sequence_builder.create_sequence(name, description)
             self.recorded_actions = []
             
+            # Grabar los frames y las entradas del gamepad de la sesión (ver session_recorder.py)
+            self.session_recorder = SessionRecorder(
+                new_session_path("wizard", self.config['session_dir']), compression=COMPRESSION_ZLIB,
+                metadata={'source': 'sequence_wizard', 'sequence': name})
+            self.session_recorder.attach_gamepad(self.gamepad_controller)
+            
             # Iniciar grabación
             self.recording = True
             self.record_button.config(text="Detener Grabación")
@@ -192,8 +205,14 @@ class SequenceWizard:
         else:
             # Detener grabación
             self.recording = False
+            recorder, self.session_recorder = self.session_recorder, None
+            if recorder is not None:
+                recorder.close()
             self.record_button.config(text="Iniciar Grabación")
-            self.status_var.set("Grabación detenida")
+            if recorder is not None and recorder.frame_count:
+                self.status_var.set(f"Grabación detenida ({recorder.frame_count} frames en {recorder.path})")
+            else:
+                self.status_var.set("Grabación detenida")
             
             # Actualizar lista de acciones
             self._update_actions_tree()
@@ -242,14 +261,22 @@ class SequenceWizard:
         Captura una imagen de la pantalla (para uso interno).
         """
         try:
-            # Capturar pantalla
-            screenshot = pyautogui.screenshot()
-            self.last_screenshot = np.array(screenshot)
-            self.last_screenshot = cv2.cvtColor(self.last_screenshot, cv2.COLOR_RGB2BGR)
+            # Usar el frame publicado en el bus compartido si existe (evita una captura extra)
+            frame = None
+            if self.frame_bus is not None:
+                frame, _ = self.frame_bus.read_latest(copy=True)
+            if frame is not None:
+                self.last_screenshot = frame
+            else:
+                # Capturar pantalla
+                screenshot = pyautogui.screenshot()
+                self.last_screenshot = np.array(screenshot)
+                self.last_screenshot = cv2.cvtColor(self.last_screenshot, cv2.COLOR_RGB2BGR)
             
-            # Guardar captura temporal
-            temp_file = os.path.join(self.config['temp_dir'], "last_screenshot.png")
-            cv2.imwrite(temp_file, self.last_screenshot)
+            # Añadir el frame a la sesión grabada (sin codificar PNG en cada tick)
+            recorder = self.session_recorder
+            if self.recording and recorder is not None:
+                recorder.add_frame(self.last_screenshot)
             
             # Actualizar canvas
             self.root.after(0, self._update_canvas)
@@ -445,27 +472,10 @@ class SequenceWizard:
         if not self.current_sequence:
             return
         
-        for i, action in enumerate(self.current_sequence.actions):
-            action_type = action['type']
-            params = action['params']
-            
-            details = ""
-            if action_type == 'button_press':
-                details = f"Botón: {params['button']}, Duración: {params.get('duration', 0.1)}s"
-            elif action_type == 'wait_for_image':
-                details = f"Imagen: {params['image_name']}, Timeout: {params.get('timeout', 10.0)}s"
-            elif action_type == 'move_cursor':
-                target_type = params['target_type']
-                if target_type == 'image':
-                    details = f"A imagen: {params['image_name']}"
-                elif target_type == 'coordinates':
-                    details = f"A coordenadas: ({params['x']}, {params['y']})"
-                elif target_type == 'element':
-                    details = f"A elemento: {params['element_id']}"
-            elif action_type == 'wait':
-                details = f"Tiempo: {params['seconds']}s"
-            
-            self.actions_tree.insert("", tk.END, values=(action_type, details))
+        actions = self.current_sequence.actions
+        for action, depth in zip(actions, action_depths(actions)):
+            # Sangrar el tipo según el bloque (if_state/loop) en el que está la acción
+            self.actions_tree.insert("", tk.END, values=("    " * depth + action['type'], describe_action(action)))
     
     def _edit_action(self):
         """
@@ -620,16 +630,11 @@ class SequenceWizard:
         print("\nCreando secuencia. Selecciona el tipo de acción a añadir:")
         
         while True:
-            print("\nTipos de acciones disponibles:")
-            print("1. Pulsar botón")
-            print("2. Esperar imagen")
-            print("3. Mover cursor")
-            print("4. Esperar tiempo")
-            print("5. Guardar y salir")
+            save_choice = print_action_menu()
             
-            choice = input("\nSelecciona una acción (1-5): ")
+            choice = input(f"\nSelecciona una acción (1-{save_choice}): ")
             
-            if choice == '5' or choice.lower() == 'fin':
+            if choice == save_choice or choice.lower() == 'fin':
                 break
             
             try:
@@ -641,6 +646,8 @@ class SequenceWizard:
                     self._cli_add_move_cursor()
                 elif choice == '4':
                     self._cli_add_wait()
+                elif choice.isdigit() and 1 <= int(choice) <= len(ACTION_CHOICES):
+                    add_state_action(self.sequence_builder, ACTION_CHOICES[int(choice) - 1])
                 else:
                     print("Opción no válida.")
             except Exception as e:
@@ -736,312 +743,6 @@ class SequenceWizard:
             print("Tiempo no válido")
 
 
-class ActionDialog:
-    """
-    Diálogo para añadir o editar una acción.
-    """
-    def __init__(self, parent, action_type=None, params=None):
-        """
-        Inicializa el diálogo.
-        
-        Args:
-            parent: Ventana padre
-            action_type: Tipo de acción (para edición)
-            params: Parámetros de la acción (para edición)
-        """
-        self.top = tk.Toplevel(parent)
-        self.top.title("Acción")
-        self.top.transient(parent)
-        self.top.grab_set()
-        
-        self.result = None
-        self.action_type = action_type
-        self.params = params or {}
-        
-        # Tipo de acción
-        ttk.Label(self.top, text="Tipo de acción:").grid(row=0, column=0, sticky=tk.W, padx=5, pady=5)
-        
-        self.type_var = tk.StringVar()
-        if action_type:
-            self.type_var.set(action_type)
-        
-        type_combo = ttk.Combobox(self.top, textvariable=self.type_var, state="readonly")
-        type_combo["values"] = ("button_press", "wait_for_image", "move_cursor", "wait")
-        type_combo.grid(row=0, column=1, padx=5, pady=5)
-        type_combo.bind("<<ComboboxSelected>>", self._on_type_change)
-        
-        # Frame para parámetros (cambia según el tipo)
-        self.params_frame = ttk.Frame(self.top)
-        self.params_frame.grid(row=1, column=0, columnspan=2, padx=5, pady=5, sticky=tk.W+tk.E)
-        
-        # Botones
-        btn_frame = ttk.Frame(self.top)
-        btn_frame.grid(row=2, column=0, columnspan=2, pady=10)
-        
-        ttk.Button(btn_frame, text="Aceptar", command=self._on_ok).pack(side=tk.LEFT, padx=5)
-        ttk.Button(btn_frame, text="Cancelar", command=self._on_cancel).pack(side=tk.LEFT, padx=5)
-        
-        # Si se está editando, mostrar los parámetros
-        if action_type:
-            self._on_type_change(None)
-        
-        # Centrar diálogo
-        self.top.update_idletasks()
-        width = self.top.winfo_width()
-        height = self.top.winfo_height()
-        x = (self.top.winfo_screenwidth() // 2) - (width // 2)
-        y = (self.top.winfo_screenheight() // 2) - (height // 2)
-        self.top.geometry('{}x{}+{}+{}'.format(width, height, x, y))
-    
-    def _on_type_change(self, event):
-        """
-        Maneja el cambio de tipo de acción.
-        """
-        # Limpiar frame de parámetros
-        for widget in self.params_frame.winfo_children():
-            widget.destroy()
-        
-        action_type = self.type_var.get()
-        
-        if action_type == "button_press":
-            self._create_button_press_params()
-        elif action_type == "wait_for_image":
-            self._create_wait_for_image_params()
-        elif action_type == "move_cursor":
-            self._create_move_cursor_params()
-        elif action_type == "wait":
-            self._create_wait_params()
-    
-    def _create_button_press_params(self):
-        """
-        Crea los widgets para los parámetros de pulsación de botón.
-        """
-        ttk.Label(self.params_frame, text="Botón:").grid(row=0, column=0, sticky=tk.W, padx=5, pady=5)
-        
-        self.button_var = tk.StringVar()
-        if 'button' in self.params:
-            self.button_var.set(self.params['button'])
-        
-        button_combo = ttk.Combobox(self.params_frame, textvariable=self.button_var)
-        button_combo["values"] = ("A", "B", "X", "Y", "LB", "RB", "LT", "RT", "START", "SELECT", 
-                                 "DPAD_UP", "DPAD_DOWN", "DPAD_LEFT", "DPAD_RIGHT")
-        button_combo.grid(row=0, column=1, padx=5, pady=5)
-        
-        ttk.Label(self.params_frame, text="Duración (s):").grid(row=1, column=0, sticky=tk.W, padx=5, pady=5)
-        
-        self.duration_var = tk.StringVar()
-        if 'duration' in self.params:
-            self.duration_var.set(str(self.params['duration']))
-        else:
-            self.duration_var.set("0.1")
-        
-        ttk.Entry(self.params_frame, textvariable=self.duration_var, width=10).grid(row=1, column=1, padx=5, pady=5, sticky=tk.W)
-    
-    def _create_wait_for_image_params(self):
-        """
-        Crea los widgets para los parámetros de espera de imagen.
-        """
-        ttk.Label(self.params_frame, text="Imagen:").grid(row=0, column=0, sticky=tk.W, padx=5, pady=5)
-        
-        self.image_var = tk.StringVar()
-        if 'image_name' in self.params:
-            self.image_var.set(self.params['image_name'])
-        
-        image_entry = ttk.Entry(self.params_frame, textvariable=self.image_var, width=30)
-        image_entry.grid(row=0, column=1, padx=5, pady=5)
-        
-        ttk.Button(self.params_frame, text="Examinar...", command=self._browse_image).grid(row=0, column=2, padx=5, pady=5)
-        
-        ttk.Label(self.params_frame, text="Timeout (s):").grid(row=1, column=0, sticky=tk.W, padx=5, pady=5)
-        
-        self.timeout_var = tk.StringVar()
-        if 'timeout' in self.params:
-            self.timeout_var.set(str(self.params['timeout']))
-        else:
-            self.timeout_var.set("10.0")
-        
-        ttk.Entry(self.params_frame, textvariable=self.timeout_var, width=10).grid(row=1, column=1, padx=5, pady=5, sticky=tk.W)
-    
-    def _create_move_cursor_params(self):
-        """
-        Crea los widgets para los parámetros de movimiento del cursor.
-        """
-        ttk.Label(self.params_frame, text="Tipo de objetivo:").grid(row=0, column=0, sticky=tk.W, padx=5, pady=5)
-        
-        self.target_type_var = tk.StringVar()
-        if 'target_type' in self.params:
-            self.target_type_var.set(self.params['target_type'])
-        else:
-            self.target_type_var.set("image")
-        
-        target_combo = ttk.Combobox(self.params_frame, textvariable=self.target_type_var, state="readonly")
-        target_combo["values"] = ("image", "coordinates", "element")
-        target_combo.grid(row=0, column=1, padx=5, pady=5)
-        target_combo.bind("<<ComboboxSelected>>", self._on_target_type_change)
-        
-        # Frame para parámetros específicos del tipo de objetivo
-        self.target_params_frame = ttk.Frame(self.params_frame)
-        self.target_params_frame.grid(row=1, column=0, columnspan=2, padx=5, pady=5, sticky=tk.W+tk.E)
-        
-        # Mostrar parámetros según el tipo de objetivo
-        self._on_target_type_change(None)
-    
-    def _on_target_type_change(self, event):
-        """
-        Maneja el cambio de tipo de objetivo para el movimiento del cursor.
-        """
-        # Limpiar frame de parámetros de objetivo
-        for widget in self.target_params_frame.winfo_children():
-            widget.destroy()
-        
-        target_type = self.target_type_var.get()
-        
-        if target_type == "image":
-            ttk.Label(self.target_params_frame, text="Imagen:").grid(row=0, column=0, sticky=tk.W, padx=5, pady=5)
-            
-            self.target_image_var = tk.StringVar()
-            if 'image_name' in self.params:
-                self.target_image_var.set(self.params['image_name'])
-            
-            ttk.Entry(self.target_params_frame, textvariable=self.target_image_var, width=30).grid(row=0, column=1, padx=5, pady=5)
-            ttk.Button(self.target_params_frame, text="Examinar...", command=self._browse_target_image).grid(row=0, column=2, padx=5, pady=5)
-        
-        elif target_type == "coordinates":
-            ttk.Label(self.target_params_frame, text="X:").grid(row=0, column=0, sticky=tk.W, padx=5, pady=5)
-            
-            self.target_x_var = tk.StringVar()
-            if 'x' in self.params:
-                self.target_x_var.set(str(self.params['x']))
-            
-            ttk.Entry(self.target_params_frame, textvariable=self.target_x_var, width=10).grid(row=0, column=1, padx=5, pady=5, sticky=tk.W)
-            
-            ttk.Label(self.target_params_frame, text="Y:").grid(row=1, column=0, sticky=tk.W, padx=5, pady=5)
-            
-            self.target_y_var = tk.StringVar()
-            if 'y' in self.params:
-                self.target_y_var.set(str(self.params['y']))
-            
-            ttk.Entry(self.target_params_frame, textvariable=self.target_y_var, width=10).grid(row=1, column=1, padx=5, pady=5, sticky=tk.W)
-        
-        elif target_type == "element":
-            ttk.Label(self.target_params_frame, text="ID del elemento:").grid(row=0, column=0, sticky=tk.W, padx=5, pady=5)
-            
-            self.target_element_var = tk.StringVar()
-            if 'element_id' in self.params:
-                self.target_element_var.set(self.params['element_id'])
-            
-            ttk.Entry(self.target_params_frame, textvariable=self.target_element_var, width=30).grid(row=0, column=1, padx=5, pady=5)
-    
-    def _create_wait_params(self):
-        """
-        Crea los widgets para los parámetros de espera.
-        """
-        ttk.Label(self.params_frame, text="Tiempo (s):").grid(row=0, column=0, sticky=tk.W, padx=5, pady=5)
-        
-        self.wait_seconds_var = tk.StringVar()
-        if 'seconds' in self.params:
-            self.wait_seconds_var.set(str(self.params['seconds']))
-        else:
-            self.wait_seconds_var.set("1.0")
-        
-        ttk.Entry(self.params_frame, textvariable=self.wait_seconds_var, width=10).grid(row=0, column=1, padx=5, pady=5, sticky=tk.W)
-    
-    def _browse_image(self):
-        """
-        Abre un diálogo para seleccionar una imagen.
-        """
-        filename = filedialog.askopenfilename(
-            title="Seleccionar imagen",
-            filetypes=[("Imágenes", "*.png;*.jpg;*.jpeg;*.bmp")]
-        )
-        
-        if filename:
-            self.image_var.set(os.path.basename(filename))
-    
-    def _browse_target_image(self):
-        """
-        Abre un diálogo para seleccionar una imagen objetivo.
-        """
-        filename = filedialog.askopenfilename(
-            title="Seleccionar imagen objetivo",
-            filetypes=[("Imágenes", "*.png;*.jpg;*.jpeg;*.bmp")]
-        )
-        
-        if filename:
-            self.target_image_var.set(os.path.basename(filename))
-    
-    def _on_ok(self):
-        """
-        Maneja el botón Aceptar.
-        """
-        action_type = self.type_var.get()
-        
-        if not action_type:
-            messagebox.showerror("Error", "Selecciona un tipo de acción")
-            return
-        
-        params = {}
-        
-        try:
-            if action_type == "button_press":
-                button = self.button_var.get()
-                if not button:
-                    messagebox.showerror("Error", "Selecciona un botón")
-                    return
-                
-                params['button'] = button
-                params['duration'] = float(self.duration_var.get())
-            
-            elif action_type == "wait_for_image":
-                image_name = self.image_var.get()
-                if not image_name:
-                    messagebox.showerror("Error", "Especifica una imagen")
-                    return
-                
-                params['image_name'] = image_name
-                params['timeout'] = float(self.timeout_var.get())
-            
-            elif action_type == "move_cursor":
-                target_type = self.target_type_var.get()
-                params['target_type'] = target_type
-                
-                if target_type == "image":
-                    image_name = self.target_image_var.get()
-                    if not image_name:
-                        messagebox.showerror("Error", "Especifica una imagen objetivo")
-                        return
-                    
-                    params['image_name'] = image_name
-                
-                elif target_type == "coordinates":
-                    params['x'] = int(self.target_x_var.get())
-                    params['y'] = int(self.target_y_var.get())
-                
-                elif target_type == "element":
-                    element_id = self.target_element_var.get()
-                    if not element_id:
-                        messagebox.showerror("Error", "Especifica un ID de elemento")
-                        return
-                    
-                    params['element_id'] = element_id
-            
-            elif action_type == "wait":
-                params['seconds'] = float(self.wait_seconds_var.get())
-        
-        except ValueError:
-            messagebox.showerror("Error", "Valor numérico no válido")
-            return
-        
-        self.result = (action_type, params)
-        self.top.destroy()
-    
-    def _on_cancel(self):
-        """
-        Maneja el botón Cancelar.
-        """
-        self.top.destroy()
-
-
 def main():
     """
     Función principal para ejecutar el asistente.
@@ -0,0 +1,694 @@
+"""
+Grabación de sesiones en un contenedor de frames sin PNG, con reproducción por mmap.
+
+Reproducir sesiones guardadas como PNG consume casi todo el tiempo en
+decodificar, y codificar cada captura 4K en PNG cuesta cientos de
+milisegundos. SessionRecorder escribe los frames de tamaño fijo (gris o BGR)
+en bloques crudos o comprimidos con zlib nivel 1, junto con sus marcas de
+tiempo y los eventos de entrada (gamepad, acciones, metadatos del frame).
+La compresión y la escritura se hacen en un hilo aparte: el llamador sólo
+paga la copia del frame al bloque en curso.
+
+SessionReader abre el archivo con mmap: en los contenedores crudos cada frame
+es una vista de solo lectura sobre el archivo, sin copia ni decodificación.
+ReplaySource lo expone como origen de frames de ScreenRecognizer
+(read_latest), de modo que una sesión grabada sirve como benchmark o como
+prueba de regresión del reconocimiento.
+
+Formato (little-endian):
+    Cabecera:   magic, versión, ancho, alto, canales, compresión,
+                frames por bloque, fecha de creación, longitud de metadatos
+                (HEADER_SIZE bytes) + metadatos JSON de la sesión.
+    Bloque i:   'CHNK', nº frames, longitud de eventos, índice del primer
+                frame, longitud de datos; marcas de tiempo (float64 x n),
+                eventos JSON y los n frames (crudos o zlib).
+
+Cada bloque lleva sus propios eventos, así que el índice se reconstruye al
+abrir recorriendo las cabeceras; una grabación interrumpida conserva todos
+los bloques completos.
+
+Uso:
+    python session_recorder.py record ../temp/sessions/prueba.efrec --duration 60 --interval 0.25
+    python session_recorder.py info ../temp/sessions/prueba.efrec
+    python session_recorder.py replay ../temp/sessions/prueba.efrec --recognize
+    python session_recorder.py bench ../images/menu_principal_20250410_130434.png --frames 20
+"""
+
+import argparse
+import bisect
+import json
+import logging
+import mmap
+import os
+import queue
+import struct
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger('session_recorder')
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SESSIONS_DIR = os.path.join(PROJECT_DIR, "temp", "sessions")
+SESSION_EXTENSION = ".efrec"
+
+COMPRESSION_RAW = 'raw'
+COMPRESSION_ZLIB = 'zlib'
+_COMPRESSION_CODES = {COMPRESSION_RAW: 0, COMPRESSION_ZLIB: 1}
+
+DEFAULT_CHUNK_BYTES = 32 * 1024 * 1024  # Tamaño objetivo de un bloque (1 frame 4K BGR, 4 en gris)
+DEFAULT_ZLIB_LEVEL = 1                  # Compresión ligera: las capturas de menús comprimen bien
+WRITE_QUEUE_CHUNKS = 2                  # Bloques pendientes de escribir antes de frenar al llamador
+
+_MAGIC = b"EFREC01\0"
+_VERSION = 1
+_HEADER = struct.Struct("<8sIIIIIIdI")  # magic, versión, ancho, alto, canales, compresión, frames/bloque, creado, len meta
+_HEADER_SIZE = 64
+_CHUNK_MAGIC = b"CHNK"
+_CHUNK_HEADER = struct.Struct("<4sIIQQ")  # magic, nº frames, len eventos, primer frame, len datos
+
+
+def new_session_path(prefix: str = "session", directory: str = SESSIONS_DIR) -> str:
+    """Ruta para una nueva grabación: <directory>/<prefix>_YYYYMMDD_HHMMSS.efrec"""
+    return os.path.join(directory, f"{prefix}_{time.strftime('%Y%m%d_%H%M%S')}{SESSION_EXTENSION}")
+
+
+class SessionRecorder:
+    """
+    Escritor del contenedor de sesión.
+
+    El tamaño de frame queda fijado por el primer frame (o por width/height);
+    los frames de otro tamaño se redimensionan. También puede usarse como
+    frame_publisher de ScreenRecognizer (método publish) y registrar las
+    entradas del gamepad con attach_gamepad().
+    """
+
+    def __init__(self, path: str, channels: int = 3, compression: str = COMPRESSION_RAW,
+                 width: Optional[int] = None, height: Optional[int] = None,
+                 chunk_bytes: int = DEFAULT_CHUNK_BYTES, zlib_level: int = DEFAULT_ZLIB_LEVEL,
+                 metadata: Optional[Dict[str, Any]] = None):
+        """
+        Args:
+            path: Archivo de salida (se crea el directorio si no existe).
+            channels: 1 (gris) o 3 (BGR).
+            compression: COMPRESSION_RAW o COMPRESSION_ZLIB.
+            width, height: Tamaño fijo de los frames (por defecto, el del primer frame).
+            chunk_bytes: Tamaño aproximado de cada bloque.
+            zlib_level: Nivel de compresión zlib (1 = rápido).
+            metadata: Metadatos de la sesión (se guardan en la cabecera).
+        """
+        if channels not in (1, 3):
+            raise ValueError(f"Canales no soportados: {channels} (1 o 3)")
+        if compression not in _COMPRESSION_CODES:
+            raise ValueError(f"Compresión no soportada: {compression} (válidas: {list(_COMPRESSION_CODES)})")
+        self.path = path
+        self.channels = channels
+        self.compression = compression
+        self.width = width
+        self.height = height
+        self.chunk_bytes = chunk_bytes
+        self.zlib_level = zlib_level
+        self.metadata = dict(metadata or {})
+        self.frames_per_chunk = 0
+        self.frame_count = 0
+        self.stats = {'frames': 0, 'chunks': 0, 'raw_bytes': 0, 'written_bytes': 0,
+                      'add_time_s': 0.0, 'write_time_s': 0.0}
+
+        self._lock = threading.Lock()
+        self._file = None
+        self._free: "queue.Queue[np.ndarray]" = queue.Queue()
+        self._pending: "queue.Queue[Optional[tuple]]" = queue.Queue(maxsize=WRITE_QUEUE_CHUNKS)
+        self._writer: Optional[threading.Thread] = None
+        self._writer_error: Optional[BaseException] = None
+        self._buffer: Optional[np.ndarray] = None
+        self._buffer_frames = 0
+        self._buffer_first = 0
+        self._timestamps: List[float] = []
+        self._events: List[Dict[str, Any]] = []
+        self._gamepads = []
+        self._closed = False
+
+    # --- Escritura ---
+
+    def _open(self, frame_shape: Tuple[int, int], region=None) -> None:
+        """Escribe la cabecera y arranca el hilo escritor (con el primer frame)."""
+        if self.width is None or self.height is None:
+            self.height, self.width = frame_shape
+        frame_bytes = self.width * self.height * self.channels
+        self.frames_per_chunk = max(1, self.chunk_bytes // frame_bytes)
+        if region and 'region' not in self.metadata:
+            self.metadata['region'] = region
+        self.metadata.setdefault('created', time.time())
+        meta = json.dumps(self.metadata, ensure_ascii=False, default=str).encode("utf-8")
+
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self._file = open(self.path, "wb")
+        header = _HEADER.pack(_MAGIC, _VERSION, self.width, self.height, self.channels,
+                              _COMPRESSION_CODES[self.compression], self.frames_per_chunk,
+                              self.metadata['created'], len(meta))
+        self._file.write(header.ljust(_HEADER_SIZE, b"\0"))
+        self._file.write(meta)
+
+        # Un bloque llenándose y WRITE_QUEUE_CHUNKS en cola: la memoria queda acotada
+        shape = (self.frames_per_chunk, self.height, self.width) + ((self.channels,) if self.channels == 3 else ())
+        for _ in range(WRITE_QUEUE_CHUNKS + 1):
+            self._free.put(np.empty(shape, dtype=np.uint8))
+        self._buffer = self._free.get()
+        self._writer = threading.Thread(target=self._write_loop, name="SessionRecorderWriter", daemon=True)
+        self._writer.start()
+        logger.info(f"Grabando sesión en {self.path} ({self.width}x{self.height}x{self.channels}, "
+                    f"{self.compression}, {self.frames_per_chunk} frames/bloque)")
+
+    def _write_loop(self) -> None:
+        while True:
+            item = self._pending.get()
+            if item is None:
+                return
+            buffer, count, first, timestamps, events = item
+            started = time.perf_counter()
+            try:
+                payload = memoryview(buffer[:count]).cast('B') if count else b""
+                if self.compression == COMPRESSION_ZLIB and count:
+                    payload = zlib.compress(payload, self.zlib_level)
+                events_raw = json.dumps(events, ensure_ascii=False, default=str).encode("utf-8") if events else b""
+                self._file.write(_CHUNK_HEADER.pack(_CHUNK_MAGIC, count, len(events_raw), first, len(payload)))
+                self._file.write(np.asarray(timestamps, dtype="<f8").tobytes())
+                self._file.write(events_raw)
+                self._file.write(payload)
+                self.stats['chunks'] += 1
+                self.stats['written_bytes'] += _CHUNK_HEADER.size + 8 * count + len(events_raw) + len(payload)
+            except Exception as e:
+                self._writer_error = e
+                logger.error(f"Error escribiendo la sesión {self.path}: {e}")
+            finally:
+                self.stats['write_time_s'] += time.perf_counter() - started
+                if buffer is not None:
+                    self._free.put(buffer)
+
+    def _flush_chunk(self) -> None:
+        """Entrega el bloque en curso al hilo escritor (bloquea si va por detrás)."""
+        if self._buffer_frames == 0 and not self._events:
+            return
+        item = (self._buffer, self._buffer_frames, self._buffer_first, self._timestamps, self._events)
+        self._pending.put(item)
+        self._buffer = self._free.get()
+        self._buffer_first = self.frame_count
+        self._buffer_frames = 0
+        self._timestamps = []
+        self._events = []
+
+    def _store(self, frame: np.ndarray, dest: np.ndarray) -> None:
+        """Copia (convirtiendo y redimensionando si hace falta) un frame sobre el slot del bloque."""
+        if frame.ndim == 3 and frame.shape[2] == 4:
+            code = cv2.COLOR_BGRA2GRAY if self.channels == 1 else cv2.COLOR_BGRA2BGR
+        elif frame.ndim == 3:
+            code = cv2.COLOR_BGR2GRAY if self.channels == 1 else None
+        else:
+            code = cv2.COLOR_GRAY2BGR if self.channels == 3 else None
+        if frame.shape[:2] != (self.height, self.width):
+            if code is not None:
+                frame = cv2.cvtColor(frame, code)
+                code = None
+            cv2.resize(frame, (self.width, self.height), dst=dest, interpolation=cv2.INTER_AREA)
+        elif code is not None:
+            cv2.cvtColor(frame, code, dst=dest)
+        else:
+            np.copyto(dest, frame)
+
+    def add_frame(self, frame: np.ndarray, timestamp: Optional[float] = None,
+                  metadata: Optional[Dict[str, Any]] = None) -> int:
+        """
+        Añade un frame a la grabación.
+
+        Args:
+            frame: Imagen BGR, BGRA o gris (uint8).
+            timestamp: Marca de tiempo (por defecto, time.time()).
+            metadata: Metadatos del frame (estado reconocido, región...); se
+                      guardan como evento 'frame'.
+
+        Returns:
+            Índice del frame en la grabación.
+        """
+        started = time.perf_counter()
+        timestamp = time.time() if timestamp is None else timestamp
+        with self._lock:
+            if self._closed:
+                raise ValueError("La grabación ya está cerrada")
+            if self._writer_error is not None:
+                raise IOError(f"La escritura de la sesión falló: {self._writer_error}")
+            if self._file is None:
+                self._open(frame.shape[:2], (metadata or {}).get('region'))
+            index = self.frame_count
+            self._store(frame, self._buffer[self._buffer_frames])
+            self._buffer_frames += 1
+            self._timestamps.append(timestamp)
+            if metadata:
+                self._events.append({'ts': timestamp, 'kind': 'frame', 'frame': index, 'data': metadata})
+            self.frame_count += 1
+            self.stats['frames'] += 1
+            self.stats['raw_bytes'] += self.width * self.height * self.channels
+            if self._buffer_frames >= self.frames_per_chunk:
+                self._flush_chunk()
+            self.stats['add_time_s'] += time.perf_counter() - started
+            return index
+
+    def add_event(self, kind: str, timestamp: Optional[float] = None, **data) -> None:
+        """
+        Registra un evento (entrada, acción grabada, marca...) en el índice de la sesión.
+
+        Args:
+            kind: Tipo de evento ('press', 'release', 'action', 'note'...).
+            timestamp: Marca de tiempo (por defecto, time.time()).
+            **data: Datos del evento (serializables a JSON).
+        """
+        event = {'ts': time.time() if timestamp is None else timestamp, 'kind': kind}
+        event.update(data)
+        with self._lock:
+            if not self._closed:
+                self._events.append(event)
+
+    def _on_gamepad_input(self, event: Dict[str, Any]) -> None:
+        with self._lock:
+            if not self._closed:
+                self._events.append(dict(event))
+
+    def attach_gamepad(self, gamepad) -> None:
+        """Registra como eventos las entradas enviadas por un GamepadController."""
+        gamepad.add_input_listener(self._on_gamepad_input)
+        self._gamepads.append(gamepad)
+
+    def publish(self, frame_bgr: np.ndarray, metadata: Optional[Dict[str, Any]] = None) -> int:
+        """Interfaz de frame_publisher (como FrameBusPublisher): graba el frame con sus metadatos."""
+        try:
+            return self.add_frame(frame_bgr, metadata=metadata) + 1
+        except (ValueError, IOError, cv2.error) as e:
+            logger.warning(f"No se pudo grabar el frame: {e}")
+            return 0
+
+    def close(self) -> None:
+        """Escribe el último bloque y cierra el archivo."""
+        for gamepad in self._gamepads:
+            gamepad.remove_input_listener(self._on_gamepad_input)
+        self._gamepads = []
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            if self._file is None:
+                logger.info(f"Grabación {self.path} cerrada sin frames (no se crea el archivo).")
+                return
+            self._flush_chunk()
+        self._pending.put(None)
+        self._writer.join()
+        self._file.close()
+        logger.info(f"Sesión {self.path}: {self.frame_count} frames, "
+                    f"{self.stats['written_bytes'] / 1e6:.1f} MB ({self.stats['raw_bytes'] / 1e6:.1f} MB sin comprimir)")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class SessionReader:
+    """
+    Lector del contenedor de sesión mediante mmap.
+    """
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path: Archivo .efrec.
+
+        Raises:
+            ValueError: Si el archivo no es una sesión compatible.
+        """
+        self.path = path
+        self._file = open(path, "rb")
+        try:
+            self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._file.close()
+            raise ValueError(f"{path}: archivo vacío")
+        if len(self._mm) < _HEADER_SIZE:
+            self.close()
+            raise ValueError(f"{path}: cabecera incompleta")
+        magic, version, width, height, channels, compression, per_chunk, created, meta_len = \
+            _HEADER.unpack_from(self._mm, 0)
+        if magic != _MAGIC or version != _VERSION:
+            self.close()
+            raise ValueError(f"{path}: no es una sesión compatible")
+        self.width, self.height, self.channels = width, height, channels
+        self.compression = COMPRESSION_ZLIB if compression == _COMPRESSION_CODES[COMPRESSION_ZLIB] else COMPRESSION_RAW
+        self.frames_per_chunk = per_chunk
+        self.created = created
+        self.metadata = json.loads(bytes(self._mm[_HEADER_SIZE:_HEADER_SIZE + meta_len]) or b"{}")
+        self.frame_shape = (height, width) + ((channels,) if channels == 3 else ())
+        self._frame_bytes = width * height * channels
+        self._cached_chunk: Tuple[int, Optional[np.ndarray]] = (-1, None)
+        self._scan(_HEADER_SIZE + meta_len)
+
+    def _scan(self, offset: int) -> None:
+        """Recorre las cabeceras de bloque para construir el índice de frames y eventos."""
+        size = len(self._mm)
+        self._chunks = []  # (primer frame, nº frames, offset de datos, longitud de datos)
+        timestamps, events = [], []
+        while offset + _CHUNK_HEADER.size <= size:
+            magic, count, events_len, first, payload_len = _CHUNK_HEADER.unpack_from(self._mm, offset)
+            body = offset + _CHUNK_HEADER.size
+            end = body + 8 * count + events_len + payload_len
+            if magic != _CHUNK_MAGIC or end > size:
+                logger.warning(f"{self.path}: bloque incompleto en el byte {offset} (grabación interrumpida); "
+                               f"se ignora el resto.")
+                break
+            timestamps.append(np.frombuffer(self._mm, dtype="<f8", count=count, offset=body).copy())
+            if events_len:
+                raw = self._mm[body + 8 * count:body + 8 * count + events_len]
+                events.extend(json.loads(raw))
+            if count:
+                self._chunks.append((first, count, body + 8 * count + events_len, payload_len))
+            offset = end
+        self.timestamps = np.concatenate(timestamps) if timestamps else np.empty(0, dtype=np.float64)
+        self._chunk_starts = [chunk[0] for chunk in self._chunks]
+        self.events = sorted(events, key=lambda e: e.get('ts', 0.0))
+        self._event_ts = [e.get('ts', 0.0) for e in self.events]
+        self._frame_meta = {e['frame']: e.get('data') or {} for e in self.events if e.get('kind') == 'frame'}
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+    @property
+    def duration_s(self) -> float:
+        return float(self.timestamps[-1] - self.timestamps[0]) if len(self) > 1 else 0.0
+
+    def frame(self, index: int, copy: bool = False) -> np.ndarray:
+        """
+        Devuelve el frame ``index``.
+
+        En sesiones crudas es una vista de solo lectura sobre el mmap (válida
+        mientras el lector esté abierto); en las comprimidas se descomprime el
+        bloque completo y se conserva el último.
+        """
+        if not 0 <= index < len(self):
+            raise IndexError(f"Frame {index} fuera de rango (0-{len(self) - 1})")
+        chunk_index = bisect.bisect_right(self._chunk_starts, index) - 1
+        first, count, payload_offset, payload_len = self._chunks[chunk_index]
+        position = index - first
+        if self.compression == COMPRESSION_RAW:
+            frame = np.ndarray(self.frame_shape, dtype=np.uint8, buffer=self._mm,
+                               offset=payload_offset + position * self._frame_bytes)
+        else:
+            cached_index, frames = self._cached_chunk
+            if cached_index != chunk_index:
+                raw = zlib.decompress(self._mm[payload_offset:payload_offset + payload_len])
+                frames = np.frombuffer(raw, dtype=np.uint8).reshape((count,) + self.frame_shape)
+                self._cached_chunk = (chunk_index, frames)
+            frame = frames[position]
+        return frame.copy() if copy else frame
+
+    def index_at(self, timestamp: float) -> int:
+        """Índice del último frame grabado en o antes de ``timestamp`` (0 si es anterior al primero)."""
+        return max(0, int(np.searchsorted(self.timestamps, timestamp, side='right')) - 1)
+
+    def frame_at(self, timestamp: float, copy: bool = False) -> np.ndarray:
+        """Frame visible en el instante ``timestamp``."""
+        return self.frame(self.index_at(timestamp), copy)
+
+    def frame_metadata(self, index: int) -> Dict[str, Any]:
+        """Metadatos grabados con el frame (p.ej. el estado reconocido), o {}."""
+        return self._frame_meta.get(index, {})
+
+    def events_between(self, start_ts: float, end_ts: float, kinds=None) -> List[Dict[str, Any]]:
+        """Eventos con start_ts <= ts < end_ts, opcionalmente filtrados por tipo."""
+        lo = bisect.bisect_left(self._event_ts, start_ts)
+        hi = bisect.bisect_left(self._event_ts, end_ts)
+        return [e for e in self.events[lo:hi] if kinds is None or e.get('kind') in kinds]
+
+    def iter_frames(self, start: int = 0, stop: Optional[int] = None) -> Iterator[Tuple[int, float, np.ndarray]]:
+        """Recorre (índice, timestamp, frame) en orden."""
+        for index in range(start, len(self) if stop is None else min(stop, len(self))):
+            yield index, float(self.timestamps[index]), self.frame(index)
+
+    def close(self) -> None:
+        self._cached_chunk = (-1, None)
+        try:
+            self._mm.close()
+        except BufferError:
+            # Quedan vistas de frames vivas: el mapeo se libera cuando se recolecten
+            logger.debug(f"{self.path}: mmap aún referenciado, se cerrará al liberar los frames.")
+        except AttributeError:
+            pass
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class ReplaySource:
+    """
+    Origen de frames (read_latest) que reproduce una sesión grabada, para
+    usar como ScreenRecognizer(frame_source=...).
+
+    Por defecto cada lectura avanza un frame (reproducción tan rápida como el
+    consumidor); con realtime=True se devuelve el frame correspondiente al
+    tiempo transcurrido desde la primera lectura.
+    """
+
+    def __init__(self, reader: SessionReader, realtime: bool = False, speed: float = 1.0, loop: bool = False):
+        self.reader = reader
+        self.realtime = realtime
+        self.speed = speed
+        self.loop = loop
+        self.position = 0
+        self.finished = len(reader) == 0
+        self._started_at = None
+
+    def _next_index(self) -> Optional[int]:
+        count = len(self.reader)
+        if self.realtime:
+            now = time.monotonic()
+            if self._started_at is None:
+                self._started_at = now
+            ts = self.reader.timestamps[0] + (now - self._started_at) * self.speed
+            if ts > self.reader.timestamps[-1] and not self.loop:
+                self.finished = True
+                return None
+            if self.loop and self.reader.duration_s > 0:
+                ts = self.reader.timestamps[0] + (ts - self.reader.timestamps[0]) % self.reader.duration_s
+            return self.reader.index_at(ts)
+        if self.position >= count:
+            if not self.loop:
+                self.finished = True
+                return None
+            self.position = 0
+        index = self.position
+        self.position += 1
+        return index
+
+    def read_latest(self, copy: bool = True) -> Tuple[Optional[np.ndarray], Dict[str, Any]]:
+        if self.finished:
+            return None, {}
+        index = self._next_index()
+        if index is None:
+            return None, {}
+        frame = self.reader.frame(index)
+        if frame.ndim == 2:
+            frame = cv2.cvtColor(frame, cv2.COLOR_GRAY2BGR)
+        elif copy:
+            frame = frame.copy()
+        metadata = {
+            'frame_id': f"replay:{index}", 'replay_index': index,
+            'bus_timestamp': float(self.reader.timestamps[index]),
+            'region': self.reader.metadata.get('region'),
+            'recorded': self.reader.frame_metadata(index),
+        }
+        return frame, metadata
+
+
+# --- CLI ---
+
+def _record(args) -> int:
+    from screen_recognizer import ScreenRecognizer
+
+    recognizer = ScreenRecognizer(monitor=args.monitor)
+    metadata = {'source': 'recognizer' if args.recognize else 'capture', 'region': recognizer._get_monitor_region()}
+    recorder = SessionRecorder(args.path, args.channels, args.compression, metadata=metadata)
+    if args.recognize:
+        # El reconocedor publica cada frame reconocido con su estado
+        recognizer.frame_publisher = recorder
+    deadline = time.monotonic() + args.duration
+    try:
+        while time.monotonic() < deadline:
+            tick = time.monotonic()
+            if args.recognize:
+                recognizer.recognize()
+            else:
+                frame = recognizer.capture_frame()
+                if frame is not None:
+                    recorder.add_frame(frame.bgr)
+            time.sleep(max(0.0, args.interval - (time.monotonic() - tick)))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        recorder.close()
+    _print_recorder_stats(recorder)
+    return 0
+
+
+def _print_recorder_stats(recorder: SessionRecorder) -> None:
+    stats = recorder.stats
+    frames = max(1, stats['frames'])
+    print(f"{stats['frames']} frames en {stats['chunks']} bloques: {stats['written_bytes'] / 1e6:.1f} MB "
+          f"({stats['written_bytes'] / max(1, stats['raw_bytes']):.0%} del tamaño crudo)")
+    print(f"Coste por frame: {1000 * stats['add_time_s'] / frames:.2f} ms en el llamador, "
+          f"{1000 * stats['write_time_s'] / frames:.2f} ms en el hilo escritor")
+
+
+def _info(args) -> int:
+    with SessionReader(args.path) as reader:
+        kinds = {}
+        for event in reader.events:
+            kinds[event.get('kind')] = kinds.get(event.get('kind'), 0) + 1
+        print(f"{args.path}: {len(reader)} frames {reader.width}x{reader.height}x{reader.channels} "
+              f"({reader.compression}), {reader.duration_s:.1f} s")
+        print(f"Metadatos: {reader.metadata}")
+        print(f"Eventos: {kinds or 'ninguno'}")
+    return 0
+
+
+def _replay(args) -> int:
+    with SessionReader(args.path) as reader:
+        if not args.recognize:
+            started = time.perf_counter()
+            checksum = 0
+            for _, _, frame in reader.iter_frames():
+                checksum ^= int(frame[0, 0].sum())  # Tocar los datos para medir el acceso real
+            elapsed = time.perf_counter() - started
+            print(f"{len(reader)} frames leídos en {elapsed:.2f} s ({1000 * elapsed / max(1, len(reader)):.2f} ms/frame)")
+            return 0
+
+        from screen_recognizer import ScreenRecognizer
+        source = ReplaySource(reader)
+        recognizer = ScreenRecognizer(monitor=None, frame_source=source)
+        compared = mismatches = 0
+        started = time.perf_counter()
+        while source.position < len(reader):
+            index = source.position
+            result = recognizer.recognize_screen_for_test()
+            expected = reader.frame_metadata(index).get('state')
+            line = f"{index:5d} {result['state']:45} {result['method']:10} {result.get('detection_time_s', 0.0):.3f}s"
+            if expected is not None:
+                compared += 1
+                if expected != result['state']:
+                    mismatches += 1
+                    line += f"  <- grabado: {expected}"
+            print(line)
+        elapsed = time.perf_counter() - started
+        print(f"\n{len(reader)} frames reconocidos en {elapsed:.1f} s")
+        if compared:
+            print(f"Coincidencias con el estado grabado: {compared - mismatches}/{compared}")
+        return 1 if mismatches else 0
+
+
+def _bench(args) -> int:
+    """Compara grabar/reproducir PNG frente al contenedor crudo y zlib."""
+    image = cv2.imread(args.image, cv2.IMREAD_COLOR)
+    if image is None:
+        print(f"No se pudo leer {args.image}", file=sys.stderr)
+        return 1
+    frames = args.frames
+    h, w = image.shape[:2]
+    print(f"Imagen {w}x{h}, {frames} frames\n")
+    print(f"{'formato':14} {'grabar ms/f':>12} {'escritor ms/f':>14} {'leer ms/f':>10} {'MB':>8}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        started = time.perf_counter()
+        encoded = None
+        for i in range(frames):
+            ok, encoded = cv2.imencode(".png", image)
+            with open(os.path.join(tmp, f"{i}.png"), "wb") as f:
+                f.write(encoded.tobytes())
+        png_write = (time.perf_counter() - started) / frames
+        started = time.perf_counter()
+        for i in range(frames):
+            cv2.imread(os.path.join(tmp, f"{i}.png"), cv2.IMREAD_COLOR)
+        png_read = (time.perf_counter() - started) / frames
+        print(f"{'png':14} {1000 * png_write:12.1f} {'-':>14} {1000 * png_read:10.2f} "
+              f"{frames * len(encoded) / 1e6:8.1f}")
+
+        for channels in (3, 1):
+            for compression in (COMPRESSION_RAW, COMPRESSION_ZLIB):
+                path = os.path.join(tmp, f"bench_{channels}_{compression}{SESSION_EXTENSION}")
+                recorder = SessionRecorder(path, channels, compression)
+                started = time.perf_counter()
+                for i in range(frames):
+                    recorder.add_frame(image, timestamp=float(i))
+                recorder.close()
+                record_total = (time.perf_counter() - started) / frames
+                with SessionReader(path) as reader:
+                    started = time.perf_counter()
+                    for _, _, frame in reader.iter_frames():
+                        int(frame[h // 2, w // 2].sum())
+                    read = (time.perf_counter() - started) / frames
+                label = f"{compression}-{'bgr' if channels == 3 else 'gris'}"
+                print(f"{label:14} {1000 * recorder.stats['add_time_s'] / frames:12.2f} "
+                      f"{1000 * recorder.stats['write_time_s'] / frames:14.1f} {1000 * read:10.2f} "
+                      f"{os.path.getsize(path) / 1e6:8.1f}   (total {1000 * record_total:.1f} ms/f)")
+    return 0
+
+
+def main():
+    """Punto de entrada de línea de comandos."""
+    parser = argparse.ArgumentParser(description="Grabación y reproducción de sesiones de frames")
+    subparsers = parser.add_subparsers(dest="command")
+
+    record_parser = subparsers.add_parser("record", help="Grabar la pantalla en un archivo de sesión")
+    record_parser.add_argument("path", nargs="?", default=None, help="Archivo de salida (por defecto en temp/sessions)")
+    record_parser.add_argument("--duration", type=float, default=60.0, help="Segundos de grabación")
+    record_parser.add_argument("--interval", type=float, default=0.25, help="Segundos entre frames")
+    record_parser.add_argument("--monitor", type=int, default=1, help="Monitor a capturar (1-based)")
+    record_parser.add_argument("--channels", type=int, choices=(1, 3), default=3, help="1 = gris, 3 = BGR")
+    record_parser.add_argument("--compression", choices=list(_COMPRESSION_CODES), default=COMPRESSION_ZLIB)
+    record_parser.add_argument("--recognize", action="store_true",
+                               help="Reconocer cada frame y grabar el estado detectado (para regresión)")
+
+    info_parser = subparsers.add_parser("info", help="Resumen de una sesión")
+    info_parser.add_argument("path")
+
+    replay_parser = subparsers.add_parser("replay", help="Reproducir una sesión")
+    replay_parser.add_argument("path")
+    replay_parser.add_argument("--recognize", action="store_true",
+                               help="Reconocer cada frame y compararlo con el estado grabado")
+
+    bench_parser = subparsers.add_parser("bench", help="Comparar con PNG a partir de una imagen")
+    bench_parser.add_argument("image")
+    bench_parser.add_argument("--frames", type=int, default=20)
+    args = parser.parse_args()
+
+    if args.command == "record":
+        args.path = args.path or new_session_path()
+        return _record(args)
+    if args.command == "info":
+        return _info(args)
+    if args.command == "replay":
+        return _replay(args)
+    if args.command == "bench":
+        return _bench(args)
+    parser.print_help()
+    return 1
+
+
+if __name__ == "__main__":
+    if not logging.getLogger().hasHandlers():
+        logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    sys.exit(main())
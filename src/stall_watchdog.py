@@ -0,0 +1,464 @@
+"""
+Vigilante de bloqueos con recuperación escalonada.
+
+En ejecuciones largas el bot a veces se queda minutos en una pantalla (o en
+'unknown') mientras un bucle como skip_all_banners sigue pulsando A.
+StallWatchdog escucha los reconocimientos (ScreenRecognizer.add_recognition_listener)
+y las entradas (GamepadController.add_input_listener) y detecta tres tipos
+de bloqueo:
+
+- state: demasiado tiempo en el mismo estado (STATE_TIMEOUT_S, o
+  UNKNOWN_TIMEOUT_S en 'unknown', que también cubre el juego en partido).
+- frozen: los frames reconocidos durante FROZEN_FRAME_S son iguales
+  (miniatura de FINGERPRINT_SIZE con diferencia media <= FROZEN_DIFF), sea
+  cual sea el estado, aunque se ha pulsado algo en ese tiempo (una pantalla
+  quieta mientras el flujo espera no es un bloqueo).
+- loop: los últimos LOOP_CHANGES cambios de estado repiten un ciclo de 2 o
+  3 pantallas en menos de LOOP_SPAN_S.
+
+Cada bloqueo abre una incidencia y se intenta resolver por niveles,
+esperando RECOVERY_GRACE_S entre uno y otro: volver atrás (BACKOUT_PRESSES
+pulsaciones de B), navegar al menú principal con el MenuNavigator y, por
+último, reiniciar el flujo (callback on_restart; en main.py repite el paso
+en curso del grafo de run_all). Mientras el vigilante pulsa B o navega, el
+paso en curso queda en pausa (callback on_pause) para que sus pulsaciones no
+se mezclen con las de la recuperación. La incidencia se da por resuelta cuando la
+pantalla sale del bloqueo y se guarda en JSON Lines con su captura, las
+acciones aplicadas y el tiempo perdido desde que empezó el bloqueo.
+
+Uso:
+    python main.py --watchdog all
+    python stall_watchdog.py report logs/stall_incidents.jsonl
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional
+
+import cv2
+import numpy as np
+
+from recognition_bundle import PROJECT_DIR
+
+logger = logging.getLogger('stall_watchdog')
+
+INCIDENTS_FILE = os.path.join(PROJECT_DIR, "logs", "stall_incidents.jsonl")
+INCIDENT_FRAMES_DIR = os.path.join(PROJECT_DIR, "logs", "stall_frames")
+
+IGNORED_STATES = ('unknown', 'error')  # No cuentan como cambio de pantalla para los ciclos
+STATE_TIMEOUT_S = 180.0       # Tiempo máximo en un mismo estado reconocido
+UNKNOWN_TIMEOUT_S = 720.0     # En 'unknown' (incluye un partido completo)
+FROZEN_FRAME_S = 45.0         # Tiempo máximo con la imagen congelada
+FROZEN_DIFF = 1.5             # Diferencia media (niveles de gris) por debajo de la cual el frame se repite
+FINGERPRINT_SIZE = (32, 18)   # Miniatura con la que se comparan los frames
+LOOP_CHANGES = 8              # Cambios de estado analizados para detectar ciclos
+LOOP_SPAN_S = 90.0            # Tiempo máximo en el que tienen que ocurrir
+CHECK_INTERVAL_S = 1.0        # Periodo de comprobación del hilo vigilante
+RECOVERY_GRACE_S = 15.0       # Espera tras cada acción antes de escalar al siguiente nivel
+BACKOUT_PRESSES = 2
+BACKOUT_INTERVAL_S = 1.0
+HOME_TIMEOUT_S = 60.0
+UNRESOLVED_COOLDOWN_S = 120.0 # Pausa tras una incidencia sin resolver antes de volver a actuar
+
+KIND_STATE = 'state'
+KIND_FROZEN = 'frozen'
+KIND_LOOP = 'loop'
+
+ACTION_BACKOUT = 'backout'
+ACTION_HOME = 'home'
+ACTION_RESTART = 'restart'
+RECOVERY_LEVELS = (ACTION_BACKOUT, ACTION_HOME, ACTION_RESTART)
+
+
+def frame_fingerprint(pyramid) -> Optional[np.ndarray]:
+    """Miniatura en gris de un frame para compararlo con el anterior (None sin pirámide)."""
+    if pyramid is None:
+        return None
+    thumbnail = pyramid.thumbnail(gray=True)
+    return cv2.resize(thumbnail, FINGERPRINT_SIZE, interpolation=cv2.INTER_AREA).astype(np.int16)
+
+
+def find_cycle(states: List[str]) -> Optional[List[str]]:
+    """Ciclo de 2 o 3 pantallas que se repite en toda la secuencia (None si no lo hay)."""
+    for period in (2, 3):
+        if len(states) < 2 * period + 1:
+            continue
+        if len(set(states)) == period and all(states[i] == states[i - period] for i in range(period, len(states))):
+            return states[-period:]
+    return None
+
+
+class StallWatchdog:
+    """
+    Detecta bloqueos a partir de los reconocimientos y aplica la recuperación escalonada.
+    """
+
+    def __init__(self, gamepad, recognizer, navigator=None, on_restart: Optional[Callable[[str], Any]] = None,
+                 on_pause: Optional[Callable[[bool], Any]] = None,
+                 incidents_path: Optional[str] = INCIDENTS_FILE, frames_dir: Optional[str] = INCIDENT_FRAMES_DIR,
+                 state_timeouts: Optional[Dict[str, Optional[float]]] = None,
+                 state_timeout: float = STATE_TIMEOUT_S, unknown_timeout: float = UNKNOWN_TIMEOUT_S,
+                 frozen_frame_s: float = FROZEN_FRAME_S, recovery_grace_s: float = RECOVERY_GRACE_S,
+                 home_states=None, check_interval: float = CHECK_INTERVAL_S):
+        """
+        Args:
+            gamepad: GamepadController (entradas y pulsaciones de recuperación).
+            recognizer: ScreenRecognizer a escuchar.
+            navigator: MenuNavigator para volver al menú principal (None = nivel omitido).
+            on_restart: Callback (motivo) que reinicia el flujo en curso; devuelve algo
+                        verdadero si lo hizo (None = nivel omitido).
+            on_pause: Callback (True/False) que detiene y reanuda el flujo en curso
+                      durante la recuperación (None = el flujo sigue pulsando).
+            incidents_path: Archivo JSON Lines de incidencias (None = no guardarlas).
+            frames_dir: Directorio de las capturas de cada incidencia (None = sin capturas).
+            state_timeouts: Tiempo máximo por estado que sustituye al general (None = sin límite).
+            state_timeout, unknown_timeout, frozen_frame_s: Umbrales de detección.
+            recovery_grace_s: Espera tras cada acción antes de escalar.
+            home_states: Pantallas del menú principal (por defecto, MAIN_MENU_STATES).
+            check_interval: Periodo de comprobación.
+        """
+        if home_states is None:
+            from menu_navigator import MAIN_MENU_STATES
+            home_states = MAIN_MENU_STATES
+        self.gamepad = gamepad
+        self.recognizer = recognizer
+        self.navigator = navigator
+        self.on_restart = on_restart
+        self.on_pause = on_pause
+        self.incidents_path = incidents_path
+        self.frames_dir = frames_dir
+        self.state_timeouts = dict(state_timeouts or {})
+        self.state_timeout = state_timeout
+        self.unknown_timeout = unknown_timeout
+        self.frozen_frame_s = frozen_frame_s
+        self.recovery_grace_s = recovery_grace_s
+        self.home_states = tuple(home_states)
+        self.check_interval = check_interval
+
+        self._lock = threading.Lock()
+        self._state = None
+        self._state_since = None
+        self._frame_id = None
+        self._fingerprint = None
+        self._frame_since = None
+        self._last_frame_change = None
+        self._last_seen = None
+        self._changes = deque(maxlen=LOOP_CHANGES)  # (instante, estado) de cada cambio de pantalla
+        self._inputs = 0
+        self._last_input = None
+
+        self._incident = None
+        self._quiet_until = 0.0
+        self._sequence = 0
+        self.incidents = []  # Incidencias cerradas de esta ejecución
+        self.started = time.time()
+
+        self._stop = threading.Event()
+        self._thread = None
+        recognizer.add_recognition_listener(self.on_recognition)
+        gamepad.add_input_listener(self.on_input)
+
+    # --- Listeners ---
+
+    def on_input(self, event: Dict[str, Any]) -> None:
+        if event.get('kind') == 'press':
+            with self._lock:
+                self._inputs += 1
+                self._last_input = event.get('ts') or time.time()
+
+    def on_recognition(self, event: Dict[str, Any]) -> None:
+        """Listener del reconocedor: actualiza el tiempo en estado, la imagen y los cambios."""
+        state = event.get('state')
+        now = event.get('ts') or time.time()
+        fingerprint = frame_fingerprint(event.get('frame_pyramid'))
+        with self._lock:
+            self._frame_id = event.get('frame_id')
+            self._last_seen = now
+            if state != self._state:
+                self._state = state
+                self._state_since = now
+                if state not in IGNORED_STATES and (not self._changes or self._changes[-1][1] != state):
+                    self._changes.append((now, state))
+            if fingerprint is not None:
+                if self._fingerprint is None or \
+                        float(np.abs(fingerprint - self._fingerprint).mean()) > FROZEN_DIFF:
+                    self._frame_since = now
+                    self._last_frame_change = now
+                self._fingerprint = fingerprint
+
+    # --- Hilo vigilante ---
+
+    def start(self) -> 'StallWatchdog':
+        """Arranca el hilo que comprueba y recupera los bloqueos."""
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="StallWatchdog", daemon=True)
+            self._thread.start()
+        return self
+
+    def close(self) -> None:
+        """Detiene el hilo, deja de escuchar y cierra la incidencia abierta como no resuelta."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5.0)
+            self._thread = None
+        self.recognizer.remove_recognition_listener(self.on_recognition)
+        self.gamepad.remove_input_listener(self.on_input)
+        if self._incident is not None:
+            self._close_incident(time.time(), resolved=False)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.check_interval):
+            try:
+                self.check()
+            except Exception:
+                logger.exception("Error en el vigilante de bloqueos")
+
+    def _timeout_for(self, state: Optional[str]) -> Optional[float]:
+        if state in self.state_timeouts:
+            return self.state_timeouts[state]
+        return self.unknown_timeout if state in IGNORED_STATES or state is None else self.state_timeout
+
+    def detect(self, now: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """
+        Bloqueo en curso, si lo hay: {'kind', 'states', 'since', 'detail'}.
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            state, state_since, frame_since = self._state, self._state_since, self._frame_since
+            last_seen, last_input = self._last_seen, self._last_input
+            changes = list(self._changes)
+        if state_since is None:
+            return None
+
+        # Congelada sólo si se han visto frames iguales durante todo el periodo (no por falta de
+        # capturas) y se ha pulsado algo después de la última imagen distinta sin que cambiara
+        if frame_since is not None and last_seen - frame_since >= self.frozen_frame_s \
+                and last_input is not None and last_input > frame_since:
+            return {'kind': KIND_FROZEN, 'states': [state], 'since': frame_since,
+                    'detail': f"imagen congelada {last_seen - frame_since:.0f} s en '{state}'"}
+
+        timeout = self._timeout_for(state)
+        if timeout is not None and now - state_since >= timeout:
+            return {'kind': KIND_STATE, 'states': [state], 'since': state_since,
+                    'detail': f"{now - state_since:.0f} s en '{state}'"}
+
+        if len(changes) == LOOP_CHANGES and changes[-1][0] - changes[0][0] <= LOOP_SPAN_S:
+            cycle = find_cycle([change[1] for change in changes])
+            if cycle:
+                return {'kind': KIND_LOOP, 'states': cycle, 'since': changes[0][0],
+                        'detail': f"ciclo {' -> '.join(cycle)} repetido en {changes[-1][0] - changes[0][0]:.0f} s"}
+        return None
+
+    def check(self, now: Optional[float] = None) -> None:
+        """Una comprobación: abre, escala o cierra la incidencia según corresponda."""
+        now = time.time() if now is None else now
+        incident = self._incident
+        if incident is not None:
+            if self._resolved(incident):
+                self._close_incident(now, resolved=True)
+            elif now - incident['action_ts'] >= self.recovery_grace_s:
+                self._escalate(incident, now)
+            return
+        if now < self._quiet_until:
+            return
+        stall = self.detect(now)
+        if stall is not None:
+            self._open_incident(stall, now)
+
+    def _resolved(self, incident: Dict[str, Any]) -> bool:
+        with self._lock:
+            state, state_since, frame_change = self._state, self._state_since, self._last_frame_change
+        if state not in incident['states'] and state_since is not None and state_since > incident['action_ts']:
+            return True
+        return incident['kind'] == KIND_FROZEN and frame_change is not None and frame_change > incident['action_ts']
+
+    # --- Incidencias ---
+
+    def _open_incident(self, stall: Dict[str, Any], now: float) -> None:
+        self._sequence += 1
+        with self._lock:
+            frame_id, inputs = self._frame_id, self._inputs
+            self._changes.clear()
+        incident = {'id': f"{time.strftime('%Y%m%d_%H%M%S', time.localtime(now))}_{self._sequence}",
+                    'kind': stall['kind'], 'states': stall['states'], 'detail': stall['detail'],
+                    'started': stall['since'], 'detected': now, 'resolved': None, 'resolved_by': None,
+                    'actions': [], 'level': 0, 'action_ts': now, 'inputs_at_start': inputs, 'frame': None}
+        incident['frame'] = self._save_frame(incident['id'], frame_id)
+        self._incident = incident
+        logger.warning(f"Bloqueo detectado ({incident['kind']}): {incident['detail']}")
+        self._escalate(incident, now)
+
+    def _escalate(self, incident: Dict[str, Any], now: float) -> None:
+        while incident['level'] < len(RECOVERY_LEVELS):
+            action = RECOVERY_LEVELS[incident['level']]
+            incident['level'] += 1
+            if self._recover(action, incident):
+                incident['actions'].append({'action': action, 'ts': time.time()})
+                incident['action_ts'] = time.time()
+                return
+        logger.error(f"Bloqueo sin resolver tras {', '.join(a['action'] for a in incident['actions']) or 'ninguna acción'}: "
+                     f"{incident['detail']}")
+        self._close_incident(now, resolved=False)
+        self._quiet_until = now + UNRESOLVED_COOLDOWN_S
+
+    def _recover(self, action: str, incident: Dict[str, Any]) -> bool:
+        """Aplica una acción de recuperación; False si no está disponible."""
+        if action == ACTION_HOME and self.navigator is None:
+            return False
+        logger.info(f"Recuperación de bloqueo: {action}")
+        if action in (ACTION_BACKOUT, ACTION_HOME):
+            self._pause_workflow(True)
+            try:
+                if action == ACTION_BACKOUT:
+                    from gamepad_controller import GamepadButton
+                    for i in range(BACKOUT_PRESSES):
+                        if i:
+                            time.sleep(BACKOUT_INTERVAL_S)
+                        self.gamepad.press_button(GamepadButton.B)
+                else:
+                    self.navigator.navigate(self.home_states, HOME_TIMEOUT_S)
+            finally:
+                self._pause_workflow(False)
+            return True
+        if action == ACTION_RESTART:
+            if self.on_restart is None:
+                return False
+            return bool(self.on_restart(f"bloqueo {incident['kind']}: {incident['detail']}"))
+        return False
+
+    def _pause_workflow(self, paused: bool) -> None:
+        if self.on_pause is None:
+            return
+        try:
+            self.on_pause(paused)
+        except Exception:
+            logger.exception("Error al detener o reanudar el flujo en curso")
+
+    def _save_frame(self, incident_id: str, frame_id) -> Optional[str]:
+        if not self.frames_dir:
+            return None
+        filename = f"stall_{incident_id}.png"
+        try:
+            result = {'frame_id': frame_id} if frame_id is not None else None
+            try:
+                return self.recognizer.save_screenshot(filename, self.frames_dir, result=result)
+            except TypeError:
+                # Reconocedores sin el argumento result: se guarda la pantalla actual
+                return self.recognizer.save_screenshot(filename, self.frames_dir)
+        except Exception as e:
+            logger.error(f"No se pudo guardar la captura de la incidencia {incident_id}: {e}")
+            return None
+
+    def _close_incident(self, now: float, resolved: bool) -> None:
+        incident, self._incident = self._incident, None
+        with self._lock:
+            inputs = self._inputs
+        incident['resolved'] = now if resolved else None
+        incident['resolved_by'] = incident['actions'][-1]['action'] if resolved and incident['actions'] else None
+        incident['lost_s'] = round(now - incident['started'], 3)
+        incident['inputs'] = inputs - incident.pop('inputs_at_start')
+        incident.pop('action_ts', None)
+        self.incidents.append(incident)
+        log = logger.info if resolved else logger.warning
+        log(f"Incidencia {incident['id']} {'resuelta con ' + str(incident['resolved_by']) if resolved else 'sin resolver'}"
+            f" ({incident['lost_s']:.0f} s perdidos)")
+        if self.incidents_path:
+            try:
+                directory = os.path.dirname(self.incidents_path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                with open(self.incidents_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(incident, ensure_ascii=False, default=str) + "\n")
+            except OSError as e:
+                logger.error(f"No se pudo guardar la incidencia en {self.incidents_path}: {e}")
+
+    # --- Métricas ---
+
+    def stats(self) -> Dict[str, Any]:
+        """Incidencias de esta ejecución y tiempo perdido en bloqueos."""
+        return summarize(self.incidents, time.time() - self.started)
+
+    def report(self) -> str:
+        """Resumen legible de stats()."""
+        return format_summary(self.stats())
+
+
+def summarize(incidents: List[Dict[str, Any]], elapsed_s: Optional[float] = None) -> Dict[str, Any]:
+    """Contadores de incidencias y tiempo perdido (elapsed_s = duración total para el porcentaje)."""
+    summary = {'incidents': len(incidents), 'resolved': 0, 'unresolved': 0, 'lost_s': 0.0,
+               'by_kind': {}, 'resolved_by': {}, 'elapsed_s': elapsed_s}
+    for incident in incidents:
+        summary['lost_s'] += incident.get('lost_s', 0.0)
+        summary['by_kind'][incident['kind']] = summary['by_kind'].get(incident['kind'], 0) + 1
+        if incident.get('resolved'):
+            summary['resolved'] += 1
+            action = incident.get('resolved_by') or 'sola'
+            summary['resolved_by'][action] = summary['resolved_by'].get(action, 0) + 1
+        else:
+            summary['unresolved'] += 1
+    summary['lost_s'] = round(summary['lost_s'], 1)
+    if elapsed_s:
+        summary['lost_pct'] = round(100.0 * summary['lost_s'] / elapsed_s, 2)
+    return summary
+
+
+def format_summary(summary: Dict[str, Any]) -> str:
+    if not summary['incidents']:
+        return "Vigilante de bloqueos: sin incidencias"
+    text = (f"Vigilante de bloqueos: {summary['incidents']} incidencias "
+            f"({', '.join(f'{kind}={n}' for kind, n in summary['by_kind'].items())}), "
+            f"{summary['resolved']} resueltas, {summary['unresolved']} sin resolver, "
+            f"{summary['lost_s']:.0f} s perdidos")
+    if 'lost_pct' in summary:
+        text += f" ({summary['lost_pct']:.1f}% de la ejecución)"
+    if summary['resolved_by']:
+        text += f"; resueltas con: {', '.join(f'{action}={n}' for action, n in summary['resolved_by'].items())}"
+    return text
+
+
+def load_incidents(path: str) -> List[Dict[str, Any]]:
+    incidents = []
+    if not os.path.exists(path):
+        return incidents
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                try:
+                    incidents.append(json.loads(line))
+                except json.JSONDecodeError:
+                    continue
+    return incidents
+
+
+def main():
+    """Punto de entrada de línea de comandos."""
+    parser = argparse.ArgumentParser(description="Incidencias del vigilante de bloqueos")
+    subparsers = parser.add_subparsers(dest="command")
+    report_parser = subparsers.add_parser("report", help="Resumen y lista de incidencias")
+    report_parser.add_argument("incidents", nargs="?", default=INCIDENTS_FILE)
+    report_parser.add_argument("--last", type=int, default=10, help="Incidencias a listar (default: 10)")
+    args = parser.parse_args()
+
+    if args.command == "report":
+        incidents = load_incidents(args.incidents)
+        print(format_summary(summarize(incidents)))
+        for incident in incidents[-args.last:]:
+            started = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(incident['started']))
+            outcome = f"resuelta con {incident['resolved_by'] or 'sola'}" if incident.get('resolved') else "sin resolver"
+            print(f"  {started} {incident['kind']:7} {incident['lost_s']:7.0f} s  {outcome:25} {incident['detail']}"
+                  + (f"  [{incident['frame']}]" if incident.get('frame') else ""))
+        return 0
+    parser.print_help()
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
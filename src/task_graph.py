@@ -0,0 +1,474 @@
+"""
+Grafo de pasos reanudable con diario en disco.
+
+run_all era una lista fija de pasos que volvía a empezar desde cero tras
+cualquier fallo. TaskGraph ejecuta los pasos (TaskStep) en orden topológico
+según sus dependencias y comprueba la pantalla antes y después de cada uno:
+
+- pre_states: si la pantalla no es ninguno de ellos, se intenta llegar con
+  el MenuNavigator; si no se llega, el paso falla sin ejecutarse.
+- post_states: tras un resultado correcto, la pantalla tiene que acabar en
+  alguno de ellos para dar el paso por completado.
+
+Cada inicio, fin y avance de un paso se añade al diario (JSON Lines, con
+fsync por registro). Si la ejecución se interrumpe (caída, Ctrl+C, timeout)
+la siguiente con el mismo plan la retoma: los pasos completados se saltan y
+los contadores de progreso (p.ej. partidos jugados) de un intento
+interrumpido se restauran. Un intento que termina fallido descarta sus
+contadores: el siguiente empieza de cero en lugar de heredar, p.ej., todos
+los partidos ya jugados sin haber logrado el objetivo. Los pasos
+con checkpoint=False (saltar banners) se repiten siempre, porque tras
+reiniciar el juego vuelven a hacer falta. Los dependientes de un paso
+fallido se bloquean en esa ejecución y se reintentan en la siguiente: la
+ejecución sólo se cierra en el diario cuando todos los pasos terminan bien.
+
+Los flujos leen y guardan su progreso con current_progress(), que sólo
+existe mientras el grafo ejecuta el paso (None fuera de él). Cada paso se
+ejecuta con un CancellationToken (async_runtime): restart_current() lo usa
+para repetir el paso en curso desde el principio (hasta max_restarts veces,
+conservando su progreso), p.ej. cuando el vigilante de bloqueos no consigue
+sacar al juego de una pantalla, y pause_current() lo detiene mientras el
+vigilante pulsa por su cuenta.
+
+Uso:
+    python main.py all              # retoma la última ejecución si quedó a medias
+    python main.py all --fresh      # empieza de cero
+    python task_graph.py status logs/run_journal.jsonl
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import namedtuple
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from async_runtime import WorkflowRestart, cancellation_scope
+
+logger = logging.getLogger('task_graph')
+
+STATE_TIMEOUT_S = 10.0     # Espera de las pantallas previa y posterior de un paso
+NAVIGATE_TIMEOUT_S = 60.0  # Navegación hasta la pantalla previa
+MAX_RESTARTS = 2           # Reinicios de un paso admitidos por intento (restart_current)
+
+STATUS_DONE = 'done'          # Completado en esta ejecución
+STATUS_RESUMED = 'resumed'    # Completado en una ejecución anterior (no se repite)
+STATUS_FAILED = 'failed'
+STATUS_BLOCKED = 'blocked'    # No se ejecutó porque falló una dependencia
+
+STATUS_LABELS = {
+    STATUS_DONE: 'Éxito',
+    STATUS_RESUMED: 'Éxito (ejecución anterior)',
+    STATUS_FAILED: 'Fallido',
+    STATUS_BLOCKED: 'Omitido (falló una dependencia)',
+}
+
+# Paso del grafo: nombre, descripción, función y argumentos, dependencias,
+# pantallas previas/posteriores (None = cualquiera) y si se guarda su finalización
+TaskStep = namedtuple('TaskStep', 'name label fn kwargs depends pre_states post_states checkpoint')
+TaskStep.__new__.__defaults__ = ({}, (), None, None, True)
+
+_local = threading.local()
+
+
+def current_progress() -> Optional['StepProgress']:
+    """Progreso del paso que se ejecuta en este hilo (None fuera de TaskGraph)."""
+    return getattr(_local, 'progress', None)
+
+
+class TaskJournal:
+    """
+    Diario de una ejecución del grafo en JSON Lines.
+
+    Cada línea es un evento ('run_start', 'step_start', 'progress', 'step_end',
+    'run_end') con la marca de tiempo y el identificador de la ejecución.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.run_id = None
+        self.completed = set()
+        self.counters = {}
+        self.attempts = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def read(path: str) -> List[Dict[str, Any]]:
+        """Eventos del diario (ignora una última línea truncada por una caída)."""
+        events = []
+        if not os.path.exists(path):
+            return events
+        with open(path, "r", encoding="utf-8") as f:
+            for number, line in enumerate(f, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    events.append(json.loads(line))
+                except json.JSONDecodeError:
+                    logger.warning(f"Línea {number} del diario {path} ilegible; se ignora")
+        return events
+
+    def open(self, plan: str, steps: Iterable[str], resume: bool = True) -> bool:
+        """
+        Abre la ejecución: retoma la última del diario si es del mismo plan y no terminó.
+
+        Returns:
+            bool: True si se retoma una ejecución anterior.
+        """
+        events = self.read(self.path) if resume else []
+        start = None
+        for index, event in enumerate(events):
+            if event.get('event') == 'run_start':
+                start = index
+        if start is not None and events[start].get('plan') == plan and \
+                not any(event.get('event') == 'run_end' for event in events[start:]):
+            self.run_id = events[start]['run']
+            for event in events[start:]:
+                step = event.get('step')
+                if event.get('event') == 'step_start':
+                    self.attempts[step] = event.get('attempt', 1)
+                elif event.get('event') == 'progress':
+                    self.counters.setdefault(step, {}).update(event.get('counters', {}))
+                elif event.get('event') == 'step_end' and event.get('status') == STATUS_DONE:
+                    self.completed.add(step)
+                elif event.get('event') == 'step_end' and event.get('status') == STATUS_FAILED:
+                    self.counters.pop(step, None)
+            self._append({'event': 'run_resume'})
+            return True
+
+        self.run_id = uuid.uuid4().hex[:12]
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # El diario sólo guarda la ejecución en curso
+        with open(self.path, "w", encoding="utf-8"):
+            pass
+        self._append({'event': 'run_start', 'plan': plan, 'steps': list(steps)})
+        return False
+
+    def _append(self, record: Dict[str, Any]) -> None:
+        record = {'ts': time.time(), 'run': self.run_id, **record}
+        line = json.dumps(record, ensure_ascii=False, default=str) + "\n"
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+
+    def step_started(self, step: str) -> int:
+        self.attempts[step] = self.attempts.get(step, 0) + 1
+        self._append({'event': 'step_start', 'step': step, 'attempt': self.attempts[step]})
+        return self.attempts[step]
+
+    def step_finished(self, step: str, status: str, detail: Optional[str] = None) -> None:
+        """Anota el fin de un intento; uno fallido descarta los contadores del paso."""
+        if status == STATUS_DONE:
+            self.completed.add(step)
+        elif status == STATUS_FAILED:
+            self.counters.pop(step, None)
+        self._append({'event': 'step_end', 'step': step, 'status': status, 'detail': detail})
+
+    def step_restarted(self, step: str, reason: Optional[str]) -> None:
+        self._append({'event': 'step_restart', 'step': step, 'reason': reason})
+
+    def progress(self, step: str, counters: Dict[str, Any]) -> None:
+        self.counters.setdefault(step, {}).update(counters)
+        self._append({'event': 'progress', 'step': step, 'counters': counters})
+
+    def close_run(self, results: Dict[str, str]) -> None:
+        self._append({'event': 'run_end', 'results': results})
+
+
+class StepProgress:
+    """
+    Contadores de progreso de un paso, guardados en el diario en cada cambio.
+    """
+
+    def __init__(self, journal: TaskJournal, step: str):
+        self.journal = journal
+        self.step = step
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return self.journal.counters.get(self.step, {}).get(key, default)
+
+    def set(self, key: str, value: Any) -> None:
+        self.journal.progress(self.step, {key: value})
+
+
+class TaskGraph:
+    """
+    Ejecuta una lista de TaskStep en orden de dependencias con checkpoints en un TaskJournal.
+    """
+
+    def __init__(self, steps: Iterable[TaskStep], journal: TaskJournal, recognizer=None, navigator=None,
+                 state_timeout: float = STATE_TIMEOUT_S, navigate_timeout: float = NAVIGATE_TIMEOUT_S,
+                 max_restarts: int = MAX_RESTARTS):
+        """
+        Args:
+            steps: Pasos del grafo.
+            journal: Diario donde se guardan los checkpoints.
+            recognizer: Reconocedor para comprobar pre_states/post_states (None = sin comprobar).
+            navigator: MenuNavigator para llegar a los pre_states (None = sólo esperar).
+            state_timeout: Espera máxima de las pantallas previa y posterior.
+            navigate_timeout: Tiempo máximo de la navegación a la pantalla previa.
+            max_restarts: Veces que restart_current puede repetir un mismo paso.
+
+        Raises:
+            ValueError: Si hay pasos repetidos, dependencias desconocidas o ciclos.
+        """
+        self.steps = {}
+        for step in steps:
+            if step.name in self.steps:
+                raise ValueError(f"Paso repetido: '{step.name}'")
+            self.steps[step.name] = step
+        for step in self.steps.values():
+            unknown = [name for name in step.depends if name not in self.steps]
+            if unknown:
+                raise ValueError(f"El paso '{step.name}' depende de pasos desconocidos: {', '.join(unknown)}")
+        self.order = self._topological_order()
+        self.journal = journal
+        self.recognizer = recognizer
+        self.navigator = navigator
+        self.state_timeout = state_timeout
+        self.navigate_timeout = navigate_timeout
+        self.max_restarts = max_restarts
+        self._current = None  # (paso, token) en ejecución
+
+    def _topological_order(self) -> List[str]:
+        """Orden de ejecución: el de declaración, salvo donde lo impiden las dependencias."""
+        order, placed = [], set()
+        while len(order) < len(self.steps):
+            ready = [name for name, step in self.steps.items()
+                     if name not in placed and all(dep in placed for dep in step.depends)]
+            if not ready:
+                pending = [name for name in self.steps if name not in placed]
+                raise ValueError(f"Dependencias circulares entre: {', '.join(pending)}")
+            order.append(ready[0])
+            placed.add(ready[0])
+        return order
+
+    def signature(self) -> str:
+        """Identifica el plan (pasos, dependencias y argumentos) para no retomar otro distinto."""
+        plan = [(name, list(self.steps[name].depends), self.steps[name].kwargs) for name in self.order]
+        encoded = json.dumps(plan, sort_keys=True, ensure_ascii=False, default=str).encode("utf-8")
+        return hashlib.blake2b(encoded, digest_size=8).hexdigest()
+
+    def _open(self, resume: bool) -> None:
+        resumed = self.journal.open(self.signature(), self.order, resume=resume)
+        if resumed:
+            done = [name for name in self.order if name in self.journal.completed]
+            logger.info(f"Retomando la ejecución {self.journal.run_id} "
+                        f"(completados: {', '.join(done) if done else 'ninguno'})")
+            print(f"Retomando la ejecución anterior (pasos completados: {', '.join(done) if done else 'ninguno'})")
+
+    def _close(self, results: Dict[str, str]) -> None:
+        # Sólo se cierra la ejecución si no queda nada por hacer; si no, la siguiente la retoma
+        if all(status in (STATUS_DONE, STATUS_RESUMED) for status in results.values()):
+            self.journal.close_run(results)
+
+    def _pending(self, name: str, results: Dict[str, str]) -> Optional[str]:
+        """Estado de un paso que no hay que ejecutar (None si hay que ejecutarlo)."""
+        step = self.steps[name]
+        if step.checkpoint and name in self.journal.completed:
+            return STATUS_RESUMED
+        if any(results.get(dep) not in (STATUS_DONE, STATUS_RESUMED) for dep in step.depends):
+            return STATUS_BLOCKED
+        return None
+
+    def _reach(self, states: Iterable[str]) -> bool:
+        if self.recognizer is None:
+            return True
+        return bool(self.recognizer.wait_for_state(states, timeout=self.state_timeout).get('matched'))
+
+    def run_step(self, name: str) -> str:
+        """
+        Ejecuta un paso con sus comprobaciones de pantalla y lo anota en el diario.
+
+        Returns:
+            str: STATUS_DONE o STATUS_FAILED.
+        """
+        step = self.steps[name]
+        attempt = self.journal.step_started(name)
+        logger.info(f"Paso '{name}' (intento {attempt})")
+
+        if step.pre_states and not self._reach(step.pre_states):
+            reached = False
+            if self.navigator is not None:
+                reached = self.navigator.navigate(step.pre_states, self.navigate_timeout).get('success', False)
+            if not reached:
+                self.journal.step_finished(name, STATUS_FAILED, "pantalla previa no alcanzada")
+                return STATUS_FAILED
+
+        _local.progress = StepProgress(self.journal, name)
+        try:
+            with cancellation_scope() as token:
+                self._current = (name, token)
+                result = self._call(step, token)
+        except Exception as e:
+            logger.exception(f"Error en el paso '{name}'")
+            self.journal.step_finished(name, STATUS_FAILED, str(e))
+            return STATUS_FAILED
+        finally:
+            self._current = None
+            _local.progress = None
+
+        if not result:
+            self.journal.step_finished(name, STATUS_FAILED, "el flujo devolvió un resultado negativo")
+            return STATUS_FAILED
+        if step.post_states and not self._reach(step.post_states):
+            self.journal.step_finished(name, STATUS_FAILED, "pantalla posterior no alcanzada")
+            return STATUS_FAILED
+        self.journal.step_finished(name, STATUS_DONE)
+        return STATUS_DONE
+
+    def _call(self, step: TaskStep, token) -> Any:
+        restarts = 0
+        while True:
+            try:
+                return step.fn(**step.kwargs)
+            except WorkflowRestart as e:
+                token.reset()
+                if token.cancelled:  # Se canceló de verdad mientras tanto
+                    raise
+                restarts += 1
+                if restarts > self.max_restarts:
+                    raise RuntimeError(f"{restarts - 1} reinicios sin completar el paso") from e
+                logger.warning(f"Reiniciando el paso '{step.name}' ({e}; {restarts}/{self.max_restarts})")
+                self.journal.step_restarted(step.name, str(e))
+
+    def restart_current(self, reason: str = "reinicio solicitado") -> Optional[str]:
+        """
+        Pide repetir el paso en curso desde el principio (en su siguiente espera).
+
+        Returns:
+            str: Nombre del paso reiniciado, o None si no se está ejecutando ninguno.
+        """
+        current = self._current
+        if current is None:
+            return None
+        current[1].cancel(reason, restart=True)
+        return current[0]
+
+    def pause_current(self, paused: bool = True) -> Optional[str]:
+        """
+        Detiene (o reanuda) el paso en curso en su siguiente espera o pulsación.
+
+        Returns:
+            str: Nombre del paso, o None si no se está ejecutando ninguno.
+        """
+        current = self._current
+        if current is None:
+            return None
+        if paused:
+            current[1].pause()
+        else:
+            current[1].resume()
+        return current[0]
+
+    def run(self, resume: bool = True,
+            on_step: Optional[Callable[[int, TaskStep], None]] = None) -> Dict[str, str]:
+        """
+        Ejecuta (o retoma) el grafo.
+
+        Args:
+            resume: Retomar la última ejecución del diario si quedó a medias.
+            on_step: Callback (número, paso) antes de cada paso que se ejecuta.
+
+        Returns:
+            dict: Estado final de cada paso (STATUS_*).
+        """
+        self._open(resume)
+        results = {}
+        for number, name in enumerate(self.order, 1):
+            results[name] = self._pending(name, results)
+            if results[name] is None:
+                if on_step is not None:
+                    on_step(number, self.steps[name])
+                results[name] = self.run_step(name)
+        self._close(results)
+        return results
+
+    async def run_async(self, runtime, step_timeout: Optional[float] = None, resume: bool = True,
+                        on_step: Optional[Callable[[int, TaskStep], None]] = None) -> Dict[str, str]:
+        """
+        Como run, pero cada paso va por AsyncRuntime.run_workflow (cancelable y con timeout).
+
+        Si se cancela la tarea, el paso en curso queda empezado y sin terminar en el
+        diario, así que la siguiente ejecución lo retoma con su progreso.
+        """
+        import asyncio
+
+        self._open(resume)
+        results = {}
+        for number, name in enumerate(self.order, 1):
+            results[name] = self._pending(name, results)
+            if results[name] is None:
+                if on_step is not None:
+                    on_step(number, self.steps[name])
+                try:
+                    results[name] = await runtime.run_workflow(name, self.run_step, name, timeout=step_timeout)
+                except asyncio.TimeoutError:
+                    self.journal.step_finished(name, STATUS_FAILED, f"timeout de {step_timeout} s")
+                    results[name] = STATUS_FAILED
+        self._close(results)
+        return results
+
+
+def summarize(path: str) -> Dict[str, Any]:
+    """Resumen de la última ejecución del diario: pasos, intentos, progreso y si terminó."""
+    events = TaskJournal.read(path)
+    starts = [index for index, event in enumerate(events) if event.get('event') == 'run_start']
+    if not starts:
+        return {}
+    run = events[starts[-1]:]
+    summary = {'run': run[0].get('run'), 'started': run[0].get('ts'), 'finished': False,
+               'steps': {name: {'status': 'pending', 'attempts': 0, 'counters': {}}
+                         for name in run[0].get('steps', [])}}
+    for event in run:
+        if event.get('event') == 'run_end':
+            summary['finished'] = True
+        if not event.get('step'):
+            continue
+        info = summary['steps'].setdefault(event['step'], {'status': 'pending', 'attempts': 0, 'counters': {}})
+        if event.get('event') == 'step_start':
+            info.update(status='running', attempts=event.get('attempt', info['attempts'] + 1))
+        elif event.get('event') == 'progress':
+            info['counters'].update(event.get('counters', {}))
+        elif event.get('event') == 'step_end':
+            info['status'] = event.get('status')
+            if info['status'] == STATUS_FAILED:
+                info['counters'] = {}  # No se retoman (ver TaskJournal.open)
+    return summary
+
+
+def main():
+    """Punto de entrada de línea de comandos."""
+    parser = argparse.ArgumentParser(description="Diario de ejecuciones reanudables")
+    subparsers = parser.add_subparsers(dest="command")
+    status_parser = subparsers.add_parser("status", help="Estado de la última ejecución del diario")
+    status_parser.add_argument("journal")
+    args = parser.parse_args()
+
+    if args.command == "status":
+        summary = summarize(args.journal)
+        if not summary:
+            print(f"No hay ejecuciones en {args.journal}")
+            return 1
+        started = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(summary['started']))
+        print(f"Ejecución {summary['run']} ({started}): {'terminada' if summary['finished'] else 'a medias'}")
+        for name, info in summary['steps'].items():
+            counters = ", ".join(f"{key}={value}" for key, value in info['counters'].items())
+            print(f"  {name:15} {info['status']:10} intentos={info['attempts']}" + (f"  {counters}" if counters else ""))
+        return 0
+    parser.print_help()
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
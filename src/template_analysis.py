@@ -0,0 +1,552 @@
+"""
+Análisis offline de las plantillas de reconocimiento.
+
+Subcomandos:
+    duplicates  Similitud entre todas las plantillas (correlación vectorizada
+                sobre miniaturas). Señala plantillas redundantes dentro de un
+                estado, que pueden fusionarse o descartarse, y parecidos entre
+                estados distintos, que provocan confusiones. Estima el coste de
+                matchTemplate por frame que se ahorraría.
+    confusion   Puntúa cada plantilla contra cada captura completa etiquetada
+                ('estado_AAAAMMDD_HHMMSS.png' en images/) en paralelo y con caché.
+                Produce la matriz estado x estado, sugiere umbrales por estado,
+                señala los estados que siempre acabarán en el OCR lento y deduce
+                el orden de evaluación y la poda que usa el reconocedor.
+
+Los resultados se aplican escribiéndolos en config/recognition_tuning.json,
+que el reconocedor carga (y recarga) automáticamente.
+
+Uso:
+    python template_analysis.py duplicates
+    python template_analysis.py duplicates --dup-threshold 0.97 --write-prune
+    python template_analysis.py confusion --workers 4 --write-tuning
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import re
+import sys
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional
+
+import cv2
+import numpy as np
+
+from recognition_bundle import (PROJECT_DIR, compile_from_config, update_tuning, detect_monitor_geometry)
+
+logger = logging.getLogger('template_analysis')
+
+LOG_DIR = os.path.join(PROJECT_DIR, "logs")
+DUPLICATES_REPORT_FILE = os.path.join(LOG_DIR, "template_duplicates.json")
+CONFUSION_REPORT_FILE = os.path.join(LOG_DIR, "template_confusion.json")
+CONFUSION_CACHE_FILE = os.path.join(PROJECT_DIR, "temp", "confusion_scores_cache.json")
+IMAGES_DIR = os.path.join(PROJECT_DIR, "images")
+
+# Mismos valores por defecto que screen_recognizer (sin importar mss/pytesseract)
+DEFAULT_TEMPLATE_THRESHOLD = 0.75
+OCR_FALLBACK_THRESHOLD = 0.60
+
+DEFAULT_DUP_THRESHOLD = 0.97        # Misma pantalla en la práctica
+DEFAULT_LOOKALIKE_THRESHOLD = 0.90  # Estados distintos peligrosamente parecidos
+THUMB_SIZE = (64, 36)               # Miniatura 16:9 (ancho, alto) para la correlación
+SHAPE_TOLERANCE = 0.10              # Sólo se comparan plantillas de tamaño similar (±10 %)
+DEFAULT_SCREEN_SHAPE = (2160, 3840) # Captura 4K si no se conoce el monitor
+
+TemplateInfo = namedtuple('TemplateInfo', 'state file path image')
+
+
+def load_templates(bundle) -> List[TemplateInfo]:
+    """Decodifica en gris todas las plantillas válidas del bundle, en orden de mapping."""
+    templates = []
+    for state, files in bundle.template_files.items():
+        for file_name in files:
+            path = os.path.join(bundle.templates_dir, file_name)
+            image = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+            if image is None:
+                logger.warning(f"No se pudo leer {path}; se omite del análisis.")
+                continue
+            templates.append(TemplateInfo(state, file_name, path, image))
+    return templates
+
+
+def similarity_matrix(images: List[np.ndarray]) -> np.ndarray:
+    """
+    Correlación de Pearson entre todas las imágenes, calculada de una vez como
+    producto matricial de miniaturas normalizadas (media 0, norma 1).
+
+    Los pares con tamaños incompatibles (diferencia > SHAPE_TOLERANCE en alto
+    o ancho) no pueden ser la misma plantilla y quedan a -1.
+    """
+    thumbs = np.stack([cv2.resize(img, THUMB_SIZE, interpolation=cv2.INTER_AREA).astype(np.float32).ravel()
+                       for img in images])
+    thumbs -= thumbs.mean(axis=1, keepdims=True)
+    norms = np.linalg.norm(thumbs, axis=1, keepdims=True)
+    thumbs /= np.where(norms > 0, norms, 1.0)
+    sim = thumbs @ thumbs.T
+
+    shapes = np.array([img.shape[:2] for img in images], dtype=np.float32)
+    heights, widths = shapes[:, 0], shapes[:, 1]
+    h_ratio = np.abs(heights[:, None] - heights[None, :]) / np.maximum(heights[:, None], heights[None, :])
+    w_ratio = np.abs(widths[:, None] - widths[None, :]) / np.maximum(widths[:, None], widths[None, :])
+    sim[(h_ratio > SHAPE_TOLERANCE) | (w_ratio > SHAPE_TOLERANCE)] = -1.0
+    np.fill_diagonal(sim, 1.0)
+    return sim
+
+
+def search_shape(bundle, state: str, screen_shape) -> tuple:
+    """(alto, ancho) de la zona donde el reconocedor busca las plantillas del estado."""
+    roi = bundle.rois.get(state)
+    if roi is None:
+        return screen_shape
+    return (min(roi[3], screen_shape[0]), min(roi[2], screen_shape[1]))
+
+
+def measure_match_cost(template: np.ndarray, area_shape, repeats: int = 3) -> float:
+    """Mediana en segundos de un matchTemplate real de la plantilla sobre un área de ese tamaño."""
+    h_area, w_area = area_shape
+    h_tpl, w_tpl = template.shape[:2]
+    if h_tpl > h_area or w_tpl > w_area:
+        return 0.0 # El reconocedor la descarta sin llamar a matchTemplate
+    area = np.random.randint(0, 256, (h_area, w_area), dtype=np.uint8)
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        cv2.matchTemplate(area, template, cv2.TM_CCOEFF_NORMED)
+        timings.append(time.perf_counter() - started)
+    return float(np.median(timings))
+
+
+def find_duplicates(bundle, dup_threshold: float = DEFAULT_DUP_THRESHOLD,
+                    lookalike_threshold: float = DEFAULT_LOOKALIKE_THRESHOLD,
+                    measure_cost: bool = True) -> Dict:
+    """
+    Analiza redundancias y parecidos entre plantillas.
+
+    Returns:
+        dict con 'redundant' (por estado: plantilla a descartar, la que se conserva
+        y su similitud), 'lookalikes' (pares de estados distintos) y el coste
+        estimado por frame de las plantillas redundantes.
+    """
+    templates = load_templates(bundle)
+    if len(templates) < 2:
+        return {'templates': len(templates), 'redundant': {}, 'lookalikes': [], 'saved_ms_per_frame': 0.0}
+    started = time.perf_counter()
+    sim = similarity_matrix([t.image for t in templates])
+    logger.info(f"Matriz de similitud {len(templates)}x{len(templates)} calculada en "
+                f"{(time.perf_counter() - started) * 1000:.1f} ms")
+
+    screen_shape = ((bundle.monitor['height'], bundle.monitor['width']) if bundle.monitor
+                    else DEFAULT_SCREEN_SHAPE)
+
+    # --- Redundantes dentro de cada estado (agrupación voraz en orden de mapping) ---
+    redundant = {}
+    saved_s = 0.0
+    by_state = {}
+    for i, t in enumerate(templates):
+        by_state.setdefault(t.state, []).append(i)
+    for state, indices in by_state.items():
+        kept = []
+        for i in indices:
+            best = max(kept, key=lambda k: sim[i, k], default=None)
+            if best is not None and sim[i, best] >= dup_threshold:
+                cost = measure_match_cost(templates[i].image, search_shape(bundle, state, screen_shape)) if measure_cost else None
+                saved_s += cost or 0.0
+                redundant.setdefault(state, []).append({
+                    'drop': templates[i].file, 'keep': templates[best].file,
+                    'similarity': round(float(sim[i, best]), 4),
+                    'match_cost_ms': round(cost * 1000, 2) if cost is not None else None,
+                })
+            else:
+                kept.append(i)
+
+    # --- Parecidos entre estados distintos ---
+    lookalikes = []
+    rows, cols = np.where(np.triu(sim >= lookalike_threshold, k=1))
+    for i, j in zip(rows, cols):
+        if templates[i].state != templates[j].state:
+            lookalikes.append({
+                'states': [templates[i].state, templates[j].state],
+                'files': [templates[i].file, templates[j].file],
+                'similarity': round(float(sim[i, j]), 4),
+                'rois': [bundle.rois.get(templates[i].state) is not None, bundle.rois.get(templates[j].state) is not None],
+            })
+    lookalikes.sort(key=lambda item: item['similarity'], reverse=True)
+
+    return {
+        'templates': len(templates),
+        'dup_threshold': dup_threshold,
+        'lookalike_threshold': lookalike_threshold,
+        'redundant': redundant,
+        'lookalikes': lookalikes,
+        'saved_ms_per_frame': round(saved_s * 1000, 2) if measure_cost else None,
+    }
+
+
+def _print_duplicates_report(report: Dict) -> None:
+    print(f"\n{report['templates']} plantillas analizadas.")
+    n_redundant = sum(len(v) for v in report['redundant'].values())
+    print(f"\nPlantillas redundantes (similitud >= {report['dup_threshold']}): {n_redundant}")
+    for state, entries in report['redundant'].items():
+        for entry in entries:
+            cost = f", {entry['match_cost_ms']} ms/frame" if entry['match_cost_ms'] is not None else ""
+            print(f"  [{state}] {entry['drop']} ~ {entry['keep']} ({entry['similarity']:.3f}{cost})")
+    if report['saved_ms_per_frame'] is not None:
+        print(f"  Ahorro estimado si se descartan: {report['saved_ms_per_frame']:.1f} ms por frame "
+              f"(peor caso, todos los estados evaluados)")
+    print(f"\nParecidos entre estados (similitud >= {report['lookalike_threshold']}): {len(report['lookalikes'])}")
+    for entry in report['lookalikes']:
+        hint = "" if all(entry['rois']) else "  -> definir ROI/OCR para separarlos"
+        print(f"  {entry['states'][0]} <-> {entry['states'][1]} ({entry['similarity']:.3f}){hint}")
+
+
+# --- Matriz de confusión ---
+
+_CAPTURE_NAME_RE = re.compile(r'^(?P<state>.+)_\d{8}_\d{6}\.(png|jpg|jpeg|bmp)$', re.IGNORECASE)
+_WORKER = {} # Plantillas cargadas una vez por proceso trabajador
+
+
+def label_from_filename(file_name: str) -> Optional[str]:
+    """Estado etiquetado en el nombre de una captura ('estado_AAAAMMDD_HHMMSS.png')."""
+    match = _CAPTURE_NAME_RE.match(file_name)
+    return match.group('state') if match else None
+
+
+def find_labelled_captures(directories: List[str], known_states, screen_shape) -> List[Dict]:
+    """
+    Capturas de pantalla completa etiquetadas con un estado conocido.
+
+    Los recortes (plantillas parciales) se descartan: sólo una pantalla completa
+    reproduce lo que ve el reconocedor. Una captura que sea a su vez plantilla
+    mapeada se puntúa sin esa plantilla (ver _score_capture).
+    """
+    captures, skipped = [], 0
+    for directory in directories:
+        if not os.path.isdir(directory):
+            logger.warning(f"Directorio de capturas no encontrado: {directory}")
+            continue
+        for file_name in sorted(os.listdir(directory)):
+            state = label_from_filename(file_name)
+            if state is None or state not in known_states:
+                continue
+            path = os.path.join(directory, file_name)
+            image = cv2.imread(path, cv2.IMREAD_UNCHANGED)
+            if image is None or image.shape[:2] != tuple(screen_shape):
+                skipped += 1
+                continue
+            st = os.stat(path)
+            captures.append({'path': path, 'file': file_name, 'state': state,
+                             'signature': f"{st.st_mtime_ns}:{st.st_size}"})
+    if skipped:
+        logger.info(f"{skipped} imágenes etiquetadas omitidas por no ser capturas completas {screen_shape[1]}x{screen_shape[0]}.")
+    return captures
+
+
+def _state_signature(bundle, state: str, scale: float) -> str:
+    """Firma de lo que determina la puntuación de un estado: plantillas, ROI y escala."""
+    parts = []
+    for file_name in bundle.template_files.get(state, ()):
+        try:
+            st = os.stat(os.path.join(bundle.templates_dir, file_name))
+            parts.append(f"{file_name}:{st.st_mtime_ns}:{st.st_size}")
+        except OSError:
+            parts.append(f"{file_name}:missing")
+    # 'loo': puntuaciones sin la propia plantilla (invalida cachés anteriores)
+    return hashlib.sha1(f"{parts}|{bundle.rois.get(state)}|{scale}|loo".encode("utf-8")).hexdigest()[:16]
+
+
+def _init_worker(templates_by_state, rois, origin, scale):
+    """Inicializador del pool: decodifica las plantillas una vez por proceso."""
+    _WORKER['rois'] = rois
+    _WORKER['origin'] = origin
+    _WORKER['scale'] = scale
+    loaded = {}
+    for state, paths in templates_by_state.items():
+        images = [] # (ruta normalizada, imagen o None), alineado con bundle.template_files[state]
+        for path in paths:
+            image = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+            if image is not None and scale != 1.0:
+                image = cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+            images.append((os.path.normcase(os.path.realpath(path)), image))
+        loaded[state] = images
+    _WORKER['templates'] = loaded
+
+
+def _score_capture(task):
+    """
+    Puntúa una captura contra las plantillas de los estados indicados, igual que
+    el reconocedor: máximo de matchTemplate dentro de la ROI de cada estado.
+
+    Si la captura es una de las plantillas mapeadas, esa plantilla se excluye
+    (leave-one-out): se encontraría a sí misma con ~1.0 y falsearía los umbrales.
+
+    Returns:
+        (ruta, { estado: [mejor puntuación, índice de la plantilla ganadora] })
+    """
+    path, states = task
+    own_path = os.path.normcase(os.path.realpath(path))
+    screen = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+    scale = _WORKER['scale']
+    if scale != 1.0:
+        screen = cv2.resize(screen, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    h_screen, w_screen = screen.shape[:2]
+    origin_left, origin_top = _WORKER['origin']
+    scores = {}
+    for state in states:
+        target = screen
+        roi = _WORKER['rois'].get(state)
+        if roi is not None:
+            x = max(0, int((roi[0] - origin_left) * scale))
+            y = max(0, int((roi[1] - origin_top) * scale))
+            w = min(int(roi[2] * scale), w_screen - x)
+            h = min(int(roi[3] * scale), h_screen - y)
+            if w > 0 and h > 0:
+                target = screen[y:y + h, x:x + w]
+        best, best_idx = 0.0, None
+        for idx, (template_path, template) in enumerate(_WORKER['templates'].get(state, [])):
+            if template is None or template_path == own_path:
+                continue
+            if template.shape[0] > target.shape[0] or template.shape[1] > target.shape[1]:
+                continue
+            _, max_val, _, _ = cv2.minMaxLoc(cv2.matchTemplate(target, template, cv2.TM_CCOEFF_NORMED))
+            if max_val > best:
+                best, best_idx = float(max_val), idx
+        scores[state] = [best, best_idx]
+    return path, scores
+
+
+def _load_cache(path: str) -> Dict:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            cache = json.load(f)
+        return cache if isinstance(cache, dict) else {}
+    except (OSError, ValueError):
+        return {}
+
+
+def compute_score_matrix(bundle, captures: List[Dict], scale: float = 1.0, workers: Optional[int] = None,
+                         cache_file: str = CONFUSION_CACHE_FILE) -> Dict[str, Dict[str, list]]:
+    """
+    Puntuaciones { captura: { estado: [puntuación, índice plantilla] } }, en paralelo y con caché.
+
+    La caché se indexa por firma de la captura y firma de cada estado (plantillas,
+    ROI, escala), así que al editar un estado sólo se recalcula su columna.
+    """
+    states = [s for s, files in bundle.template_files.items() if files]
+    state_sigs = {s: _state_signature(bundle, s, scale) for s in states}
+    cache = _load_cache(cache_file)
+    results, tasks = {}, []
+    for capture in captures:
+        cached = cache.get(f"{capture['path']}|{capture['signature']}", {})
+        results[capture['path']] = {s: cached[state_sigs[s]] for s in states if state_sigs[s] in cached}
+        pending = [s for s in states if state_sigs[s] not in cached]
+        if pending:
+            tasks.append((capture['path'], pending))
+
+    n_pairs = sum(len(p) for _, p in tasks)
+    logger.info(f"{len(captures)} capturas x {len(states)} estados: {n_pairs} pares por calcular "
+                f"({len(captures) * len(states) - n_pairs} en caché).")
+    if tasks:
+        started = time.perf_counter()
+        templates_by_state = {s: [os.path.join(bundle.templates_dir, f) for f in bundle.template_files[s]] for s in states}
+        origin = (bundle.monitor['left'], bundle.monitor['top']) if bundle.monitor else (0, 0)
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(templates_by_state, bundle.rois, origin, scale)) as pool:
+            for path, scores in pool.map(_score_capture, tasks):
+                results[path].update(scores)
+        logger.info(f"Puntuaciones calculadas en {time.perf_counter() - started:.1f} s.")
+
+        # Guardar caché (sólo entradas vigentes)
+        new_cache = {}
+        for capture in captures:
+            key = f"{capture['path']}|{capture['signature']}"
+            new_cache[key] = {state_sigs[s]: v for s, v in results[capture['path']].items()}
+        os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+        with open(cache_file, "w", encoding="utf-8") as f:
+            json.dump(new_cache, f)
+    return results
+
+
+def analyze_confusion(bundle, captures: List[Dict], scores: Dict, threshold: float = DEFAULT_TEMPLATE_THRESHOLD,
+                      ocr_fallback_threshold: float = OCR_FALLBACK_THRESHOLD, margin: float = 0.02) -> Dict:
+    """
+    Construye la matriz estado x estado y deduce umbrales, orden y poda.
+
+    Para cada estado, las puntuaciones sobre sus propias capturas son positivas y
+    sobre las de otros estados negativas. El umbral sugerido separa ambas con un
+    margen; si se solapan se prioriza no aceptar falsos positivos.
+    """
+    states = [s for s, files in bundle.template_files.items() if files]
+    labelled = sorted({c['state'] for c in captures})
+    matrix = {true_state: {s: [] for s in states} for true_state in labelled}
+    for capture in captures:
+        for state, (score, _) in scores[capture['path']].items():
+            matrix[capture['state']][state].append(score)
+
+    per_state = {}
+    for state in states:
+        positives = matrix.get(state, {}).get(state, [])
+        negatives = [(score, true_state) for true_state in labelled if true_state != state
+                     for score in matrix[true_state][state]]
+        neg_max, neg_state = max(negatives, default=(0.0, None))
+        entry = {
+            'captures': len(positives),
+            'pos_min': round(min(positives), 4) if positives else None,
+            'pos_mean': round(float(np.mean(positives)), 4) if positives else None,
+            'neg_max': round(neg_max, 4), 'neg_max_state': neg_state,
+            'has_ocr': state in bundle.ocr_regions,
+        }
+        if positives:
+            pos_min = min(positives)
+            if pos_min - neg_max > 2 * margin:
+                suggested = (pos_min + neg_max) / 2
+            else:
+                suggested = neg_max + margin # Solapamiento: evitar falsos positivos
+            suggested = float(np.clip(suggested, ocr_fallback_threshold, 0.99))
+            entry['separable'] = pos_min > neg_max
+            entry['margin'] = round(pos_min - neg_max, 4)
+            entry['suggested_threshold'] = round(suggested, 3)
+            entry['ocr_rate_current'] = round(sum(p < threshold for p in positives) / len(positives), 3)
+            entry['ocr_rate_suggested'] = round(sum(p < suggested for p in positives) / len(positives), 3)
+            entry['always_ocr'] = entry['ocr_rate_suggested'] == 1.0
+        per_state[state] = entry
+
+    # Decisión simulada (sin contexto) con los umbrales sugeridos: matriz de confusión
+    thresholds = {s: e.get('suggested_threshold', threshold) for s, e in per_state.items()}
+    confusion = {true_state: {} for true_state in labelled}
+    for capture in captures:
+        accepted = [(score, s) for s, (score, _) in scores[capture['path']].items() if score >= thresholds[s]]
+        if accepted:
+            predicted = max(accepted)[1]
+        elif any(score >= ocr_fallback_threshold for score, _ in scores[capture['path']].values()):
+            predicted = 'ocr'
+        else:
+            predicted = 'unknown'
+        row = confusion[capture['state']]
+        row[predicted] = row.get(predicted, 0) + 1
+
+    # Poda: plantillas que nunca ganan en las capturas de su estado
+    wins = {}
+    for capture in captures:
+        score, idx = scores[capture['path']].get(capture['state'], (0.0, None))
+        if idx is not None:
+            wins.setdefault(capture['state'], set()).add(idx)
+    prune = {}
+    for state, files in bundle.template_files.items():
+        if len(files) > 1 and per_state.get(state, {}).get('captures', 0) >= 2 and state in wins:
+            unused = [f for i, f in enumerate(files) if i not in wins[state]]
+            if unused and len(unused) < len(files):
+                prune[state] = unused
+
+    # Orden: primero los estados más discriminables (las paradas tempranas son más seguras)
+    state_order = sorted(states, key=lambda s: per_state[s].get('margin', -1.0), reverse=True)
+
+    return {
+        'captures': len(captures),
+        'threshold': threshold,
+        'mean_scores': {t: {s: round(float(np.mean(v)), 4) for s, v in row.items() if v} for t, row in matrix.items()},
+        'confusion': confusion,
+        'per_state': per_state,
+        'thresholds': {s: e['suggested_threshold'] for s, e in per_state.items() if 'suggested_threshold' in e},
+        'state_order': state_order,
+        'prune': prune,
+    }
+
+
+def _print_confusion_report(report: Dict) -> None:
+    print(f"\n{report['captures']} capturas etiquetadas analizadas (umbral global {report['threshold']}).")
+    print(f"\n{'Estado':45} {'caps':>4} {'pos_min':>7} {'neg_max':>7} {'umbral':>6} {'OCR act':>7} {'OCR sug':>7}  Confusión con")
+    for state, e in sorted(report['per_state'].items()):
+        if not e['captures']:
+            continue
+        flags = " SIEMPRE OCR" if e.get('always_ocr') else ""
+        if e.get('always_ocr') and not e['has_ocr']:
+            flags = " IRRECONOCIBLE (sin regiones OCR)"
+        print(f"{state[:45]:45} {e['captures']:>4} {e['pos_min']:>7.3f} {e['neg_max']:>7.3f} "
+              f"{e['suggested_threshold']:>6.3f} {e['ocr_rate_current']:>7.0%} {e['ocr_rate_suggested']:>7.0%}  "
+              f"{e['neg_max_state'] or '-'}{flags}")
+    without = [s for s, e in report['per_state'].items() if not e['captures']]
+    if without:
+        print(f"\nEstados sin capturas completas etiquetadas ({len(without)}): {', '.join(sorted(without))}")
+    errors = {t: {p: n for p, n in row.items() if p not in (t, 'ocr')} for t, row in report['confusion'].items()}
+    errors = {t: row for t, row in errors.items() if row}
+    print(f"\nConfusiones con los umbrales sugeridos: {sum(sum(r.values()) for r in errors.values())}")
+    for true_state, row in errors.items():
+        print(f"  {true_state} -> {row}")
+    if report['prune']:
+        print(f"\nPlantillas que nunca ganan en su estado (candidatas a poda): {report['prune']}")
+
+
+def main():
+    """Punto de entrada de línea de comandos."""
+    parser = argparse.ArgumentParser(description="Análisis de plantillas de reconocimiento")
+    parser.add_argument("--resolution", default="4K", help="Resolución de las plantillas")
+    parser.add_argument("--monitor", type=int, default=1, help="Monitor de referencia (1-based, 0 = 4K por defecto)")
+    subparsers = parser.add_subparsers(dest="command")
+    dup_parser = subparsers.add_parser("duplicates", help="Plantillas redundantes y parecidos entre estados")
+    dup_parser.add_argument("--dup-threshold", type=float, default=DEFAULT_DUP_THRESHOLD)
+    dup_parser.add_argument("--lookalike-threshold", type=float, default=DEFAULT_LOOKALIKE_THRESHOLD)
+    dup_parser.add_argument("--no-timing", action="store_true", help="No medir el coste de matchTemplate")
+    dup_parser.add_argument("--write-prune", action="store_true",
+                            help="Guardar las redundantes como poda en recognition_tuning.json")
+    conf_parser = subparsers.add_parser("confusion", help="Matriz de confusión y umbrales por estado")
+    conf_parser.add_argument("--captures", action="append", default=None,
+                             help="Directorio de capturas etiquetadas (repetible; por defecto images/)")
+    conf_parser.add_argument("--threshold", type=float, default=DEFAULT_TEMPLATE_THRESHOLD, help="Umbral global actual")
+    conf_parser.add_argument("--scale", type=float, default=1.0, help="Escala de cálculo (<1 es más rápido, aproximado)")
+    conf_parser.add_argument("--workers", type=int, default=None, help="Procesos en paralelo (por defecto, nº de CPUs)")
+    conf_parser.add_argument("--write-tuning", action="store_true",
+                             help="Guardar umbrales y orden de estados en recognition_tuning.json")
+    conf_parser.add_argument("--write-prune", action="store_true",
+                             help="Guardar la poda deducida en recognition_tuning.json")
+    args = parser.parse_args()
+
+    if args.command is None:
+        parser.print_help()
+        return 0
+    monitor = detect_monitor_geometry(args.monitor) if args.monitor > 0 else None
+    # Analizar todas las plantillas, incluidas las ya podadas
+    bundle = compile_from_config(args.resolution, monitor, use_tuning=False)
+
+    if args.command == "duplicates":
+        report = find_duplicates(bundle, args.dup_threshold, args.lookalike_threshold, not args.no_timing)
+        _print_duplicates_report(report)
+        os.makedirs(LOG_DIR, exist_ok=True)
+        with open(DUPLICATES_REPORT_FILE, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"\nInforme guardado en {DUPLICATES_REPORT_FILE}")
+        if args.write_prune:
+            prune = {state: [e['drop'] for e in entries] for state, entries in report['redundant'].items()}
+            update_tuning('prune', prune, f"template_analysis duplicates (umbral {args.dup_threshold})")
+
+    elif args.command == "confusion":
+        screen_shape = (monitor['height'], monitor['width']) if monitor else DEFAULT_SCREEN_SHAPE
+        directories = args.captures or sorted({IMAGES_DIR, bundle.templates_dir})
+        captures = find_labelled_captures(directories, set(bundle.template_files), screen_shape)
+        if not captures:
+            print("No hay capturas completas etiquetadas que analizar.")
+            return 1
+        scores = compute_score_matrix(bundle, captures, args.scale, args.workers)
+        report = analyze_confusion(bundle, captures, scores, args.threshold)
+        _print_confusion_report(report)
+        os.makedirs(LOG_DIR, exist_ok=True)
+        with open(CONFUSION_REPORT_FILE, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"\nInforme guardado en {CONFUSION_REPORT_FILE}")
+        source = f"template_analysis confusion ({len(captures)} capturas, escala {args.scale})"
+        if args.write_tuning:
+            update_tuning('thresholds', report['thresholds'], source)
+            update_tuning('state_order', report['state_order'], source)
+        if args.write_prune:
+            update_tuning('prune', report['prune'], source)
+    return 0
+
+
+if __name__ == "__main__":
+    if not logging.getLogger().hasHandlers():
+        logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    sys.exit(main())
@@ -27,6 +27,7 @@ try:
         detect_monitors,
         IMAGES_DIR, CONFIG_DIR, OCR_MAPPING_FILE_PATH, TEMPLATE_MAPPING_FILE_PATH
     )
+    from frame_bus import open_reader_from_env, frame_matches_monitor # Bus de frames compartido con la automatización
     from panels.template_panel import TemplatePanel
     from panels.image_preview_panel import ImagePreviewPanel # Importar el correcto
     from panels.ocr_definition_panel import OcrDefinitionPanel # Importar el correcto
@@ -61,6 +62,7 @@ class TemplateManagerGUI(tk.Tk):
         self.protocol("WM_DELETE_WINDOW", self._on_close)
         self.monitors_info = detect_monitors(); self.template_names_mapping = {}; self.ocr_regions_mapping = {}; self.current_template_name = None; self.current_image_filename = None; self.current_image_path = None; self.current_image_numpy = None; self.current_ocr_regions = []; self.status_label_var = tk.StringVar(value="Inicializando...")
         self.template_panel = None; self.preview_panel = None; self.ocr_panel = None
+        self.frame_bus = open_reader_from_env() # None si no hay automatización publicando frames
         self._setup_styles_and_fonts(); self._create_widgets(); self.load_mappings_from_json(); self._reset_ui_state(); logging.info("GUI inicializada."); self.status_message("Listo.")
 
     def _setup_styles_and_fonts(self):
@@ -230,7 +232,16 @@ class TemplateManagerGUI(tk.Tk):
         captured_img = None
         try:
             if capture_type == "monitor":
-                captured_img = capture_screen(monitor=monitor_idx)
+                # Con bus compartido, tomar exactamente el frame publicado por la automatización
+                # (sólo si es una captura completa del monitor elegido; si no, capturar ese monitor)
+                if self.frame_bus is not None:
+                    bus_img, bus_meta = self.frame_bus.read_latest(copy=True)
+                    target_monitor_info = self.monitors_info[monitor_idx] if monitor_idx < len(self.monitors_info) else {}
+                    if bus_img is not None and frame_matches_monitor(bus_meta, target_monitor_info):
+                        captured_img = bus_img
+                    elif bus_img is not None:
+                        logging.info(f"El frame del bus ({bus_meta.get('region')}) no es del monitor {monitor_idx}; se captura directamente.")
+                if captured_img is None: captured_img = capture_screen(monitor=monitor_idx)
             elif capture_type == "region":
                  monitor_image = capture_screen(monitor=monitor_idx)
                  if monitor_image is not None:
@@ -0,0 +1,1510 @@
+"""
+Pruebas de la lógica pura de la automatización de eFootball
+
+A diferencia de tests.py, estas pruebas no necesitan vgamepad, la pantalla ni
+el juego: cubren los módulos que sólo dependen de Python (y numpy), usando
+objetos falsos en lugar del gamepad y del reconocedor.
+
+Uso:
+    python test_core.py
+    python -m pytest -q test_core.py
+"""
+
+import gc
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import unittest
+import weakref
+from concurrent.futures import Future
+from enum import Enum
+
+import cv2
+import numpy as np
+
+# Añadir el directorio src al path para poder importar los módulos
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from async_runtime import CancellationToken, WorkflowCancelled, cancellation_scope, wait_future
+import batch_classify
+from capture_history import CaptureHistory, CaptureHistoryReader
+from config_interface.config_manager import ActionSequence
+from config_interface.sequence_program import (compile_sequence, run_program, OP_PRESS, OP_RELEASE,
+                                               OP_TRIGGER, OP_WAIT_STATE, OP_BRANCH_STATE, OP_JUMP, OP_SYNC,
+                                               OP_END)
+from input_scheduler import InputScheduler, clock
+from frame_pyramid import FramePyramid, THUMBNAIL_WIDTH
+from frame_bus import FrameBusPublisher, FrameBusReader, frame_matches_monitor
+from dpad_navigation import DpadNavigator, HighlightWatcher, SimulatedMenu, _ScrollModel
+from frame_buffer import FrameBufferPool
+from highlight_detector import HighlightDetector
+from feedback_store import fit_thresholds, OCR_FALLBACK_THRESHOLD
+from menu_navigator import MenuGraph, MAIN_MENU_STATES
+from recognition_bundle import (BundleError, RecognitionBundle, compile_bundle, compile_from_config,
+                                CONFIG_DIR)
+from screen_recognizer import ScreenRecognizer
+from screenshot_writer import ScreenshotWriter
+from session_recorder import (ReplaySource, SessionReader, SessionRecorder, COMPRESSION_RAW,
+                              COMPRESSION_ZLIB)
+from stall_watchdog import StallWatchdog, find_cycle, ACTION_HOME, KIND_FROZEN, KIND_LOOP, KIND_STATE
+from template_analysis import (analyze_confusion, find_duplicates, label_from_filename, similarity_matrix,
+                               _init_worker, _score_capture)
+from task_graph import (TaskGraph, TaskJournal, TaskStep, current_progress, summarize,
+                        STATUS_DONE, STATUS_RESUMED, STATUS_FAILED, STATUS_BLOCKED)
+from transition_model import TransitionModel, TransitionObserver
+
+
+_recognizer = None
+
+
+def _offline_recognizer():
+    """ScreenRecognizer sin pantalla con la configuración del repositorio (se crea una sola vez)."""
+    global _recognizer
+    if _recognizer is None:
+        _recognizer = ScreenRecognizer(monitor=None)
+    return _recognizer
+
+
+def _bgr(height, width, level):
+    """Imagen BGR uniforme."""
+    return np.full((height, width, 3), level, dtype=np.uint8)
+
+
+def _feedback(correct_state, scores, event='confirm'):
+    """Registro etiquetado como los que devuelve FeedbackStore.labelled_records()."""
+    return {'event': event, 'correct_state': correct_state, 'detected_state': correct_state,
+            'state_scores': scores}
+
+
+class TestFrameBufferPool(unittest.TestCase):
+    """Pruebas del anillo de buffers de captura"""
+
+    def test_views_are_read_only(self):
+        """Las vistas del slot no se pueden escribir y materialize devuelve una copia propia"""
+        pool = FrameBufferPool(slots=2)
+        slot = pool.fill_from_bgr(_bgr(4, 6, 200))
+        with self.assertRaises(ValueError):
+            slot.bgr_view()[0, 0, 0] = 0
+        with self.assertRaises(ValueError):
+            slot.gray_view()[0, 0] = 0
+        self.assertEqual(int(slot.gray[0, 0]), 200)
+        image = pool.materialize(slot.frame_id)
+        image[0, 0, 0] = 0
+        self.assertEqual(int(slot.bgr[0, 0, 0]), 200)
+
+    def test_ring_wraps_and_reuses_buffers(self):
+        """Tras 'slots' capturas el frame más antiguo desaparece y los buffers se reutilizan"""
+        pool = FrameBufferPool(slots=3)
+        ids = [pool.fill_from_bgr(_bgr(4, 6, level)).frame_id for level in (10, 20, 30, 40)]
+        self.assertIsNone(pool.get(ids[0]))
+        self.assertIsNone(pool.materialize(ids[0]))
+        self.assertEqual(int(pool.materialize(ids[3])[0, 0, 0]), 40)
+        self.assertEqual(pool.allocations, 3)
+        pool.fill_from_bgra(np.zeros((8, 6, 4), dtype=np.uint8))
+        self.assertEqual(pool.allocations, 4)  # Sólo se reasigna si cambia el tamaño
+
+    def test_recognizer_refuses_reused_slot(self):
+        """get_captured_image devuelve None cuando el slot del resultado ya se reutilizó"""
+        recognizer = _offline_recognizer()
+        result = recognizer.recognize_image(_bgr(90, 160, 30))
+        self.assertEqual(int(recognizer.get_captured_image(result)[0, 0, 0]), 30)
+        for _ in range(recognizer.frame_pool.num_slots):
+            recognizer.recognize_image(_bgr(90, 160, 90))
+        self.assertIsNone(recognizer.get_captured_image(result))
+
+
+class TestFrameBus(unittest.TestCase):
+    """Pruebas del bus de frames en memoria compartida"""
+
+    def setUp(self):
+        self.name = f"efootball_test_{os.getpid()}_{int(time.time() * 1000) % 100000}"
+        self.publisher = FrameBusPublisher(self.name, max_width=32, max_height=16, slots=2)
+        self.reader = FrameBusReader(self.name)
+
+    def tearDown(self):
+        self.reader.close()
+        self.publisher.close()
+
+    def test_round_trip(self):
+        """El lector recibe el último frame publicado con sus metadatos"""
+        self.assertEqual(self.reader.read_latest()[0], None)
+        region = {'left': 0, 'top': 0, 'width': 8, 'height': 4}
+        self.publisher.publish(_bgr(4, 8, 10), {'state': 'A', 'region': region})
+        seq = self.publisher.publish(_bgr(4, 8, 20), {'state': 'B', 'region': region})
+        frame, metadata = self.reader.read_latest(copy=False)
+        self.assertEqual(frame.shape, (4, 8, 3))
+        self.assertEqual(int(frame[0, 0, 0]), 20)
+        self.assertFalse(frame.flags.writeable)
+        self.assertEqual((metadata['state'], metadata['bus_seq']), ('B', seq))
+        self.assertFalse(self.reader.wait_for_new(timeout=0.05))
+        self.publisher.publish(_bgr(4, 8, 30))
+        self.assertTrue(self.reader.wait_for_new(timeout=0.05))
+
+    def test_oversized_frame_is_rejected(self):
+        """Un frame mayor que el segmento no se publica"""
+        self.assertEqual(self.publisher.publish(_bgr(17, 8, 0)), 0)
+        self.assertEqual(self.reader.latest_seq(), 0)
+
+    def test_frame_matches_monitor(self):
+        """Sólo se usa el frame del bus si es la captura completa del monitor pedido"""
+        monitor = {'left': 3840, 'top': 0, 'width': 1920, 'height': 1080}
+        self.assertTrue(frame_matches_monitor({'region': dict(monitor)}, monitor))
+        self.assertFalse(frame_matches_monitor({'region': {'left': 0, 'top': 0, 'width': 1920, 'height': 1080}},
+                                               monitor))
+        self.assertFalse(frame_matches_monitor({}, monitor))
+        self.assertFalse(frame_matches_monitor({'region': monitor}, {}))
+
+
+class TestCompileBundle(unittest.TestCase):
+    """Pruebas de la validación y normalización de la configuración de reconocimiento"""
+
+    MONITOR = {'left': 0, 'top': 0, 'width': 1000, 'height': 500}
+
+    def setUp(self):
+        """Directorio de plantillas con 'a.png' y 'b.png'"""
+        self.directory = tempfile.mkdtemp()
+        for name in ("a.png", "b.png"):
+            open(os.path.join(self.directory, name), "wb").close()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def _compile(self, templates=None, ocr=None, transitions=None, rois=None, tuning=None):
+        templates = {'A': ["a.png"], 'B': ["b.png"]} if templates is None else templates
+        return compile_bundle(templates, ocr or {}, transitions or {}, rois or {},
+                              templates_dir=self.directory, monitor=self.MONITOR, tuning=tuning)
+
+    def _kinds(self, bundle, level):
+        return sorted((entry['state'], entry['kind']) for entry in bundle.issues if entry['level'] == level)
+
+    def test_invalid_templates(self):
+        """Las plantillas faltantes o mal escritas se descartan sin lanzar excepción"""
+        bundle = self._compile({'A': ["a.png", "falta.png", 3], 'B': "b.png", 'C': []})
+        self.assertEqual(bundle.template_files['A'], ("a.png",))
+        self.assertEqual(self._kinds(bundle, 'error'),
+                         [('A', 'missing_template'), ('A', 'templates'), ('B', 'templates')])
+        self.assertIn(('C', 'templates'), self._kinds(bundle, 'warning'))
+
+    def test_transitions(self):
+        """Las aristas se normalizan; botones desconocidos y destinos sin plantillas se descartan"""
+        bundle = self._compile(transitions={
+            'A': ["B", {'state': "B", 'button': "a"}, {'state': "C"}, {'state': "B", 'button': "x_turbo"}],
+            'B': [{'state': "A", 'button': ["B", "a"], 'latency_s': 0.5}, {'state': "A", 'latency_s': -1}],
+            'D': "A"})
+        self.assertEqual(bundle.transitions['A'], ("B",))
+        self.assertEqual(bundle.edges['B'][0].buttons, ("b", "a"))
+        self.assertEqual(bundle.edges['B'][0].latency_s, 0.5)
+        self.assertEqual(self._kinds(bundle, 'error'), [('A', 'transitions'), ('B', 'transitions'),
+                                                        ('D', 'transitions')])
+        self.assertIn(('A', 'dangling_transition'), self._kinds(bundle, 'warning'))
+
+    def test_rois_and_ocr_regions(self):
+        """ROIs y regiones OCR se validan contra el monitor"""
+        bundle = self._compile(
+            rois={'A': {'left': 900, 'top': 0, 'width': 200, 'height': 100},
+                  'B': {'left': 2000, 'top': 0, 'width': 10, 'height': 10},
+                  'C': {'left': 0, 'top': 0, 'width': 0, 'height': 10}},
+            ocr={'A': [{'region': {'left': 0, 'top': 0, 'width': 50, 'height': 20}, 'expected_text': ["Hola", ""]},
+                       {'region': {'left': 0, 'top': 0, 'width': 50, 'height': 20}},
+                       {'region': {'left': 5000, 'top': 0, 'width': 50, 'height': 20}, 'expected_text': ["X"]}]})
+        self.assertEqual(bundle.rois, {'A': (900, 0, 100, 100)})  # Recortada al monitor
+        self.assertEqual([spec.expected for spec in bundle.ocr_regions['A']], [("Hola",)])
+        self.assertEqual(self._kinds(bundle, 'error'), [('A', 'ocr'), ('A', 'ocr_outside_monitor'),
+                                                        ('B', 'roi_outside_monitor'), ('C', 'roi')])
+
+    def test_tuning(self):
+        """Umbrales fuera de (0, 1] se rechazan y state_order sólo conserva estados reconocibles"""
+        bundle = self._compile(tuning={'thresholds': {'A': 0.8, 'B': 1.5}, 'state_order': ["B", "Z", "B", "A"]})
+        self.assertEqual(bundle.thresholds, {'A': 0.8})
+        self.assertEqual(bundle.state_order, ("B", "A"))
+        self.assertEqual(self._kinds(bundle, 'error'), [('B', 'thresholds')])
+
+    def test_dict_round_trip(self):
+        """to_dict/from_dict conservan el bundle y rechazan otras versiones"""
+        bundle = self._compile(transitions={'A': [{'state': "B", 'button': "a"}]},
+                               rois={'A': {'left': 0, 'top': 0, 'width': 10, 'height': 10}})
+        data = json.loads(json.dumps(bundle.to_dict()))
+        restored = RecognitionBundle.from_dict(data)
+        self.assertEqual(restored.edges, bundle.edges)
+        self.assertEqual(restored.rois, bundle.rois)
+        data['version'] = -1
+        with self.assertRaises(BundleError):
+            RecognitionBundle.from_dict(data)
+
+    def test_shipped_config_compiles(self):
+        """La configuración del repositorio no tiene transiciones mal escritas"""
+        bundle = compile_from_config(use_tuning=False)
+        self.assertTrue(bundle.template_files)
+        self.assertEqual([entry for entry in bundle.errors if entry['kind'] == 'transitions'], [])
+
+
+def _pattern(seed, height=40, width=60):
+    """Plantilla sintética de ruido reproducible."""
+    return np.random.default_rng(seed).integers(0, 256, (height, width), dtype=np.uint8)
+
+
+class TestTemplateAnalysis(unittest.TestCase):
+    """Pruebas del análisis de duplicados y confusiones con plantillas sintéticas"""
+
+    def setUp(self):
+        """'A' con una plantilla y su casi copia, 'B' distinta y 'C' igual que 'A' con otro brillo"""
+        self.directory = tempfile.mkdtemp()
+        a = _pattern(1)
+        noisy = np.clip(a.astype(np.int16) + _pattern(9) // 64 - 2, 0, 255).astype(np.uint8)
+        images = {"a.png": a, "a_dup.png": noisy, "b.png": _pattern(2), "c.png": a // 2 + 60}
+        for name, image in images.items():
+            cv2.imwrite(os.path.join(self.directory, name), image)
+        self.bundle = compile_bundle({'A': ["a.png", "a_dup.png"], 'B': ["b.png"], 'C': ["c.png"]}, {}, {}, {},
+                                     templates_dir=self.directory)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_similarity_matrix(self):
+        """Correlación 1 con la propia imagen, baja con ruido distinto y -1 con tamaños incompatibles"""
+        sim = similarity_matrix([_pattern(1), _pattern(2), _pattern(1, 80, 60)])
+        self.assertAlmostEqual(float(sim[0, 0]), 1.0, places=5)
+        self.assertLess(abs(float(sim[0, 1])), 0.3)
+        self.assertEqual(float(sim[0, 2]), -1.0)
+
+    def test_find_duplicates(self):
+        """La casi copia es redundante dentro de 'A' y 'C' se parece a 'A' entre estados"""
+        report = find_duplicates(self.bundle, measure_cost=False)
+        self.assertEqual([(e['drop'], e['keep']) for e in report['redundant']['A']], [("a_dup.png", "a.png")])
+        self.assertNotIn('B', report['redundant'])
+        pairs = {tuple(sorted(e['states'])) for e in report['lookalikes']}
+        self.assertEqual(pairs, {('A', 'C')})
+        self.assertIsNone(report['saved_ms_per_frame'])
+
+    def test_label_from_filename(self):
+        self.assertEqual(label_from_filename("menu_home_sel_20240101_120000.png"), "menu_home_sel")
+        self.assertIsNone(label_from_filename("menu_home_sel.png"))
+
+    def test_capture_is_scored_leave_one_out(self):
+        """Una captura que también es plantilla de su estado no se puntúa contra sí misma"""
+        screen = _pattern(5, 120, 200)
+        screen[30:70, 50:110] = _pattern(1)
+        capture = os.path.join(self.directory, "A_20240101_120000.png")
+        cv2.imwrite(capture, screen)
+        templates = {'A': [capture, os.path.join(self.directory, "a.png")],
+                     'B': [os.path.join(self.directory, "b.png")]}
+        _init_worker(templates, {}, (0, 0), 1.0)
+        _, scores = _score_capture((capture, ['A', 'B']))
+        self.assertEqual(scores['A'][1], 1)  # Gana a.png, no la propia captura
+        self.assertGreater(scores['A'][0], 0.99)
+        self.assertLess(scores['B'][0], 0.5)
+
+    def test_analyze_confusion(self):
+        """Umbrales entre positivos y negativos, matriz de confusión, orden y poda"""
+        captures = [{'path': f"{state}{i}", 'state': state} for state in "AB" for i in range(2)]
+        scores = {"A0": {'A': [0.95, 0], 'B': [0.5, 0], 'C': [0.4, 0]},
+                  "A1": {'A': [0.97, 0], 'B': [0.45, 0], 'C': [0.4, 0]},
+                  "B0": {'A': [0.6, 0], 'B': [0.9, 0], 'C': [0.3, 0]},
+                  "B1": {'A': [0.55, 0], 'B': [0.92, 0], 'C': [0.3, 0]}}
+        report = analyze_confusion(self.bundle, captures, scores)
+        self.assertEqual(report['thresholds'], {'A': 0.775, 'B': 0.7})
+        self.assertEqual(report['confusion'], {'A': {'A': 2}, 'B': {'B': 2}})
+        self.assertEqual(report['state_order'][:2], ['B', 'A'])  # B tiene más margen (0.4 frente a 0.35)
+        self.assertEqual(report['prune'], {'A': ["a_dup.png"]})
+
+
+class TestTrackedMatching(unittest.TestCase):
+    """Pruebas de la búsqueda local alrededor de la última posición de cada plantilla"""
+
+    def setUp(self):
+        self.recognizer = _offline_recognizer()
+        self.recognizer.reset_tracking()
+        self.template = _pattern(1)
+
+    def tearDown(self):
+        self.recognizer.reset_tracking()
+
+    def _screen(self, x, y):
+        screen = _pattern(7, 200, 300)
+        screen[y:y + 40, x:x + 60] = self.template
+        return screen
+
+    def _find(self, screen, offset=(0, 0)):
+        return self.recognizer._find_template_tracked('A', 0, screen, offset, self.template, 0.9)
+
+    def test_local_window_then_fallback(self):
+        """La segunda búsqueda se resuelve en la ventana; si la plantilla se mueve, se busca en todo"""
+        self.assertEqual(self._find(self._screen(100, 50))[0], (100, 50))
+        self.assertEqual(self._find(self._screen(104, 52))[0], (104, 52))
+        self.assertEqual(self._find(self._screen(10, 140))[0], (10, 140))
+        stats = self.recognizer.get_tracking_stats()
+        self.assertEqual((stats['local_hits'], stats['local_misses'], stats['full_searches']), (1, 1, 2))
+        self.assertEqual(stats['tracked_templates'], 1)
+
+    def test_positions_are_absolute(self):
+        """La posición recordada está en coordenadas del frame, no de la ROI"""
+        screen = self._screen(100, 50)
+        self._find(screen)
+        loc, _ = self._find(screen[40:, 80:], offset=(80, 40))
+        self.assertEqual(loc, (20, 10))
+        self.assertEqual(self.recognizer.get_tracking_stats()['local_hits'], 1)
+
+    def test_miss_below_threshold_is_not_remembered(self):
+        """Una coincidencia por debajo del umbral no se recuerda"""
+        self._find(_pattern(7, 200, 300))
+        self.assertEqual(self.recognizer.get_tracking_stats()['tracked_templates'], 0)
+
+
+class TestFramePyramid(unittest.TestCase):
+    """Pruebas de las representaciones memorizadas de un frame"""
+
+    def setUp(self):
+        bgr = np.zeros((400, 800, 3), dtype=np.uint8)
+        bgr[:, 400:] = (255, 0, 0)  # Mitad derecha azul
+        self.pyramid = FramePyramid(bgr, frame_id=7)
+
+    def test_levels_are_memoized(self):
+        """Cada nivel se calcula una sola vez, es de solo lectura y reduce el frame a la mitad"""
+        self.assertEqual(self.pyramid.half.shape, (200, 400, 3))
+        self.assertEqual(self.pyramid.quarter.shape, (100, 200, 3))
+        self.assertEqual(self.pyramid.level(4, gray=True).shape, (100, 200))
+        computed = self.pyramid.computed
+        self.assertIs(self.pyramid.level(2), self.pyramid.half)
+        self.assertEqual(self.pyramid.computed, computed)
+        self.assertFalse(self.pyramid.half.flags.writeable)
+        with self.assertRaises(ValueError):
+            self.pyramid.level(3)
+
+    def test_fit_and_thumbnail(self):
+        """fit mantiene el aspecto y la miniatura tiene THUMBNAIL_WIDTH de ancho"""
+        self.assertEqual(self.pyramid.fit(300, 300).shape, (150, 300, 3))
+        self.assertEqual(self.pyramid.thumbnail(gray=True).shape, (THUMBNAIL_WIDTH // 2, THUMBNAIL_WIDTH))
+        rgb = self.pyramid.fit(300, 300, rgb=True)
+        self.assertEqual(tuple(rgb[0, -1]), (0, 0, 255))
+
+    def test_roi(self):
+        """roi devuelve una vista recortada al frame, escalada al nivel pedido"""
+        view = self.pyramid.roi((380, 10, 40, 20))
+        self.assertEqual(view.shape, (20, 40))
+        self.assertTrue(np.shares_memory(view, self.pyramid.gray))
+        self.assertEqual(self.pyramid.roi((380, 10, 40, 20), factor=2, gray=False).shape, (10, 20, 3))
+        self.assertEqual(self.pyramid.roi((780, 390, 100, 100)).shape, (10, 20))
+        self.assertIsNone(self.pyramid.roi((900, 0, 10, 10)))
+
+
+class TestRecognitionDeadline(unittest.TestCase):
+    """Pruebas del presupuesto de tiempo de un reconocimiento"""
+
+    def setUp(self):
+        self.recognizer = _offline_recognizer()
+        self.previous_state = self.recognizer.last_recognized_state
+
+    def tearDown(self):
+        self.recognizer.last_recognized_state = self.previous_state
+
+    def test_spent_budget_reports_unevaluated_states(self):
+        """Sin presupuesto no se evalúa ningún estado y el resultado lo indica"""
+        result = self.recognizer.recognize_image(_bgr(90, 160, 0), deadline_ms=0)
+        self.assertFalse(result['complete'])
+        self.assertEqual(result['state'], 'unknown')
+        self.assertEqual(sorted(result['unevaluated_states']), sorted(self.recognizer.templates))
+
+    def test_unbounded_scan_is_complete(self):
+        """Sin deadline se evalúan todos los estados"""
+        result = self.recognizer.recognize_image(_bgr(90, 160, 0))
+        self.assertTrue(result['complete'])
+        self.assertEqual(result['unevaluated_states'], [])
+        self.assertEqual(set(result['state_scores']), set(self.recognizer.templates))
+
+    def test_incomplete_scan_keeps_context(self):
+        """Un reconocimiento incompleto sin resultado no olvida el estado anterior"""
+        state = next(s for s, nxt in self.recognizer.bundle.transitions.items() if nxt)
+        self.recognizer.last_recognized_state = state
+        result = self.recognizer.recognize_image(_bgr(90, 160, 0), use_context=True, deadline_ms=0)
+        self.assertEqual(result['unevaluated_states'][0], self.recognizer.bundle.transitions[state][0])
+        self.assertEqual(self.recognizer.last_recognized_state, state)
+
+
+class TestBatchClassify(unittest.TestCase):
+    """Pruebas de la clasificación por lotes (sin pool de procesos)"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.directory, "sub"))
+        for name in ("b.png", "a.PNG", "notas.txt", os.path.join("sub", "c.jpg")):
+            open(os.path.join(self.directory, name), "wb").close()
+
+    def tearDown(self):
+        batch_classify._WORKER.clear()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def _names(self, paths):
+        return [os.path.relpath(path, self.directory) for path in paths]
+
+    def test_collect_images(self):
+        """Directorios y patrones se expanden a imágenes ordenadas y sin repetidos"""
+        names = self._names
+        self.assertEqual(names(batch_classify.collect_images([self.directory])), ["a.PNG", "b.png"])
+        self.assertEqual(names(batch_classify.collect_images([self.directory], recursive=True)),
+                         ["a.PNG", "b.png", os.path.join("sub", "c.jpg")])
+        pattern = os.path.join(self.directory, "*.png")
+        self.assertEqual(names(batch_classify.collect_images([pattern, pattern])), ["b.png"])
+
+    def test_classify_rows(self):
+        """Cada imagen produce una fila; las ilegibles quedan como error"""
+        batch_classify._WORKER.update({'recognizer': _offline_recognizer(), 'origin': (0, 0)})
+        path = os.path.join(self.directory, "captura.png")
+        cv2.imwrite(path, _bgr(90, 160, 0))
+        row = batch_classify._classify((path, 0))
+        self.assertEqual((row['width'], row['height'], row['complete'], row['error']), (160, 90, False, None))
+        row = batch_classify._classify((os.path.join(self.directory, "b.png"), None))
+        self.assertEqual((row['state'], row['error']), ('error', "No se pudo leer la imagen"))
+
+    def test_output_writer(self):
+        """Las filas se escriben en CSV con cabecera o en JSON Lines"""
+        row = {field: None for field in batch_classify.OUTPUT_FIELDS}
+        row.update({'file': "x.png", 'state': "menu"})
+        for fmt in ('csv', 'jsonl'):
+            path = os.path.join(self.directory, f"salida.{fmt}")
+            writer = batch_classify._OutputWriter(path, fmt)
+            writer.write(row)
+            writer.close()
+            with open(path, encoding="utf-8") as f:
+                lines = f.read().splitlines()
+            if fmt == 'csv':
+                self.assertEqual(lines[0].split(","), list(batch_classify.OUTPUT_FIELDS))
+                self.assertTrue(lines[1].startswith("x.png,menu,"))
+            else:
+                self.assertEqual(json.loads(lines[0])['state'], "menu")
+
+
+class TestSessionRecorder(unittest.TestCase):
+    """Pruebas de la grabación de sesiones y su reproducción por mmap"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "sesion.efrec")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def _record(self, compression=COMPRESSION_RAW, channels=3, frames=5):
+        # Bloques de 2 frames: la sesión ocupa varios bloques
+        with SessionRecorder(self.path, channels=channels, compression=compression,
+                             chunk_bytes=2 * 16 * 24 * channels, metadata={'origen': "prueba"}) as recorder:
+            for i in range(frames):
+                recorder.add_frame(_bgr(16, 24, 10 * i), timestamp=100.0 + i, metadata={'state': f"s{i}"})
+                recorder.add_event('press', timestamp=100.5 + i, button='a')
+        return recorder
+
+    def test_raw_round_trip(self):
+        """Los frames crudos se leen como vistas de solo lectura sobre el archivo"""
+        self._record()
+        with SessionReader(self.path) as reader:
+            self.assertEqual((len(reader), reader.frames_per_chunk, reader.duration_s), (5, 2, 4.0))
+            self.assertEqual(reader.metadata['origen'], "prueba")
+            frame = reader.frame(3)
+            self.assertEqual((frame.shape, int(frame[0, 0, 0])), ((16, 24, 3), 30))
+            self.assertFalse(frame.flags.writeable)
+            self.assertEqual(reader.frame_metadata(3), {'state': "s3"})
+            self.assertEqual(int(reader.frame_at(102.7)[0, 0, 0]), 20)
+            self.assertEqual(len(reader.events_between(101.0, 103.0, kinds=('press',))), 2)
+            self.assertEqual([index for index, _, _ in reader.iter_frames(3)], [3, 4])
+            with self.assertRaises(IndexError):
+                reader.frame(5)
+
+    def test_zlib_gray_round_trip(self):
+        """Las sesiones comprimidas y en gris conservan los frames"""
+        self._record(compression=COMPRESSION_ZLIB, channels=1)
+        with SessionReader(self.path) as reader:
+            self.assertEqual(reader.compression, COMPRESSION_ZLIB)
+            self.assertEqual([int(frame[0, 0]) for _, _, frame in reader.iter_frames()], [0, 10, 20, 30, 40])
+
+    def test_interrupted_recording_keeps_complete_chunks(self):
+        """Un bloque final a medio escribir se ignora"""
+        self._record()
+        with open(self.path, "r+b") as f:
+            f.truncate(os.path.getsize(self.path) - 10)
+        with SessionReader(self.path) as reader:
+            self.assertEqual(len(reader), 4)
+
+    def test_replay_source(self):
+        """ReplaySource entrega los frames en orden (en BGR) y termina"""
+        self._record(channels=1, frames=2)
+        with SessionReader(self.path) as reader:
+            source = ReplaySource(reader)
+            frame, metadata = source.read_latest()
+            self.assertEqual((frame.shape, metadata['replay_index']), ((16, 24, 3), 0))
+            self.assertEqual(metadata['recorded'], {'state': "s0"})
+            self.assertEqual(source.read_latest()[1]['replay_index'], 1)
+            self.assertEqual(source.read_latest(), (None, {}))
+            self.assertTrue(source.finished)
+
+    def test_empty_file_is_rejected(self):
+        open(self.path, "wb").close()
+        with self.assertRaises(ValueError):
+            SessionReader(self.path)
+
+
+class TestCaptureHistory(unittest.TestCase):
+    """Pruebas del historial por deltas"""
+
+    T0 = 1_700_000_000.0
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def _write(self, frames, **kwargs):
+        history = CaptureHistory(self.directory, tile_size=32, queue_size=len(frames), **kwargs)
+        for offset, frame in frames:
+            self.assertIsNotNone(history.add(frame, timestamp=self.T0 + offset, metadata={'t': offset}))
+        history.close()
+        return history
+
+    def test_deltas_reconstruct_frames(self):
+        """Keyframe, delta de una tesela, cambio de pantalla y cambio por debajo del umbral"""
+        first = _bgr(96, 128, 0)
+        one_tile = first.copy()
+        one_tile[40:50, 40:50] = 200
+        other = _bgr(96, 128, 120)
+        faint = other + 3
+        history = self._write([(0, first), (1, one_tile), (2, other), (3, faint)])
+        self.assertEqual((history.stats['keyframes'], history.stats['deltas'], history.stats['tiles_written']),
+                         (2, 2, 1))
+        reader = CaptureHistoryReader(self.directory)
+        frame, ts, metadata = reader.frame_at(self.T0 + 1.5)
+        self.assertTrue(np.array_equal(frame, one_tile))
+        self.assertEqual((ts, metadata), (self.T0 + 1, {'t': 1}))
+        self.assertTrue(np.array_equal(reader.frame_at(self.T0 + 3)[0], other))  # Por debajo del umbral
+        self.assertEqual([entry['keyframe'] for entry in reader.timeline()], [True, False, True, False])
+        self.assertEqual(reader.frame_at(self.T0 - 1), (None, None, {}))
+
+    def test_segments_and_disk_budget(self):
+        """Cada keyframe periódico abre un segmento y el presupuesto borra los más antiguos"""
+        frames = [(offset, _bgr(64, 64, 10 * i)) for i, offset in enumerate((0, 61, 122))]
+        history = self._write(frames, keyframe_interval_s=60.0, disk_budget_bytes=1)
+        self.assertEqual(history.stats['segments_deleted'], 2)
+        reader = CaptureHistoryReader(self.directory)
+        self.assertEqual(reader.summary()['segments'], 1)
+        self.assertEqual(reader.frame_at(self.T0 + 10), (None, None, {}))
+        self.assertEqual(int(reader.frame_at(self.T0 + 130)[0][0, 0, 0]), 20)
+
+
+class TestScreenshotWriter(unittest.TestCase):
+    """Pruebas de la escritura asíncrona de capturas"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def test_queue_overflow_drops_oldest(self):
+        """Con la cola llena se descarta la captura pendiente más antigua"""
+        writer = ScreenshotWriter(queue_size=2, min_interval_s=0.0)
+        release = threading.Event()
+        write = writer._write
+
+        def blocked_write(image, path):
+            release.wait(5.0)
+            write(image, path)
+
+        writer._write = blocked_write
+        writer.submit(_bgr(8, 8, 0), self._path("a.png"))
+        deadline = time.monotonic() + 2.0
+        while writer._queue and time.monotonic() < deadline:  # 'a' pasa a codificarse
+            time.sleep(0.01)
+        for name in ("b.png", "c.png", "d.png"):
+            writer.submit(_bgr(8, 8, 0), self._path(name))
+        self.assertEqual((writer.stats['dropped'], writer.queue_depth), (1, 3))
+        release.set()
+        self.assertTrue(writer.flush(timeout=5.0))
+        writer.close()
+        self.assertEqual(sorted(os.listdir(self.directory)), ["a.png", "c.png", "d.png"])
+
+    def test_rate_limit_per_path(self):
+        """Una misma ruta acepta como mucho una captura por min_interval_s"""
+        writer = ScreenshotWriter(min_interval_s=60.0)
+        self.assertIsNotNone(writer.submit(_bgr(8, 8, 0), self._path("a.png")))
+        self.assertIsNone(writer.submit(_bgr(8, 8, 0), self._path("a.png")))
+        self.assertIsNotNone(writer.submit(_bgr(8, 8, 0), self._path("b.png")))
+        writer.close()
+        self.assertEqual(writer.get_stats()['rate_limited'], 1)
+
+    def test_format_flush_and_close(self):
+        """El formato fijo cambia la extensión, flush espera a escribir y close rechaza lo nuevo"""
+        writer = ScreenshotWriter(image_format='jpg')
+        path = writer.submit(_bgr(8, 8, 90), self._path("captura.png"))
+        self.assertEqual(path, self._path("captura.jpg"))
+        self.assertTrue(writer.flush(timeout=5.0))
+        self.assertEqual(cv2.imread(path).shape, (8, 8, 3))
+        self.assertEqual(writer.get_stats()['queue_depth'], 0)
+        writer.close()
+        self.assertIsNone(writer.submit(_bgr(8, 8, 0), self._path("tarde.png")))
+        with self.assertRaises(ValueError):
+            ScreenshotWriter(image_format='gif')
+
+
+class TestFitThresholds(unittest.TestCase):
+    """Pruebas del ajuste de umbrales por estado a partir del feedback"""
+
+    def test_threshold_above_highest_negative(self):
+        """El umbral queda justo por encima del negativo más alto"""
+        records = [_feedback('A', {'A': 0.9, 'B': 0.3}) for _ in range(5)]
+        records += [_feedback('B', {'A': 0.7 - i * 0.01, 'B': 0.95}) for i in range(5)]
+        fitted = fit_thresholds(records, target_error=0.0, min_positives=3, min_negatives=5)
+        self.assertAlmostEqual(fitted['A']['threshold'], 0.701, places=3)
+        self.assertEqual(fitted['A']['false_accept_rate'], 0.0)
+        self.assertEqual(fitted['A']['ocr_rate_fitted'], 0.0)
+
+    def test_state_without_negatives_is_skipped(self):
+        """Sin negativos el estado conserva su umbral en vez de bajar al suelo"""
+        records = [_feedback('A', {'A': 0.9}) for _ in range(5)]
+        fitted = fit_thresholds(records, min_positives=3)
+        self.assertNotIn('A', fitted)
+        fitted = fit_thresholds(records, min_positives=3, min_negatives=0)
+        self.assertEqual(fitted['A']['threshold'], OCR_FALLBACK_THRESHOLD)
+
+    def test_few_positives_or_negatives_are_skipped(self):
+        """Los estados con pocos positivos o negativos no se ajustan"""
+        records = [_feedback('A', {'A': 0.9, 'B': 0.2}) for _ in range(2)]
+        records += [_feedback('B', {'A': 0.4, 'B': 0.9}) for _ in range(3)]
+        fitted = fit_thresholds(records, min_positives=3, min_negatives=3)
+        self.assertNotIn('A', fitted)  # 2 positivos
+        self.assertNotIn('B', fitted)  # 2 negativos
+
+    def test_denied_detection_counts_as_negative(self):
+        """Una detección negada cuenta como negativo del estado detectado"""
+        records = [_feedback('A', {'A': 0.9}) for _ in range(3)]
+        records.append({'event': 'deny', 'correct_state': None, 'detected_state': 'A',
+                        'state_scores': {'A': 0.85}})
+        fitted = fit_thresholds(records, target_error=0.0, min_positives=3, min_negatives=1)
+        self.assertAlmostEqual(fitted['A']['threshold'], 0.851, places=3)
+
+
+class TestMenuGraph(unittest.TestCase):
+    """Pruebas de la planificación de caminos entre menús (Dijkstra)"""
+
+    def setUp(self):
+        """Grafo pequeño: dos caminos de A a D y una arista sin botón"""
+        self.graph = MenuGraph.from_transitions({
+            'A': [{'state': 'B', 'button': 'dpad_right', 'latency_s': 0.5},
+                  {'state': 'C', 'button': ['dpad_down', 'a'], 'latency_s': 0.2}],
+            'B': [{'state': 'D', 'button': 'a', 'latency_s': 2.0}],
+            'C': [{'state': 'D', 'button': 'a', 'latency_s': 0.5}, 'E'],
+        }, press_cost_s=0.1)
+
+    def test_plan_picks_lowest_cost_path(self):
+        """Se elige el camino de menor latencia más pulsaciones, no el de menos saltos"""
+        plan = self.graph.plan('A', 'D')
+        self.assertEqual([hop.target for hop in plan], ['C', 'D'])
+        self.assertEqual(plan[0].buttons, ('dpad_down', 'a'))
+        self.assertAlmostEqual(sum(hop.expected_s for hop in plan), 0.7)
+
+    def test_plan_to_nearest_of_several_targets(self):
+        """Con varios destinos se llega al más cercano; en el destino el plan es vacío"""
+        self.assertEqual([hop.target for hop in self.graph.plan('A', ('B', 'D'))], ['B'])
+        self.assertEqual(self.graph.plan('D', ('B', 'D')), [])
+
+    def test_unlabelled_edges_are_not_planned(self):
+        """Las aristas sin botón no se ejecutan: no hay camino"""
+        self.assertIsNone(self.graph.plan('C', 'E'))
+        self.assertIsNone(self.graph.plan('D', 'A'))
+
+    def test_measured_latency_overrides_configured(self):
+        """La latencia medida sustituye a la configurada al planificar"""
+        graph = MenuGraph(self.graph.edges, press_cost_s=0.1,
+                          latency_source=lambda source, target: 5.0 if target == 'C' else None)
+        self.assertEqual([hop.target for hop in graph.plan('A', 'D')], ['B', 'D'])
+
+    def test_config_routes_back_to_main_menu(self):
+        """state_transitions.json permite volver al menú principal desde los submenús"""
+        with open(os.path.join(CONFIG_DIR, "state_transitions.json"), "r", encoding="utf-8") as f:
+            graph = MenuGraph.from_transitions(json.load(f))
+        for state in ('menu_contrato_raquel_confirmar_fichar_GP_sel', 'menu_jugador_acciones_despedir',
+                      'menu_partido_eventos_ia_partido'):
+            plan = graph.plan(state, MAIN_MENU_STATES)
+            self.assertTrue(plan, state)
+            self.assertIn(plan[-1].target, MAIN_MENU_STATES)
+
+    def test_config_routes_forward_from_main_menu(self):
+        """state_transitions.json permite avanzar por el menú principal y entrar en los submenús"""
+        with open(os.path.join(CONFIG_DIR, "state_transitions.json"), "r", encoding="utf-8") as f:
+            graph = MenuGraph.from_transitions(json.load(f))
+        plan = graph.plan('menu_home_sel', 'menu_home_contrato_sel')
+        self.assertTrue(plan)
+        self.assertTrue(all(hop.buttons == ('dpad_right',) for hop in plan))
+        plan = graph.plan('menu_home_premijuego_sel', 'menu_contrato_jugadores_especiales_sel')
+        self.assertTrue(plan)
+        self.assertEqual(plan[-1].buttons, ('a',))
+
+
+def _menu(options, highlighted, layout='vertical', color=(200, 200, 200), band=80):
+    """Menú sintético: franjas oscuras con la opción ``highlighted`` pintada de ``color``."""
+    length = options * band
+    image = _bgr(length, 320, 40) if layout == 'vertical' else _bgr(120, length, 40)
+    start, end = highlighted * band, (highlighted + 1) * band
+    if layout == 'vertical':
+        image[start:end] = color
+    else:
+        image[:, start:end] = color
+    return image
+
+
+class TestHighlightDetector(unittest.TestCase):
+    """Pruebas de la detección de la opción resaltada sobre menús sintéticos"""
+
+    def test_brightness_finds_highlighted_band(self):
+        """Por brillo se elige la franja más clara en ambas orientaciones"""
+        for layout in ('vertical', 'horizontal'):
+            detector = HighlightDetector(5, layout)
+            for index in (0, 2, 4):
+                result = detector.detect(_menu(5, index, layout))
+                self.assertEqual(result.index, index, (layout, index))
+                self.assertEqual(len(result.scores), 5)
+
+    def test_color_ignores_brighter_options(self):
+        """Por color cuenta el color de selección, no el brillo"""
+        image = _menu(4, 1, color=(40, 120, 160))
+        image[3 * 80:] = 255  # Opción blanca, más brillante que la seleccionada
+        self.assertEqual(HighlightDetector(4, highlight_color=(40, 120, 160)).detect(image).index, 1)
+        self.assertEqual(HighlightDetector(4).detect(image).index, 3)
+
+    def test_color_accepts_gray_crop(self):
+        """Un recorte en grises se convierte a BGR en lugar de fallar"""
+        gray = cv2.cvtColor(_menu(3, 2), cv2.COLOR_BGR2GRAY)
+        result = HighlightDetector(3, highlight_color=(200, 200, 200)).detect(gray)
+        self.assertEqual(result.index, 2)
+
+    def test_ambiguous_highlight_is_rejected(self):
+        """Sin una franja que destaque (p.ej. durante una animación) index es None"""
+        image = _menu(4, 0)
+        image[80:160] = 190  # Segunda franja casi igual de brillante
+        result = HighlightDetector(4).detect(image)
+        self.assertIsNone(result.index)
+        self.assertLess(result.confidence, 0.15)
+
+
+class _InstantMenu:
+    """Menú falso sin retardo: cada pulsación mueve el resaltado salvo las de ``dropped``."""
+
+    def __init__(self, total, visible, start=0, dropped=()):
+        self.model = _ScrollModel(total, visible)
+        self.position, self.offset = start, max(0, start - visible + 1)
+        self.dropped = set(dropped)
+        self.presses = 0
+
+    def press_button(self, button, duration=0.1):
+        self.presses += 1
+        if self.presses not in self.dropped:
+            self.position, self.offset = self.model.step(self.position, self.offset, 1 if button == 'down' else -1)
+
+    def observe(self):
+        time.sleep(0.001)
+        return self.position - self.offset
+
+
+class TestDpadNavigation(unittest.TestCase):
+    """Pruebas del modelo de desplazamiento y de la navegación en lazo cerrado con observe falso"""
+
+    def test_scroll_model_moves_window_at_edges(self):
+        """El resaltado llega al borde y a partir de ahí se desplaza la lista"""
+        model = _ScrollModel(10, 3)
+        self.assertEqual(model.replay(0, 0, [1, 1]), (2, 0))
+        self.assertEqual(model.step(2, 0, 1), (3, 1))
+        self.assertEqual(model.replay(3, 1, [-1, -1, -1]), (0, 0))
+        self.assertEqual(model.step(9, 7, 1), (9, 7))
+        self.assertEqual(model.step(0, 0, -1), (0, 0))
+
+    def test_navigates_to_target(self):
+        """Sin pulsaciones perdidas llega al objetivo con una pulsación por opción"""
+        menu = _InstantMenu(5, 5, start=1)
+        navigator = DpadNavigator(menu, menu.observe, 5, buttons=('up', 'down'),
+                                  repeat_interval_s=0.01, input_lag_s=0.005)
+        outcome = navigator.navigate(4, timeout_s=5.0)
+        self.assertTrue(outcome['success'])
+        self.assertEqual((outcome['position'], menu.position), (4, 4))
+        self.assertEqual(outcome['presses'], 3)
+
+    def test_dropped_press_is_corrected(self):
+        """Una pulsación perdida se detecta al observar y se repite"""
+        menu = _InstantMenu(20, 5, start=2, dropped={2})
+        navigator = DpadNavigator(menu, menu.observe, 5, 20, buttons=('up', 'down'),
+                                  repeat_interval_s=0.02, input_lag_s=0.005)
+        outcome = navigator.navigate(9, current=2, timeout_s=5.0)
+        self.assertTrue(outcome['success'])
+        self.assertEqual(menu.position, 9)
+        self.assertGreaterEqual(outcome['presses'], 8)
+
+    def test_simulated_menu_with_scrollbar(self):
+        """Con la barra de desplazamiento observada llega al objetivo en una lista larga"""
+        menu = SimulatedMenu(40, 8, start=3, input_lag_s=0.01, min_repeat_s=0.01, drop_rate=0.0,
+                             capture_s=0.001, scrollbar=True)
+        navigator = DpadNavigator(menu, menu.observe, 8, 40, buttons=('up', 'down'),
+                                  repeat_interval_s=0.015, press_duration_s=0.0, input_lag_s=0.015)
+        outcome = navigator.navigate(25, current=3, timeout_s=10.0)
+        self.assertTrue(outcome['success'])
+        self.assertEqual(menu.settled_position(), 25)
+
+    def test_watcher_releases_from_its_thread(self):
+        """HighlightWatcher llama a release desde su propio hilo al terminar"""
+        released = []
+        with HighlightWatcher(lambda: 0, release=lambda: released.append(threading.current_thread().name)) as watcher:
+            watcher.wait_newer(0, 1.0)
+        self.assertEqual(released, ["HighlightWatcher"])
+
+    def test_release_thread_session_closes_only_current(self):
+        """release_thread_session cierra la sesión mss del hilo actual y la olvida"""
+
+        class _Session:
+            closed = False
+
+            def close(self):
+                self.closed = True
+
+        recognizer = ScreenRecognizer(monitor=None)
+        mine, other = _Session(), _Session()
+        recognizer._sct_local.sct = mine
+        recognizer._sct_sessions.extend([mine, other])
+        recognizer.release_thread_session()
+        self.assertTrue(mine.closed)
+        self.assertFalse(other.closed)
+        self.assertEqual(recognizer._sct_sessions, [other])
+        recognizer.release_thread_session()  # Sin sesión en el hilo: no hace nada
+        recognizer.close()
+        self.assertTrue(other.closed)
+
+
+class TestTransitionObserver(unittest.TestCase):
+    """Pruebas de la atribución de transiciones a pulsaciones"""
+
+    def setUp(self):
+        """Modelo sólo en memoria con el estado inicial 'A'"""
+        self.model = TransitionModel(path=None, min_samples=1)
+        self.observer = TransitionObserver(self.model, max_latency_s=2.0)
+        self.observer.on_recognition({'ts': 0.0, 'state': 'A'})
+
+    def _press(self, button, ts):
+        self.observer.on_input({'kind': 'press', 'button': button, 'ts': ts})
+
+    def test_single_press_is_recorded(self):
+        """Una única pulsación antes del cambio se registra con su latencia"""
+        self._press('a', 1.0)
+        self.observer.on_recognition({'ts': 1.2, 'state': 'A'})
+        self.observer.on_recognition({'ts': 1.5, 'state': 'B'})
+        self.assertAlmostEqual(self.model.latency('A', 'B'), 0.5)
+        self.assertEqual([row['input'] for row in self.model.rows()], ['a'])
+
+    def test_multiple_presses_are_ambiguous(self):
+        """Con varias pulsaciones candidatas no se acredita la última"""
+        self._press('dpad_down', 1.0)
+        self._press('a', 1.1)
+        self.observer.on_recognition({'ts': 1.5, 'state': 'B'})
+        self.assertEqual(len(self.model), 0)
+
+    def test_stale_press_is_ignored(self):
+        """Un cambio posterior a max_latency_s no se atribuye a la pulsación"""
+        self._press('a', 1.0)
+        self.observer.on_recognition({'ts': 4.0, 'state': 'B'})
+        self.assertEqual(len(self.model), 0)
+        self._press('b', 5.0)
+        self.observer.on_recognition({'ts': 5.4, 'state': 'A'})
+        self.assertAlmostEqual(self.model.latency('B', 'A'), 0.4)
+
+    def test_edge_without_samples_has_no_max(self):
+        """Una arista sin muestras (archivo editado) no rompe los percentiles"""
+        self.model.record('A', 'a', 'B', 0.5)
+        self.model._edges[('A', 'a', 'B')].samples.clear()
+        self.assertIsNone(self.model.rows()[0]['max'])
+        self.assertIsNone(self.model.timeout('A', 'B'))
+
+
+class _RecordingGamepad:
+    """Gamepad falso: guarda las entradas aplicadas en cada update()."""
+
+    def __init__(self):
+        self.batch = []
+        self.updates = []
+
+    def update(self):
+        self.updates.append(self.batch)
+        self.batch = []
+
+
+class _RecordingController:
+    """Controlador falso con la interfaz que usa InputScheduler."""
+
+    def __init__(self):
+        self.gamepad = _RecordingGamepad()
+        self.button_mapping = {'a': 'a', 'b': 'b'}
+        self._state_lock = threading.RLock()
+        self.held = set()
+
+    def _apply_press(self, button):
+        self.held.add(button)
+        self.gamepad.batch.append(('press', button))
+
+    def _apply_release(self, button):
+        self.held.discard(button)
+        self.gamepad.batch.append(('release', button))
+
+    def _apply_joystick(self, joystick, x, y):
+        self.gamepad.batch.append(('joystick', joystick, x, y))
+
+    def _apply_trigger(self, trigger, value):
+        self.gamepad.batch.append(('trigger', trigger, value))
+
+    def _notify_input(self, kind, **data):
+        pass
+
+
+class TestInputScheduler(unittest.TestCase):
+    """Pruebas del planificador de entradas con plazos absolutos"""
+
+    def setUp(self):
+        """Planificador sobre un controlador falso"""
+        self.controller = _RecordingController()
+        self.scheduler = InputScheduler(self.controller)
+
+    def tearDown(self):
+        self.scheduler.close()
+
+    def test_events_applied_in_deadline_order(self):
+        """Los eventos se aplican por plazo, no por orden de llegada"""
+        start = clock() + 0.05
+        last = self.scheduler.schedule('release', at=start + 0.02, button='a')
+        self.scheduler.schedule('press', at=start, button='a')
+        self.scheduler.schedule('press', at=start + 0.01, button='b')
+        last.result(timeout=2)
+        applied = [event for batch in self.controller.gamepad.updates for event in batch]
+        self.assertEqual(applied, [('press', 'a'), ('press', 'b'), ('release', 'a')])
+
+    def test_same_deadline_coalesced_per_control(self):
+        """Controles distintos en el mismo plazo comparten update(); el mismo control no"""
+        at = clock() + 0.05
+        futures = [self.scheduler.schedule('press', at=at, button='a'),
+                   self.scheduler.schedule('press', at=at, button='b'),
+                   self.scheduler.schedule('release', at=at, button='a')]
+        for future in futures:
+            future.result(timeout=2)
+        self.assertEqual(self.controller.gamepad.updates,
+                         [[('press', 'a'), ('press', 'b')], [('release', 'a')]])
+
+    def test_cancel_applies_pending_releases(self):
+        """Al cancelar, lo pulsado se suelta y lo que no se pulsó no se pulsa"""
+        press = self.scheduler.schedule('press', button='a')
+        press.result(timeout=2)
+        release = self.scheduler.schedule('release', at=clock() + 10, button='a')
+        later = self.scheduler.schedule('press', at=clock() + 10, button='b')
+        stick = self.scheduler.schedule('joystick', at=clock() + 10, joystick='left', x=0, y=0)
+        self.assertEqual(self.scheduler.cancel_pending(), 1)
+        self.assertTrue(later.cancelled())
+        self.assertTrue(release.done() and not release.cancelled())
+        self.assertTrue(stick.done() and not stick.cancelled())
+        self.assertEqual(self.controller.held, set())
+        self.assertEqual(self.controller.gamepad.updates[-1], [('release', 'a'), ('joystick', 'left', 0, 0)])
+        self.assertEqual(self.scheduler.pending(), 0)
+
+    def test_closed_scheduler_is_released(self):
+        """Tras close() el hook de salida no retiene el planificador"""
+        scheduler = InputScheduler(_RecordingController())
+        ref = weakref.ref(scheduler)
+        scheduler.close()
+        del scheduler
+        gc.collect()
+        self.assertIsNone(ref())
+
+
+class _Button(Enum):
+    """Subconjunto de GamepadButton (sin importar vgamepad)."""
+    A = 'a'
+    B = 'b'
+    DPAD_DOWN = 'dpad_down'
+
+
+class _ProgramController(_RecordingController):
+    """Controlador falso con botones tipo GamepadButton y su propio planificador."""
+
+    def __init__(self):
+        super().__init__()
+        self.button_mapping = {button: button.value for button in _Button}
+        self.scheduler = InputScheduler(self)
+        self.presses = []
+        self.press_times = []
+
+    def _apply_press(self, button):
+        super()._apply_press(button)
+        self.presses.append(button.value)
+        self.press_times.append(clock())
+
+
+class _ScriptedRecognizer:
+    """Reconocedor falso: la pantalla está en ``state`` (o la decide ``state_fn``)."""
+
+    def __init__(self, state='home', state_fn=None):
+        self.state = state
+        self.state_fn = state_fn
+        self.calls = 0
+
+    def wait_for_state(self, states, timeout=10.0, poll_interval=0.25):
+        self.calls += 1
+        deadline = time.monotonic() + timeout
+        while True:
+            state = self.state_fn() if self.state_fn else self.state
+            if state in states or time.monotonic() >= deadline:
+                return {'state': state, 'matched': state in states}
+            time.sleep(0.001)
+
+
+def _sequence(*actions):
+    """Secuencia a partir de tuplas (tipo, {parámetros})."""
+    sequence = ActionSequence("prueba")
+    for action_type, params in actions:
+        sequence.add_action(action_type, **params)
+    return sequence
+
+
+class TestSequenceProgram(unittest.TestCase):
+    """Pruebas de compile_sequence y run_program"""
+
+    def setUp(self):
+        """Controlador falso con planificador"""
+        self.controller = _ProgramController()
+
+    def tearDown(self):
+        self.controller.scheduler.close()
+
+    def _run(self, sequence, recognizer=None):
+        run_program(compile_sequence(sequence), self.controller, lambda opcode, operand: None, recognizer)
+        return self.controller.presses
+
+    def test_compile_offsets_and_triggers(self):
+        """Las esperas sólo desplazan offsets; LT se compila como eje de gatillo"""
+        program = compile_sequence(_sequence(('button_press', {'button': 'A', 'duration': 0.1}),
+                                             ('wait', {'seconds': 0.5}),
+                                             ('button_press', {'button': 'LT', 'duration': 0.2})))
+        self.assertEqual(program.opcodes, (OP_PRESS, OP_RELEASE, OP_TRIGGER, OP_TRIGGER, OP_END))
+        self.assertEqual(program.operands[:2], ('a', 'a'))
+        self.assertEqual(program.operands[2:4], (('left', 255), ('left', 0)))
+        for offset, expected in zip(program.offsets, (0.0, 0.1, 0.6, 0.8, 0.8)):
+            self.assertAlmostEqual(offset, expected)
+        self.assertAlmostEqual(program.duration_s, 0.8)
+        self.assertFalse(program.needs_recognizer)
+
+    def test_compile_sync_points_restart_offsets(self):
+        """Tras un punto de sincronización los offsets vuelven a contar desde cero"""
+        program = compile_sequence(_sequence(('button_press', {'button': 'A', 'duration': 0.1}),
+                                             ('wait', {'seconds': 0.2}),
+                                             ('wait_for_state', {'states': 'home'}),
+                                             ('wait', {'seconds': 0.3}),
+                                             ('button_press', {'button': 'B', 'duration': 0.05})))
+        self.assertEqual(program.opcodes, (OP_PRESS, OP_RELEASE, OP_WAIT_STATE, OP_PRESS, OP_RELEASE, OP_END))
+        for offset, expected in zip(program.offsets, (0.0, 0.1, 0.3, 0.3, 0.35, 0.35)):
+            self.assertAlmostEqual(offset, expected)
+        self.assertAlmostEqual(program.duration_s, 0.65)  # Tiempo fijo de toda la secuencia
+
+    def test_compile_block_end_keeps_pending_wait(self):
+        """El tiempo pendiente al cerrar un if_state se conserva con OP_SYNC dentro del bloque"""
+        program = compile_sequence(_sequence(('if_state', {'states': 'home'}),
+                                             ('button_press', {'button': 'A', 'duration': 0.1}),
+                                             ('wait', {'seconds': 0.2}),
+                                             ('end_if', {})))
+        self.assertEqual(program.opcodes, (OP_BRANCH_STATE, OP_PRESS, OP_RELEASE, OP_SYNC, OP_END))
+        for offset, expected in zip(program.offsets, (0.0, 0.0, 0.1, 0.3, 0.0)):
+            self.assertAlmostEqual(offset, expected)
+        self.assertEqual(program.operands[0][2], 4)  # Fuera del estado se salta también la espera
+
+    def test_run_follows_offsets(self):
+        """Las pulsaciones se aplican en su offset y el programa dura su tiempo fijo"""
+        sequence = _sequence(('button_press', {'button': 'A', 'duration': 0.01}),
+                             ('wait', {'seconds': 0.1}),
+                             ('button_press', {'button': 'B', 'duration': 0.01}),
+                             ('wait', {'seconds': 0.05}))
+        program = compile_sequence(sequence)
+        started = clock()
+        run_program(program, self.controller, lambda opcode, operand: None)
+        elapsed = clock() - started
+        self.assertEqual(self.controller.presses, ['a', 'b'])
+        gap = self.controller.press_times[1] - self.controller.press_times[0]
+        self.assertGreaterEqual(gap, 0.11 - 0.005)
+        self.assertLess(gap, 0.11 + 0.05)
+        self.assertGreaterEqual(elapsed, program.duration_s - 0.005)
+
+    def test_compile_patches_branch_targets(self):
+        """if_state salta a la rama else y la rama then salta al final"""
+        program = compile_sequence(_sequence(('if_state', {'states': 'home'}),
+                                             ('button_press', {'button': 'A'}),
+                                             ('else', {}),
+                                             ('button_press', {'button': 'B'}),
+                                             ('end_if', {})))
+        self.assertEqual(program.opcodes[0], OP_BRANCH_STATE)
+        self.assertEqual(program.operands[0][2], 4)           # Inicio de la rama else
+        self.assertEqual(program.opcodes[3], OP_JUMP)
+        self.assertEqual(program.operands[3], (len(program.opcodes) - 1,))
+        self.assertTrue(program.needs_recognizer)
+
+    def test_unbalanced_blocks_are_rejected(self):
+        """Bloques mal anidados o sin cerrar dan ValueError con la acción culpable"""
+        cases = [
+            ((('else', {}),), "acción 1"),
+            ((('loop', {'count': 2}), ('end_if', {})), "acción 2"),
+            ((('if_state', {'states': 'x'}), ('else', {}), ('else', {}), ('end_if', {})), "acción 3"),
+            ((('button_press', {'button': 'A'}), ('if_state', {'states': 'x'})), "falta 'end_if'"),
+            ((('loop', {'count': 2}),), "falta 'end_loop'"),
+        ]
+        for actions, message in cases:
+            with self.assertRaises(ValueError) as ctx:
+                compile_sequence(_sequence(*actions))
+            self.assertIn(message, str(ctx.exception))
+
+    def test_invalid_parameters_are_rejected(self):
+        """Botones, contadores y tipos desconocidos se detectan al compilar"""
+        for action in (('button_press', {'button': 'Z'}), ('loop', {'count': 0}),
+                       ('wait', {'seconds': -1}), ('jump', {})):
+            with self.assertRaises(ValueError):
+                compile_sequence(_sequence(action, ('end_loop', {})) if action[0] == 'loop'
+                                 else _sequence(action))
+
+    def test_run_if_else_branches(self):
+        """Se ejecuta sólo la rama que corresponde al estado"""
+        sequence = _sequence(('if_state', {'states': ['home']}),
+                             ('button_press', {'button': 'A', 'duration': 0.001}),
+                             ('else', {}),
+                             ('button_press', {'button': 'B', 'duration': 0.001}),
+                             ('end_if', {}),
+                             ('button_press', {'button': 'DPAD_DOWN', 'duration': 0.001}))
+        self.assertEqual(self._run(sequence, _ScriptedRecognizer('home')), ['a', 'dpad_down'])
+        self.controller.presses.clear()
+        self.assertEqual(self._run(sequence, _ScriptedRecognizer('other')), ['b', 'dpad_down'])
+
+    def test_run_loops(self):
+        """Los bucles repiten su cuerpo, anidados y con salida por estado"""
+        nested = _sequence(('loop', {'count': 2}),
+                           ('button_press', {'button': 'A', 'duration': 0.001}),
+                           ('loop', {'count': 3}),
+                           ('button_press', {'button': 'B', 'duration': 0.001}),
+                           ('end_loop', {}),
+                           ('end_loop', {}))
+        self.assertEqual(self._run(nested), ['a', 'b', 'b', 'b'] * 2)
+
+        self.controller.presses.clear()
+        until = _sequence(('loop', {'count': 10, 'until_states': 'done'}),
+                          ('button_press', {'button': 'A', 'duration': 0.001}),
+                          ('end_loop', {}))
+        recognizer = _ScriptedRecognizer(state_fn=lambda: 'done' if len(self.controller.presses) >= 3 else 'home')
+        self.assertEqual(self._run(until, recognizer), ['a'] * 3)
+
+    def test_run_press_until_state(self):
+        """press_until_state pulsa hasta llegar al estado o falla al agotar las pulsaciones"""
+        sequence = _sequence(('press_until_state', {'button': 'B', 'states': 'home', 'interval': 0.01,
+                                                    'max_presses': 5, 'duration': 0.001}))
+        recognizer = _ScriptedRecognizer(state_fn=lambda: 'home' if len(self.controller.presses) >= 2 else 'menu')
+        self.assertEqual(self._run(sequence, recognizer), ['b', 'b'])
+        self.controller.presses.clear()
+        with self.assertRaises(TimeoutError):
+            self._run(sequence, _ScriptedRecognizer('menu'))
+        self.assertEqual(len(self.controller.presses), 5)
+
+    def test_wait_for_state_timeout_releases_inputs(self):
+        """Un wait_for_state fallido aborta la secuencia sin dejar botones pulsados"""
+        sequence = _sequence(('button_press', {'button': 'A', 'duration': 0.001}),
+                             ('wait_for_state', {'states': 'home', 'timeout': 0.01}),
+                             ('button_press', {'button': 'B', 'duration': 0.001}))
+        with self.assertRaises(TimeoutError):
+            self._run(sequence, _ScriptedRecognizer('menu'))
+        self.assertEqual(self.controller.presses, ['a'])
+        self.assertEqual(self.controller.held, set())
+
+    def test_cancel_interrupts_fixed_wait(self):
+        """Cancelar el flujo corta una espera larga y suelta lo pulsado"""
+        sequence = _sequence(('button_press', {'button': 'A', 'duration': 0.001}),
+                             ('wait', {'seconds': 5.0}),
+                             ('button_press', {'button': 'B', 'duration': 0.001}))
+        token = CancellationToken()
+        threading.Timer(0.05, token.cancel).start()
+        started = time.monotonic()
+        with cancellation_scope(token), self.assertRaises(WorkflowCancelled):
+            self._run(sequence)
+        self.assertLess(time.monotonic() - started, 1.0)
+        self.assertEqual(self.controller.presses, ['a'])
+        self.assertEqual(self.controller.held, set())
+
+    def test_state_actions_require_recognizer(self):
+        """Un programa con acciones de estado no arranca sin reconocedor"""
+        with self.assertRaises(ValueError):
+            self._run(_sequence(('wait_for_state', {'states': 'home'})))
+
+
+class TestTaskJournal(unittest.TestCase):
+    """Pruebas de la reanudación de ejecuciones con el diario"""
+
+    def setUp(self):
+        """Diario en un directorio temporal"""
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "journal.jsonl")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def _journal(self, plan="plan", resume=True):
+        journal = TaskJournal(self.path)
+        resumed = journal.open(plan, ["a", "b"], resume=resume)
+        return journal, resumed
+
+    def test_interrupted_attempt_keeps_counters(self):
+        """Un intento sin terminar (caída) conserva su progreso y los pasos completados"""
+        journal, resumed = self._journal()
+        self.assertFalse(resumed)
+        journal.step_started("a")
+        journal.step_finished("a", STATUS_DONE)
+        journal.step_started("b")
+        journal.progress("b", {'matches_played': 3})
+        journal, resumed = self._journal()
+        self.assertTrue(resumed)
+        self.assertEqual(journal.completed, {"a"})
+        self.assertEqual(journal.counters, {"b": {'matches_played': 3}})
+        self.assertEqual(journal.step_started("b"), 2)
+
+    def test_failed_attempt_discards_counters(self):
+        """Un intento fallido no deja contadores para el siguiente"""
+        journal, _ = self._journal()
+        journal.step_started("b")
+        journal.progress("b", {'matches_played': 5})
+        journal.step_finished("b", STATUS_FAILED, "objetivo no alcanzado")
+        self.assertNotIn("b", journal.counters)
+        journal, resumed = self._journal()
+        self.assertTrue(resumed)
+        self.assertEqual(journal.counters, {})
+        self.assertEqual(summarize(self.path)['steps']['b'],
+                         {'status': STATUS_FAILED, 'attempts': 1, 'counters': {}})
+
+    def test_closed_or_different_plan_starts_fresh(self):
+        """Una ejecución cerrada, otro plan o resume=False empiezan de cero"""
+        journal, _ = self._journal()
+        journal.step_started("a")
+        journal.step_finished("a", STATUS_DONE)
+        journal, resumed = self._journal(plan="otro")
+        self.assertFalse(resumed)
+        self.assertEqual(journal.completed, set())
+        journal.close_run({"a": STATUS_DONE})
+        self.assertFalse(self._journal(plan="otro")[1])
+        self.assertFalse(self._journal(plan="otro", resume=False)[1])
+
+    def test_graph_resumes_and_blocks_dependents(self):
+        """El grafo salta lo completado, repite checkpoint=False y retoma el progreso"""
+        calls = []
+
+        def banners():
+            calls.append("banners")
+            return True
+
+        def sign():
+            calls.append("sign")
+            return True
+
+        interrupt = [True]
+
+        def play():
+            progress = current_progress()
+            played = progress.get('played', 0)
+            calls.append(("play", played))
+            while played < 3:
+                if played == 1 and interrupt[0]:
+                    raise KeyboardInterrupt  # Interrupción: sin step_end en el diario
+                played += 1
+                progress.set('played', played)
+            return True
+
+        steps = [TaskStep("banners", "Banners", banners, checkpoint=False),
+                 TaskStep("sign", "Fichar", sign, depends=("banners",)),
+                 TaskStep("play", "Jugar", play, depends=("sign",))]
+        with self.assertRaises(KeyboardInterrupt):
+            TaskGraph(steps, TaskJournal(self.path)).run()
+        interrupt[0] = False
+        results = TaskGraph(steps, TaskJournal(self.path)).run()
+        self.assertEqual(results, {"banners": STATUS_DONE, "sign": STATUS_RESUMED, "play": STATUS_DONE})
+        self.assertEqual(calls, ["banners", "sign", ("play", 0), "banners", ("play", 1)])
+        self.assertTrue(summarize(self.path)['finished'])
+
+        graph = TaskGraph([TaskStep("banners", "Banners", lambda: False),
+                           TaskStep("sign", "Fichar", sign, depends=("banners",))], TaskJournal(self.path))
+        self.assertEqual(graph.run(), {"banners": STATUS_FAILED, "sign": STATUS_BLOCKED})
+        self.assertFalse(summarize(self.path)['finished'])
+
+
+T0 = 1000.0  # Origen de los instantes de las pruebas del vigilante (ts = 0 equivale a "sin ts")
+
+
+class _Pyramid:
+    """Pirámide falsa: una miniatura gris uniforme."""
+
+    def __init__(self, level):
+        self.level = level
+
+    def thumbnail(self, gray=True):
+        return np.full((90, 160), self.level, dtype=np.uint8)
+
+
+class _ListeningFake:
+    """Gamepad, reconocedor y navegador falsos para el vigilante."""
+
+    def __init__(self):
+        self.calls = []
+
+    def add_recognition_listener(self, listener):
+        pass
+
+    def remove_recognition_listener(self, listener):
+        pass
+
+    def add_input_listener(self, listener):
+        pass
+
+    def remove_input_listener(self, listener):
+        pass
+
+    def navigate(self, states, timeout):
+        self.calls.append('navigate')
+        return {'success': True}
+
+    def save_screenshot(self, filename, directory=None):
+        return os.path.join(directory, filename)
+
+
+class TestStallWatchdog(unittest.TestCase):
+    """Pruebas de la detección de bloqueos"""
+
+    def setUp(self):
+        self.fake = _ListeningFake()
+        self.watchdog = StallWatchdog(self.fake, self.fake, navigator=self.fake, incidents_path=None,
+                                      frames_dir=None, home_states=('menu',),
+                                      state_timeout=100.0, unknown_timeout=500.0, frozen_frame_s=30.0)
+
+    def _seen(self, state, ts, level=None):
+        self.watchdog.on_recognition({'state': state, 'ts': T0 + ts,
+                                      'frame_pyramid': _Pyramid(level) if level is not None else None})
+
+    def test_find_cycle(self):
+        """Sólo cuentan los ciclos de 2 o 3 pantallas repetidos en toda la secuencia"""
+        self.assertEqual(find_cycle(['a', 'b', 'a', 'b', 'a']), ['b', 'a'])
+        self.assertEqual(find_cycle(['a', 'b', 'c'] * 3), ['a', 'b', 'c'])
+        self.assertIsNone(find_cycle(['a', 'b', 'a', 'b']))  # Demasiado corta
+        self.assertIsNone(find_cycle(['a', 'b', 'a', 'c', 'a', 'b', 'a']))
+        self.assertIsNone(find_cycle(['a', 'b', 'c', 'd'] * 2))
+
+    def test_state_timeout(self):
+        """Demasiado tiempo en un estado (o en 'unknown', con su propio límite)"""
+        self._seen('menu', 0.0)
+        self.assertIsNone(self.watchdog.detect(now=T0 + 99.0))
+        self.assertEqual(self.watchdog.detect(now=T0 + 100.0)['kind'], KIND_STATE)
+        self._seen('unknown', 100.0)
+        self.assertIsNone(self.watchdog.detect(now=T0 + 400.0))
+        self.assertEqual(self.watchdog.detect(now=T0 + 600.0)['kind'], KIND_STATE)
+
+    def test_static_screen_without_inputs_is_not_frozen(self):
+        """Una pantalla quieta mientras el flujo espera no es un bloqueo"""
+        for ts in range(0, 60, 5):
+            self._seen('partido', float(ts), level=40)
+        self.assertIsNone(self.watchdog.detect(now=T0 + 60.0))
+
+    def test_static_screen_with_inputs_is_frozen(self):
+        """Pulsar sin que cambie la imagen durante frozen_frame_s es una imagen congelada"""
+        self._seen('partido', 0.0, level=40)
+        self.watchdog.on_input({'kind': 'press', 'button': 'a', 'ts': T0 + 10.0})
+        self._seen('partido', 20.0, level=40)
+        self.assertIsNone(self.watchdog.detect(now=T0 + 20.0))
+        self._seen('partido', 35.0, level=41)  # Diferencia por debajo de FROZEN_DIFF
+        stall = self.watchdog.detect(now=T0 + 35.0)
+        self.assertEqual(stall['kind'], KIND_FROZEN)
+        self.assertEqual(stall['since'], T0)
+        self._seen('partido', 40.0, level=120)
+        self.assertIsNone(self.watchdog.detect(now=T0 + 40.0))
+
+    def test_loop(self):
+        """Ocho cambios que alternan dos pantallas en poco tiempo son un ciclo"""
+        for i in range(8):
+            self._seen('a' if i % 2 else 'b', float(i))
+            self._seen('unknown', i + 0.5)  # Las transiciones por 'unknown' no rompen el ciclo
+        stall = self.watchdog.detect(now=T0 + 8.0)
+        self.assertEqual(stall['kind'], KIND_LOOP)
+        self.assertEqual(sorted(stall['states']), ['a', 'b'])
+
+    def test_recovery_pauses_workflow(self):
+        """El flujo queda en pausa mientras el vigilante navega y se reanuda después"""
+        pauses = []
+        self.watchdog.on_pause = lambda paused: pauses.append(paused) or self.fake.calls.append(paused)
+        self.assertTrue(self.watchdog._recover(ACTION_HOME, {'kind': KIND_STATE, 'detail': ''}))
+        self.assertEqual(self.fake.calls, [True, 'navigate', False])
+        self.watchdog.navigator = None
+        self.assertFalse(self.watchdog._recover(ACTION_HOME, {'kind': KIND_STATE, 'detail': ''}))
+        self.assertEqual(pauses, [True, False])
+
+    def test_save_frame_without_result_argument(self):
+        """Reconocedores cuyo save_screenshot no acepta result guardan la pantalla actual"""
+        self.watchdog.frames_dir = "frames"
+        self.assertEqual(self.watchdog._save_frame("x", 7), os.path.join("frames", "stall_x.png"))
+
+
+class TestCancellationToken(unittest.TestCase):
+    """Pruebas de la pausa de un flujo"""
+
+    def _checking(self, token):
+        outcome = []
+
+        def body():
+            try:
+                token.check()
+                outcome.append('resumed')
+            except WorkflowCancelled:
+                outcome.append('cancelled')
+
+        thread = threading.Thread(target=body)
+        thread.start()
+        return thread, outcome
+
+    def test_pause_blocks_until_resume(self):
+        """check() espera mientras el token está en pausa"""
+        token = CancellationToken()
+        token.pause()
+        thread, outcome = self._checking(token)
+        time.sleep(0.2)
+        self.assertEqual(outcome, [])
+        token.resume()
+        thread.join(timeout=1.0)
+        self.assertEqual(outcome, ['resumed'])
+
+    def test_cancel_interrupts_pause(self):
+        """Una cancelación durante la pausa la interrumpe"""
+        token = CancellationToken()
+        token.pause()
+        thread, outcome = self._checking(token)
+        token.cancel("timeout")
+        thread.join(timeout=1.0)
+        self.assertEqual(outcome, ['cancelled'])
+
+    def test_unpausable_sleep_returns_while_paused(self):
+        """sleep(pausable=False) no se queda en la pausa (para soltar lo pulsado)"""
+        token = CancellationToken()
+        token.pause()
+        started = time.monotonic()
+        token.sleep(0.01, pausable=False)
+        self.assertLess(time.monotonic() - started, 0.5)
+
+    def test_wait_future_is_cancellable(self):
+        """wait_future deja de esperar un Future que no termina al cancelar el flujo"""
+        token = CancellationToken()
+        threading.Timer(0.05, token.cancel).start()
+        with cancellation_scope(token), self.assertRaises(WorkflowCancelled):
+            wait_future(Future())
+        done = Future()
+        done.set_result(7)
+        self.assertEqual(wait_future(done), 7)  # Fuera de un flujo: future.result()
+
+
+if __name__ == "__main__":
+    unittest.main()
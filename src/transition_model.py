@@ -0,0 +1,349 @@
+"""
+Modelo aprendido de transiciones entre pantallas.
+
+Durante el funcionamiento normal, TransitionObserver escucha las entradas
+del gamepad (GamepadController.add_input_listener) y los reconocimientos
+(ScreenRecognizer.add_recognition_listener) y registra tuplas
+(estado origen, botón, estado destino, latencia): la latencia va desde la
+pulsación hasta la captura del primer frame reconocido en el estado nuevo,
+así que incluye la animación del juego y queda acotada por el ritmo de
+reconocimiento.
+
+TransitionModel agrega las tuplas por arista (últimas MAX_SAMPLES
+latencias, percentiles y contador) y las guarda en JSON. El modelo
+alimenta a menu_navigator: latencias medidas para planificar, esperas por
+salto a partir del p95 y botones aprendidos para las transiciones que
+state_transitions.json no etiqueta.
+
+Uso:
+    python transition_model.py report --top 15
+    python transition_model.py show menu_home_sel
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from recognition_bundle import PROJECT_DIR, TransitionEdge
+
+logger = logging.getLogger('transition_model')
+
+MODEL_FILE = os.path.join(PROJECT_DIR, "logs", "transition_model.json")
+MODEL_FORMAT = "efootball-transition-model"
+MODEL_VERSION = 1
+MAX_SAMPLES = 200            # Latencias guardadas por arista (las más recientes)
+MIN_SAMPLES = 3              # Observaciones mínimas para usar una arista aprendida
+MAX_LATENCY_S = 5.0          # Un cambio de estado más tardío no se atribuye a la pulsación
+TIMEOUT_MARGIN = 1.5         # Espera sugerida = p95 x margen ...
+MIN_TIMEOUT_S = 1.0          # ... con este mínimo
+AUTOSAVE_EVERY = 20          # Observaciones entre guardados automáticos
+IGNORED_STATES = ('unknown', 'error')
+
+
+class _EdgeStats:
+    """Latencias observadas de una arista (origen, botón, destino)."""
+
+    __slots__ = ('count', 'samples', 'last_seen')
+
+    def __init__(self, count: int = 0, samples: Optional[List[float]] = None, last_seen: float = 0.0):
+        self.count = count
+        self.samples = list(samples or [])
+        self.last_seen = last_seen
+
+    def add(self, latency_s: float, timestamp: float) -> None:
+        self.count += 1
+        self.samples.append(latency_s)
+        if len(self.samples) > MAX_SAMPLES:
+            del self.samples[:len(self.samples) - MAX_SAMPLES]
+        self.last_seen = timestamp
+
+    def percentile(self, q: float) -> Optional[float]:
+        return float(np.percentile(self.samples, q)) if self.samples else None
+
+
+class TransitionModel:
+    """
+    Latencias de transición por (origen, botón, destino), con persistencia en JSON.
+    """
+
+    def __init__(self, path: Optional[str] = MODEL_FILE, min_samples: int = MIN_SAMPLES):
+        """
+        Args:
+            path: Archivo del modelo (None = sólo en memoria).
+            min_samples: Observaciones mínimas para que una arista cuente en planificación.
+        """
+        self.path = path
+        self.min_samples = min_samples
+        self._edges: Dict[Tuple[str, str, str], _EdgeStats] = {}
+        self._lock = threading.Lock()
+        self._dirty = 0
+        self._mtime = None
+
+    @classmethod
+    def load(cls, path: str = MODEL_FILE, **kwargs) -> 'TransitionModel':
+        """Carga el modelo de disco (vacío si el archivo no existe o no es válido)."""
+        model = cls(path, **kwargs)
+        model.reload()
+        return model
+
+    def reload(self) -> bool:
+        """Vuelve a leer el archivo si cambió en disco. Devuelve True si se recargó."""
+        if not self.path or not os.path.exists(self.path):
+            return False
+        mtime = os.stat(self.path).st_mtime_ns
+        if mtime == self._mtime:
+            return False
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get('format') != MODEL_FORMAT:
+                raise ValueError(f"formato desconocido: {data.get('format')!r}")
+            edges = {(e['from'], e['input'], e['to']): _EdgeStats(e['count'], e['samples'], e.get('last_seen', 0.0))
+                     for e in data.get('edges', [])}
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.error(f"No se pudo cargar el modelo de transiciones {self.path}: {e}")
+            return False
+        with self._lock:
+            self._edges = edges
+            self._mtime = mtime
+            self._dirty = 0
+        logger.debug(f"Modelo de transiciones cargado: {len(edges)} aristas")
+        return True
+
+    def save(self, path: Optional[str] = None) -> None:
+        """Guarda el modelo (escritura atómica) con los percentiles precalculados para consulta."""
+        path = path or self.path
+        if not path:
+            return
+        data = {'format': MODEL_FORMAT, 'version': MODEL_VERSION, 'saved_at': time.time(),
+                'edges': [dict(row, samples=stats.samples, last_seen=stats.last_seen)
+                          for row, stats in self._rows_with_stats()]}
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=1)
+        os.replace(temp_path, path)
+        with self._lock:
+            self._dirty = 0
+            if path == self.path:
+                self._mtime = os.stat(path).st_mtime_ns
+
+    def record(self, from_state: str, button: str, to_state: str, latency_s: float,
+               timestamp: Optional[float] = None) -> None:
+        """Añade una observación; guarda cada AUTOSAVE_EVERY observaciones."""
+        with self._lock:
+            stats = self._edges.setdefault((from_state, button, to_state), _EdgeStats())
+            stats.add(latency_s, timestamp if timestamp is not None else time.time())
+            self._dirty += 1
+            autosave = self.path is not None and self._dirty >= AUTOSAVE_EVERY
+        if autosave:
+            try:
+                self.save()
+            except OSError as e:
+                logger.error(f"No se pudo guardar el modelo de transiciones: {e}")
+
+    def _rows_with_stats(self):
+        with self._lock:
+            items = [(key, _EdgeStats(s.count, s.samples, s.last_seen)) for key, s in self._edges.items()]
+        for (from_state, button, to_state), stats in sorted(items):
+            yield {'from': from_state, 'input': button, 'to': to_state, 'count': stats.count,
+                   'p50': stats.percentile(50), 'p90': stats.percentile(90),
+                   'p95': stats.percentile(95), 'max': max(stats.samples) if stats.samples else None}, stats
+
+    def rows(self) -> List[Dict[str, Any]]:
+        """Aristas con contador y percentiles (p50, p90, p95, max) de latencia."""
+        return [row for row, _ in self._rows_with_stats()]
+
+    def _best(self, from_state: str, to_state: str) -> Optional[_EdgeStats]:
+        """Estadísticas del botón más observado entre dos estados (con muestras suficientes)."""
+        with self._lock:
+            candidates = [s for (f, _, t), s in self._edges.items()
+                          if f == from_state and t == to_state and s.count >= self.min_samples]
+        return max(candidates, key=lambda s: s.count) if candidates else None
+
+    def latency(self, from_state: str, to_state: str, percentile: float = 50) -> Optional[float]:
+        """Latencia medida entre dos estados (None si no hay observaciones suficientes)."""
+        stats = self._best(from_state, to_state)
+        return stats.percentile(percentile) if stats else None
+
+    def timeout(self, from_state: str, to_state: str) -> Optional[float]:
+        """Espera sugerida para una transición: p95 x TIMEOUT_MARGIN (mínimo MIN_TIMEOUT_S)."""
+        p95 = self.latency(from_state, to_state, 95)
+        return max(MIN_TIMEOUT_S, p95 * TIMEOUT_MARGIN) if p95 is not None else None
+
+    def learned_edges(self) -> Dict[str, List[TransitionEdge]]:
+        """
+        Aristas aprendidas con muestras suficientes, en el formato de RecognitionBundle.edges.
+
+        Para cada (origen, destino) se usa el botón más observado y su latencia p50.
+        """
+        best: Dict[Tuple[str, str], Tuple[int, str, _EdgeStats]] = {}
+        with self._lock:
+            items = list(self._edges.items())
+        for (from_state, button, to_state), stats in items:
+            if stats.count < self.min_samples:
+                continue
+            current = best.get((from_state, to_state))
+            if current is None or stats.count > current[0]:
+                best[(from_state, to_state)] = (stats.count, button, stats)
+        edges: Dict[str, List[TransitionEdge]] = {}
+        for (from_state, to_state), (_, button, stats) in sorted(best.items()):
+            edges.setdefault(from_state, []).append(TransitionEdge(to_state, (button,), stats.percentile(50)))
+        return edges
+
+    def augment(self, edges: Dict[str, Any]) -> Dict[str, List[TransitionEdge]]:
+        """
+        Completa las aristas configuradas con lo aprendido.
+
+        Las transiciones sin botón toman el botón aprendido; las observadas que no
+        estaban configuradas se añaden. Los botones configurados se respetan.
+        """
+        learned = self.learned_edges()
+        merged: Dict[str, List[TransitionEdge]] = {}
+        for state in set(edges) | set(learned):
+            by_target = {edge.target: edge for edge in learned.get(state, [])}
+            state_edges = []
+            for edge in edges.get(state, ()):
+                observed = by_target.pop(edge.target, None)
+                if not edge.buttons and observed is not None:
+                    edge = observed
+                state_edges.append(edge)
+            state_edges.extend(by_target.values())
+            merged[state] = state_edges
+        return merged
+
+    def __len__(self) -> int:
+        return len(self._edges)
+
+
+class TransitionObserver:
+    """
+    Registra transiciones en un TransitionModel a partir de las entradas del
+    gamepad y los reconocimientos.
+
+    Una transición sólo se atribuye si desde el cambio de estado anterior hubo
+    exactamente una pulsación en los últimos max_latency_s. Con varias (saltos de
+    varios botones, pulsaciones que no cambiaron nada) la causa es ambigua y la
+    observación se descarta en lugar de acreditársela al último botón.
+    """
+
+    def __init__(self, model: TransitionModel, gamepad=None, recognizer=None,
+                 max_latency_s: float = MAX_LATENCY_S):
+        """
+        Args:
+            model: Modelo donde registrar las observaciones.
+            gamepad: GamepadController a escuchar (opcional; también se puede llamar a on_input).
+            recognizer: ScreenRecognizer a escuchar (opcional; también on_recognition).
+            max_latency_s: Latencia máxima atribuible a una pulsación.
+        """
+        self.model = model
+        self.max_latency_s = max_latency_s
+        self.gamepad = gamepad
+        self.recognizer = recognizer
+        self._lock = threading.Lock()
+        self._state = None      # Último estado reconocido
+        self._presses = []      # (estado origen, botón, instante) desde el último cambio de estado
+        if gamepad is not None:
+            gamepad.add_input_listener(self.on_input)
+        if recognizer is not None:
+            recognizer.add_recognition_listener(self.on_recognition)
+
+    def on_input(self, event: Dict[str, Any]) -> None:
+        """Listener del gamepad: memoriza la pulsación como causa candidata."""
+        if event.get('kind') != 'press':
+            return
+        with self._lock:
+            if self._state is not None:
+                horizon = event['ts'] - self.max_latency_s
+                self._presses = [p for p in self._presses if p[2] >= horizon]
+                self._presses.append((self._state, event['button'], event['ts']))
+
+    def on_recognition(self, event: Dict[str, Any]) -> None:
+        """Listener del reconocedor: cierra la transición pendiente si cambió el estado."""
+        state = event.get('state')
+        if state in IGNORED_STATES or state is None:
+            return
+        observation = None
+        ts = event['ts']
+        with self._lock:
+            if state != self._state:
+                causes = [p for p in self._presses
+                          if p[0] == self._state and 0 <= ts - p[2] <= self.max_latency_s]
+                if len(causes) == 1:
+                    from_state, button, pressed_at = causes[0]
+                    observation = (from_state, button, state, ts - pressed_at)
+                elif causes:
+                    logger.debug(f"Transición {self._state} -> {state} descartada: "
+                                 f"{len(causes)} pulsaciones candidatas")
+                # Las pulsaciones posteriores al frame se aplicaron ya sobre el estado nuevo
+                self._presses = [(state, button, pressed_at) for _, button, pressed_at in self._presses
+                                 if pressed_at > ts]
+            self._state = state
+        if observation is not None:
+            self.model.record(*observation, timestamp=event['ts'])
+            logger.debug(f"Transición {observation[0]} --{observation[1]}--> {observation[2]} "
+                         f"en {observation[3]:.3f} s")
+
+    def close(self, save: bool = True) -> None:
+        """Deja de escuchar y guarda el modelo."""
+        if self.gamepad is not None:
+            self.gamepad.remove_input_listener(self.on_input)
+        if self.recognizer is not None:
+            self.recognizer.remove_recognition_listener(self.on_recognition)
+        if save and self.model.path:
+            try:
+                self.model.save()
+            except OSError as e:
+                logger.error(f"No se pudo guardar el modelo de transiciones: {e}")
+
+
+def _format_row(row: Dict[str, Any]) -> str:
+    return (f"{row['from']:38} --{row['input']:>12}--> {row['to']:38} n={row['count']:<4} "
+            f"p50 {row['p50']:.2f} s | p90 {row['p90']:.2f} s | p95 {row['p95']:.2f} s | máx {row['max']:.2f} s")
+
+
+def main():
+    """Punto de entrada de línea de comandos."""
+    parser = argparse.ArgumentParser(description="Modelo aprendido de transiciones entre pantallas")
+    parser.add_argument("--model", default=MODEL_FILE, help="Archivo del modelo")
+    subparsers = parser.add_subparsers(dest="command")
+    report_parser = subparsers.add_parser("report", help="Transiciones más lentas")
+    report_parser.add_argument("--top", type=int, default=20)
+    report_parser.add_argument("--by", choices=("p50", "p90", "p95", "max"), default="p95")
+    show_parser = subparsers.add_parser("show", help="Transiciones observadas desde un estado")
+    show_parser.add_argument("state")
+    args = parser.parse_args()
+
+    if args.command not in ("report", "show"):
+        parser.print_help()
+        return 1
+    model = TransitionModel.load(args.model)
+    rows = [row for row in model.rows() if row['max'] is not None]
+    if not rows:
+        print(f"Sin transiciones registradas en {args.model}")
+        return 1
+    if args.command == "report":
+        print(f"{len(rows)} aristas, {sum(r['count'] for r in rows)} observaciones. "
+              f"Más lentas por {args.by}:")
+        for row in sorted(rows, key=lambda r: -r[args.by])[:args.top]:
+            print(_format_row(row))
+        return 0
+    selected = [row for row in rows if row['from'] == args.state]
+    for row in sorted(selected, key=lambda r: -r['count']):
+        print(_format_row(row))
+    return 0 if selected else 1
+
+
+if __name__ == "__main__":
+    if not logging.getLogger().hasHandlers():
+        logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    sys.exit(main())